@@ -0,0 +1,4 @@
+# app/cli/__init__.py
+"""
+Commandes de maintenance lancées à la main : python -m app.cli.<commande>
+"""
@@ -0,0 +1,60 @@
+# app/cli/backfill_positions.py
+"""
+Reconstruit Position_Courante depuis l'historique Suivi_Parcours.
+
+Usage :
+    python -m app.cli.backfill_positions [--user-id 42] [--dry-run]
+"""
+import argparse
+import logging
+from typing import Dict, List, Optional
+
+from ..deps import service_client
+from ..services.position_store import rebuild_from_history, upsert_positions
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000
+UPSERT_BATCH = 500
+SUIVI_COLUMNS = "id,Users_Id,Parcours_Id,Date,Taux_Reussite,Type_Evolution,Derniere_Observation_Id"
+
+
+def _iter_suivis(sb, user_id: Optional[int]):
+    """Parcourt Suivi_Parcours par id croissant (pagination par clé, pas d'offset)."""
+    last_id = 0
+    while True:
+        q = sb.table("Suivi_Parcours").select(SUIVI_COLUMNS).gt("id", last_id)
+        if user_id is not None:
+            q = q.eq("Users_Id", user_id)
+        page = q.order("id").limit(PAGE_SIZE).execute().data or []
+        yield from page
+        if len(page) < PAGE_SIZE:
+            return
+        last_id = int(page[-1]["id"])
+
+
+def backfill(user_id: Optional[int] = None, dry_run: bool = False) -> Dict[str, int]:
+    sb = service_client()
+    positions: List[Dict] = rebuild_from_history(_iter_suivis(sb, user_id))
+    logger.info(f"[BackfillPositions] {len(positions)} positions reconstruites")
+
+    if not dry_run:
+        for i in range(0, len(positions), UPSERT_BATCH):
+            upsert_positions(sb, positions[i:i + UPSERT_BATCH])
+
+    return {"positions": len(positions), "written": 0 if dry_run else len(positions)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reconstruit Position_Courante depuis Suivi_Parcours")
+    parser.add_argument("--user-id", type=int, default=None, help="limiter à un utilisateur")
+    parser.add_argument("--dry-run", action="store_true", help="calcule sans écrire")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = backfill(user_id=args.user_id, dry_run=args.dry_run)
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# app/cli/generate_offline_data.py
+"""
+Génère une base SQLite pour le backend hors ligne (SUPABASE_BACKEND=offline).
+
+Usage :
+    python -m app.cli.generate_offline_data --db offline.db --users 100000 --observations 50000000
+    SUPABASE_BACKEND=offline OFFLINE_DB=offline.db uvicorn app.main:app
+
+Volume indicatif : ~70 octets par observation (50M ≈ 3,5 Go), ~8 s par million
+d'observations sur un cœur.
+"""
+import argparse
+import logging
+import os
+import time
+
+from ..offline import SqliteStore
+from ..offline.generate import generate
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Génère les tables Supabase hors ligne dans un fichier SQLite")
+    parser.add_argument("--db", required=True, help="fichier SQLite à créer")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--observations", type=int, default=None, help="total visé (défaut : 300 par utilisateur)")
+    parser.add_argument("--days", type=int, default=180, help="historique max en jours")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true", help="écraser le fichier existant")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if os.path.exists(args.db):
+        if not args.force:
+            parser.error(f"{args.db} existe déjà (--force pour l'écraser)")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    t0 = time.perf_counter()
+    store = SqliteStore(args.db)
+    store.conn.execute("PRAGMA synchronous=OFF")
+    try:
+        written = generate(store, users=args.users, observations=args.observations, days=args.days, seed=args.seed)
+        store.conn.execute("ANALYZE")
+    finally:
+        store.close()
+    print({"db": args.db, "seconds": round(time.perf_counter() - t0, 1), **written})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# app/cli/outbox_worker.py
+"""
+Worker Outbox hors du process API (traitement différé des soumissions,
+OBSERVATIONS_PIPELINE=outbox). Plusieurs instances peuvent tourner en parallèle.
+
+Usage :
+    python -m app.cli.outbox_worker [--concurrency 4] [--poll 2] [--once]
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+from ..deps import async_service_client, get_client_factory
+from ..services.outbox import OUTBOX_CONCURRENCY, OUTBOX_POLL_SECONDS, OutboxWorker
+
+
+async def _main(args) -> None:
+    worker = OutboxWorker(async_service_client(), concurrency=args.concurrency, name=args.name, poll=args.poll)
+    try:
+        if args.once:
+            print({"worker": worker.name, "jobs": await worker.drain(), "done": worker.done, "errors": worker.errors})
+            return
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+        await worker.run_forever()
+    finally:
+        await get_client_factory().aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Traite les jobs de la table Outbox")
+    parser.add_argument("--concurrency", type=int, default=OUTBOX_CONCURRENCY, help="jobs traités en parallèle")
+    parser.add_argument("--poll", type=float, default=OUTBOX_POLL_SECONDS, help="secondes entre deux passes à vide")
+    parser.add_argument("--name", default=None, help="identifiant du worker (locked_by)")
+    parser.add_argument("--once", action="store_true", help="vide la file puis s'arrête")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# app/cli/rebuild_scoring_stats.py
+"""
+Reconstruit Stats_Scoring (fenêtres glissantes du scoring) depuis Observations.
+
+Par paquets d'utilisateurs : leurs entraînements, puis leurs observations, lus
+par clé ; les 50 dernières observations de chaque (Parcours_Id, Operation)
+forment la fenêtre. Mémoire bornée par la taille du paquet.
+
+Usage :
+    python -m app.cli.rebuild_scoring_stats [--user-id 42] [--batch 200] [--dry-run]
+"""
+import argparse
+import logging
+from typing import Dict, Iterator, List, Optional
+
+from ..deps import service_client
+from ..services.keyset import iter_in, iter_rows
+from ..services.scoring_stats import history_windows, upsert_windows
+
+logger = logging.getLogger(__name__)
+
+USER_BATCH = 200
+UPSERT_BATCH = 500
+OBS_COLUMNS = "id,Entrainement_Id,Parcours_Id,Operation,Temps_Seconds,Marge_Erreur,Etat"
+
+
+def _iter_user_batches(sb, user_id: Optional[int], batch: int) -> Iterator[List[int]]:
+    if user_id is not None:
+        yield [user_id]
+        return
+    ids: List[int] = []
+    for r in iter_rows(lambda: sb.table("users_map").select("user_id"), key="user_id"):
+        ids.append(int(r["user_id"]))
+        if len(ids) >= batch:
+            yield ids
+            ids = []
+    if ids:
+        yield ids
+
+
+def rebuild(user_id: Optional[int] = None, batch: int = USER_BATCH, dry_run: bool = False) -> Dict[str, int]:
+    sb = service_client()
+    users = windows = written = 0
+    for user_ids in _iter_user_batches(sb, user_id, batch):
+        owner = {
+            r["id"]: int(r["Users_Id"])
+            for r in iter_in(lambda: sb.table("Entrainement").select("id,Users_Id"), "Users_Id", user_ids)
+        }
+        by_user: Dict[int, List[Dict]] = {}
+        for o in iter_in(lambda: sb.table("Observations").select(OBS_COLUMNS), "Entrainement_Id", owner):
+            if o.get("Parcours_Id") is not None and o.get("Operation") is not None:
+                by_user.setdefault(owner[o["Entrainement_Id"]], []).append(o)
+
+        rows = [w for uid, obs in by_user.items() for w in history_windows(uid, obs).values()]
+        users += len(user_ids)
+        windows += len(rows)
+        if not dry_run:
+            for i in range(0, len(rows), UPSERT_BATCH):
+                upsert_windows(sb, rows[i:i + UPSERT_BATCH])
+            written += len(rows)
+        logger.info(f"[RebuildScoringStats] {users} utilisateurs, {windows} fenêtres")
+
+    return {"users": users, "windows": windows, "written": written}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reconstruit Stats_Scoring depuis Observations")
+    parser.add_argument("--user-id", type=int, default=None, help="limiter à un utilisateur")
+    parser.add_argument("--batch", type=int, default=USER_BATCH, help="utilisateurs par paquet")
+    parser.add_argument("--dry-run", action="store_true", help="calcule sans écrire")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = rebuild(user_id=args.user_id, batch=args.batch, dry_run=args.dry_run)
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
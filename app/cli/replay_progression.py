@@ -0,0 +1,176 @@
+# app/cli/replay_progression.py
+"""
+Recalcule l'historique Suivi_Parcours en rejouant la règle d'évolution sur
+toutes les observations (après un changement de seuils, par exemple).
+
+Un process par tranche d'utilisateurs (Users_Id % shards). Chaque process lit
+ses utilisateurs par paquets : entraînements, observations en flux par id
+croissant (fusion des paquets `in`, une page en mémoire par paquet), suivis
+existants ; rejoue (services/progression_replay.py), compare, puis réécrit les
+historiques qui diffèrent : suppression des anciens suivis par id, insertion
+en masse, Position_Courante avec ses compteurs de fenêtre. Mémoire bornée par
+la taille du paquet.
+
+Une opération sans observation garde son historique. La réécriture d'un
+utilisateur n'est pas atomique : à lancer hors trafic, relancer en cas d'arrêt.
+
+Usage :
+    python -m app.cli.replay_progression [--shards 4] [--batch 200] [--user-id 42]
+        [--dry-run] [--report diff.jsonl] [--progression 0.90] [--regression 0.5]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+from typing import Dict, Iterator, List, Optional
+
+from ..deps import service_client
+from ..services.evolution import PROGRESSION_THRESHOLD, REGRESSION_THRESHOLD
+from ..services.keyset import iter_in, iter_in_merged, iter_rows
+from ..services.parcours_catalog import ParcoursCatalog
+from ..services.position_store import upsert_positions
+from ..services.progression_replay import UserReplay, diff_history
+
+logger = logging.getLogger(__name__)
+
+USER_BATCH = 200
+WRITE_BATCH = 500
+OBS_COLUMNS = "id,Entrainement_Id,Operation,Etat"
+SUIVI_COLUMNS = "id,Users_Id,Parcours_Id,Type_Evolution,Taux_Reussite,Derniere_Observation_Id"
+
+
+def _iter_user_batches(sb, user_id: Optional[int], batch: int, shard: int, shards: int) -> Iterator[List[int]]:
+    if user_id is not None:
+        yield [user_id]
+        return
+    ids: List[int] = []
+    for r in iter_rows(lambda: sb.table("users_map").select("user_id"), key="user_id"):
+        uid = int(r["user_id"])
+        if uid % shards != shard:
+            continue
+        ids.append(uid)
+        if len(ids) >= batch:
+            yield ids
+            ids = []
+    if ids:
+        yield ids
+
+
+def _replay_batch(sb, catalog: ParcoursCatalog, user_ids: List[int], progression: float, regression: float) -> Dict[int, UserReplay]:
+    sessions = {
+        int(r["id"]): (int(r["Users_Id"]), r.get("Date"))
+        for r in iter_in(lambda: sb.table("Entrainement").select("id,Users_Id,Date"), "Users_Id", user_ids)
+    }
+    replays: Dict[int, UserReplay] = {}
+    for o in iter_in_merged(lambda: sb.table("Observations").select(OBS_COLUMNS), "Entrainement_Id", sessions):
+        uid, day = sessions[o["Entrainement_Id"]]
+        rp = replays.get(uid)
+        if rp is None:
+            rp = replays[uid] = UserReplay(uid, catalog, progression, regression)
+        rp.add(o, day)
+    for rp in replays.values():
+        rp.finish()
+    return replays
+
+
+def _existing(sb, catalog: ParcoursCatalog, user_ids: List[int]) -> Dict[tuple, List[Dict]]:
+    """Suivis existants par (Users_Id, Type_Operation), ordre d'écriture."""
+    out: Dict[tuple, List[Dict]] = {}
+    for s in iter_in(lambda: sb.table("Suivi_Parcours").select(SUIVI_COLUMNS), "Users_Id", user_ids):
+        op = catalog.type_of(s.get("Parcours_Id"))
+        if op:
+            out.setdefault((int(s["Users_Id"]), op), []).append(s)
+    return out
+
+
+def _rewrite(sb, replay: UserReplay, ops: List[str], existing: Dict[tuple, List[Dict]], catalog: ParcoursCatalog) -> int:
+    """Remplace l'historique des opérations `ops` de l'utilisateur. Retourne le nombre de suivis écrits."""
+    old_ids = [int(s["id"]) for op in ops for s in existing.get((replay.user_id, op), [])]
+    for i in range(0, len(old_ids), WRITE_BATCH):
+        sb.table("Suivi_Parcours").delete().in_("id", old_ids[i:i + WRITE_BATCH]).execute()
+
+    rows = [r for r in replay.suivis if catalog.type_of(r["Parcours_Id"]) in ops]
+    for i in range(0, len(rows), WRITE_BATCH):
+        part = rows[i:i + WRITE_BATCH]
+        inserted = getattr(sb.table("Suivi_Parcours").insert(part).execute(), "data", []) or []
+        for row, ins in zip(part, inserted):
+            row["id"] = ins.get("id")  # Suivi_Id des positions
+    upsert_positions(sb, [p for p in replay.positions() if p["Type_Operation"] in ops])
+    return len(rows)
+
+
+def _run_shard(shard: int, shards: int, opts: Dict) -> Dict[str, int]:
+    logging.basicConfig(level=logging.INFO)
+    sb = service_client()
+    catalog = ParcoursCatalog(sb)
+    catalog.ensure_fresh()
+    report = None
+    if opts.get("report"):
+        path = opts["report"] if shards == 1 else f"{opts['report']}.{shard}"
+        report = open(path, "w", encoding="utf-8")
+
+    totals = {"users": 0, "observations": 0, "histories": 0, "changed": 0, "written": 0}
+    examples = 0
+    try:
+        for user_ids in _iter_user_batches(sb, opts.get("user_id"), opts["batch"], shard, shards):
+            replays = _replay_batch(sb, catalog, user_ids, opts["progression"], opts["regression"])
+            existing = _existing(sb, catalog, user_ids)
+            for uid, rp in replays.items():
+                totals["observations"] += rp.observations
+                changed: List[str] = []
+                for op in rp.windows:
+                    before = existing.get((uid, op), [])
+                    after = [r for r in rp.suivis if catalog.type_of(r["Parcours_Id"]) == op]
+                    totals["histories"] += 1
+                    diff = diff_history(before, after)
+                    if diff is None:
+                        continue
+                    changed.append(op)
+                    if report:
+                        report.write(json.dumps({"user_id": uid, "operation": op, **diff}) + "\n")
+                    if examples < opts["examples"]:
+                        examples += 1
+                        logger.info(f"[ReplayProgression] {uid} {op} : {diff}")
+                totals["changed"] += len(changed)
+                if changed and not opts["dry_run"]:
+                    totals["written"] += _rewrite(sb, rp, changed, existing, catalog)
+            totals["users"] += len(user_ids)
+            logger.info(f"[ReplayProgression] tranche {shard}/{shards} : {totals}")
+    finally:
+        if report:
+            report.close()
+    return totals
+
+
+def replay(shards: int = 1, **opts) -> Dict[str, int]:
+    if shards <= 1 or opts.get("user_id") is not None:
+        return _run_shard(0, 1, opts)
+    ctx = multiprocessing.get_context("spawn")  # un client (et un pool) neuf par process
+    with ctx.Pool(shards) as pool:
+        results = pool.starmap(_run_shard, [(s, shards, opts) for s in range(shards)])
+    return {k: sum(r[k] for r in results) for k in results[0]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rejoue la règle d'évolution et réécrit Suivi_Parcours")
+    parser.add_argument("--shards", type=int, default=1, help="process en parallèle (Users_Id % shards)")
+    parser.add_argument("--batch", type=int, default=USER_BATCH, help="utilisateurs par paquet")
+    parser.add_argument("--user-id", type=int, default=None, help="limiter à un utilisateur")
+    parser.add_argument("--dry-run", action="store_true", help="compare sans écrire")
+    parser.add_argument("--report", default=None, help="différences en JSONL (suffixe .N par tranche)")
+    parser.add_argument("--examples", type=int, default=5, help="différences affichées par tranche")
+    parser.add_argument("--progression", type=float, default=PROGRESSION_THRESHOLD, help="seuil de progression (>)")
+    parser.add_argument("--regression", type=float, default=REGRESSION_THRESHOLD, help="seuil de régression (<)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = replay(
+        shards=args.shards, user_id=args.user_id, batch=args.batch, dry_run=args.dry_run,
+        report=args.report, examples=args.examples,
+        progression=args.progression, regression=args.regression,
+    )
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+# app/cron/idempotency_cleanup.py
+"""
+Tâche planifiée : purge des clés d'idempotence expirées (table Idempotency_Keys,
+migration 015). Les clés expirées ne sont déjà plus rejouées ; la purge borne
+la taille de la table.
+"""
+
+import logging
+from ..deps import service_client
+from ..services.idempotency import purge_expired
+
+logger = logging.getLogger(__name__)
+
+
+async def purge_idempotency_keys():
+    try:
+        deleted = purge_expired(service_client())
+        logger.info(f"[IdempotencyCleanup] {deleted} clés expirées supprimées")
+    except Exception as e:
+        logger.error(f"[IdempotencyCleanup] Erreur purge Idempotency_Keys: {e}")
@@ -35,6 +35,7 @@ def init_scheduler():
     
     # Import des tâches
     from .ranking_checker import check_rankings
+    from .idempotency_cleanup import purge_idempotency_keys
 
     # NOTE: Rappels quotidiens (daily_reminder) désactivés
     # NOTE: Notifications du matin (morning_quote) désactivées
@@ -48,6 +49,16 @@ def init_scheduler():
         replace_existing=True
     )
     logger.info("[Scheduler] ✓ Vérification classements programmée (toutes les 30 min)")
+
+    # 2) Purge des clés d'idempotence expirées - Toutes les heures
+    scheduler.add_job(
+        purge_idempotency_keys,
+        CronTrigger(minute=17, timezone=PARIS_TZ),
+        id='idempotency_cleanup',
+        name='Purge clés d\'idempotence',
+        replace_existing=True
+    )
+    logger.info("[Scheduler] ✓ Purge des clés d'idempotence programmée (toutes les heures)")
     
     # Démarrer le scheduler
     scheduler.start()
@@ -1,26 +1,37 @@
 # app/deps.py
-import os, json, base64
+import os
 from typing import Optional
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from fastapi import Depends, Header, HTTPException, Request, Response
+
+from .offline import offline_enabled
+from .supabase_pool import AsyncScopedClient, ScopedClient, SupabaseClientFactory, get_factory
+from .services.etag import etag_matches, resource_etag
+from .services.identity import Identity, InvalidToken, aidentity_from_token, verifier
 
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+if not offline_enabled() and (not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY):
     raise RuntimeError("Configure SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY")
 
+# Pool HTTP unique du process ; les clients ci-dessous n'en sont que des vues
+_factory: SupabaseClientFactory = get_factory()
+
 # Client global service (ne jamais l'auth() avec un JWT user)
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase: ScopedClient = _factory.service()
+
+def get_client_factory() -> SupabaseClientFactory:
+    return _factory
 
-def service_client() -> Client:
-    """Client service tout neuf (zéro état, pas de JWT collant)."""
-    return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+def service_client() -> ScopedClient:
+    """Client service (vue partagée sur le pool, aucun état ni JWT collant)."""
+    return _factory.service()
 
-def _b64url_decode(s: str) -> bytes:
-    s += "=" * (-len(s) % 4)
-    return base64.urlsafe_b64decode(s.encode("utf-8"))
+def async_service_client() -> AsyncScopedClient:
+    """Pendant async de service_client() pour les routes `async def`."""
+    return _factory.async_service()
 
 def _extract_bearer(authorization: Optional[str]) -> Optional[str]:
     if not authorization:
@@ -31,20 +42,74 @@ def _extract_bearer(authorization: Optional[str]) -> Optional[str]:
     return parts[1].strip()
 
 def get_auth_uid_from_bearer(authorization: Optional[str]) -> Optional[str]:
+    """`sub` d'un JWT dont la signature a été vérifiée (None sinon)."""
+    token = _extract_bearer(authorization)
+    if not token:
+        return None
+    try:
+        return verifier.verify(token).get("sub")
+    except InvalidToken:
+        return None
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Dépendances FastAPI d'identité (JWT vérifié localement + cache auth_uid → Users.id)
+# ────────────────────────────────────────────────────────────────────────────────
+async def optional_identity(authorization: Optional[str] = Header(None)) -> Optional[Identity]:
+    """Identité de l'appelant, ou None si pas de Bearer / jeton invalide."""
     token = _extract_bearer(authorization)
     if not token:
         return None
     try:
-        payload = json.loads(_b64url_decode(token.split(".")[1]).decode("utf-8"))
-        return payload.get("sub")
-    except Exception:
+        return await aidentity_from_token(token)
+    except InvalidToken:
         return None
 
-def user_scoped_client(authorization: Optional[str]) -> Client:
-    """Client jetable scoppé utilisateur pour CETTE requête (RLS via auth.uid())."""
+async def current_identity(authorization: Optional[str] = Header(None)) -> Identity:
+    """Identité obligatoire : 401 si Bearer absent ou invalide."""
+    token = _extract_bearer(authorization)
+    if not token:
+        raise HTTPException(status_code=401, detail="Missing Bearer token")
+    try:
+        return await aidentity_from_token(token)
+    except InvalidToken:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+async def current_user_id(identity: Identity = Depends(current_identity)) -> int:
+    """Users.id de l'appelant : 401 si le compte Auth n'a pas de ligne users_map."""
+    if identity.user_id is None:
+        raise HTTPException(status_code=401, detail="Non authentifié")
+    return identity.user_id
+
+def user_scoped_client(authorization: Optional[str]) -> ScopedClient:
+    """Vue jetable scoppée utilisateur pour CETTE requête (RLS via auth.uid()), même pool."""
+    token = _extract_bearer(authorization)
+    if not token:
+        raise ValueError("Missing Bearer token")
+    return _factory.for_token(token)
+
+def async_user_scoped_client(authorization: Optional[str]) -> AsyncScopedClient:
+    """Pendant async de user_scoped_client() (mêmes règles, même pool)."""
     token = _extract_bearer(authorization)
     if not token:
         raise ValueError("Missing Bearer token")
-    sb = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-    sb.postgrest.auth(token)  # active RLS avec le JWT utilisateur
-    return sb
+    return _factory.async_for_token(token)
+
+# ────────────────────────────────────────────────────────────────────────────────
+# GET conditionnels (ETag / If-None-Match, services/etag.py)
+# ────────────────────────────────────────────────────────────────────────────────
+def conditional_get(request: Request, response: Response, resource: str,
+                    private: bool = False, **keys) -> Optional[Response]:
+    """
+    Pose l'ETag de `resource` sur `response` ; renvoie un 304 à retourner tel quel si
+    If-None-Match correspond (un seul appel etag_state). `private` : ETag propre au
+    jeton (réponses lues avec le client RLS de l'appelant).
+    """
+    scope = (request.headers.get("authorization") or "") if private else None
+    etag = resource_etag(supabase, resource, request.url.query, scope, **keys)
+    if etag is None:
+        return None
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
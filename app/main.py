@@ -21,7 +21,13 @@ import os
 # ← NOUVEAU : Import pour le scheduler
 from contextlib import asynccontextmanager
 from app.cron.scheduler import init_scheduler, shutdown_scheduler
+from app.deps import async_service_client, get_client_factory
+from app.services import leaderboard, outbox
+from app.services.submission import OBSERVATIONS_PIPELINE
+from app import metrics
+from fastapi.responses import PlainTextResponse
 import logging
+import time
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -32,12 +38,19 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Démarrage de l'application...")
     init_scheduler()  # Démarrer les cron jobs
+    if OBSERVATIONS_PIPELINE == "outbox" and outbox.OUTBOX_IN_PROCESS:
+        outbox.start_worker(async_service_client())  # traitement différé des soumissions
+    leaderboard.start_refresher(async_service_client())  # classement en mémoire de /classement
     
     yield
     
     # Shutdown
     logger.info("🛑 Arrêt de l'application...")
     shutdown_scheduler()  # Arrêter les cron jobs
+    await outbox.stop_worker()
+    await leaderboard.stop_refresher()
+    get_client_factory().close()  # fermer les connexions du pool Supabase
+    await get_client_factory().aclose()
 
 
 # ← MODIFIÉ : Ajouter lifespan à FastAPI
@@ -60,6 +73,11 @@ def _echo(request: Request):
         "headers": dict(request.headers),
     }
 
+@app.get("/_pool")
+def _pool():
+    """Occupation du pool HTTP Supabase (dimensionnement SUPABASE_POOL_*)."""
+    return {"ok": True, **get_client_factory().pool_stats()}
+
 @app.middleware("http")
 async def log_auth_header(request: Request, call_next):
     auth = request.headers.get("authorization")
@@ -68,6 +86,28 @@ async def log_auth_header(request: Request, call_next):
     resp = await call_next(request)
     return resp
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Métriques Prometheus : latences HTTP, allers-retours et temps Supabase par route/table."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.middleware("http")
+async def db_metrics(request: Request, call_next):
+    # compte les appels Supabase de CETTE requête (ContextVar héritée par la tâche de la route)
+    stats, token = metrics.begin_request()
+    t0 = time.perf_counter()
+    try:
+        resp = await call_next(request)
+    finally:
+        metrics.end_request(token)
+    route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+    if route != "/metrics":
+        metrics.observe_request(route, request.method, time.perf_counter() - t0, stats)
+    if metrics.DEBUG_HEADERS:
+        resp.headers["X-DB-Roundtrips"] = str(stats.roundtrips)
+        resp.headers["X-DB-Time-Ms"] = f"{stats.db_seconds * 1000:.1f}"
+    return resp
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
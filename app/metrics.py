@@ -0,0 +1,232 @@
+# app/metrics.py
+"""
+Instrumentation des allers-retours Supabase (PostgREST) et export Prometheus.
+
+Chaque appel passant par la fabrique (`SupabaseClientFactory.request/arequest`,
+donc tout `.execute()` des clients de l'app) est enregistré : table (ou
+`rpc/<fonction>`), verbe (select, count, insert, upsert, update, delete, rpc),
+latence, nombre de lignes, statut. Les appels sont regroupés par requête HTTP
+via une ContextVar posée par le middleware de main.py (elle suit les
+`asyncio.gather` et le threadpool FastAPI).
+
+Exposé sur GET /metrics (format texte Prometheus) :
+  http_request_duration_seconds{route,method}   histogramme
+  db_roundtrips_per_request{route}               histogramme
+  db_time_per_request_seconds{route}             histogramme
+  db_query_duration_seconds{table,verb}          histogramme
+  db_query_rows{table,verb}                      histogramme
+  db_queries_total{table,verb,status}            compteur
+
+APP_DEBUG=1 ajoute X-DB-Roundtrips / X-DB-Time-Ms aux réponses.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+DEBUG_HEADERS = os.getenv("APP_DEBUG", "").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROUNDTRIP_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Registre minimal (pas de dépendance prometheus_client)
+# ────────────────────────────────────────────────────────────────────────────────
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], le: Optional[str] = None) -> str:
+    parts = ['%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)]
+    if le is not None:
+        parts.append('le="%s"' % le)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labelnames: Tuple[str, ...], buckets: Iterable[float]):
+        self.name, self.doc, self.labelnames = name, doc, labelnames
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List] = {}  # labels → [counts par bucket, somme, total]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            if i < len(self.buckets):
+                s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for labels, (counts, total_sum, count) in sorted(series.items()):
+            cum = 0
+            for b, c in zip(self.buckets, counts):
+                cum += c
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, str(b))} {cum}")
+            out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, '+Inf')} {count}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total_sum}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return out
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labelnames: Tuple[str, ...]):
+        self.name, self.doc, self.labelnames = name, doc, labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple[str, ...], value: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, v in sorted(values.items()):
+            out.append(f"{self.name}{_labels(self.labelnames, labels)} {v}")
+        return out
+
+
+HTTP_DURATION = Histogram("http_request_duration_seconds", "Durée des requêtes HTTP.", ("route", "method"), LATENCY_BUCKETS)
+REQUEST_ROUNDTRIPS = Histogram("db_roundtrips_per_request", "Allers-retours Supabase par requête HTTP.", ("route",), ROUNDTRIP_BUCKETS)
+REQUEST_DB_TIME = Histogram("db_time_per_request_seconds", "Temps cumulé passé en appels Supabase par requête HTTP.", ("route",), LATENCY_BUCKETS)
+QUERY_DURATION = Histogram("db_query_duration_seconds", "Latence d'un appel PostgREST.", ("table", "verb"), LATENCY_BUCKETS)
+QUERY_ROWS = Histogram("db_query_rows", "Lignes retournées par appel PostgREST.", ("table", "verb"), ROWS_BUCKETS)
+QUERIES = Counter("db_queries_total", "Appels PostgREST.", ("table", "verb", "status"))
+
+_REGISTRY = (HTTP_DURATION, REQUEST_ROUNDTRIPS, REQUEST_DB_TIME, QUERY_DURATION, QUERY_ROWS, QUERIES)
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Appels groupés par requête
+# ────────────────────────────────────────────────────────────────────────────────
+@dataclass
+class DbCall:
+    table: str
+    verb: str
+    seconds: float
+    rows: Optional[int]
+    status: int
+
+
+@dataclass
+class RequestStats:
+    calls: List[DbCall] = field(default_factory=list)
+
+    @property
+    def roundtrips(self) -> int:
+        return len(self.calls)
+
+    @property
+    def db_seconds(self) -> float:
+        return sum(c.seconds for c in self.calls)
+
+    def by_table(self) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        for c in self.calls:
+            key = f"{c.verb} {c.table}"
+            out[key] = out.get(key, 0) + 1
+        return out
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("db_request_stats", default=None)
+
+
+def begin_request() -> Tuple[RequestStats, object]:
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def end_request(token) -> None:
+    _current.reset(token)
+
+
+def current_request() -> Optional[RequestStats]:
+    return _current.get()
+
+
+def observe_request(route: str, method: str, seconds: float, stats: RequestStats) -> None:
+    HTTP_DURATION.observe((route, method), seconds)
+    REQUEST_ROUNDTRIPS.observe((route,), stats.roundtrips)
+    REQUEST_DB_TIME.observe((route,), stats.db_seconds)
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Observation d'un appel (appelé par la fabrique)
+# ────────────────────────────────────────────────────────────────────────────────
+def _table_and_verb(method: str, path: str, headers) -> Tuple[str, str]:
+    table = path.split("?", 1)[0].strip("/")
+    if table.startswith("rpc/"):
+        return table, "rpc"
+    prefer = (headers.get("prefer") or "") if headers is not None else ""
+    if method == "GET":
+        return table, "select"
+    if method == "HEAD":
+        return table, "count"
+    if method == "POST":
+        return table, "upsert" if "resolution=" in prefer else "insert"
+    if method == "PATCH":
+        return table, "update"
+    if method == "DELETE":
+        return table, "delete"
+    return table, method.lower()
+
+
+def _row_count(res: httpx.Response) -> Optional[int]:
+    cr = res.headers.get("content-range")
+    if cr and "-" in cr.split("/", 1)[0]:
+        lo, hi = cr.split("/", 1)[0].split("-", 1)
+        try:
+            return int(hi) - int(lo) + 1
+        except ValueError:
+            pass
+    body = res.content
+    if not body:
+        return 0
+    if body[:1] == b"{":
+        return 1
+    if body[:1] == b"[":
+        try:
+            return len(json.loads(body))
+        except ValueError:
+            return None
+    return None
+
+
+def record_call(method: str, path: str, headers, res: Optional[httpx.Response], seconds: float) -> None:
+    table, verb = _table_and_verb(method, path, headers)
+    status = res.status_code if res is not None else 0
+    rows = _row_count(res) if res is not None and res.is_success else None
+
+    QUERY_DURATION.observe((table, verb), seconds)
+    if rows is not None:
+        QUERY_ROWS.observe((table, verb), rows)
+    QUERIES.inc((table, verb, str(status)))
+
+    stats = _current.get()
+    if stats is not None:
+        stats.calls.append(DbCall(table, verb, seconds, rows, status))
@@ -0,0 +1,111 @@
+# app/offline/__init__.py
+"""
+Backend Supabase hors ligne, dans le process : profiler / tester / benchmarker
+les endpoints sans projet Supabase ni réseau.
+
+Activation (lu par supabase_pool.get_factory) :
+  SUPABASE_BACKEND=offline
+  OFFLINE_DB=:memory:            tables en mémoire (défaut) ; sinon chemin d'un fichier SQLite
+  OFFLINE_SEED_USERS=100         en mémoire uniquement : jeu de données généré au démarrage
+  OFFLINE_LATENCY_MS=0           latence simulée par aller-retour
+  OFFLINE_LATENCY_JITTER_MS=0    ± aléa uniforme sur cette latence
+
+Un fichier SQLite réaliste (100k users, 50M observations) se génère avec :
+  python -m app.cli.generate_offline_data --db offline.db --users 100000 --observations 50000000
+
+L'identité : /auth/v1/user renvoie le `sub` du JWT sans vérifier la signature
+(hors ligne uniquement). Les `auth_uid` générés valent offline_auth_uid(user_id).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Optional
+
+from .backend import (
+    RPCS,
+    AsyncOfflineTransport,
+    OfflinePostgrest,
+    SyncOfflineTransport,
+    register_rpc,
+)
+from .store import Conflict, Filter, MemoryStore, Query, SqliteStore, Store, StoreError
+
+OFFLINE_URL = "http://offline.supabase"
+OFFLINE_KEY = "offline-service-role-key"
+
+
+def offline_enabled() -> bool:
+    return os.getenv("SUPABASE_BACKEND", "").strip().lower() == "offline"
+
+
+def offline_auth_uid(user_id: int) -> str:
+    """auth_uid déterministe des utilisateurs générés (JWT de test : sub = cette valeur)."""
+    return f"00000000-0000-4000-8000-{int(user_id):012d}"
+
+
+def offline_token(user_id: int, ttl: int = 3600) -> str:
+    """
+    JWT d'un utilisateur généré. Signé avec SUPABASE_JWT_SECRET s'il est défini
+    (vérification locale), sinon avec une clé jetable (repli /auth/v1/user).
+    """
+    from jose import jwt
+
+    now = int(time.time())
+    claims = {
+        "sub": offline_auth_uid(user_id), "aud": os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated"),
+        "role": "authenticated", "email": f"user{int(user_id)}@offline.test", "iat": now, "exp": now + ttl,
+    }
+    return jwt.encode(claims, os.getenv("SUPABASE_JWT_SECRET") or "offline-jwt-secret", algorithm="HS256")
+
+
+def open_store(path: Optional[str] = None) -> Store:
+    path = path if path is not None else os.getenv("OFFLINE_DB", ":memory:")
+    if path in ("", ":memory:", "memory"):
+        return MemoryStore()
+    return SqliteStore(path)
+
+
+_backend: Optional[OfflinePostgrest] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> OfflinePostgrest:
+    """Backend process-wide, créé depuis l'environnement (et peuplé s'il est en mémoire)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                store = open_store()
+                backend = OfflinePostgrest(
+                    store,
+                    latency=float(os.getenv("OFFLINE_LATENCY_MS", "0")) / 1000.0,
+                    jitter=float(os.getenv("OFFLINE_LATENCY_JITTER_MS", "0")) / 1000.0,
+                )
+                if isinstance(store, MemoryStore):
+                    from .generate import generate
+                    generate(store, users=int(os.getenv("OFFLINE_SEED_USERS", "100")))
+                _backend = backend
+    return _backend
+
+
+def offline_factory(backend: Optional[OfflinePostgrest] = None):
+    """SupabaseClientFactory dont les deux clients httpx parlent au backend hors ligne."""
+    from ..supabase_pool import SupabaseClientFactory
+
+    backend = backend or get_backend()
+    return SupabaseClientFactory(
+        OFFLINE_URL,
+        OFFLINE_KEY,
+        transport=SyncOfflineTransport(backend),
+        async_transport=AsyncOfflineTransport(backend),
+    )
+
+
+__all__ = [
+    "OFFLINE_URL", "OFFLINE_KEY", "RPCS", "Conflict", "Filter", "MemoryStore", "OfflinePostgrest",
+    "Query", "SqliteStore", "Store", "StoreError", "SyncOfflineTransport", "AsyncOfflineTransport",
+    "get_backend", "offline_auth_uid", "offline_enabled", "offline_factory", "offline_token", "open_store",
+    "register_rpc",
+]
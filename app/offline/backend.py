@@ -0,0 +1,752 @@
+# app/offline/backend.py
+"""
+PostgREST + GoTrue minimaux au-dessus d'un `Store`, branchés sur les
+transports httpx de la fabrique : le code de l'app (builders postgrest-py,
+`execute()`, métriques) tourne à l'identique, seule la destination change.
+
+Sous-ensemble couvert (ce que l'app utilise) :
+  GET/HEAD  select (colonnes, alias), eq/neq/gt/gte/lt/lte/in/is/like/ilike (+ not.),
+            order, limit/offset (range), single / maybe_single, count=exact
+  POST      insert, upsert (merge / ignore-duplicates, on_conflict)
+  PATCH     update      DELETE    delete
+  POST /rpc/<fn>        fonctions enregistrées dans RPCS (register_rpc)
+  /auth/v1/user         renvoie le `sub` du JWT, SANS vérification de signature
+  /auth/v1/.well-known/jwks.json   vide (vérification locale via SUPABASE_JWT_SECRET)
+
+Triggers reproduits : calcul Solution/Etat/Score/Marge_Erreur à l'insertion
+d'une Observation, `created_at` par défaut.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import httpx
+
+from .store import Conflict, Filter, Query, Store, StoreError
+
+_RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+_OPS = {"eq", "neq", "gt", "gte", "lt", "lte", "in", "is", "like", "ilike"}
+
+RpcFn = Callable[[Store, Dict[str, Any]], Any]
+RPCS: Dict[str, RpcFn] = {}
+
+
+def register_rpc(name: str):
+    """Déclare une fonction SQL émulée : `fn(store, params) -> données JSON`."""
+    def deco(fn: RpcFn) -> RpcFn:
+        RPCS[name] = fn
+        return fn
+    return deco
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Triggers / défauts
+# ────────────────────────────────────────────────────────────────────────────────
+def solution_of(op: str, a: int, b: int) -> int:
+    op = (op or "").strip().lower()
+    if op.startswith("add"):
+        return a + b
+    if op.startswith("sous"):
+        return a - b
+    return a * b
+
+
+def observation_trigger(table: str, row: Dict[str, Any]) -> None:
+    """Équivalent du trigger DB sur Observations (colonnes calculées)."""
+    if table != "Observations" or row.get("Operateur_Un") is None or row.get("Operateur_Deux") is None:
+        return
+    sol = solution_of(row.get("Operation"), int(row["Operateur_Un"]), int(row["Operateur_Deux"]))
+    prop = row.get("Proposition")
+    ok = prop is not None and int(prop) == sol
+    row["Solution"] = sol
+    row["Etat"] = "VRAI" if ok else "FAUX"
+    row["Score"] = 1 if ok else -1
+    row["Marge_Erreur"] = abs(int(prop) - sol) if prop is not None else None
+
+
+def created_at_default(table: str, row: Dict[str, Any]) -> None:
+    row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+
+
+def _activity_upsert(store: Store, deltas: List[Dict[str, Any]]) -> None:
+    from ..services.activity import ACTIVITY_KEY, ACTIVITY_TABLE, merge_day
+
+    for delta in deltas:
+        current = _first(store, ACTIVITY_TABLE, [Filter(c, "eq", delta[c]) for c in ACTIVITY_KEY])
+        store.upsert(ACTIVITY_TABLE, [merge_day(current, delta)], list(ACTIVITY_KEY))
+
+
+def observations_after_insert(store: Store, inserted: List[Dict[str, Any]]) -> None:
+    """
+    Équivalent des triggers AFTER INSERT sur Observations : stats_entrainement_ingest
+    (migrations 018 et 019 : Stats_Entrainement, Activite_Jour) et score_cumule_ingest
+    (migration 021 : Score_Cumule).
+    """
+    from ..services.activity import observation_deltas
+    from ..services.score_series import SCORE_SERIES_TABLE, extend
+    from ..services.session_stats import KEY_COLUMNS, SESSION_STATS_TABLE, merge_row, session_rows
+
+    eids = list({o["Entrainement_Id"] for o in inserted if o.get("Entrainement_Id") is not None})
+    if not eids:
+        return
+    entr, _ = store.select(Query("Entrainement", [Filter("id", "in", eids)]))
+    sessions = {e["id"]: e for e in entr}
+    by_user: Dict[int, List[Dict[str, Any]]] = {}
+    for o in inserted:
+        uid = (sessions.get(o.get("Entrainement_Id")) or {}).get("Users_Id")
+        if uid is not None:
+            by_user.setdefault(uid, []).append(o)
+    with store.lock:
+        for delta in session_rows(inserted, sessions):
+            current = _first(store, SESSION_STATS_TABLE, [Filter(c, "eq", delta[c]) for c in KEY_COLUMNS])
+            store.upsert(SESSION_STATS_TABLE, [merge_row(current, delta)], list(KEY_COLUMNS))
+        _activity_upsert(store, observation_deltas(inserted, sessions))
+        for uid in sorted(by_user):
+            current = _first(store, SCORE_SERIES_TABLE, [Filter("Users_Id", "eq", uid)])
+            series = extend(current or {"Users_Id": uid}, by_user[uid])
+            store.upsert(SCORE_SERIES_TABLE, [series], ["Users_Id"])
+
+
+def activity_sessions_trigger(store: Store, inserted: List[Dict[str, Any]]) -> None:
+    """Équivalent du trigger activite_jour_sessions (migration 019), après création d'entraînements."""
+    from ..services.activity import session_deltas
+
+    with store.lock:
+        _activity_upsert(store, session_deltas(inserted))
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# RPC émulées
+# ────────────────────────────────────────────────────────────────────────────────
+@register_rpc("get_global_ranking")
+def _get_global_ranking(store: Store, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Fonction SQL non versionnée dans ce dépôt ; approximation : niveau moyen des
+    trois opérations (Position_Courante), trié décroissant.
+    """
+    rows, _ = store.select(Query("Position_Courante"))
+    levels: Dict[int, List[float]] = {}
+    for r in rows:
+        levels.setdefault(int(r["Users_Id"]), []).append(float(r.get("Niveau") or 0))
+    ranking = [{"user_id": uid, "weighted_level": round(sum(v) / 3.0, 4)} for uid, v in levels.items()]
+    ranking.sort(key=lambda r: (-r["weighted_level"], r["user_id"]))
+    return ranking
+
+
+@register_rpc("sum_user_score")
+def _sum_user_score(store: Store, params: Dict[str, Any]) -> int:
+    entr, _ = store.select(Query("Entrainement", [Filter("Users_Id", "eq", int(params["uid"]))]))
+    ids = [e["id"] for e in entr]
+    if not ids:
+        return 0
+    obs, _ = store.select(Query("Observations", [Filter("Entrainement_Id", "in", ids)]))
+    return sum(int(o.get("Score") or 0) for o in obs)
+
+
+def _first(store: Store, table: str, filters: List[Filter], order=None) -> Optional[Dict[str, Any]]:
+    rows, _ = store.select(Query(table, filters, order or [], 1))
+    return rows[0] if rows else None
+
+
+def _max_id(store: Store, table: str, filters: List[Filter], column: str = "id") -> Optional[int]:
+    row = _first(store, table, filters, [(column, True, None)])
+    return row[column] if row else None
+
+
+@register_rpc("etag_state")
+def _etag_state(store: Store, params: Dict[str, Any]) -> Dict[str, Any]:
+    """etag_state (migration 020) : dernières observations / suivis dont dépendent les ETags."""
+    uid, eid = params.get("p_user_id"), params.get("p_entrainement_id")
+    state: Dict[str, Any] = {"observation": None, "suivi": None, "positions": None, "parcours": None,
+                             "entrainement": None}
+    if uid is not None:
+        uid = int(uid)
+        state["observation"] = _max_id(store, "Stats_Entrainement", [Filter("Users_Id", "eq", uid)],
+                                       "last_observation_id")
+        state["suivi"] = _max_id(store, "Suivi_Parcours", [Filter("Users_Id", "eq", uid)])
+        rows, _ = store.select(Query("Position_Courante", [Filter("Users_Id", "eq", uid)]))
+        state["positions"] = {r["Type_Operation"]: [
+            r.get("Parcours_Id"), r.get("Suivi_Id"),
+            _max_id(store, "Observations", [Filter("Parcours_Id", "eq", r.get("Parcours_Id"))]),
+        ] for r in rows} or None
+    pids = params.get("p_parcours_ids") or []
+    if pids:
+        state["parcours"] = {str(p): _max_id(store, "Observations", [Filter("Parcours_Id", "eq", int(p))]) for p in pids}
+    if eid is not None:
+        state["entrainement"] = _max_id(store, "Observations", [Filter("Entrainement_Id", "eq", int(eid))])
+    return state
+
+
+def _recent_entrainements(store: Store, user_id: int) -> List[int]:
+    rows, _ = store.select(Query("Entrainement", [Filter("Users_Id", "eq", user_id)], [("id", True, None)], 200))
+    return [r["id"] for r in rows]
+
+
+def _append_suivi_position(store: Store, user_id: int, parcours: Dict[str, Any], evolution: str,
+                           taux: float, last_obs: Optional[int]) -> Dict[str, Any]:
+    """append_suivi_position (migrations 011, 017) : Suivi_Parcours + Position_Courante, compteurs remis à zéro."""
+    from ..services.position_store import position_after_suivi
+
+    suivi = store.insert("Suivi_Parcours", [{
+        "Users_Id": user_id, "Parcours_Id": parcours["id"], "Date": datetime.now().date().isoformat(),
+        "Type_Evolution": evolution, "Taux_Reussite": taux, "Derniere_Observation_Id": last_obs,
+    }])[0]
+    pos = position_after_suivi(suivi, parcours)
+    if not store.upsert("Position_Courante", [pos], ["Users_Id", "Type_Operation"], ignore_duplicates=True):
+        # ON CONFLICT ... WHERE : n'avance que vers un suivi plus récent
+        key = [Filter("Users_Id", "eq", user_id), Filter("Type_Operation", "eq", pos["Type_Operation"])]
+        store.update("Position_Courante", key + [Filter("Suivi_Id", "lt", suivi["id"])], pos) \
+            or store.update("Position_Courante", key + [Filter("Suivi_Id", "is", None)], pos)
+    return suivi
+
+
+def _current_parcours_id(store: Store, user_id: int, op: str) -> Tuple[Optional[int], Optional[int]]:
+    """(Parcours_Id, Derniere_Observation_Id) : Position_Courante, sinon dernier suivi du type."""
+    pos = _first(store, "Position_Courante", [Filter("Users_Id", "eq", user_id), Filter("Type_Operation", "eq", op)])
+    if pos:
+        return pos["Parcours_Id"], pos.get("Derniere_Observation_Id")
+    ladder, _ = store.select(Query("Parcours", [Filter("Type_Operation", "eq", op)]))
+    suivi = _first(store, "Suivi_Parcours", [
+        Filter("Users_Id", "eq", user_id), Filter("Parcours_Id", "in", [p["id"] for p in ladder]),
+    ], [("id", True, None)])
+    if suivi:
+        return suivi["Parcours_Id"], suivi.get("Derniere_Observation_Id")
+    return None, None
+
+
+def _evolve(store: Store, user_id: int, op: str, session: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Boucle d'évolution de process_session pour une opération (règles d'EvolutionService) :
+    compteurs de fenêtre de Position_Courante (migration 017) augmentés des observations de la session.
+    """
+    from ..services.evolution import EvolutionService
+    from ..services.position_store import window_add, window_valid
+
+    ladder, _ = store.select(Query("Parcours", [Filter("Type_Operation", "eq", op)], [("Niveau", False, None)]))
+    if not ladder:
+        return None
+    parcours_id, last_obs = _current_parcours_id(store, user_id, op)
+    if parcours_id is None:
+        parcours_id, last_obs = ladder[0]["id"], None
+        _append_suivi_position(store, user_id, ladder[0], "initialisation", 0.0, None)
+    cur = next((p for p in ladder if p["id"] == parcours_id), None)
+    if cur is None:
+        return None
+    critere = int(cur.get("Critere") or 0)
+
+    pos_filters = [Filter("Users_Id", "eq", user_id), Filter("Type_Operation", "eq", op)]
+    pos = _first(store, "Position_Courante", pos_filters)
+    if window_valid(pos):
+        counters = window_add(pos, session, op)
+    else:
+        # compteurs absents ou d'un autre suivi : recomptage depuis le dernier suivi
+        filters = [Filter("Entrainement_Id", "in", _recent_entrainements(store, user_id)), Filter("Operation", "eq", op)]
+        if last_obs:
+            filters.append(Filter("id", "gt", int(last_obs)))
+        window, _ = store.select(Query("Observations", filters))
+        counters = {
+            "Total_Fenetre": len(window),
+            "Corrects_Fenetre": sum(1 for o in window if o.get("Etat") == "VRAI"),
+            "Fenetre_Depuis_Id": int(last_obs or 0),
+            "Fenetre_Dernier_Id": max([o["id"] for o in window], default=int(last_obs or 0)),
+        }
+    if pos:
+        store.update("Position_Courante", pos_filters, counters)
+    total, corrects = counters["Total_Fenetre"], counters["Corrects_Fenetre"]
+    if critere <= 0 or total < critere:
+        return None
+    last_id = counters["Fenetre_Dernier_Id"]
+    pct = corrects / total
+
+    prev_p = next((p for p in reversed(ladder) if p["Niveau"] < cur["Niveau"]), None)
+    next_p = next((p for p in ladder if p["Niveau"] > cur["Niveau"]), None)
+    decision = EvolutionService._decide(pct, has_prev=prev_p is not None, has_next=next_p is not None)
+    arrival = next_p if decision == "progression" else prev_p if decision == "régression" else cur
+
+    suivi = _append_suivi_position(store, user_id, arrival, decision, round(pct, 4), last_id)
+    return {
+        "suivi": suivi,
+        "operation": op.lower(),
+        "from": {"parcours_id": cur["id"], "niveau": cur["Niveau"]},
+        "to": {"parcours_id": arrival["id"], "niveau": arrival["Niveau"]},
+        "type": decision,
+        "taux_reussite": round(pct, 4),
+        "window": {"total": total, "corrects": corrects, "last_id_included": last_id},
+    }
+
+
+def _insert_session(store: Store, params: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[int], List[int]]:
+    """
+    Début de submit_observations / submit_observations_async : contrôles puis insertion
+    (troncature au Volume). Retourne (réponse anticipée ou None, Users_Id, ids insérés).
+    """
+    eid = int(params["p_entrainement_id"])
+    entr = _first(store, "Entrainement", [Filter("id", "eq", eid)])
+    if entr is None:
+        return {"status": "not_found"}, None, []
+    key = params.get("p_idempotency_key")
+    if key is not None:
+        # rejeu (migration 015) : réponse d'origine tant que la clé n'a pas expiré
+        kept = _first(store, "Idempotency_Keys", [Filter("Entrainement_Id", "eq", eid), Filter("key", "eq", key),
+                                                  Filter("expires_at", "gt", _now())])
+        if kept:
+            return {**kept["response"], "replayed": True}, None, []
+    if _first(store, "Observations", [Filter("Entrainement_Id", "eq", eid)]):
+        return {"status": "already_processed"}, None, []
+
+    rows = list(params.get("p_rows") or [])
+    if entr.get("Volume") is not None:
+        rows = rows[:int(entr["Volume"])]
+    inserted = store.insert("Observations", [{
+        "Entrainement_Id": eid,
+        "Parcours_Id": int(r["Parcours_Id"]),
+        "Operateur_Un": int(r["Operateur_Un"]),
+        "Operateur_Deux": int(r["Operateur_Deux"]),
+        "Operation": r["Operation"],
+        "Proposition": int(r["Proposition"]),
+        "Correction": r.get("Correction") or "NON",
+        "Temps_Seconds": int(r.get("Temps_Seconds") or 0),
+    } for r in rows])
+    observations_after_insert(store, inserted)
+    ids = [o["id"] for o in inserted]
+    if entr.get("Users_Id") is None:
+        return {"status": "ok", "user_id": None, "ids": ids, "evolutions": [], "positions": {}}, None, ids
+    return None, int(entr["Users_Id"]), ids
+
+
+def _process_session(store: Store, uid: int, eid: int, rules: str) -> Dict[str, Any]:
+    """process_session (migrations 014, 022) : scoring, classement, évolutions, positions d'une session insérée."""
+    from ..services.scoring_stats import STATS_TABLE, RollingWindow, history_windows
+    from ..services.submission import classement_payloads, score_session, session_keys
+
+    ops = ("Addition", "Soustraction", "Multiplication")
+    inserted, _ = store.select(Query("Observations", [Filter("Entrainement_Id", "eq", eid)], [("id", False, None)]))
+    ids = [o["id"] for o in inserted]
+
+    # scoring (règle p_rules) : fenêtres Stats_Scoring (migration 012), clés absentes amorcées depuis
+    # les 2000 dernières observations des 200 derniers entraînements
+    keys = session_keys(inserted)
+    stored, _ = store.select(Query(STATS_TABLE, [Filter("Users_Id", "eq", uid)]))
+    windows = {w.key: w for w in map(RollingWindow.from_row, stored) if w.key in keys}
+    missing = keys - windows.keys()
+    if missing:
+        pool, _ = store.select(Query("Observations", [Filter("Entrainement_Id", "in", _recent_entrainements(store, uid))],
+                                     [("id", True, None)], 2000))
+        current = set(ids)
+        windows.update(history_windows(uid, [o for o in pool if o["id"] not in current], missing))
+    for p in score_session(uid, inserted, windows, rules):
+        store.update("Observations", [Filter("id", "eq", p["id"])], {k: v for k, v in p.items() if k != "id"})
+    store.upsert(STATS_TABLE, [w.to_row() for w in windows.values()], ["Users_Id", "Parcours_Id", "Operation"])
+
+    # classement + users_map
+    session, _ = store.select(Query("Observations", [Filter("Entrainement_Id", "eq", eid)]))
+    cl = _first(store, "Classement", [Filter("Users_Id", "eq", uid)]) or {}
+    um = _first(store, "users_map", [Filter("user_id", "eq", uid)]) or {}
+    classement, users_map = classement_payloads(uid, session, cl, um, datetime.now().date())
+    store.upsert("Classement", [classement], ["Users_Id"])
+    store.update("users_map", [Filter("user_id", "eq", uid)], users_map)
+
+    # évolutions, puis positions des trois opérations
+    batch_ops = {(o.get("Operation") or "").strip().lower() for o in inserted}
+    evolutions = [e for e in (_evolve(store, uid, op, inserted) for op in ops if op.lower() in batch_ops) if e]
+    positions = {}
+    for op in ops:
+        ladder, _ = store.select(Query("Parcours", [Filter("Type_Operation", "eq", op)], [("Niveau", False, None)]))
+        pid, _ = _current_parcours_id(store, uid, op)
+        p = next((x for x in ladder if x["id"] == pid), ladder[0] if ladder else None)
+        if p:
+            positions[op.lower()] = {"parcours_id": p["id"], "niveau": p["Niveau"], "critere": p["Critere"]}
+    return {"user_id": uid, "ids": ids, "evolutions": evolutions, "positions": positions,
+            "classement": {k: classement[k] for k in ("score_global", "score_week", "week_start")}}
+
+
+@register_rpc("submit_observations")
+def _submit_observations(store: Store, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    submit_observations (migrations 011 à 015) : mêmes étapes et mêmes règles que la
+    fonction SQL, sous le verrou du store. Pas de contrôle d'appartenance (hors ligne).
+    """
+    from ..services.scoring import RULES_SESSION
+
+    with store.lock:
+        early, uid, _ = _insert_session(store, params)
+        if early is not None:
+            return early
+        eid = int(params["p_entrainement_id"])
+        result = {"status": "ok", **_process_session(store, uid, eid, params.get("p_rules") or RULES_SESSION)}
+        _remember(store, params, uid, result)
+    return result
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _remember(store: Store, params: Dict[str, Any], uid: Optional[int], result: Dict[str, Any]) -> None:
+    """Réponse conservée 24 h sous la clé d'idempotence de la soumission (migration 015)."""
+    if params.get("p_idempotency_key") is None:
+        return
+    now = datetime.now(timezone.utc)
+    store.upsert("Idempotency_Keys", [{
+        "Entrainement_Id": int(params["p_entrainement_id"]), "key": params["p_idempotency_key"], "Users_Id": uid,
+        "response": result, "created_at": now.isoformat(), "expires_at": (now + timedelta(hours=24)).isoformat(),
+    }], ["Entrainement_Id", "key"])
+
+
+@register_rpc("increment_classement")
+def _increment_classement(store: Store, params: Dict[str, Any]) -> Dict[str, Any]:
+    """increment_classement (migration 016) : lecture et écriture sous le verrou du store."""
+    from ..services.submission import classement_increment
+
+    uid = int(params["p_user_id"])
+    with store.lock:
+        cl = _first(store, "Classement", [Filter("Users_Id", "eq", uid)]) or {}
+        um = _first(store, "users_map", [Filter("user_id", "eq", uid)])
+        classement, users_map = classement_increment(uid, cl, um or {}, int(params["p_delta_classement"]),
+                                                     int(params["p_delta_base"]), datetime.now().date())
+        store.upsert("Classement", [classement], ["Users_Id"])
+        if um is not None:
+            store.update("users_map", [Filter("user_id", "eq", uid)], users_map)
+    return {**{k: classement[k] for k in ("score_global", "score_week", "week_start")},
+            "score_base": users_map["score_base"] if um is not None else None}
+
+
+# ---- outbox (migration 014) ----
+
+
+@register_rpc("submit_observations_async")
+def _submit_observations_async(store: Store, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Insertion + évènement Outbox 'session_submitted' ; le traitement attend un worker."""
+    from ..services.scoring import RULES_SESSION
+
+    with store.lock:
+        early, uid, ids = _insert_session(store, params)
+        if early is not None:
+            return early
+        eid = int(params["p_entrainement_id"])
+        job = _first(store, "Outbox", [Filter("event", "eq", "session_submitted"), Filter("Entrainement_Id", "eq", eid)])
+        if job is None:
+            job = store.insert("Outbox", [{
+                "event": "session_submitted", "Entrainement_Id": eid, "Users_Id": uid,
+                "payload": {"rules": params.get("p_rules") or RULES_SESSION},
+                "status": "pending", "attempts": 0, "available_at": _now(), "updated_at": _now(),
+            }])[0]
+        result = {"status": "ok", "user_id": uid, "ids": ids, "job_id": job["id"]}
+        _remember(store, params, uid, result)
+    return result
+
+
+@register_rpc("claim_outbox_jobs")
+def _claim_outbox_jobs(store: Store, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    now = datetime.now(timezone.utc)
+    expired = (now - timedelta(seconds=int(params.get("p_lease_seconds") or 60))).isoformat()
+    with store.lock:
+        pending, _ = store.select(Query("Outbox", [Filter("status", "eq", "pending"), Filter("available_at", "lte", now.isoformat())]))
+        stale, _ = store.select(Query("Outbox", [Filter("status", "eq", "running"), Filter("locked_at", "lt", expired)]))
+        # FIFO par utilisateur : premier job non terminé de chacun
+        open_jobs, _ = store.select(Query("Outbox", [Filter("status", "in", ["pending", "running"])]))
+        first = {}
+        for j in open_jobs:
+            if j.get("Users_Id") is not None:
+                first[j["Users_Id"]] = min(first.get(j["Users_Id"], j["id"]), j["id"])
+        ready = [j for j in pending + stale if j.get("Users_Id") is None or first[j["Users_Id"]] == j["id"]]
+        jobs = sorted(ready, key=lambda j: (j["available_at"], j["id"]))[:int(params.get("p_limit") or 4)]
+        return [store.update("Outbox", [Filter("id", "eq", j["id"])], {
+            "status": "running", "attempts": int(j.get("attempts") or 0) + 1,
+            "locked_by": params["p_worker"], "locked_at": now.isoformat(), "updated_at": now.isoformat(),
+        })[0] for j in jobs]
+
+
+@register_rpc("run_outbox_job")
+def _run_outbox_job(store: Store, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Hors ligne, pas de transaction : une erreur de _process_session laisse ses écritures partielles."""
+    from ..services.scoring import RULES_SESSION
+
+    with store.lock:
+        job = _first(store, "Outbox", [Filter("id", "eq", int(params["p_job_id"]))])
+        if job is None:
+            return {"status": "not_found"}
+        if job["status"] == "done":
+            return {"status": "done", "result": job.get("result")}
+        if job["status"] != "running" or job.get("locked_by") != params["p_worker"]:
+            return {"status": "lost"}
+        if job["event"] != "session_submitted":
+            raise StoreError(f"évènement Outbox inconnu : {job['event']}")
+        if job.get("Users_Id") is None:
+            result = {"evolutions": [], "positions": {}}
+        else:
+            rules = (job.get("payload") or {}).get("rules") or RULES_SESSION
+            result = _process_session(store, int(job["Users_Id"]), int(job["Entrainement_Id"]), rules)
+        store.update("Outbox", [Filter("id", "eq", job["id"])], {
+            "status": "done", "result": result, "last_error": None,
+            "locked_by": None, "locked_at": None, "updated_at": _now(),
+        })
+    return {"status": "done", "result": result}
+
+
+@register_rpc("fail_outbox_job")
+def _fail_outbox_job(store: Store, params: Dict[str, Any]) -> str:
+    with store.lock:
+        job = _first(store, "Outbox", [Filter("id", "eq", int(params["p_job_id"])), Filter("status", "eq", "running"),
+                                       Filter("locked_by", "eq", params["p_worker"])])
+        if job is None:
+            return "lost"
+        attempts = int(job.get("attempts") or 0)
+        status = "failed" if attempts >= int(params.get("p_max_attempts") or 5) else "pending"
+        store.update("Outbox", [Filter("id", "eq", job["id"])], {
+            "status": status,
+            "available_at": (datetime.now(timezone.utc) + timedelta(seconds=min(300, 2 ** attempts))).isoformat(),
+            "last_error": str(params.get("p_error") or "")[:2000],
+            "locked_by": None, "locked_at": None, "updated_at": _now(),
+        })
+    return status
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Traduction HTTP ↔ Store
+# ────────────────────────────────────────────────────────────────────────────────
+def coerce(v: str) -> Any:
+    if v in ("null", "true", "false"):
+        return {"null": None, "true": True, "false": False}[v]
+    try:
+        return int(v)
+    except ValueError:
+        try:
+            return float(v)
+        except ValueError:
+            return v
+
+
+def _split_list(raw: str) -> List[str]:
+    """`(a,"b,c",d)` → ['a', 'b,c', 'd']"""
+    out, cur, quoted = [], "", False
+    for ch in raw.strip()[1:-1]:
+        if ch == '"':
+            quoted = not quoted
+        elif ch == "," and not quoted:
+            out.append(cur)
+            cur = ""
+        else:
+            cur += ch
+    if cur or out:
+        out.append(cur)
+    return out
+
+
+def parse_filter(column: str, expr: str) -> Filter:
+    negate = expr.startswith("not.")
+    if negate:
+        expr = expr[4:]
+    op, _, raw = expr.partition(".")
+    if op not in _OPS:
+        raise StoreError(f"opérateur non supporté hors ligne : {op}")
+    if op == "in":
+        value: Any = [coerce(x) for x in _split_list(raw)]
+    elif op in ("like", "ilike"):
+        value = raw.replace("*", "%")
+    else:
+        value = coerce(raw)
+    return Filter(column, op, value, negate)
+
+
+def parse_order(raw: str) -> List[Tuple[str, bool, Optional[bool]]]:
+    out = []
+    for part in filter(None, raw.split(",")):
+        bits = part.split(".")
+        desc = "desc" in bits[1:]
+        nulls_first = True if "nullsfirst" in bits[1:] else False if "nullslast" in bits[1:] else None
+        out.append((bits[0], desc, nulls_first))
+    return out
+
+
+def parse_columns(raw: Optional[str]) -> Optional[List[Tuple[str, str]]]:
+    """select=... → [(clé renvoyée, colonne)] ; None = toutes."""
+    if not raw or raw.strip() == "*":
+        return None
+    out = []
+    for part in (p.strip() for p in raw.split(",")):
+        if not part:
+            continue
+        if "(" in part:
+            raise StoreError("embedding de tables non supporté hors ligne")
+        if part == "*":
+            return None
+        alias, _, col = part.rpartition(":") if ":" in part and "::" not in part else ("", "", part)
+        col = col.split("::", 1)[0].strip().strip('"')  # "id" : identifiant cité, comme PostgREST
+        out.append((alias.strip().strip('"') or col, col))
+    return out
+
+
+def project(rows: List[Dict[str, Any]], cols: Optional[List[Tuple[str, str]]]) -> List[Dict[str, Any]]:
+    if cols is None:
+        return rows
+    return [{key: r.get(col) for key, col in cols} for r in rows]
+
+
+def _error(status: int, code: str, message: str, details: Optional[str] = None) -> httpx.Response:
+    return httpx.Response(status, json={"code": code, "message": message, "details": details, "hint": None})
+
+
+class OfflinePostgrest:
+    """Le « serveur » : une méthode `handle(request) -> response`, thread-safe."""
+
+    def __init__(self, store: Store, latency: float = 0.0, jitter: float = 0.0):
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.roundtrips = 0
+        self._lock = threading.Lock()
+        store.insert_hooks.extend([created_at_default, observation_trigger])
+
+    def delay(self) -> float:
+        """Latence simulée d'un aller-retour (secondes)."""
+        if not self.jitter:
+            return self.latency
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    # ---- entrée ----
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        with self._lock:
+            self.roundtrips += 1
+        path = request.url.path
+        try:
+            if path.startswith("/auth/v1/"):
+                return self._auth(request, path[len("/auth/v1/"):])
+            if not path.startswith("/rest/v1/"):
+                return _error(404, "PGRST000", f"chemin inconnu : {path}")
+            name = path[len("/rest/v1/"):]
+            if name.startswith("rpc/"):
+                return self._rpc(request, name[4:])
+            return self._table(request, name)
+        except Conflict as e:
+            return _error(409, "23505", str(e))
+        except StoreError as e:
+            return _error(400, "PGRST100", str(e))
+
+    # ---- GoTrue ----
+    def _auth(self, request: httpx.Request, route: str) -> httpx.Response:
+        if route == ".well-known/jwks.json":
+            return httpx.Response(200, json={"keys": []})
+        if route == "user":
+            auth = request.headers.get("authorization", "")
+            try:
+                payload = auth.split(" ", 1)[1].split(".")[1]
+                claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+            except Exception:
+                return httpx.Response(401, json={"code": 401, "msg": "invalid JWT"})
+            if not claims.get("sub"):
+                return httpx.Response(401, json={"code": 401, "msg": "invalid JWT"})
+            return httpx.Response(200, json={
+                "id": claims["sub"], "aud": claims.get("aud", "authenticated"), "email": claims.get("email"),
+                "role": claims.get("role", "authenticated"), "app_metadata": {}, "user_metadata": {},
+                "created_at": "2024-01-01T00:00:00Z",
+            })
+        return httpx.Response(404, json={"code": 404, "msg": f"route GoTrue non émulée : {route}"})
+
+    # ---- RPC ----
+    def _rpc(self, request: httpx.Request, fn: str) -> httpx.Response:
+        impl = RPCS.get(fn)
+        if impl is None:
+            return _error(404, "PGRST202", f"Could not find the function public.{fn} in the schema cache")
+        params = json.loads(request.content) if request.content else {}
+        if request.method in ("GET", "HEAD"):
+            params = {k: coerce(v) for k, v in parse_qsl(request.url.query.decode())}
+        return httpx.Response(200, json=impl(self.store, params or {}))
+
+    # ---- tables ----
+    def _table(self, request: httpx.Request, table: str) -> httpx.Response:
+        params = parse_qsl(request.url.query.decode(), keep_blank_values=True)
+        opts = {k: v for k, v in params if k in _RESERVED}
+        filters = [parse_filter(k, v) for k, v in params if k not in _RESERVED]
+        cols = parse_columns(opts.get("select"))
+        prefer = request.headers.get("prefer", "")
+        want_count = "count=" in prefer
+        single = "vnd.pgrst.object" in request.headers.get("accept", "")
+        minimal = "return=minimal" in prefer
+        method = request.method
+
+        if method == "POST":
+            body = json.loads(request.content) if request.content else []
+            payload = body if isinstance(body, list) else [body]
+            if opts.get("columns"):
+                wanted = [c.strip().strip('"') for c in opts["columns"].split(",")]
+                payload = [{c: p.get(c) for c in wanted} for p in payload]
+            if "resolution=" in prefer:
+                keys = [k.strip() for k in opts.get("on_conflict", "").split(",") if k.strip()]
+                rows = self.store.upsert(table, payload, keys, ignore_duplicates="ignore-duplicates" in prefer)
+            else:
+                rows = self.store.insert(table, payload)
+                if table == "Observations":
+                    observations_after_insert(self.store, rows)
+                elif table == "Entrainement":
+                    activity_sessions_trigger(self.store, rows)
+            return self._respond(201, project(rows, cols), len(rows) if want_count else None, 0, single, minimal)
+
+        if method == "PATCH":
+            values = json.loads(request.content) if request.content else {}
+            rows = self.store.update(table, filters, values)
+            return self._respond(200, project(rows, cols), len(rows) if want_count else None, 0, single, minimal)
+
+        if method == "DELETE":
+            rows = self.store.delete(table, filters)
+            return self._respond(200, project(rows, cols), len(rows) if want_count else None, 0, single, minimal)
+
+        limit = int(opts["limit"]) if opts.get("limit") not in (None, "") else None
+        offset = int(opts.get("offset") or 0)
+        q = Query(table, filters, parse_order(opts.get("order", "")), limit, offset)
+        rows, total = self.store.select(q, count=want_count)
+        resp = self._respond(200, project(rows, cols), total if want_count else None, offset, single, False)
+        if method == "HEAD":
+            return httpx.Response(resp.status_code, headers={"content-range": resp.headers.get("content-range", "*/*")})
+        return resp
+
+    @staticmethod
+    def _respond(status: int, rows: List[Dict[str, Any]], total: Optional[int], offset: int,
+                 single: bool, minimal: bool) -> httpx.Response:
+        span = f"{offset}-{offset + len(rows) - 1}" if rows else "*"
+        headers = {"content-range": f"{span}/{'*' if total is None else total}"}
+        if single:
+            if len(rows) != 1:
+                return httpx.Response(406, json={
+                    "code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned",
+                    "details": f"The result contains {len(rows)} rows", "hint": None,
+                }, headers=headers)
+            return httpx.Response(status, json=rows[0], headers=headers)
+        if minimal:
+            return httpx.Response(status, headers=headers)
+        return httpx.Response(status, json=rows, headers=headers)
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Transports httpx (un par client de la fabrique)
+# ────────────────────────────────────────────────────────────────────────────────
+class SyncOfflineTransport(httpx.BaseTransport):
+    def __init__(self, backend: OfflinePostgrest):
+        self.backend = backend
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        lat = self.backend.delay()
+        if lat:
+            time.sleep(lat)
+        return self.backend.handle(request)
+
+
+class AsyncOfflineTransport(httpx.AsyncBaseTransport):
+    def __init__(self, backend: OfflinePostgrest):
+        self.backend = backend
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        lat = self.backend.delay()
+        if lat:
+            await asyncio.sleep(lat)
+        return self.backend.handle(request)
@@ -0,0 +1,246 @@
+# app/offline/generate.py
+"""
+Jeu de données synthétique et cohérent pour le backend hors ligne.
+
+Par utilisateur : une compétence tirée au hasard, un nombre de sessions à queue
+lourde (Pareto : quelques gros joueurs, beaucoup d'occasionnels), des sessions
+mixtes de 10 exercices par opération étalées sur `days` jours. Les niveaux
+évoluent comme dans EvolutionService (fenêtre de `Critere` observations,
+> 90 % → progression, < 50 % → régression), ce qui produit des Suivi_Parcours,
+Position_Courante, Stats_Entrainement, Activite_Jour, Score_Cumule, Classement
+et users_map cohérents avec les Observations.
+
+Écriture en flux par paquets (`Store.bulk_insert`) : la mémoire reste bornée
+quel que soit le volume.
+"""
+from __future__ import annotations
+
+import logging
+import random
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ..services.score_series import CHECKPOINT
+from .store import Store
+
+logger = logging.getLogger(__name__)
+
+OPS = ("Addition", "Soustraction", "Multiplication")
+NIVEAUX = 10
+CRITERE = 20
+EXOS_PAR_OP = 10
+OBS_PAR_USER = 300
+BATCH = 50_000
+
+PARCOURS_COLS = ("id", "Type_Operation", "Niveau", "Critere",
+                 "Operateur1_Min", "Operateur1_Max", "Operateur2_Min", "Operateur2_Max")
+USERS_COLS = ("id", "name", "email", "display_name")
+USERS_MAP_COLS = ("user_id", "auth_uid", "email", "score_base", "last_training_date", "is_subscribed")
+ENTR_COLS = ("id", "Users_Id", "Parcours_Id", "Volume", "Date", "Time", "created_at")
+OBS_COLS = ("id", "Entrainement_Id", "Parcours_Id", "Operation", "Operateur_Un", "Operateur_Deux",
+            "Proposition", "Solution", "Etat", "Score", "Marge_Erreur", "Temps_Seconds", "score_global")
+SUIVI_COLS = ("id", "Users_Id", "Parcours_Id", "Date", "Type_Evolution", "Taux_Reussite", "Derniere_Observation_Id")
+CLASSEMENT_COLS = ("Users_Id", "score_global", "score_week", "week_start")
+POSITION_COLS = ("Users_Id", "Type_Operation", "Parcours_Id", "Niveau", "Suivi_Id",
+                 "Derniere_Observation_Id", "Taux_Reussite", "Type_Evolution", "Date")
+RANKING_COLS = ("user_id", "rank", "score_global", "weighted_level", "checked_at")
+SESSION_STATS_COLS = ("Entrainement_Id", "Parcours_Id", "Operation", "Users_Id", "Date", "n", "corrects",
+                      "n_temps", "sum_temps", "sumsq_temps", "n_marge", "sum_marge", "sumsq_marge",
+                      "n_score", "sum_score", "sumsq_score", "first_observation_id", "last_observation_id")
+ACTIVITY_COLS = ("Users_Id", "Jour", "sessions", "observations", "corrects")
+
+
+def parcours_id(op: str, niveau: int) -> int:
+    return OPS.index(op) * NIVEAUX + niveau
+
+
+def _parcours_rows() -> List[Tuple]:
+    rows = []
+    for op in OPS:
+        for niveau in range(1, NIVEAUX + 1):
+            hi = 10 * niveau if op != "Multiplication" else 2 + niveau
+            rows.append((parcours_id(op, niveau), op, niveau, CRITERE, 1, hi, 1, hi))
+    return rows
+
+
+class _Sink:
+    """Tampons par table, vidés dans le store tous les BATCH lignes."""
+
+    def __init__(self, store: Store, batch: int):
+        self.store = store
+        self.batch = batch
+        self.buffers: Dict[str, Tuple[Sequence[str], List[Tuple]]] = {}
+        self.records: Dict[str, List[Dict[str, Any]]] = {}
+        self.written: Dict[str, int] = {}
+
+    def add(self, table: str, cols: Sequence[str], row: Tuple) -> None:
+        buf = self.buffers.setdefault(table, (cols, []))[1]
+        buf.append(row)
+        if len(buf) >= self.batch:
+            self.flush(table)
+
+    def add_record(self, table: str, row: Dict[str, Any]) -> None:
+        """Ligne avec des colonnes tableau (JSON) : écrite par Store.insert, pas en masse."""
+        buf = self.records.setdefault(table, [])
+        buf.append(row)
+        if len(buf) >= self.batch:
+            self.flush(table)
+
+    def flush(self, table: Optional[str] = None) -> None:
+        for t in ([table] if table else list(self.buffers) + list(self.records)):
+            if t in self.buffers and self.buffers[t][1]:
+                cols, buf = self.buffers[t]
+                self.written[t] = self.written.get(t, 0) + self.store.bulk_insert(t, cols, buf)
+                buf.clear()
+            if self.records.get(t):
+                self.written[t] = self.written.get(t, 0) + len(self.store.insert(t, self.records[t]))
+                self.records[t].clear()
+
+
+def generate(
+    store: Store,
+    users: int = 100,
+    observations: Optional[int] = None,
+    days: int = 180,
+    seed: int = 42,
+    batch: int = BATCH,
+    today: Optional[date] = None,
+) -> Dict[str, int]:
+    """Peuple `store` (supposé vide). Retourne le nombre de lignes écrites par table."""
+    from . import offline_auth_uid
+
+    rng = random.Random(seed)
+    today = today or date.today()
+    monday = today - timedelta(days=today.weekday())
+    target = observations if observations is not None else users * OBS_PAR_USER
+    obs_per_session = EXOS_PAR_OP * len(OPS)
+
+    sink = _Sink(store, batch)
+    parcours = _parcours_rows()
+    ranges = {(p[1], p[2]): (p[4], p[5], p[6], p[7]) for p in parcours}
+    for p in parcours:
+        sink.add("Parcours", PARCOURS_COLS, p)
+
+    weights = [rng.paretovariate(1.5) for _ in range(users)]
+    scale = target / (sum(weights) or 1.0) / obs_per_session
+
+    entr_id = obs_id = suivi_id = 0
+    levels: List[Tuple[float, int, int]] = []
+    for uid in range(1, users + 1):
+        skill = rng.uniform(0.6, 0.97)
+        n_sessions = max(1, round(weights[uid - 1] * scale))
+        span = min(days, max(1, n_sessions * 3))
+        start = today - timedelta(days=span - 1)
+        day_offsets = sorted(rng.randrange(span) for _ in range(n_sessions))
+
+        email = f"user{uid}@offline.test"
+        sink.add("Users", USERS_COLS, (uid, f"user{uid}", email, f"Joueur {uid}"))
+
+        niveau = {op: 1 for op in OPS}
+        window = {op: [0, 0] for op in OPS}  # [total, corrects] depuis le dernier suivi
+        last_suivi: Dict[str, Tuple] = {}
+        first_day = (start + timedelta(days=day_offsets[0])).isoformat()
+        for op in OPS:
+            suivi_id += 1
+            row = (suivi_id, uid, parcours_id(op, 1), first_day, "initialisation", None, None)
+            sink.add("Suivi_Parcours", SUIVI_COLS, row)
+            last_suivi[op] = row
+
+        score_global = score_week = score_base = 0
+        last_day = first_day
+        activity: Dict[str, List[int]] = {}  # jour → [sessions, observations, corrects] (Activite_Jour)
+        n_obs = score_total = 0
+        checkpoints: List[int] = []  # score cumulé toutes les CHECKPOINT observations (Score_Cumule)
+        for off in day_offsets:
+            d = start + timedelta(days=off)
+            last_day = d.isoformat()
+            t = f"{rng.randrange(7, 23):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"
+            entr_id += 1
+            sink.add("Entrainement", ENTR_COLS, (
+                entr_id, uid, parcours_id("Addition", niveau["Addition"]), obs_per_session,
+                last_day, t, f"{last_day}T{t}+00:00",
+            ))
+            this_week = d >= monday
+            day = activity.setdefault(last_day, [0, 0, 0])
+            day[0] += 1
+            for op in OPS:
+                lvl = niveau[op]
+                a_min, a_max, b_min, b_max = ranges[(op, lvl)]
+                p_ok = max(0.3, skill - 0.035 * (lvl - 1))
+                pid = parcours_id(op, lvl)
+                agg = [0] * 7  # corrects, puis (somme, carrés) temps / marge / score — Stats_Entrainement
+                for _ in range(EXOS_PAR_OP):
+                    a, b = rng.randint(a_min, a_max), rng.randint(b_min, b_max)
+                    if op == "Soustraction" and b > a:
+                        a, b = b, a
+                    sol = a + b if op == "Addition" else a - b if op == "Soustraction" else a * b
+                    ok = rng.random() < p_ok
+                    prop = sol if ok else sol + rng.choice((-3, -2, -1, 1, 2, 3))
+                    temps = rng.randint(1, 12)
+                    score = 1 if ok else -1
+                    sg = score + (1 if ok and temps <= 3 else 0)
+                    obs_id += 1
+                    sink.add("Observations", OBS_COLS, (
+                        obs_id, entr_id, pid, op, a, b, prop, sol,
+                        "VRAI" if ok else "FAUX", score, abs(prop - sol), temps, sg,
+                    ))
+                    window[op][0] += 1
+                    window[op][1] += ok
+                    n_obs += 1
+                    score_total += score
+                    if n_obs % CHECKPOINT == 0:
+                        checkpoints.append(score_total)
+                    agg[0] += ok
+                    for i, v in ((1, temps), (3, abs(prop - sol)), (5, score)):
+                        agg[i] += v
+                        agg[i + 1] += v * v
+                    score_global += sg
+                    score_base += score
+                    if this_week:
+                        score_week += sg
+
+                n = EXOS_PAR_OP
+                day[1] += n
+                day[2] += agg[0]
+                sink.add("Stats_Entrainement", SESSION_STATS_COLS, (
+                    entr_id, pid, op, uid, last_day, n, agg[0], n, agg[1], agg[2], n, agg[3], agg[4],
+                    n, agg[5], agg[6], obs_id - n + 1, obs_id,
+                ))
+
+                total, corrects = window[op]
+                if total >= CRITERE:
+                    pct = corrects / total
+                    if pct > 0.90 and lvl < NIVEAUX:
+                        evol, niveau[op] = "progression", lvl + 1
+                    elif pct < 0.5 and lvl > 1:
+                        evol, niveau[op] = "régression", lvl - 1
+                    else:
+                        evol = "stagnation"
+                    suivi_id += 1
+                    row = (suivi_id, uid, parcours_id(op, niveau[op]), last_day, evol, round(pct, 4), obs_id)
+                    sink.add("Suivi_Parcours", SUIVI_COLS, row)
+                    last_suivi[op] = row
+                    window[op] = [0, 0]
+
+        for jour, (sessions, day_obs, corrects) in activity.items():
+            sink.add("Activite_Jour", ACTIVITY_COLS, (uid, jour, sessions, day_obs, corrects))
+        sink.add_record("Score_Cumule", {"Users_Id": uid, "n": n_obs, "total": score_total,
+                                         "checkpoints": checkpoints, "last_observation_id": obs_id})
+        for op in OPS:
+            s = last_suivi[op]
+            sink.add("Position_Courante", POSITION_COLS, (uid, op, s[2], niveau[op], s[0], s[6], s[5], s[4], s[3]))
+        sink.add("users_map", USERS_MAP_COLS, (uid, offline_auth_uid(uid), email, score_base, last_day, uid % 10 == 0))
+        sink.add("Classement", CLASSEMENT_COLS, (uid, score_global, score_week, monday.isoformat()))
+        levels.append((sum(niveau.values()) / len(OPS), score_global, uid))
+
+        if uid % 10_000 == 0:
+            logger.info(f"[OfflineData] {uid}/{users} utilisateurs, {obs_id} observations")
+
+    checked_at = datetime.combine(today - timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc).isoformat()
+    levels.sort(key=lambda x: (-x[0], x[2]))
+    for rank, (lvl, sg, uid) in enumerate(levels, start=1):
+        sink.add("Ranking_History", RANKING_COLS, (uid, rank, sg, round(lvl, 4), checked_at))
+
+    sink.flush()
+    logger.info(f"[OfflineData] terminé : {sink.written}")
+    return sink.written
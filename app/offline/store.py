@@ -0,0 +1,547 @@
+# app/offline/store.py
+"""
+Stockage des tables du backend hors ligne : en mémoire (`MemoryStore`) ou
+SQLite (`SqliteStore`), derrière la même interface. Utilisé par
+`OfflinePostgrest` (backend.py) et par le générateur de données
+(python -m app.cli.generate_offline_data).
+
+Les tables sont sans schéma : une colonne existe dès qu'une ligne la porte
+(ALTER TABLE côté SQLite). Seules les clés et les index utiles aux endpoints
+chauds sont déclarés dans TABLES ; une table inconnue a une clé `id` auto.
+"""
+from __future__ import annotations
+
+import json
+import operator
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from heapq import nlargest, nsmallest
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+TABLES: Dict[str, Dict[str, Any]] = {
+    "Users": {"pk": ("id",)},
+    "users_map": {"pk": ("user_id",), "auto_id": False, "indexes": [("auth_uid",)]},
+    "Parcours": {"pk": ("id",), "indexes": [("Type_Operation", "Niveau")]},
+    "Entrainement": {"pk": ("id",), "indexes": [("Users_Id", "id")]},
+    "Observations": {"pk": ("id",), "indexes": [("Entrainement_Id", "id"), ("Parcours_Id", "id")]},
+    "Suivi_Parcours": {"pk": ("id",), "indexes": [("Users_Id", "id")]},
+    "Classement": {"pk": ("Users_Id",), "auto_id": False,
+                   "indexes": [("score_global", "Users_Id"), ("score_week", "Users_Id")]},
+    "Position_Courante": {"pk": ("Users_Id", "Type_Operation"), "auto_id": False},
+    "Ranking_History": {"pk": ("id",), "indexes": [("checked_at",)]},
+    "Stats_Scoring": {"pk": ("Users_Id", "Parcours_Id", "Operation"), "auto_id": False},
+    "Stats_Entrainement": {"pk": ("Entrainement_Id", "Parcours_Id", "Operation"), "auto_id": False,
+                           "indexes": [("Parcours_Id", "last_observation_id"), ("Parcours_Id", "Date"),
+                                       ("Users_Id", "last_observation_id")]},
+    "Activite_Jour": {"pk": ("Users_Id", "Jour"), "auto_id": False},
+    "Score_Cumule": {"pk": ("Users_Id",), "auto_id": False},
+    "Outbox": {"pk": ("id",), "indexes": [("status",)]},
+    "Idempotency_Keys": {"pk": ("Entrainement_Id", "key"), "auto_id": False},
+}
+
+
+def table_spec(table: str) -> Dict[str, Any]:
+    spec = TABLES.get(table, {"pk": ("id",)})
+    return {"auto_id": True, "indexes": [], **spec}
+
+
+class StoreError(Exception):
+    """Requête invalide pour le stockage (équivalent d'un 400 PostgREST)."""
+
+
+class Conflict(StoreError):
+    """Violation de clé primaire (équivalent de l'erreur Postgres 23505)."""
+
+
+@dataclass
+class Filter:
+    column: str
+    op: str           # eq, neq, gt, gte, lt, lte, in, is, like, ilike
+    value: Any
+    negate: bool = False
+
+
+@dataclass
+class Query:
+    table: str
+    filters: List[Filter] = field(default_factory=list)
+    order: List[Tuple[str, bool, Optional[bool]]] = field(default_factory=list)  # (colonne, desc, nulls_first)
+    limit: Optional[int] = None
+    offset: int = 0
+
+
+Hook = Callable[[str, Dict[str, Any]], None]
+
+
+class Store:
+    """Interface commune. Les lignes renvoyées sont des copies."""
+
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+        # appelés sur chaque NOUVELLE ligne avant écriture (défauts, triggers)
+        self.insert_hooks: List[Hook] = []
+
+    def _new_row(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        row = dict(row)
+        for hook in self.insert_hooks:
+            hook(table, row)
+        return row
+
+    def select(self, q: Query, count: bool = False) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        raise NotImplementedError
+
+    def insert(self, table: str, rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def upsert(self, table: str, rows: Sequence[Dict[str, Any]], on_conflict: Sequence[str],
+               ignore_duplicates: bool = False) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update(self, table: str, filters: List[Filter], values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def delete(self, table: str, filters: List[Filter]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def bulk_insert(self, table: str, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> int:
+        """Chargement massif (générateur) : tuples dans l'ordre de `columns`, sans hooks ni RETURNING."""
+        raise NotImplementedError
+
+    def count(self, table: str) -> int:
+        return self.select(Query(table, limit=0), count=True)[1] or 0
+
+    def close(self) -> None:
+        pass
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Évaluation des filtres en Python (MemoryStore)
+# ────────────────────────────────────────────────────────────────────────────────
+_CMP = {"eq": operator.eq, "neq": operator.ne, "gt": operator.gt,
+        "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+
+
+def _aligned(a: Any, b: Any) -> Tuple[Any, Any]:
+    # la valeur d'une query string est typée à la volée : on compare en texte si les types divergent
+    if isinstance(a, str) != isinstance(b, str):
+        return str(a), str(b)
+    return a, b
+
+
+def like_regex(pattern: str, case_insensitive: bool) -> "re.Pattern[str]":
+    rx = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in pattern)
+    return re.compile(f"^{rx}$", re.IGNORECASE | re.DOTALL if case_insensitive else re.DOTALL)
+
+
+def matches(row: Dict[str, Any], f: Filter) -> bool:
+    v = row.get(f.column)
+    if f.op == "is":
+        ok = v is None if f.value is None else v == f.value
+    elif v is None:
+        return False  # NULL : ni vrai ni faux, NOT compris (sémantique SQL)
+    elif f.op == "in":
+        ok = any(operator.eq(*_aligned(v, t)) for t in f.value)
+    elif f.op in ("like", "ilike"):
+        ok = like_regex(str(f.value), f.op == "ilike").match(str(v)) is not None
+    else:
+        ok = _CMP[f.op](*_aligned(v, f.value))
+    return ok != f.negate
+
+
+def _sort_key(v: Any) -> Tuple[int, Any]:
+    return (1, v) if isinstance(v, str) else (0, v)
+
+
+def order_rows(rows: List[Dict[str, Any]], order, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Tri PostgREST (asc → NULL à la fin, desc → NULL en tête). `limit` : top-k sans tri complet."""
+    if len(order) == 1 and limit is not None and limit < len(rows):
+        col, desc, nulls_first = order[0]
+        nulls_first = desc if nulls_first is None else nulls_first
+        present = [r for r in rows if r.get(col) is not None]
+        absent = [r for r in rows if r.get(col) is None]
+        pick = nlargest if desc else nsmallest
+        if nulls_first:
+            return (absent + pick(max(limit - len(absent), 0), present, key=lambda r: _sort_key(r[col])))[:limit]
+        return pick(limit, present, key=lambda r: _sort_key(r[col])) + absent[:max(limit - len(present), 0)]
+    for col, desc, nulls_first in reversed(order):
+        nulls_first = desc if nulls_first is None else nulls_first
+        present = [r for r in rows if r.get(col) is not None]
+        absent = [r for r in rows if r.get(col) is None]
+        present.sort(key=lambda r: _sort_key(r[col]), reverse=desc)
+        rows = absent + present if nulls_first else present + absent
+    return rows
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# En mémoire
+# ────────────────────────────────────────────────────────────────────────────────
+class MemoryStore(Store):
+    """Listes de dicts + index d'égalité construits à la demande (eq / in)."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.seq: Dict[str, int] = {}
+        self._index: Dict[Tuple[str, str], Dict[Any, List[Dict[str, Any]]]] = {}
+
+    def _rows(self, table: str) -> List[Dict[str, Any]]:
+        return self.tables.setdefault(table, [])
+
+    def _index_for(self, table: str, col: str) -> Dict[Any, List[Dict[str, Any]]]:
+        idx = self._index.get((table, col))
+        if idx is None:
+            idx = {}
+            for r in self._rows(table):
+                idx.setdefault(r.get(col), []).append(r)
+            self._index[(table, col)] = idx
+        return idx
+
+    def _index_add(self, table: str, row: Dict[str, Any]) -> None:
+        for (t, col), idx in self._index.items():
+            if t == table:
+                idx.setdefault(row.get(col), []).append(row)
+
+    def _index_remove(self, table: str, row: Dict[str, Any], cols: Optional[Iterable[str]] = None) -> None:
+        for (t, col), idx in self._index.items():
+            if t != table or (cols is not None and col not in cols):
+                continue
+            bucket = idx.get(row.get(col), [])
+            for i, r in enumerate(bucket):
+                if r is row:
+                    del bucket[i]
+                    break
+
+    def _candidates(self, table: str, filters: List[Filter]) -> Tuple[List[Dict[str, Any]], Optional[Filter]]:
+        """Lignes candidates + le filtre déjà satisfait par l'index (inutile de le réévaluer)."""
+        for f in filters:
+            if f.negate:
+                continue
+            if f.op == "eq":
+                return list(self._index_for(table, f.column).get(f.value, [])), f
+            if f.op == "in":
+                idx = self._index_for(table, f.column)
+                return [r for v in dict.fromkeys(f.value) for r in idx.get(v, [])], f
+        return list(self._rows(table)), None
+
+    def _find(self, table: str, keys: Sequence[str], row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        for r in self._index_for(table, keys[0]).get(row.get(keys[0]), []):
+            if all(r.get(k) == row.get(k) for k in keys):
+                return r
+        return None
+
+    def _filtered(self, table: str, filters: List[Filter]) -> List[Dict[str, Any]]:
+        rows, used = self._candidates(table, filters)
+        rest = [f for f in filters if f is not used]
+        return [r for r in rows if all(matches(r, f) for f in rest)]
+
+    def _add(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        spec = table_spec(table)
+        row = self._new_row(table, row)
+        if spec["auto_id"] and row.get("id") is None:
+            self.seq[table] = self.seq.get(table, 0) + 1
+            row["id"] = self.seq[table]
+        elif isinstance(row.get("id"), int):
+            self.seq[table] = max(self.seq.get(table, 0), row["id"])
+        if self._find(table, spec["pk"], row) is not None:
+            raise Conflict(f'duplicate key value violates unique constraint "{table}_pkey"')
+        self._rows(table).append(row)
+        self._index_add(table, row)
+        return row
+
+    def select(self, q: Query, count: bool = False):
+        with self.lock:
+            rows = self._filtered(q.table, q.filters)
+            total = len(rows)
+            end = None if q.limit is None else q.offset + q.limit
+            if q.order:
+                rows = order_rows(rows, q.order, end)
+            rows = rows[q.offset:end]
+            return [dict(r) for r in rows], total
+
+    def insert(self, table, rows):
+        with self.lock:
+            return [dict(self._add(table, r)) for r in rows]
+
+    def upsert(self, table, rows, on_conflict, ignore_duplicates=False):
+        keys = list(on_conflict) or list(table_spec(table)["pk"])
+        out = []
+        with self.lock:
+            for p in rows:
+                cur = self._find(table, keys, p)
+                if cur is None:
+                    out.append(dict(self._add(table, p)))
+                elif not ignore_duplicates:
+                    self._set(table, cur, p)
+                    out.append(dict(cur))
+            return out
+
+    def _set(self, table: str, row: Dict[str, Any], values: Dict[str, Any]) -> None:
+        changed = [k for k, v in values.items() if row.get(k) != v]
+        self._index_remove(table, row, changed)
+        row.update(values)
+        for col in changed:
+            idx = self._index.get((table, col))
+            if idx is not None:
+                idx.setdefault(row.get(col), []).append(row)
+
+    def update(self, table, filters, values):
+        with self.lock:
+            rows = self._filtered(table, filters)
+            for r in rows:
+                self._set(table, r, values)
+            return [dict(r) for r in rows]
+
+    def delete(self, table, filters):
+        with self.lock:
+            doomed = self._filtered(table, filters)
+            ids = {id(r) for r in doomed}
+            self.tables[table] = [r for r in self._rows(table) if id(r) not in ids]
+            for r in doomed:
+                self._index_remove(table, r)
+            return [dict(r) for r in doomed]
+
+    def bulk_insert(self, table, columns, rows):
+        spec = table_spec(table)
+        with self.lock:
+            n = 0
+            dest = self._rows(table)
+            for values in rows:
+                row = dict(zip(columns, values))
+                if spec["auto_id"] and row.get("id") is None:
+                    self.seq[table] = self.seq.get(table, 0) + 1
+                    row["id"] = self.seq[table]
+                elif isinstance(row.get("id"), int):
+                    self.seq[table] = max(self.seq.get(table, 0), row["id"])
+                dest.append(row)
+                n += 1
+            for key in [k for k in self._index if k[0] == table]:
+                del self._index[key]  # reconstruits au prochain filtre
+            return n
+
+    def count(self, table):
+        return len(self._rows(table))
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# SQLite
+# ────────────────────────────────────────────────────────────────────────────────
+_SQL_CMP = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+_META = "_offline_json_columns"
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SqliteStore(Store):
+    """
+    Un fichier SQLite (ou ":memory:"). Colonnes sans type déclaré : les valeurs
+    gardent leur type Python (int, float, texte) ; dict/list sont stockés en JSON.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {_META} (tbl TEXT, col TEXT, PRIMARY KEY (tbl, col))")
+        self._columns: Dict[str, List[str]] = {}
+        for (name,) in self.conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"):
+            if name != _META:
+                self._columns[name] = [r["name"] for r in self.conn.execute(f"PRAGMA table_info({_q(name)})")]
+        self._json: Dict[str, set] = {}
+        for r in self.conn.execute(f"SELECT tbl, col FROM {_META}"):
+            self._json.setdefault(r["tbl"], set()).add(r["col"])
+
+    # ---- schéma ----
+    def _ensure(self, table: str, cols: Iterable[str]) -> None:
+        known = self._columns.get(table)
+        if known is None:
+            spec = table_spec(table)
+            pk = spec["pk"]
+            if spec["auto_id"] and pk == ("id",):
+                defs = ['"id" INTEGER PRIMARY KEY']
+            else:
+                defs = [_q(c) for c in pk] + [f"PRIMARY KEY ({', '.join(_q(c) for c in pk)})"]
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {_q(table)} ({', '.join(defs)})")
+            known = self._columns[table] = list(pk)
+        missing = [c for c in dict.fromkeys(cols) if c not in known]
+        for c in missing:
+            try:
+                self.conn.execute(f"ALTER TABLE {_q(table)} ADD COLUMN {_q(c)}")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):  # ajoutée entre-temps par un autre process
+                    raise
+            known.append(c)
+        if missing or len(known) == len(table_spec(table)["pk"]):
+            self._ensure_indexes(table)
+
+    def _ensure_indexes(self, table: str) -> None:
+        known = self._columns.get(table, [])
+        for cols in table_spec(table)["indexes"]:
+            if all(c in known for c in cols):
+                name = _q(f"idx_{table}_{'_'.join(cols)}")
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {_q(table)} ({', '.join(_q(c) for c in cols)})")
+
+    def _encode(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        out = {}
+        for k, v in row.items():
+            if isinstance(v, (dict, list)):
+                if k not in self._json.get(table, ()):
+                    self.conn.execute(f"INSERT OR IGNORE INTO {_META} VALUES (?, ?)", (table, k))
+                    self._json.setdefault(table, set()).add(k)
+                v = json.dumps(v)
+            out[k] = v
+        return out
+
+    def _decode(self, table: str, row: sqlite3.Row) -> Dict[str, Any]:
+        d = dict(row)
+        for k in self._json.get(table, ()):
+            if isinstance(d.get(k), str):
+                d[k] = json.loads(d[k])
+        return d
+
+    # ---- requêtes ----
+    def _col(self, table: str, col: str) -> str:
+        return _q(col) if col in self._columns.get(table, ()) else "NULL"
+
+    def _where(self, table: str, filters: List[Filter]) -> Tuple[str, List[Any]]:
+        parts: List[str] = []
+        params: List[Any] = []
+        for f in filters:
+            col = self._col(table, f.column)
+            if f.op == "is":
+                expr = f"{col} IS NULL" if f.value is None else f"{col} IS ?"
+                if f.value is not None:
+                    params.append(f.value)
+            elif f.op == "in":
+                if not f.value:
+                    expr = "0"
+                else:
+                    expr = f"{col} IN ({', '.join('?' * len(f.value))})"
+                    params.extend(f.value)
+            elif f.op == "like":
+                expr = f"{col} GLOB ?"
+                params.append(str(f.value).replace("%", "*").replace("_", "?"))
+            elif f.op == "ilike":
+                expr = f"{col} LIKE ?"
+                params.append(f.value)
+            else:
+                expr = f"{col} {_SQL_CMP[f.op]} ?"
+                params.append(f.value)
+            parts.append(f"NOT ({expr})" if f.negate else expr)
+        return (" WHERE " + " AND ".join(parts)) if parts else "", params
+
+    def select(self, q: Query, count: bool = False):
+        with self.lock:
+            if q.table not in self._columns:
+                return [], (0 if count else None)
+            where, params = self._where(q.table, q.filters)
+            order = ", ".join(
+                f"{_q(c)} {'DESC' if desc else 'ASC'} NULLS {'FIRST' if (desc if nf is None else nf) else 'LAST'}"
+                for c, desc, nf in q.order if c in self._columns[q.table]
+            )
+            sql = f"SELECT * FROM {_q(q.table)}{where}" + (f" ORDER BY {order}" if order else "")
+            if q.limit is not None or q.offset:
+                sql += f" LIMIT {-1 if q.limit is None else int(q.limit)} OFFSET {int(q.offset)}"
+            rows = [self._decode(q.table, r) for r in self.conn.execute(sql, params)]
+            total = None
+            if count:
+                total = self.conn.execute(f"SELECT COUNT(*) FROM {_q(q.table)}{where}", params).fetchone()[0]
+            return rows, total
+
+    def _insert_one(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        row = self._encode(table, self._new_row(table, row))
+        self._ensure(table, row)
+        cols = list(row)
+        sql = (f"INSERT INTO {_q(table)} ({', '.join(_q(c) for c in cols)}) "
+               f"VALUES ({', '.join('?' * len(cols))}) RETURNING *") if cols else f"INSERT INTO {_q(table)} DEFAULT VALUES RETURNING *"
+        try:
+            return self._decode(table, self.conn.execute(sql, [row[c] for c in cols]).fetchone())
+        except sqlite3.IntegrityError as e:
+            raise Conflict(f'duplicate key value violates unique constraint "{table}_pkey" ({e})') from e
+
+    def _tx(self, fn):
+        with self.lock:
+            # IMMEDIATE : verrou d'écriture d'emblée (plusieurs process sur le même fichier,
+            # une transaction différée qui lit puis écrit échoue sans attendre)
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn()
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return out
+
+    def insert(self, table, rows):
+        return self._tx(lambda: [self._insert_one(table, r) for r in rows])
+
+    def _update_where(self, table: str, where: str, params: List[Any], values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        values = self._encode(table, values)
+        self._ensure(table, values)
+        if not values:
+            return [self._decode(table, r) for r in self.conn.execute(f"SELECT * FROM {_q(table)}{where}", params)]
+        sets = ", ".join(f"{_q(c)} = ?" for c in values)
+        sql = f"UPDATE {_q(table)} SET {sets}{where} RETURNING *"
+        return [self._decode(table, r) for r in self.conn.execute(sql, list(values.values()) + params)]
+
+    def upsert(self, table, rows, on_conflict, ignore_duplicates=False):
+        keys = list(on_conflict) or list(table_spec(table)["pk"])
+
+        def run():
+            out = []
+            for p in rows:
+                if table in self._columns:
+                    where, params = self._where(table, [Filter(k, "is" if p.get(k) is None else "eq", p.get(k)) for k in keys])
+                    hit = self.conn.execute(f"SELECT 1 FROM {_q(table)}{where} LIMIT 1", params).fetchone()
+                else:
+                    hit = None
+                if hit is None:
+                    out.append(self._insert_one(table, p))
+                elif not ignore_duplicates:
+                    out.extend(self._update_where(table, where, params, p))
+            return out
+
+        return self._tx(run)
+
+    def update(self, table, filters, values):
+        def run():
+            if table not in self._columns:
+                return []
+            where, params = self._where(table, filters)
+            return self._update_where(table, where, params, values)
+
+        return self._tx(run)
+
+    def delete(self, table, filters):
+        def run():
+            if table not in self._columns:
+                return []
+            where, params = self._where(table, filters)
+            return [self._decode(table, r) for r in self.conn.execute(f"DELETE FROM {_q(table)}{where} RETURNING *", params)]
+
+        return self._tx(run)
+
+    def bulk_insert(self, table, columns, rows):
+        def run():
+            self._ensure(table, columns)
+            sql = f"INSERT INTO {_q(table)} ({', '.join(_q(c) for c in columns)}) VALUES ({', '.join('?' * len(columns))})"
+            before = self.conn.total_changes
+            self.conn.executemany(sql, rows)
+            return self.conn.total_changes - before
+
+        return self._tx(run)
+
+    def count(self, table):
+        with self.lock:
+            if table not in self._columns:
+                return 0
+            return self.conn.execute(f"SELECT COUNT(*) FROM {_q(table)}").fetchone()[0]
+
+    def close(self) -> None:
+        self.conn.close()
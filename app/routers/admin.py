@@ -16,6 +16,7 @@ from jose import jwt as jose_jwt
 from pydantic import BaseModel
 
 from app.deps import get_auth_uid_from_bearer, service_client
+from app.services.keyset import iter_in, iter_rows
 
 ADMIN_PASSWORD = os.getenv("ADMIN_DASHBOARD_PASSWORD", "pixel_admin_2024")
 JWT_SECRET = os.getenv("JWT_SECRET", os.getenv("SUPABASE_SERVICE_ROLE_KEY", "fallback-secret"))
@@ -112,29 +113,12 @@ def analytics_overview(
         total_operations = total_ops_res.count if total_ops_res else 0
         logger.info(f"[OVERVIEW DEBUG] Total operations counted: {total_operations}")
 
-        # Entrainements sur la période (pour active_users)
-        ent_res = (
-            sb.table("Entrainement")
-            .select("id")
-            .gte("Date", since)
-            .limit(100000)
-            .execute()
-        )
-
         # Utilisateurs actifs (au moins 1 entrainement sur la période)
-        active_ids = set()
-        for e in (getattr(ent_res, "data", []) or []):
-            # On a besoin de Users_Id, refaisons la requête avec le bon select
-            pass
-
-        ent_full = (
-            sb.table("Entrainement")
-            .select("Users_Id")
-            .gte("Date", since)
-            .limit(100000)
-            .execute()
-        )
-        active_ids = {e["Users_Id"] for e in (getattr(ent_full, "data", []) or []) if e.get("Users_Id")}
+        active_ids = {
+            e["Users_Id"]
+            for e in iter_rows(lambda: sb.table("Entrainement").select("id, Users_Id").gte("Date", since))
+            if e.get("Users_Id")
+        }
         active_users = len(active_ids)
 
         # Premium users (abonnés via RevenueCat)
@@ -172,19 +156,15 @@ def analytics_user_activity(
 
     try:
         # Tous les entrainements de la période avec Users_Id et Date
-        ent_res = (
-            sb.table("Entrainement")
-            .select("id, Users_Id, Date")
-            .gte("Date", since)
-            .order("id")
-            .limit(100000)
-            .execute()
-        )
-        entrainements = getattr(ent_res, "data", []) or []
+        entrainements = list(iter_rows(
+            lambda: sb.table("Entrainement").select("id, Users_Id, Date").gte("Date", since)
+        ))
 
         # Tous les utilisateurs (pour display_name)
-        users_res = sb.table("users_map").select("user_id, display_name").execute()
-        users_map_data = {u["user_id"]: u.get("display_name", f"User {u['user_id']}") for u in (getattr(users_res, "data", []) or [])}
+        users_map_data = {
+            u["user_id"]: u.get("display_name", f"User {u['user_id']}")
+            for u in iter_rows(lambda: sb.table("users_map").select("user_id, display_name"), key="user_id")
+        }
 
         # Regrouper par user
         from collections import defaultdict
@@ -197,19 +177,9 @@ def analytics_user_activity(
         # Récupérer les ids d'entrainement pour compter les observations
         all_ent_ids = [e["id"] for e in entrainements]
         obs_counts: dict = defaultdict(int)  # Entrainement_Id -> count
-        if all_ent_ids:
-            # Compter observations par batch
-            for i in range(0, len(all_ent_ids), 500):
-                batch = all_ent_ids[i:i+500]
-                obs_res = (
-                    sb.table("Observations")
-                    .select("Entrainement_Id")
-                    .in_("Entrainement_Id", batch)
-                    .limit(100000)
-                    .execute()
-                )
-                for o in (getattr(obs_res, "data", []) or []):
-                    obs_counts[o["Entrainement_Id"]] += 1
+        # Compter observations par paquets d'entrainements
+        for o in iter_in(lambda: sb.table("Observations").select("id, Entrainement_Id"), "Entrainement_Id", all_ent_ids):
+            obs_counts[o["Entrainement_Id"]] += 1
 
         users_list = []
         weeks = max(days / 7, 1)
@@ -297,15 +267,7 @@ def analytics_operations_daily(
 
     try:
         # Récupérer entrainements avec Date
-        ent_res = (
-            sb.table("Entrainement")
-            .select("id, Date")
-            .gte("Date", since)
-            .order("Date")
-            .limit(100000)
-            .execute()
-        )
-        entrainements = getattr(ent_res, "data", []) or []
+        entrainements = iter_rows(lambda: sb.table("Entrainement").select("id, Date").gte("Date", since))
 
         # Compter observations par entrainement
         from collections import defaultdict
@@ -315,21 +277,11 @@ def analytics_operations_daily(
             if d:
                 ent_by_date[d].append(e["id"])
 
-        # Compter toutes les observations d'un coup
-        all_ent_ids = [e["id"] for e in entrainements]
+        # Compter les observations de ces entrainements
+        all_ent_ids = [eid for ids in ent_by_date.values() for eid in ids]
         obs_per_ent: dict = defaultdict(int)
-        if all_ent_ids:
-            for i in range(0, len(all_ent_ids), 500):
-                batch = all_ent_ids[i:i+500]
-                obs_res = (
-                    sb.table("Observations")
-                    .select("Entrainement_Id")
-                    .in_("Entrainement_Id", batch)
-                    .limit(100000)
-                    .execute()
-                )
-                for o in (getattr(obs_res, "data", []) or []):
-                    obs_per_ent[o["Entrainement_Id"]] += 1
+        for o in iter_in(lambda: sb.table("Observations").select("id, Entrainement_Id"), "Entrainement_Id", all_ent_ids):
+            obs_per_ent[o["Entrainement_Id"]] += 1
 
         # Agréger par date
         ops_by_date: dict = defaultdict(int)
@@ -372,7 +324,7 @@ def analytics_operations_daily_activity(
 
         today = date.today()
 
-        # Récupérer les entrainements (avec pagination pour dépasser la limite Supabase de 1000)
+        # Récupérer les entrainements (lecture par clé, au-delà de la limite Supabase de 1000)
         if days is not None:
             cutoff_date = (today - timedelta(days=days)).strftime("%Y-%m-%d")
         else:
@@ -381,56 +333,29 @@ def analytics_operations_daily_activity(
         logger.info(f"[ACTIVITY] Today: {today}")
         logger.info(f"[ACTIVITY] Cutoff date: {cutoff_date}")
 
-        all_entrainements = []
-        page_size = 1000
-        offset = 0
-        while True:
+        def ent_query():
             query = sb.table("Entrainement").select("id, Date")
-            if cutoff_date:
-                query = query.gte("Date", cutoff_date)
-            query = query.order("id").range(offset, offset + page_size - 1)
-            ent_res = query.execute()
-            page_data = getattr(ent_res, "data", []) or []
-            all_entrainements.extend(page_data)
-            if len(page_data) < page_size:
-                break
-            offset += page_size
-
-        logger.info(f"[ACTIVITY] Total entrainements found: {len(all_entrainements)}")
+            return query.gte("Date", cutoff_date) if cutoff_date else query
 
         # Map entrainement_id -> date
         ent_date_map: dict = {}
-        for e in all_entrainements:
+        n_entrainements = 0
+        for e in iter_rows(ent_query):
+            n_entrainements += 1
             d = str(e.get("Date", ""))[:10]
             if d:
                 ent_date_map[e["id"]] = d
 
+        logger.info(f"[ACTIVITY] Total entrainements found: {n_entrainements}")
+
         all_ent_ids = list(ent_date_map.keys())
 
-        # Compter les observations par date (avec pagination par batch)
+        # Compter les observations par date (paquets d'entrainements, lecture par clé)
         ops_by_date: dict = defaultdict(int)
-        if all_ent_ids:
-            for i in range(0, len(all_ent_ids), 500):
-                batch = all_ent_ids[i:i + 500]
-                obs_offset = 0
-                while True:
-                    obs_res = (
-                        sb.table("Observations")
-                        .select("Entrainement_Id")
-                        .in_("Entrainement_Id", batch)
-                        .order("id")
-                        .range(obs_offset, obs_offset + page_size - 1)
-                        .execute()
-                    )
-                    obs_data = getattr(obs_res, "data", []) or []
-                    for o in obs_data:
-                        eid = o.get("Entrainement_Id")
-                        d = ent_date_map.get(eid)
-                        if d:
-                            ops_by_date[d] += 1
-                    if len(obs_data) < page_size:
-                        break
-                    obs_offset += page_size
+        for o in iter_in(lambda: sb.table("Observations").select("id, Entrainement_Id"), "Entrainement_Id", all_ent_ids):
+            d = ent_date_map.get(o.get("Entrainement_Id"))
+            if d:
+                ops_by_date[d] += 1
 
         # Déterminer la date de début
         if days is not None:
@@ -454,7 +379,7 @@ def analytics_operations_daily_activity(
 
         dates = [d["date"] for d in data]
         logger.info(f"[ACTIVITY] Date range: {min(dates) if dates else 'N/A'} to {max(dates) if dates else 'N/A'}")
-        logger.info(f"[ACTIVITY] Total days returned: {len(data)}, Entrainements fetched: {len(all_entrainements)}")
+        logger.info(f"[ACTIVITY] Total days returned: {len(data)}, Entrainements fetched: {n_entrainements}")
 
         return {"data": data}
     except HTTPException:
@@ -494,60 +419,28 @@ def analytics_user_regularity_matrix(
         days_in_current_month = calendar.monthrange(today.year, today.month)[1]
         days_in_prev_month = calendar.monthrange(prev_month_last_day.year, prev_month_last_day.month)[1]
 
-        # --- Récupérer TOUS les entrainements (paginé) ---
-        all_entrainements = []
-        page_size = 1000
-        offset = 0
-        while True:
-            ent_res = (
-                sb.table("Entrainement")
-                .select("id, Users_Id, Date")
-                .order("id")
-                .range(offset, offset + page_size - 1)
-                .execute()
-            )
-            page_data = getattr(ent_res, "data", []) or []
-            all_entrainements.extend(page_data)
-            if len(page_data) < page_size:
-                break
-            offset += page_size
-
-        if not all_entrainements:
-            return {"global_regularity": 0.0, "users": []}
-
+        # --- Parcourir TOUS les entrainements (lecture par clé) ---
         # Map entrainement -> (user_id, date_str)
         ent_info: dict = {}  # ent_id -> (user_id, date_str)
         user_ent_ids: dict = defaultdict(list)  # user_id -> [ent_ids]
-        for e in all_entrainements:
+        n_entrainements = 0
+        for e in iter_rows(lambda: sb.table("Entrainement").select("id, Users_Id, Date")):
+            n_entrainements += 1
             uid = e.get("Users_Id")
             d = str(e.get("Date", ""))[:10]
             if uid and d:
                 ent_info[e["id"]] = (uid, d)
                 user_ent_ids[uid].append(e["id"])
 
+        if not n_entrainements:
+            return {"global_regularity": 0.0, "users": []}
+
         all_ent_ids = list(ent_info.keys())
 
-        # --- Compter observations par entrainement (paginé) ---
+        # --- Compter observations par entrainement (paquets, lecture par clé) ---
         obs_per_ent: dict = defaultdict(int)
-        if all_ent_ids:
-            for i in range(0, len(all_ent_ids), 500):
-                batch = all_ent_ids[i:i + 500]
-                obs_offset = 0
-                while True:
-                    obs_res = (
-                        sb.table("Observations")
-                        .select("Entrainement_Id")
-                        .in_("Entrainement_Id", batch)
-                        .order("id")
-                        .range(obs_offset, obs_offset + page_size - 1)
-                        .execute()
-                    )
-                    obs_data = getattr(obs_res, "data", []) or []
-                    for o in obs_data:
-                        obs_per_ent[o["Entrainement_Id"]] += 1
-                    if len(obs_data) < page_size:
-                        break
-                    obs_offset += page_size
+        for o in iter_in(lambda: sb.table("Observations").select("id, Entrainement_Id"), "Entrainement_Id", all_ent_ids):
+            obs_per_ent[o["Entrainement_Id"]] += 1
 
         # --- Construire les données par utilisateur ---
         # user_id -> {dates: set, ops_by_date: {date_str: int}}
@@ -557,10 +450,9 @@ def analytics_user_regularity_matrix(
             user_data[uid]["ops_by_date"][d_str] += obs_per_ent.get(ent_id, 0)
 
         # --- Display names ---
-        users_res = sb.table("users_map").select("user_id, display_name").execute()
         display_names = {
             u["user_id"]: u.get("display_name") or f"User {u['user_id']}"
-            for u in (getattr(users_res, "data", []) or [])
+            for u in iter_rows(lambda: sb.table("users_map").select("user_id, display_name"), key="user_id")
         }
 
         # --- Helper : compter ops et jours dans une plage ---
@@ -825,15 +717,7 @@ def analytics_success_rate_daily(
 
     try:
         # Récupérer entrainements avec Date
-        ent_res = (
-            sb.table("Entrainement")
-            .select("id, Date")
-            .gte("Date", since)
-            .order("Date")
-            .limit(100000)
-            .execute()
-        )
-        entrainements = getattr(ent_res, "data", []) or []
+        entrainements = iter_rows(lambda: sb.table("Entrainement").select("id, Date").gte("Date", since))
 
         from collections import defaultdict
         ent_date_map: dict = {}  # ent_id -> date_str
@@ -849,23 +733,13 @@ def analytics_success_rate_daily(
         daily_correct: dict = defaultdict(int)
         daily_total: dict = defaultdict(int)
 
-        if all_ent_ids:
-            for i in range(0, len(all_ent_ids), 500):
-                batch = all_ent_ids[i:i+500]
-                obs_res = (
-                    sb.table("Observations")
-                    .select("Entrainement_Id, Etat")
-                    .in_("Entrainement_Id", batch)
-                    .limit(100000)
-                    .execute()
-                )
-                for o in (getattr(obs_res, "data", []) or []):
-                    eid = o.get("Entrainement_Id")
-                    d = ent_date_map.get(eid)
-                    if d:
-                        daily_total[d] += 1
-                        if str(o.get("Etat", "")).upper() != "FAUX":
-                            daily_correct[d] += 1
+        obs = iter_in(lambda: sb.table("Observations").select("id, Entrainement_Id, Etat"), "Entrainement_Id", all_ent_ids)
+        for o in obs:
+            d = ent_date_map.get(o.get("Entrainement_Id"))
+            if d:
+                daily_total[d] += 1
+                if str(o.get("Etat", "")).upper() != "FAUX":
+                    daily_correct[d] += 1
 
         # Générer toutes les dates
         data = []
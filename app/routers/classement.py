@@ -1,85 +1,143 @@
 # app/routers/classement.py
-from fastapi import APIRouter, HTTPException, Query, Header
-from typing import Optional, Literal
-import os
-from supabase import create_client, Client
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Any, Dict, List, Optional, Literal
+import asyncio
+from app.deps import async_service_client, current_user_id, optional_identity
+from app.services.identity import Identity
+from app.services.leaderboard import decode_cursor, encode_cursor, reader
+from app.services.repositories import ClassementRepository
 
 router = APIRouter(prefix="/classement", tags=["classement"])
 
 CAPACITY = 350 * 350
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    raise RuntimeError("SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY manquants")
-sb: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
-def _me_user_id_from_bearer(authorization: Optional[str]) -> Optional[int]:
-    """Résout Users_Id depuis le JWT (Auth → users_map). Ne crée rien ici."""
-    if not authorization or not authorization.lower().startswith("bearer "):
+def _repo():
+    # classement en mémoire (services/leaderboard.py) une fois chargé, sinon la table
+    return reader() or ClassementRepository(async_service_client())
+
+
+def _metric(scope: str) -> str:
+    return "score_week" if scope == "this_week" else "score_global"
+
+
+async def _me_entry(repo, me_user_id: Optional[int], scope: str, metric: str):
+    if me_user_id is None:
         return None
-    jwt = authorization.split(" ", 1)[1]
-    try:
-        u = sb.auth.get_user(jwt)
-        user_obj = getattr(u, "user", None) or u
-        auth_uid = user_obj.id
-        m = sb.table("users_map").select("user_id").eq("auth_uid", auth_uid).maybe_single().execute()
-        data = getattr(m, "data", None)
-        return int(data["user_id"]) if data and "user_id" in data else None
-    except Exception:
+    data = await repo.scores(me_user_id)
+    if not data:
         return None
+    my_glob = int(data.get("score_global") or 0)
+    my_score = int(data.get("score_week") or 0) if scope == "this_week" else my_glob
+    # rang = nb STRICTEMENT supérieurs + 1
+    greater = await repo.count_above(metric, my_score)
+    return {
+        "rank": greater + 1,
+        "user_id": me_user_id,
+        "display_name": None,
+        "score_total": my_score,
+        "pixel_ratio": min(1.0, my_glob / CAPACITY),
+    }
 
-@router.get("")
-def get_leaderboard(
-    scope: Literal["all", "this_week"] = Query("all"),
-    limit: int = Query(50, ge=1, le=200),
-    offset: int = Query(0, ge=0),
-    authorization: Optional[str] = Header(None),
-):
-    # 1) Top N
-    metric = "score_week" if scope == "this_week" else "score_global"
-    try:
-        resp = (
-            sb.table("Classement")
-            .select("Users_Id,score_global,score_week")
-            .order(metric, desc=True)
-            .range(offset, offset + limit - 1)
-            .execute()
-        )
-        rows = getattr(resp, "data", []) or []
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Classement fetch failed: {e}")
 
+def _items(rows: List[Dict[str, Any]], start: int, scope: str) -> List[Dict[str, Any]]:
+    """Lignes Classement → entrées ; rang = position dans l'ordre (score desc, Users_Id asc) + 1."""
     items = []
     for i, r in enumerate(rows):
         score_glob = int(r.get("score_global") or 0)
         score = int(r.get("score_week") or 0) if scope == "this_week" else score_glob
         items.append({
-            "rank": offset + i + 1,
+            "rank": start + i + 1,
             "user_id": int(r["Users_Id"]),
             "display_name": None,  # tu pourras peupler plus tard
             "score_total": score,
             "pixel_ratio": min(1.0, score_glob / CAPACITY),
         })
+    return items
+
+
+def _cursors(items: List[Dict[str, Any]], scope: str, has_prev: bool, has_next: bool) -> Dict[str, Optional[str]]:
+    """Curseurs opaques (score, user_id) des pages voisines, None en bout de classement."""
+    if not items:
+        return {"next_cursor": None, "prev_cursor": None}
+    first, last = items[0], items[-1]
+    return {
+        "next_cursor": encode_cursor(scope, "next", last["score_total"], last["user_id"]) if has_next else None,
+        "prev_cursor": encode_cursor(scope, "prev", first["score_total"], first["user_id"]) if has_prev else None,
+    }
+
+
+async def _page(repo, scope: str, metric: str, limit: int, offset: int, cursor: Optional[str]):
+    """(position du premier, lignes, page précédente ?, page suivante ?) ; limit + 1 lignes lues."""
+    if cursor is None:
+        rows = await repo.top(metric, offset, limit + 1)
+        return offset, rows[:limit], offset > 0, len(rows) > limit
+    try:
+        direction, score, user_id = decode_cursor(cursor, scope)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if direction == "next":
+        start, rows = await repo.after(metric, score, user_id, limit + 1)
+        return start, rows[:limit], start > 0, len(rows) > limit
+    start, rows = await repo.before(metric, score, user_id, limit)
+    return start, rows, start > 0, True
+
+
+@router.get("")
+async def get_leaderboard(
+    scope: Literal["all", "this_week"] = Query("all"),
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor / prev_cursor d'une page précédente"),
+    identity: Optional[Identity] = Depends(optional_identity),
+):
+    if cursor is not None and offset:
+        raise HTTPException(status_code=400, detail="cursor et offset sont exclusifs")
+    repo = _repo()
+    metric = _metric(scope)
+
+    # 1) page et 2) "me" (position + scores) : indépendants, lancés en parallèle
+    page, me = await asyncio.gather(
+        _page(repo, scope, metric, limit, offset, cursor),
+        _me_entry(repo, identity.user_id if identity else None, scope, metric),
+        return_exceptions=True,
+    )
+    if isinstance(page, HTTPException):
+        raise page
+    if isinstance(page, Exception):
+        raise HTTPException(status_code=500, detail=f"Classement fetch failed: {page}")
+    if isinstance(me, Exception):
+        raise me
+
+    start, rows, has_prev, has_next = page
+    items = _items(rows, start, scope)
+    return {"scope": scope, "items": items, "me": me, **_cursors(items, scope, has_prev, has_next)}
+
+
+@router.get("/around_me")
+async def get_around_me(
+    scope: Literal["all", "this_week"] = Query("all"),
+    radius: int = Query(10, ge=0, le=100),
+    user_id: int = Depends(current_user_id),
+):
+    """`radius` entrées de part et d'autre de l'appelant ; curseurs pour poursuivre dans les deux sens."""
+    repo = _repo()
+    metric = _metric(scope)
+    window, me = await asyncio.gather(
+        repo.around(metric, user_id, radius, after=radius + 1),  # une ligne de plus : page suivante ?
+        _me_entry(repo, user_id, scope, metric),
+        return_exceptions=True,
+    )
+    if isinstance(window, Exception):
+        raise HTTPException(status_code=500, detail=f"Classement fetch failed: {window}")
+    if isinstance(me, Exception):
+        raise me
 
-    # 2) "me" (position + scores)
-    me = None
-    me_user_id = _me_user_id_from_bearer(authorization)
-    if me_user_id is not None:
-        me_row = sb.table("Classement").select("score_global,score_week").eq("Users_Id", me_user_id).maybe_single().execute()
-        data = getattr(me_row, "data", None)
-        if data:
-            my_glob = int(data.get("score_global") or 0)
-            my_score = int(data.get("score_week") or 0) if scope == "this_week" else my_glob
-            # rang = nb STRICTEMENT supérieurs + 1
-            cnt = sb.table("Classement").select("Users_Id", count="exact", head=True).gt(metric, my_score).execute()
-            greater = int(getattr(cnt, "count", 0) or 0)
-            me = {
-                "rank": greater + 1,
-                "user_id": me_user_id,
-                "display_name": None,
-                "score_total": my_score,
-                "pixel_ratio": min(1.0, my_glob / CAPACITY),
-            }
-
-    return {"scope": scope, "items": items, "me": me}
+    start, rows = window
+    items = _items(rows, start, scope)
+    mine = next((i for i, it in enumerate(items) if it["user_id"] == user_id), None)
+    has_next = mine is not None and len(items) > mine + radius + 1
+    if mine is not None:
+        items = items[:mine + radius + 1]
+    return {"scope": scope, "radius": radius, "items": items, "me": me,
+            **_cursors(items, scope, start > 0, has_next)}
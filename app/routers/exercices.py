@@ -3,57 +3,14 @@ from typing import Literal, List, Dict, Any, Optional
 from ..deps import supabase
 import random
 from ..services.user_resolver import resolve_or_register_user_id
+from ..services.position_store import current_parcours
 
 router = APIRouter()
 
 def _get_position_par_type(user_id: int, type_op: str) -> Optional[Dict[str, Any]]:
     """Récupère la position ACTUELLE (Parcours) pour ce user et ce type,
     sinon renvoie le premier niveau du type."""
-    # Derniers suivis
-    suivis = (
-        supabase.table("Suivi_Parcours")
-        .select("Parcours_Id,id")
-        .eq("Users_Id", user_id)
-        .order("id", desc=True)
-        .limit(50)
-        .execute()
-        .data
-        or []
-    )
-    for s in suivis:
-        prow = (
-            supabase.table("Parcours")
-            .select("*")
-            .eq("id", s["Parcours_Id"])
-            .limit(1)
-            .execute()
-            .data
-            or []
-        )
-        if prow and prow[0].get("Type_Operation") == type_op:
-            return prow[0]
-
-    # Fallback: premier niveau du type
-    p_rows = (
-        supabase.table("Parcours")
-        .select("*")
-        .eq("Type_Operation", type_op)
-        .order("Niveau")
-        .limit(1)
-        .execute()
-        .data
-    )
-    if not p_rows:
-        p_rows = (
-            supabase.table("Parcours")
-            .select("*")
-            .eq("Type_Operation", type_op)
-            .order("id")
-            .limit(1)
-            .execute()
-            .data
-        )
-    return p_rows[0] if p_rows else None
+    return current_parcours(supabase, user_id, [type_op]).get(type_op)
 
 
 def _gen_add(a_min:int, a_max:int, b_min:int, b_max:int) -> dict:
@@ -3,11 +3,11 @@
 Router pour gérer les paramètres de notifications des utilisateurs.
 """
 
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 from datetime import time
-from ..deps import service_client
+from ..deps import current_user_id, service_client
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,36 +28,13 @@ class NotificationSettingsResponse(BaseModel):
     notification_token: Optional[str]
 
 
-def _get_user_id_from_bearer(authorization: Optional[str]) -> Optional[int]:
-    """Résout Users_Id depuis le JWT."""
-    if not authorization or not authorization.lower().startswith("bearer "):
-        return None
-    jwt = authorization.split(" ", 1)[1]
-    try:
-        supabase = service_client()
-        u = supabase.auth.get_user(jwt)
-        user_obj = getattr(u, "user", None) or u
-        auth_uid = user_obj.id
-        m = supabase.table("users_map").select("user_id").eq("auth_uid", auth_uid).maybe_single().execute()
-        data = getattr(m, "data", None)
-        return int(data["user_id"]) if data and "user_id" in data else None
-    except Exception as e:
-        logger.error(f"Erreur résolution user_id: {e}")
-        return None
-
-
 @router.get("", response_model=NotificationSettingsResponse)
 async def get_notification_settings(
-    authorization: Optional[str] = Header(None)
+    user_id: int = Depends(current_user_id)
 ):
     """
     Récupère les paramètres de notification de l'utilisateur connecté.
     """
-    user_id = _get_user_id_from_bearer(authorization)
-    
-    if user_id is None:
-        raise HTTPException(status_code=401, detail="Non authentifié")
-    
     try:
         supabase = service_client()
         
@@ -94,16 +71,11 @@ async def get_notification_settings(
 @router.put("")
 async def update_notification_settings(
     settings: NotificationSettings,
-    authorization: Optional[str] = Header(None)
+    user_id: int = Depends(current_user_id)
 ):
     """
     Met à jour les paramètres de notification de l'utilisateur connecté.
     """
-    user_id = _get_user_id_from_bearer(authorization)
-    
-    if user_id is None:
-        raise HTTPException(status_code=401, detail="Non authentifié")
-    
     try:
         supabase = service_client()
         
@@ -159,16 +131,11 @@ async def update_notification_settings(
 
 @router.post("/test-notification")
 async def send_test_notification(
-    authorization: Optional[str] = Header(None)
+    user_id: int = Depends(current_user_id)
 ):
     """
     Envoie une notification de test à l'utilisateur connecté.
     """
-    user_id = _get_user_id_from_bearer(authorization)
-    
-    if user_id is None:
-        raise HTTPException(status_code=401, detail="Non authentifié")
-    
     try:
         supabase = service_client()
         
@@ -1,6 +1,7 @@
 # app/routers/observations.py
-from fastapi import APIRouter, HTTPException, Query
-from app.deps import supabase
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from app.deps import conditional_get, supabase
+from app.services.session_stats import entrainement_stats, is_missing_table, mark_stats_missing, stats_enabled
 
 router = APIRouter(prefix="/observations", tags=["observations"])
 
@@ -16,10 +17,54 @@ def norm_op(op: str | None) -> str | None:
     if o.startswith("mul") or o.startswith("mult"): return "Multiplication"
     return None
 
+def _metrics_from_stats(entrainement_id: int) -> dict | None:
+    """Une ligne Stats_Entrainement par (parcours, opération) au lieu des observations ; None si la table est absente."""
+    if not stats_enabled():
+        return None
+    try:
+        rows = entrainement_stats(supabase, entrainement_id)
+    except Exception as e:
+        if is_missing_table(e):
+            mark_stats_missing(e)
+            return None
+        raise HTTPException(status_code=502, detail=f"Supabase client error: {e}")
+
+    acc = {k: [0, 0, 0.0, 0, 0.0, 0] for k in ("Addition", "Soustraction", "Multiplication")}
+    for s in rows:
+        k = norm_op(s.get("Operation"))
+        if not k:
+            continue
+        a = acc[k]
+        for i, col in enumerate(("n", "corrects", "sum_temps", "n_temps", "sum_marge", "n_marge")):
+            a[i] += s.get(col) or 0
+
+    def compute(a: list) -> dict:
+        total, ok, sum_t, n_t, sum_m, n_m = a
+        if total == 0:
+            return {"successRate": 0, "avgTimeSec": 0.0, "errorMargin": 0.0, "count": 0}
+        return {
+            "successRate": round((ok/total)*100),
+            "avgTimeSec": sum_t/n_t if n_t else 0.0,
+            "errorMargin": sum_m/n_m if n_m else 0.0,
+            "count": total
+        }
+
+    return {k: compute(a) for k, a in acc.items()}
+
 @router.get("/metrics")
 def metrics_of_entrainement(
+    request: Request,
+    response: Response,
     entrainement_id: int = Query(..., description="Id de l'entraînement"),
 ):
+    nm = conditional_get(request, response, "observations_metrics", entrainement_id=entrainement_id)
+    if nm is not None:
+        return nm
+
+    stats = _metrics_from_stats(entrainement_id)
+    if stats is not None:
+        return stats
+
     try:
         res = (
             supabase.table(TABLE_NAME)
@@ -1,7 +1,10 @@
 # app/routers/parcours.py
-from fastapi import APIRouter, HTTPException, Query, Header
+from fastapi import APIRouter, HTTPException, Query, Header, Request, Response
 from typing import Optional, Dict, Any, Literal, List
-from ..deps import supabase, user_scoped_client
+from ..deps import conditional_get, supabase, user_scoped_client
+from ..services.keyset import iter_rows
+from ..services.parcours_catalog import get_catalog
+from ..services.position_store import read_positions
 import logging
 
 logger = logging.getLogger("uvicorn.error")
@@ -60,99 +63,46 @@ def _infer_user_id(
 def _last_suivi_for_type(sb, users_id: int, typ: OpType) -> Optional[Dict[str, Any]]:
     """Retourne la dernière position (niveau + meta) pour un type d'opération donné."""
     try:
-        res = (
-            sb.table("Suivi_Parcours")
-            .select("id,Users_Id,Parcours_Id,Date,Taux_Reussite,Type_Evolution")
-            .eq("Users_Id", users_id)
-            .order("id", desc=True)
-            .limit(300)
-            .execute()
-        )
-        suivis = getattr(res, "data", []) or []
+        pos = read_positions(sb, users_id).get(typ)
     except Exception as e:
-        print("[parcours] _last_suivi_for_type - err Suivi_Parcours:", e)
+        print("[parcours] _last_suivi_for_type - err Position_Courante:", e)
         return None
 
-    for s in suivis:
-        pid = s.get("Parcours_Id")
-        if not pid:
-            continue
-        try:
-            p = (
-                sb.table("Parcours")
-                .select("id,Niveau,Type_Operation")
-                .eq("id", pid)
-                .limit(1)
-                .execute()
-            )
-            prow = (getattr(p, "data", []) or [None])[0]
-        except Exception as e:
-            print("[parcours] _last_suivi_for_type - err Parcours:", e)
-            continue
-
-        if not prow or prow.get("Type_Operation") != typ:
-            continue
-
-        return {
-            "niveau": prow.get("Niveau"),
-            "parcours_id": pid,
-            "taux": s.get("Taux_Reussite"),
-            "type_evolution": s.get("Type_Evolution"),
-            "date": s.get("Date"),
-        }
+    if not pos:
+        return None
 
-    return None
+    return {
+        "niveau": pos.get("Niveau"),
+        "parcours_id": pos.get("Parcours_Id"),
+        "taux": pos.get("Taux_Reussite"),
+        "type_evolution": pos.get("Type_Evolution"),
+        "date": pos.get("Date"),
+    }
 
 
 def _last_suivi_by_type(sb, users_id: int) -> Dict[str, Dict[str, Any]]:
     """
     Retourne, pour chaque type d’opération, le dernier suivi + le parcours associé
     + le critère et les 'restantes' avant prochain test critique (calculé avec Derniere_Observation_Id).
+    Les trois positions viennent d'une seule lecture de Position_Courante.
     """
     out: Dict[str, Dict[str, Any]] = {}
-    seen = set()
 
     try:
-        rs = (
-            sb.table("Suivi_Parcours")
-            .select("id,Users_Id,Parcours_Id,Date,Taux_Reussite,Type_Evolution,Derniere_Observation_Id")
-            .eq("Users_Id", users_id)
-            .order("id", desc=True)
-            .limit(200)
-            .execute()
-        )
-        suivis = getattr(rs, "data", []) or []
+        positions = read_positions(sb, users_id)
     except Exception as e:
-        print("[parcours] _last_suivi_by_type - err Suivi_Parcours:", e)
-        suivis = []
-
-    for s in suivis:
-        pid = s.get("Parcours_Id")
-        if not pid:
-            continue
-
-        try:
-            pr = (
-                sb.table("Parcours")
-                .select("id,Type_Operation,Niveau,Critere")
-                .eq("id", pid)
-                .limit(1)
-                .execute()
-            )
-            prow = (getattr(pr, "data", []) or [None])[0]
-        except Exception as e:
-            print("[parcours] _last_suivi_by_type - err Parcours:", e)
-            prow = None
+        print("[parcours] _last_suivi_by_type - err Position_Courante:", e)
+        positions = {}
 
+    catalog = get_catalog()
+    for typ, pos in positions.items():
+        pid = pos.get("Parcours_Id")
+        prow = catalog.get(pid)
         if not prow:
             continue
 
-        typ = prow.get("Type_Operation")
-        if not typ or typ in seen:
-            continue
-
         critere = int(prow.get("Critere") or 20)
-        last_obs_id = int(s.get("Derniere_Observation_Id") or 0)
+        last_obs_id = int(pos.get("Derniere_Observation_Id") or 0)
 
         # compte les obs réalisées DEPUIS le dernier test critique
         try:
@@ -172,17 +122,13 @@ def _last_suivi_by_type(sb, users_id: int) -> Dict[str, Dict[str, Any]]:
         out[typ] = {
             "niveau": prow.get("Niveau"),
             "parcours_id": pid,
-            "taux": s.get("Taux_Reussite"),
-            "type_evolution": s.get("Type_Evolution"),
-            "date": s.get("Date"),
+            "taux": pos.get("Taux_Reussite"),
+            "type_evolution": pos.get("Type_Evolution"),
+            "date": pos.get("Date"),
             "critere": critere,
             "restantes": restantes,
         }
 
-        seen.add(typ)
-        if len(out) == 3:
-            break
-
     return out
 
 # -------------------------------------------------------------------
@@ -282,6 +228,8 @@ def get_parcours_position(
 # -------------------------------------------------------------------
 @router.get("/positions_currentes")
 def positions_currentes(
+    request: Request,
+    response: Response,
     user_id: Optional[int] = Query(None, description="Id interne utilisateur"),
     parcours_id: Optional[int] = Query(None, description="Parcours seed si user_id absent"),
     authorization: Optional[str] = Header(default=None),
@@ -316,6 +264,11 @@ def positions_currentes(
             "score_global": None,
         }
 
+    # ETag (dernière observation, dernier suivi, positions) : 304 avant les lectures
+    nm = conditional_get(request, response, "positions_currentes", private=True, user_id=uid)
+    if nm is not None:
+        return nm
+
     # 2) positions par type
     by_type = _last_suivi_by_type(sb, uid)
 
@@ -398,14 +351,8 @@ def score_cumule(
         raise HTTPException(status_code=400, detail="user_id ou parcours_id requis")
 
     try:
-        e = (
-            sb.table("Entrainement")
-             .select("id")
-             .eq("Users_Id", uid)
-             .order("id", desc=True)
-             .limit(100000).execute()
-        )
-        eids = [int(r["id"]) for r in (getattr(e, "data", []) or []) if r.get("id") is not None]
+        e = iter_rows(lambda: sb.table("Entrainement").select("id").eq("Users_Id", uid), desc=True)
+        eids = [int(r["id"]) for r in e if r.get("id") is not None]
         if not eids:
             return {"points": [], "meta": {"bucket": bucket, "window_obs": window_obs}}
     except Exception as ex:
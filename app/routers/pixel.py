@@ -1,19 +1,13 @@
 # app/routers/pixel.py
-import os
 from datetime import date, datetime
 from fastapi import APIRouter, HTTPException, Query
-from supabase import create_client, Client
+from app.deps import service_client
+from app.services import leaderboard
 from app.services.user_resolver import resolve_or_register_user_id
 
 router = APIRouter(prefix="/pixel", tags=["pixel"])
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    raise RuntimeError("SUPABASE_URL ou SUPABASE_SERVICE_ROLE_KEY manquant. Charge ton .env au démarrage.")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = service_client()
 
 CAPACITY = 350 * 350  # 122_500
 
@@ -95,11 +89,13 @@ def get_pixel_state(auth_uid: str = Query(..., description="UUID Supabase de l'u
                     cl.get("malus_applied_date") == date.today().isoformat()
                 )
                 if cl and not already_applied:
-                    supabase.table("Classement").update({
+                    malused = {
                         "score_global":       max(0, int(cl.get("score_global") or 0) - malus),
                         "score_week":         max(0, int(cl.get("score_week")   or 0) - malus),
                         "malus_applied_date": date.today().isoformat(),
-                    }).eq("Users_Id", user_id).execute()
+                    }
+                    supabase.table("Classement").update(malused).eq("Users_Id", user_id).execute()
+                    leaderboard.apply_totals(user_id, malused)
 
     except Exception as e:
         print(f"[PIXEL STATE] users_map error: {e}")
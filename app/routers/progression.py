@@ -1,11 +1,26 @@
 # app/routers/progression.py
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from datetime import datetime
 from typing import Literal, Optional
 from collections import Counter
+from itertools import islice
 import datetime as dt
-from typing import Literal, Optional, Dict, Any
-from ..deps import supabase
+from typing import Literal, Optional, Dict, Any, Iterable, Iterator
+from ..deps import conditional_get, supabase
+from ..services.activity import activity_enabled, is_missing_feature, mark_activity_missing, parcours_daily_counts
+from ..services.evolution import EvolutionService
+from ..services.parcours_catalog import get_catalog
+from ..services.keyset import PAGE_SIZE, iter_in, iter_rows
+from ..services.position_store import append_suivi, read_positions
+from ..services.score_series import CHECKPOINT, user_series, window_points
+from ..services.session_stats import (
+    is_correct,
+    is_missing_table,
+    iter_parcours_stats,
+    latest_sessions,
+    mark_stats_missing,
+    stats_enabled,
+)
 
 router = APIRouter(prefix="/progression", tags=["progression"])
 
@@ -18,70 +33,50 @@ def analyser_progression(
     type: str = Query(..., regex="^(Addition|Soustraction|Multiplication)$")
 ):
     # NOTE : cette section reprend ta logique existante.
-    suivis = (supabase.table("Suivi_Parcours")
-              .select("id,Parcours_Id,Derniere_Observation_Id")
-              .eq("Users_Id", user_id)
-              .order("id", desc=True)
-              .limit(50).execute().data or [])
-    suivi = None
+    # Fenêtre = compteurs de Position_Courante depuis le dernier suivi (migration 017),
+    # sans relire les observations.
+    evo = EvolutionService(supabase)
+    suivi = evo.current_position(user_id, type)
     parcours_id = None
     critere = 20
 
-    for s in suivis:
-        prow = (supabase.table("Parcours")
-                .select("id,Type_Operation,Critere")
-                .eq("id", s["Parcours_Id"])
-                .limit(1).execute().data or [])
-        if prow and prow[0]["Type_Operation"] == type:
-            suivi = s
-            parcours_id = prow[0]["id"]
-            critere = int(prow[0].get("Critere", 20))
-            break
+    prow = get_catalog().get(suivi.get("Parcours_Id")) if suivi else None
+    if prow:
+        parcours_id = prow["id"]
+        critere = int(prow.get("Critere", 20))
 
     if not suivi or not parcours_id:
         raise HTTPException(400, detail="Aucun suivi pour ce type (initialise d'abord)")
 
-    last_obs_used = suivi.get("Derniere_Observation_Id") or 0
+    window = evo.window_for(user_id, type)
+    if window["total"] < critere:
+        return {"status": "not_enough_data", "have": window["total"], "need": critere}
 
-    obs = (supabase.table("Observations")
-           .select("id,Etat")
-           .eq("Parcours_Id", parcours_id)    # ✅ on filtre bien par Parcours_Id ici
-           .gt("id", last_obs_used)
-           .order("id")
-           .limit(10000).execute().data or [])
-
-    if len(obs) < critere:
-        return {"status": "not_enough_data", "have": len(obs), "need": critere}
-
-    selection = obs[-critere:]
-    nb_bonnes = sum(1 for r in selection if (r.get("Etat") or "").upper() == "VRAI")
-    taux = round(nb_bonnes / critere, 2)
+    taux = round(window["corrects"] / window["total"], 2)
 
     evolution = "stagnation"
     next_parcours_id = parcours_id
+    # voisins par Niveau (échelle du catalogue), pas par ordre d'id
+    prv = nxt = None
+    if prow.get("Niveau") is not None:
+        prv, _, nxt = get_catalog().neighbors(type, int(prow["Niveau"]))
 
     if taux >= 0.95:
         evolution = "progression"
-        nxt = (supabase.table("Parcours")
-               .select("id").eq("Type_Operation", type)
-               .gt("id", parcours_id).order("id").limit(1).execute().data)
-        if nxt: next_parcours_id = nxt[0]["id"]
+        if nxt: next_parcours_id = nxt["id"]
     elif taux < 0.5:
         evolution = "régression"
-        prv = (supabase.table("Parcours")
-               .select("id").eq("Type_Operation", type)
-               .lt("id", parcours_id).order("id", desc=True).limit(1).execute().data)
-        if prv: next_parcours_id = prv[0]["id"]
+        if prv: next_parcours_id = prv["id"]
 
-    last_obs_id = selection[-1]["id"]
-    supabase.table("Suivi_Parcours").insert({
+    last_obs_id = window["last_id_included"]
+    append_suivi(supabase, {
         "Users_Id": user_id,
         "Parcours_Id": next_parcours_id,
         "Date": datetime.now().strftime("%Y-%m-%d"),
         "Taux_Reussite": taux,
         "Type_Evolution": evolution,
         "Derniere_Observation_Id": last_obs_id
-    }).execute()
+    })
 
     return {"status": "ok", "taux": taux, "evolution": evolution, "next_parcours_id": next_parcours_id}
 
@@ -106,12 +101,7 @@ def _num(x) -> Optional[float]:
         pass
     return None
 
-def _is_ok(r: dict) -> bool:
-    # Etat peut être 'VRAI' / 'FAUX' ou on compare Proposition vs Solution
-    etat = (r.get("Etat") or "").upper()
-    if etat in ("VRAI", "FAUX"):
-        return etat == "VRAI"
-    return str(r.get("Proposition")) == str(r.get("Solution"))
+_is_ok = is_correct
 
 def _norm_op(op: str | None) -> Optional[str]:
     if not op: return None
@@ -121,81 +111,171 @@ def _norm_op(op: str | None) -> Optional[str]:
     if o.startswith("mul"): return "Multiplication"
     return None
 
-def _fetch_obs(parcours_id: int | str) -> list[dict]:
-    """Lit les observations d'un PARCOURS (tri par id car pas de created_at)."""
+def _iter_obs(parcours_id: int | str) -> Iterator[dict]:
+    """Observations d'un PARCOURS en flux, par id croissant (pas de created_at)."""
+    try:
+        yield from iter_rows(lambda: supabase.table(OBS_TABLE)
+                             .select(OBS_SELECT)
+                             .eq("Parcours_Id", parcours_id))   # ✅ filtre par parcours
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Supabase client error: {e}")
+
+
+class _Agg:
+    """Agrégats d'un groupe d'observations, alimentés ligne à ligne."""
+    __slots__ = ("n", "ok", "score", "erreur", "temps", "label")
+
+    def __init__(self, label=None):
+        self.n = self.ok = 0
+        self.score: list[float] = [0.0, 0]   # [somme, nb valeurs numériques]
+        self.erreur: list[float] = [0.0, 0]
+        self.temps: list[float] = [0.0, 0]
+        self.label = label
+
+    def add(self, r: dict) -> None:
+        self.n += 1
+        self.ok += _is_ok(r)
+        for acc, col in ((self.score, "Score"), (self.erreur, "Marge_Erreur"), (self.temps, "Temps_Seconds")):
+            v = _num(r.get(col))
+            if v is not None:
+                acc[0] += v; acc[1] += 1
+
+    def add_stats(self, s: dict) -> None:
+        """Ligne Stats_Entrainement : agrégats d'une session, ajoutés d'un bloc."""
+        self.n += int(s.get("n") or 0)
+        self.ok += int(s.get("corrects") or 0)
+        for acc, m in ((self.score, "score"), (self.erreur, "marge"), (self.temps, "temps")):
+            acc[0] += float(s.get(f"sum_{m}") or 0); acc[1] += int(s.get(f"n_{m}") or 0)
+
+    @staticmethod
+    def mean(acc: list[float]) -> float:
+        return round(acc[0]/acc[1], 2) if acc[1] else 0.0
+
+
+def _stats_call(fn, *args):
+    """Lecture Stats_Entrainement ; None si la table est absente (migration 018)."""
+    if not stats_enabled():
+        return None
     try:
-        res = (supabase.table(OBS_TABLE)
-               .select(OBS_SELECT)
-               .eq("Parcours_Id", parcours_id)   # ✅ filtre par parcours
-               .order("id", desc=False)
-               .limit(100000)
-               .execute())
+        return fn(*args)
+    except HTTPException:
+        raise
     except Exception as e:
+        if is_missing_table(e):
+            mark_stats_missing(e)
+            return None
         raise HTTPException(status_code=502, detail=f"Supabase client error: {e}")
 
-    if getattr(res, "error", None):
-        raise HTTPException(status_code=500, detail=str(res.error))
-    return getattr(res, "data", []) or []
+
+def _session_groups(parcours_id: int, operation: Optional[str], limit: int) -> Optional[list[tuple[int, _Agg]]]:
+    """(rang, agrégat) des `limit` derniers entraînements, depuis Stats_Entrainement."""
+    res = _stats_call(latest_sessions, supabase, parcours_id, operation, limit)
+    if res is None:
+        return None
+    rows, total = res
+    by_eid: dict[int, _Agg] = {}
+    for s in rows:
+        k = int(s["Entrainement_Id"])
+        g = by_eid.get(k)
+        if g is None:
+            g = by_eid[k] = _Agg(s["Entrainement_Id"])
+        g.add_stats(s)
+    first = max(total - len(by_eid), 0)
+    return [(first + i + 1, by_eid[k]) for i, k in enumerate(sorted(by_eid))]
+
+
+def _obs_tail(parcours_id: int, operation: Optional[str], bucket: int, limit: int) -> tuple[int, list[dict]]:
+    """
+    Observations des `limit` derniers paquets de `bucket` (découpés depuis la première
+    observation du parcours) : un comptage, puis la queue seulement, lue à rebours.
+    Retourne (paquets précédents, observations par id croissant).
+    """
+    def base():
+        q = supabase.table(OBS_TABLE).select(OBS_SELECT).eq("Parcours_Id", parcours_id)
+        return q.eq("Operation", operation) if operation else q
+
+    try:
+        q = supabase.table(OBS_TABLE).select("id", count="exact").eq("Parcours_Id", parcours_id)
+        if operation:
+            q = q.eq("Operation", operation)
+        total = int(getattr(q.limit(0).execute(), "count", 0) or 0)
+        skipped = max(-(-total // bucket) - limit, 0)
+        need = total - skipped * bucket
+        if need <= 0:
+            return skipped, []
+        tail = list(islice(iter_rows(base, desc=True, page_size=min(PAGE_SIZE, need)), need))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Supabase client error: {e}")
+    return skipped, tail[::-1]
 
 
 # --- KPI time series ---------------------------------------------------------
 @router.get("/kpi_timeseries")
 def kpi_timeseries(
+    request: Request,
+    response: Response,
     parcours_id: int = Query(...),
     kpi: KPI = Query("taux"),
     granularite: GRAN = Query("entrainement"),
     operation: OP = Query("MIXTE"),
     limit: int = Query(100, ge=1, le=500),
 ):
-    rows = _fetch_obs(parcours_id)
-
-    if operation != "MIXTE":
-        rows = [r for r in rows if _norm_op(r.get("Operation")) == operation]
-
-    # Groupement
-    groups: list[list[dict]] = []
-    if granularite == "entrainement":
-        by_eid: dict[int, list[dict]] = {}
-        for r in rows:
-            k = int(r.get("Entrainement_Id") or 0)
-            by_eid.setdefault(k, []).append(r)
-        for k_ in sorted(by_eid.keys()):
-            groups.append(by_eid[k_])
-    else:
-        bucket = 10 if granularite == "obs10" else 50
-        buf: list[dict] = []
-        for r in rows:
-            buf.append(r)
-            if len(buf) == bucket:
-                groups.append(buf); buf = []
-        if buf: groups.append(buf)
-
-    # Calcul KPI
-    def calc(gr: list[dict]) -> float:
-        if not gr: return 0.0
+    nm = conditional_get(request, response, "kpi_timeseries", parcours_ids=[parcours_id])
+    if nm is not None:
+        return nm
+    # Seuls les `limit` derniers groupes sont lus : agrégats par session (Stats_Entrainement)
+    # ou queue des observations pour les paquets obs10 / obs50
+    def calc(g: _Agg) -> float:
+        if not g.n: return 0.0
         if kpi == "score":
             # si Score présent, moyenne ; sinon ok-ko
-            vals = [_num(r.get("Score")) for r in gr if _num(r.get("Score")) is not None]
-            if vals: return round(sum(vals) / len(vals), 2)
-            ok = sum(1 for r in gr if _is_ok(r)); ko = len(gr) - ok
-            return float(ok - ko)
+            if g.score[1]: return _Agg.mean(g.score)
+            return float(g.ok - (g.n - g.ok))
         if kpi == "taux":
-            ok = sum(1 for r in gr if _is_ok(r))
-            return round((ok/len(gr))*100, 2)
+            return round((g.ok/g.n)*100, 2)
         if kpi == "erreur":
-            vals = [_num(r.get("Marge_Erreur")) for r in gr]; vals = [v for v in vals if v is not None]
-            return round(sum(vals)/len(vals), 2) if vals else 0.0
+            return _Agg.mean(g.erreur)
         if kpi == "temps":
-            vals = [_num(r.get("Temps_Seconds")) for r in gr]; vals = [v for v in vals if v is not None]
-            return round(sum(vals)/len(vals), 2) if vals else 0.0
+            return _Agg.mean(g.temps)
         return 0.0
 
+    op_filter = None if operation == "MIXTE" else operation
+    if granularite == "entrainement":
+        groups = _session_groups(parcours_id, op_filter, limit)
+        if groups is None:   # Stats_Entrainement absente : observations brutes
+            by_eid: dict[int, _Agg] = {}
+            for r in _iter_obs(parcours_id):
+                if op_filter and _norm_op(r.get("Operation")) != op_filter:
+                    continue
+                eid = r.get("Entrainement_Id")
+                k = int(eid or 0)
+                g = by_eid.get(k)
+                if g is None:
+                    g = by_eid[k] = _Agg(eid)
+                g.add(r)
+            keys = sorted(by_eid.keys())
+            groups = [(i+1, by_eid[k_]) for i, k_ in enumerate(keys)][-limit:]
+    else:
+        bucket = 10 if granularite == "obs10" else 50
+        n_groups, rows = _obs_tail(parcours_id, op_filter, bucket, limit)
+        groups = []
+        cur: Optional[_Agg] = None
+        for r in rows:
+            if cur is None:
+                n_groups += 1
+                cur = _Agg()
+                groups.append((n_groups, cur))
+            cur.add(r)
+            if cur.n == bucket:
+                cur = None
+
     pts = [{
-        "x": i+1,
-        "label": f"# {gr[0].get('Entrainement_Id')}" if granularite == "entrainement" and gr else str(i+1),
-        "kpi": calc(gr)
-    } for i, gr in enumerate(groups)]
-    pts = pts[-limit:]
+        "x": x,
+        "label": f"# {g.label}" if granularite == "entrainement" else str(x),
+        "kpi": calc(g)
+    } for x, g in groups]
 
     # delta % (moyenne 2e moitié vs 1re moitié)
     delta_pct = None
@@ -210,13 +290,16 @@ def kpi_timeseries(
 
 
 # --- Régularité (courbe jour par jour) --------------------------------------
-def _fetch_entrainements_dates() -> dict[int, str]:
+def _fetch_entrainements_dates(eids: Iterable[int]) -> dict[int, str]:
     """
-    Map Entrainement_Id -> 'YYYY-MM-DD'.
+    Map Entrainement_Id -> 'YYYY-MM-DD', pour les seuls `eids` demandés (paquets `in`).
     Essaie d'abord la table 'Entrainement' (singulier), puis 'Entrainements' (pluriel).
     Essaie la colonne 'Date' puis 'date'.
     Renvoie {} si aucune combinaison ne marche.
     """
+    eids = list(eids)
+    if not eids:
+        return {}
     candidates = [
         ("Entrainement", '"id","Date"'),
         ("Entrainement", '"id","date"'),
@@ -225,24 +308,16 @@ def _fetch_entrainements_dates() -> dict[int, str]:
     ]
 
     for table_name, select_cols in candidates:
+        out: dict[int, str] = {}
         try:
-            res = (
-                supabase.table(table_name)
-                .select(select_cols)
-                .limit(100000)
-                .execute()
-            )
-            data = getattr(res, "data", []) or []
+            for r in iter_in(lambda: supabase.table(table_name).select(select_cols), "id", eids):
+                rid = r.get("id")
+                raw = r.get("Date") if "Date" in r else r.get("date")
+                if rid is None or not raw:
+                    continue
+                out[int(rid)] = str(raw)[:10]  # YYYY-MM-DD
         except Exception:
             continue  # essaie le candidat suivant
-
-        out: dict[int, str] = {}
-        for r in data:
-            rid = r.get("id")
-            raw = r.get("Date") if "Date" in r else r.get("date")
-            if rid is None or not raw:
-                continue
-            out[int(rid)] = str(raw)[:10]  # YYYY-MM-DD
         if out:
             return out
 
@@ -258,25 +333,29 @@ def _safe_iso(date_like) -> Optional[str]:
 
 
 
-@router.get("/regularite")
-def regularite(parcours_id: int = Query(...), days: int = Query(60, ge=7, le=365)):
-    rows = _fetch_obs(parcours_id)
-    eid2date = _fetch_entrainements_dates()
+def _raw_daily_counts(parcours_id: int, days: int) -> Counter:
+    """Observations par date d'entraînement, relues depuis les observations du parcours."""
+    per_eid = Counter()
+    total = 0
+    for r in _iter_obs(parcours_id):
+        total += 1
+        eid = r.get("Entrainement_Id")
+        if eid is not None:
+            per_eid[int(eid)] += 1
+    eid2date = _fetch_entrainements_dates(per_eid.keys())
 
     counts = Counter()
     any_date = False
-    for r in rows:
-        eid = r.get("Entrainement_Id")
-        d = _safe_iso(eid2date.get(int(eid))) if eid is not None else None
+    for eid, c in per_eid.items():
+        d = _safe_iso(eid2date.get(eid))
         if d:
-            counts[d] += 1
+            counts[d] += c
             any_date = True
 
     # si aucune date trouvée, timeline synthétique
     if not any_date:
         end = dt.date.today()
         start = end - dt.timedelta(days=days - 1)
-        total = len(rows)
         if total > 0:
             per_day = max(1, total // days)
             cur = start
@@ -286,9 +365,33 @@ def regularite(parcours_id: int = Query(...), days: int = Query(60, ge=7, le=365
                 counts[cur.isoformat()] += put
                 remaining -= put
                 cur += dt.timedelta(days=1)
+    return counts
+
 
+def _activity_call(fn, *args):
+    """Lecture des index datés (migration 019) ; None si table ou colonne absente."""
+    if not activity_enabled():
+        return None
+    try:
+        return fn(*args)
+    except HTTPException:
+        raise
+    except Exception as e:
+        if is_missing_feature(e):
+            mark_activity_missing(e)
+            return None
+        raise HTTPException(status_code=502, detail=f"Supabase client error: {e}")
+
+
+@router.get("/regularite")
+def regularite(parcours_id: int = Query(...), days: int = Query(60, ge=7, le=365)):
     end = dt.date.today()
     start = end - dt.timedelta(days=days - 1)
+    # seuls les jours affichés (Stats_Entrainement."Date"), à défaut toutes les observations
+    counts = _activity_call(parcours_daily_counts, supabase, parcours_id, start, end)
+    if counts is None:
+        counts = _raw_daily_counts(parcours_id, days)
+
     daily = []
     tmp = best = 0
     cur = start
@@ -313,41 +416,45 @@ def regularite(parcours_id: int = Query(...), days: int = Query(60, ge=7, le=365
 
 # --- Tableau des niveaux -----------------------------------------------------
 @router.get("/levels_summary")
-def levels_summary(parcours_id: int = Query(...), operation: str = Query("ALL")):
-    rows = _fetch_obs(parcours_id)
-    if operation != "ALL":
-        rows = [r for r in rows if _norm_op(r.get("Operation")) == operation]
-
-    def agg(sub: list[dict], op_label: str, niveau: Optional[int] = None) -> dict:
-        if not sub:
-            return {"operation": op_label, "niveau": niveau, "volume": 0, "taux": 0.0, "temps": 0.0, "erreur": 0.0}
-        ok = sum(1 for r in sub if _is_ok(r))
-        t = [_num(r.get("Temps_Seconds")) for r in sub]; t = [v for v in t if v is not None]
-        e = [_num(r.get("Marge_Erreur")) for r in sub]; e = [v for v in e if v is not None]
+def levels_summary(request: Request, response: Response,
+                   parcours_id: int = Query(...), operation: str = Query("ALL")):
+    nm = conditional_get(request, response, "levels_summary", parcours_ids=[parcours_id])
+    if nm is not None:
+        return nm
+
+    def agg(g: _Agg, op_label: str, niveau: Optional[int] = None) -> dict:
         return {
             "operation": op_label,
             "niveau": niveau,
-            "volume": len(sub),
-            "taux": round((ok/len(sub))*100, 1),
-            "temps": round(sum(t)/len(t), 2) if t else 0.0,
-            "erreur": round(sum(e)/len(e), 2) if e else 0.0,
+            "volume": g.n,
+            "taux": round((g.ok/g.n)*100, 1),
+            "temps": _Agg.mean(g.temps),
+            "erreur": _Agg.mean(g.erreur),
         }
 
     # Regroupement par opération (et, si tu veux, par Parcours_Id pour avoir une ligne par niveau)
-    by_op: dict[str, list[dict]] = {"Addition": [], "Soustraction": [], "Multiplication": []}
-    for r in rows:
-        k = _norm_op(r.get("Operation"))
-        if k: by_op[k].append(r)
+    def fill(rows: Iterable[dict], add) -> dict[str, _Agg]:
+        by_op = {"Addition": _Agg(), "Soustraction": _Agg(), "Multiplication": _Agg()}
+        for r in rows:
+            k = _norm_op(r.get("Operation"))
+            if k and (operation == "ALL" or k == operation):
+                add(by_op[k], r)
+        return by_op
+
+    # une ligne par session (Stats_Entrainement), à défaut les observations
+    by_op = _stats_call(lambda: fill(iter_parcours_stats(supabase, parcours_id), _Agg.add_stats))
+    if by_op is None:
+        by_op = fill(_iter_obs(parcours_id), _Agg.add)
 
     out = []
     if operation == "ALL":
-        for k, sub in by_op.items():
-            if sub:
-                out.append(agg(sub, k, niveau=None))  # on peut remplacer par le niveau réel si tu veux, via table Parcours
+        for k, g in by_op.items():
+            if g.n:
+                out.append(agg(g, k, niveau=None))  # on peut remplacer par le niveau réel si tu veux, via table Parcours
     else:
-        sub = by_op.get(operation, [])
-        if sub:
-            out.append(agg(sub, operation, niveau=None))
+        g = by_op.get(operation)
+        if g is not None and g.n:
+            out.append(agg(g, operation, niveau=None))
 
     return {"rows": out}
 
@@ -357,58 +464,24 @@ def levels_summary(parcours_id: int = Query(...), operation: str = Query("ALL"))
 # ---------- utils top-level (pas imbriqués) ----------
 def _last_suivi_by_type(users_id: int) -> Dict[str, Dict[str, Any]]:
     """
-    Retourne, pour un Users_Id donné, le dernier Suivi_Parcours par Type_Operation,
-    enrichi avec le Niveau depuis Parcours.
+    Retourne, pour un Users_Id donné, la position courante par Type_Operation
+    (une lecture de Position_Courante), enrichie avec le Niveau.
     """
     try:
-        res = (
-            supabase.table("Suivi_Parcours")
-            .select("id,Users_Id,Parcours_Id,Date,Taux_Reussite,Type_Evolution")
-            .eq("Users_Id", users_id)
-            .order("id", desc=True)
-            .limit(200)
-            .execute()
-        )
-        suivis = getattr(res, "data", []) or []
+        positions = read_positions(supabase, users_id)
     except Exception as e:
-        print("[parcours] _last_suivi_by_type - err Suivi_Parcours:", e)
+        print("[parcours] _last_suivi_by_type - err Position_Courante:", e)
         return {}
 
     out: Dict[str, Dict[str, Any]] = {}
-    seen = set()
-    for s in suivis:
-        pid = s.get("Parcours_Id")
-        if not pid:
-            continue
-        try:
-            p = (
-                supabase.table("Parcours")
-                .select("id,Type_Operation,Niveau")
-                .eq("id", pid)
-                .limit(1)
-                .execute()
-            )
-            prow = (getattr(p, "data", []) or [None])[0]
-        except Exception as e:
-            print("[parcours] _last_suivi_by_type - err Parcours:", e)
-            continue
-
-        if not prow:
-            continue
-        typ = prow.get("Type_Operation")
-        if not typ or typ in seen:
-            continue
-        seen.add(typ)
-
+    for typ, pos in positions.items():
         out[typ] = {
-            "niveau": prow.get("Niveau"),
-            "parcours_id": pid,
-            "taux": s.get("Taux_Reussite"),
-            "type_evolution": s.get("Type_Evolution"),
-            "date": s.get("Date"),
+            "niveau": pos.get("Niveau"),
+            "parcours_id": pos.get("Parcours_Id"),
+            "taux": pos.get("Taux_Reussite"),
+            "type_evolution": pos.get("Type_Evolution"),
+            "date": pos.get("Date"),
         }
-        if len(out) == 3:
-            break
     return out
 
 
@@ -498,60 +571,25 @@ def positions_currentes(
 
 @router.get("/score_cumule_50")
 def score_cumule_50(
+    request: Request,
+    response: Response,
     user_id: int = Query(..., description="ID interne Users.id (BIGINT)"),
-    windows: int = Query(10, ge=1, le=20, description="Nombre de fenêtres de 50 obs (10 = 500 obs cumulées)")
+    windows: int = Query(10, ge=1, le=20, description="Nombre de fenêtres de 50 obs (10 = 500 obs cumulées)"),
+    step: int = Query(CHECKPOINT, ge=CHECKPOINT, le=100 * CHECKPOINT, multiple_of=CHECKPOINT,
+                      description="Taille d'une fenêtre (multiple de 50)"),
 ):
-    # 1) récup ids d'entraînements du user
-    try:
-        r_e = supabase.table("Entrainement").select("id").eq("Users_Id", user_id).order("id").limit(50000).execute()
-        eids = [int(x["id"]) for x in (getattr(r_e,"data",[]) or []) if x.get("id") is not None]
-    except Exception as e:
-        raise HTTPException(502, f"Supabase error Entrainement: {e}")
-
-    if not eids:
-        return {"points": [], "meta": {"windows": windows}}
+    nm = conditional_get(request, response, "score_cumule_50", user_id=user_id)
+    if nm is not None:
+        return nm
 
-    # 2) récup observations triées par id
+    # une ligne Score_Cumule (sommes préfixes toutes les 50 obs), à défaut recalcul depuis les observations
     try:
-        r_o = (
-            supabase.table("Observations")
-            .select("id,Score")
-            .in_("Entrainement_Id", eids)
-            .order("id")
-            .limit(50 * windows)   # on ne garde que les N*50 dernières obs
-            .execute()
-        )
-        rows = getattr(r_o,"data",[]) or []
+        series = user_series(supabase, user_id)
     except Exception as e:
-        raise HTTPException(502, f"Supabase error Observations: {e}")
-
-    # 3) on prend la queue (N*50 dernières)
-    rows = rows[-(50 * windows):]
-
-    # 4) regrouper par blocs de 50 (du plus ancien au plus récent)
-    buckets: List[List[Dict[str,Any]]] = []
-    buf: List[Dict[str,Any]] = []
-    for r in rows:
-        buf.append(r)
-        if len(buf) == 50:
-            buckets.append(buf); buf = []
-    if buf:
-        # si pas multiple de 50, on complète le dernier bucket
-        buckets.append(buf)
-
-    # 5) calcul score cumulé (somme des scores par bucket, cumulée)
-    cum = 0
-    points = []
-    for i, b in enumerate(buckets, start=1):
-        s = 0
-        for r in b:
-            sc = r.get("Score")
-            try:
-                if sc is not None:
-                    s += int(float(str(sc)))
-            except Exception:
-                pass
-        cum += s
-        points.append({"x": i, "label": f"{i*50}", "y": cum})
-
-    return {"points": points, "meta": {"windows": windows}}
\ No newline at end of file
+        raise HTTPException(502, f"Supabase error Score_Cumule: {e}")
+
+    points = window_points(series, step, windows)
+    meta = {"windows": windows}
+    if step != CHECKPOINT:
+        meta["step"] = step
+    return {"points": points, "meta": meta}
\ No newline at end of file
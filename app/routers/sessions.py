@@ -1,19 +1,46 @@
-from fastapi import APIRouter, Body, Header, HTTPException, Query
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
 from typing import Any, Dict, List, Optional
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 from ..services.evolution import EvolutionService
+import asyncio
+import logging
 import random
-import math
-from collections import defaultdict
 from pydantic import BaseModel
-from ..deps import supabase, get_auth_uid_from_bearer, user_scoped_client  # ← ajout user_scoped_client
+from ..deps import (
+    supabase,
+    user_scoped_client,  # ← ajout user_scoped_client
+    async_service_client,
+    async_user_scoped_client,
+    optional_identity,
+)
+from ..services.identity import Identity
+from ..services.live_session import LiveSession
 from ..services.user_resolver import resolve_or_register_user_id
+from ..services.position_store import current_parcours
+from ..services.repositories import TrainingRepository
+from ..services.scoring import active_rules
+from ..services.scoring_stats import history_windows
+from ..services import idempotency, leaderboard, outbox
+from ..services.submission import (
+    classement_payloads,
+    increment_enabled,
+    mark_increment_missing,
+    mark_outbox_missing,
+    mark_rpc_missing,
+    outbox_enabled,
+    rpc_enabled,
+    score_session,
+    session_deltas,
+    session_keys,
+)
 import os
 print("[boot] sessions.py loaded from:", os.path.abspath(__file__))
 
 # -----------------------------------------------------------------------------
 # Router
 # -----------------------------------------------------------------------------
+logger = logging.getLogger("uvicorn.error")
 router = APIRouter()
 
 # -----------------------------------------------------------------------------
@@ -58,50 +85,61 @@ def _gen_mul(a_min: int, a_max: int, b_min: int, b_max: int):
     }
 
 
+def _mixte_exercises(positions: Dict[str, Any], n: int, include_solution: bool) -> List[Dict[str, Any]]:
+    """n exercices par type, bornes du parcours courant (generer_mixte, /ws/session)."""
+    gens = {"Addition": _gen_add, "Soustraction": _gen_sub, "Multiplication": _gen_mul}
+    exercices: List[Dict[str, Any]] = []
+    for t in ("Addition", "Soustraction", "Multiplication"):
+        pos = positions[t]
+        try:
+            a_min = int(pos.get("Operateur1_Min", 0))
+            a_max = int(pos.get("Operateur1_Max", 10))
+            b_min = int(pos.get("Operateur2_Min", 0))
+            b_max = int(pos.get("Operateur2_Max", 10))
+        except Exception as conv_err:
+            print("ERREUR conversion bornes:", t, pos, repr(conv_err))
+            raise HTTPException(500, detail=f"Parcours incomplet pour {t}: bornes opérateurs manquantes")
+
+        generator = gens[t]
+        for _ in range(n):
+            exo = generator(a_min, a_max, b_min, b_max)
+            item = {
+                "Parcours_Id": pos["id"],
+                "Operation": exo["operation"],  # affichage
+                "Operateur_Un": exo["operateur_un"],
+                "Operateur_Deux": exo["operateur_deux"],
+                "Type": exo["type"],  # catégorie logique
+            }
+            if include_solution:
+                item["Solution"] = exo["solution"]
+            exercices.append(item)
+    return exercices
+
+
 def _get_position_par_type(sb, user_id: int, type_op: str):
     """Retourne le parcours courant pour un type, sinon le premier parcours du type (via client user-scopé)."""
-    suivis = (
-        sb.table("Suivi_Parcours")
-        .select("Parcours_Id,id")
-        .eq("Users_Id", user_id)
-        .order("id", desc=True)
-        .limit(50)
-        .execute()
-        .data
-        or []
-    )
-    for s in suivis:
-        p_rows = (
-            sb.table("Parcours")
-            .select("*")
-            .eq("id", s["Parcours_Id"])
-            .limit(1)
-            .execute()
-            .data
-        )
-        if p_rows and p_rows[0].get("Type_Operation") == type_op:
-            return p_rows[0]
-
-    p_rows = (
-        sb.table("Parcours")
-        .select("*")
-        .eq("Type_Operation", type_op)
-        .order("Niveau")
-        .limit(1)
-        .execute()
-        .data
-    )
-    if not p_rows:
-        p_rows = (
-            sb.table("Parcours")
-            .select("*")
-            .eq("Type_Operation", type_op)
-            .order("id")
-            .limit(1)
-            .execute()
-            .data
-        )
-    return p_rows[0] if p_rows else None
+    return current_parcours(sb, user_id, [type_op]).get(type_op)
+
+
+def _training_repo(authorization: Optional[str]) -> TrainingRepository:
+    """Repository async des routes chaudes : client RLS du JWT + client service."""
+    return TrainingRepository(async_user_scoped_client(authorization), async_service_client())
+
+
+async def _caller_user_id(
+    repo: TrainingRepository,
+    identity: Optional[Identity],
+    auth_uid: Optional[str],
+    email: Optional[str],
+) -> int:
+    """Users.id depuis ?auth_uid= sinon le JWT vérifié (créé si absent) ; cache identity."""
+    if identity is not None and (not auth_uid or auth_uid == identity.auth_uid):
+        if identity.user_id is not None:
+            return identity.user_id
+        auth_uid, email = identity.auth_uid, email or identity.email
+    if not auth_uid:
+        raise HTTPException(status_code=400, detail="Fournir user_id ou auth_uid")
+    return await repo.resolve_user_id(auth_uid, email=email)
 
 
 @router.get("/parcours/positions_currentes")
@@ -182,7 +220,7 @@ def start_entrainement(
 
 
 @router.post("/entrainement/start_mixte")
-def start_entrainement_mixte(
+async def start_entrainement_mixte(
     user_id: Optional[int] = Query(None),
     auth_uid: Optional[str] = Query(None),
     email: Optional[str] = Query(None),
@@ -190,15 +228,13 @@ def start_entrainement_mixte(
     Volume_q: Optional[int] = Query(default=None, alias="Volume"),
     volume_q: Optional[int] = Query(default=None, alias="volume"),
     body: Optional[dict] = Body(default=None),
+    identity: Optional[Identity] = Depends(optional_identity),
 ):
     """Crée un Entrainement 'mixte' (Add+Sub+Mul) pour l'utilisateur. Volume total = volume*3."""
-    sb = user_scoped_client(authorization)
+    repo = _training_repo(authorization)
 
     if user_id is None:
-        auth_uid = auth_uid or get_auth_uid_from_bearer(authorization)
-        if not auth_uid:
-            raise HTTPException(status_code=400, detail="Fournir user_id ou auth_uid")
-        user_id = resolve_or_register_user_id(supabase, auth_uid, email=email)
+        user_id = await _caller_user_id(repo, identity, auth_uid, email)
 
     vol = None
     if isinstance(body, dict):
@@ -217,9 +253,10 @@ def start_entrainement_mixte(
     except Exception:
         raise HTTPException(status_code=422, detail=[{"loc": ["Volume"], "msg": "Volume must be between 1 and 200", "type": "value_error"}])
 
-    pos_add = _get_position_par_type(sb, user_id, "Addition")
-    pos_sub = _get_position_par_type(sb, user_id, "Soustraction")
-    pos_mul = _get_position_par_type(sb, user_id, "Multiplication")
+    positions = await repo.positions(user_id)
+    pos_add = positions.get("Addition")
+    pos_sub = positions.get("Soustraction")
+    pos_mul = positions.get("Multiplication")
     if not (pos_add and pos_sub and pos_mul):
         raise HTTPException(status_code=400, detail="Positions/parcours manquants pour un des types")
 
@@ -231,11 +268,9 @@ def start_entrainement_mixte(
         "Date": date.today().isoformat(),
         "Time": datetime.now().strftime("%H:%M:%S"),
     }
-    ins = sb.table("Entrainement").insert(payload).execute()
-    data = getattr(ins, "data", []) or []
-    if not data:
+    entrainement = await repo.insert_entrainement(payload)
+    if not entrainement:
         raise HTTPException(status_code=500, detail="Insertion Entrainement échouée")
-    entrainement = data[0]
 
     return {
         "entrainement_id": entrainement.get("id"),
@@ -253,7 +288,7 @@ def start_entrainement_mixte(
 # Génération exercices (mixte)
 # -----------------------------------------------------------------------------
 @router.get("/exercices/generer_mixte")
-def generer_exercices_mixte(
+async def generer_exercices_mixte(
     user_id: Optional[int] = Query(None),
     auth_uid: Optional[str] = Query(None),
     email: Optional[str] = Query(None),
@@ -263,16 +298,14 @@ def generer_exercices_mixte(
     volume_q: Optional[int] = Query(default=None, alias="volume"),
     include_solution: bool = Query(False),
     seed: Optional[int] = Query(None),
+    identity: Optional[Identity] = Depends(optional_identity),
 ):
     """Génère n exercices par type (Add/Sub/Mul) en fonction du parcours courant de l'utilisateur."""
-    sb = user_scoped_client(authorization)
+    repo = _training_repo(authorization)
 
     try:
         if user_id is None:
-            auth_uid = auth_uid or get_auth_uid_from_bearer(authorization)
-            if not auth_uid:
-                raise HTTPException(status_code=400, detail="Fournir user_id ou auth_uid")
-            user_id = resolve_or_register_user_id(supabase, auth_uid, email=email)
+            user_id = await _caller_user_id(repo, identity, auth_uid, email)
 
         n_val = n_q if n_q is not None else (Volume_q if Volume_q is not None else volume_q)
         if n_val is None:
@@ -288,39 +321,12 @@ def generer_exercices_mixte(
             random.seed(seed)
 
         types = ["Addition", "Soustraction", "Multiplication"]
-        positions: Dict[str, Dict[str, Any]] = {}
+        positions = await repo.positions(user_id)
         for t in types:
-            pos = _get_position_par_type(sb, user_id, t)
-            if not pos:
+            if not positions.get(t):
                 raise HTTPException(status_code=400, detail=f"Aucun niveau (Parcours) disponible pour {t}")
-            positions[t] = pos
 
-        gens = {"Addition": _gen_add, "Soustraction": _gen_sub, "Multiplication": _gen_mul}
-        exercices: List[Dict[str, Any]] = []
-        for t in types:
-            pos = positions[t]
-            try:
-                a_min = int(pos.get("Operateur1_Min", 0))
-                a_max = int(pos.get("Operateur1_Max", 10))
-                b_min = int(pos.get("Operateur2_Min", 0))
-                b_max = int(pos.get("Operateur2_Max", 10))
-            except Exception as conv_err:
-                print("ERREUR conversion bornes:", t, pos, repr(conv_err))
-                raise HTTPException(500, detail=f"Parcours incomplet pour {t}: bornes opérateurs manquantes")
-
-            generator = gens[t]
-            for _ in range(n):
-                exo = generator(a_min, a_max, b_min, b_max)
-                item = {
-                    "Parcours_Id": pos["id"],
-                    "Operation": exo["operation"],  # affichage
-                    "Operateur_Un": exo["operateur_un"],
-                    "Operateur_Deux": exo["operateur_deux"],
-                    "Type": exo["type"],  # catégorie logique
-                }
-                if include_solution:
-                    item["Solution"] = exo["solution"]
-                exercices.append(item)
+        exercices = _mixte_exercises(positions, n, include_solution)
 
         return {
             "mode": "mixte",
@@ -340,253 +346,70 @@ def generer_exercices_mixte(
 # -----------------------------------------------------------------------------
 # Observations (nouvelle logique : DB calcule Etat/Score/Marge_Erreur/Solution)
 # -----------------------------------------------------------------------------
-def _calculate_scoring(sb, entrainement_id: int, user_id: int, inserted_rows: List[Dict[str, Any]]) -> None:
+async def _calculate_scoring(repo: TrainingRepository, user_id: int, inserted_rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Porte en Python la logique du trigger calculate_new_scoring.
-    1. Une requête pour les IDs d'entraînements + une requête pour tout l'historique
-       (équivalent du JOIN Observations-Entrainement WHERE Users_Id = user_id)
-    2. Calcul en mémoire de bonus_vitesse, bonus_marge, score_global par Parcours_Id+Operation
-    3. Mise à jour en une seule requête upsert
-    Le trigger calculate_new_scoring reste actif pendant la phase de validation.
+    Fenêtres Stats_Scoring (1 lecture) → calcul en mémoire → upsert des scores et des fenêtres.
+    Retourne les scores écrits (vide si l'upsert a échoué).
     """
-    if not inserted_rows:
-        return
-
-    current_ids = {r["id"] for r in inserted_rows if r.get("id") is not None}
-    if not current_ids:
-        return
-
-    # --- 1) Historique : IDs des 200 entraînements les plus récents du user ---
-    entr_res = (
-        sb.table("Entrainement")
-        .select("id")
-        .eq("Users_Id", user_id)
-        .order("id", desc=True)
-        .limit(200)
-        .execute()
-    )
-    all_entr_ids = [r["id"] for r in (entr_res.data or [])]
-    if not all_entr_ids:
-        return
-
-    # --- 2) Toutes les observations (historique + courantes pour Etat/Marge_Erreur du trigger) ---
-    obs_res = (
-        sb.table("Observations")
-        .select(
-            "id, Entrainement_Id, Parcours_Id, Operation, Operateur_Un, Operateur_Deux, "
-            "Proposition, Correction, Temps_Seconds, Etat, Score, Solution, Marge_Erreur"
-        )
-        .in_("Entrainement_Id", all_entr_ids)
-        .order("id", desc=True)
-        .limit(2000)
-        .execute()
-    )
-    all_obs = obs_res.data or []
-
-    # --- 3) Séparer historique (sessions passées) et observations courantes ---
-    history: List[Dict[str, Any]] = []
-    current_obs: List[Dict[str, Any]] = []
-    for o in all_obs:
-        if o.get("id") in current_ids:
-            current_obs.append(o)
-        else:
-            history.append(o)
-
-    # Grouper l'historique par (Parcours_Id, Operation) — déjà trié id desc
-    hist_by_key: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
-    for o in history:
-        hist_by_key[(o.get("Parcours_Id"), o.get("Operation"))].append(o)
-
-    # --- 4) Calcul en mémoire ---
-    HIST_MIN   = 5
-    HIST_LIMIT = 50
-    upsert_payloads: List[Dict[str, Any]] = []
-
-    for obs in current_obs:
-        key  = (obs.get("Parcours_Id"), obs.get("Operation"))
-        hist = hist_by_key[key][:HIST_LIMIT]
-        etat = str(obs.get("Etat") or "").strip()
-        score_base = int(obs.get("Score") or (1 if etat == "VRAI" else -1))
-
-        if len(hist) < HIST_MIN:
-            # Pas assez d'historique → bonus nuls, score_global = Score de base
-            bonus_vitesse = 0.0
-            bonus_marge   = 0.0
-            score_global  = score_base
-        else:
-            temps = float(obs.get("Temps_Seconds") or 0)
-            marge = float(obs.get("Marge_Erreur") or 0)
-
-            # Stats vitesse sur toutes les obs de l'historique
-            temps_list = [float(h["Temps_Seconds"]) for h in hist if h.get("Temps_Seconds") is not None]
-            if temps_list:
-                mean_t = sum(temps_list) / len(temps_list)
-                std_t  = (sum((x - mean_t) ** 2 for x in temps_list) / len(temps_list)) ** 0.5
-            else:
-                mean_t, std_t = temps, 0.0
-
-            # Stats marge sur les FAUX uniquement
-            marge_list = [
-                float(h["Marge_Erreur"]) for h in hist
-                if h.get("Marge_Erreur") is not None and h.get("Etat") == "FAUX"
-            ]
-            if marge_list:
-                mean_m = sum(marge_list) / len(marge_list)
-                std_m  = (sum((x - mean_m) ** 2 for x in marge_list) / len(marge_list)) ** 0.5
-            else:
-                mean_m, std_m = marge, 0.0
-
-            # bonus_vitesse
-            if std_t == 0 or mean_t == 0:
-                bonus_vitesse = 0.0 if etat == "VRAI" else -2.0
-            else:
-                zone_min_t = mean_t - std_t
-                zone_max_t = mean_t + std_t
-                if etat == "VRAI":
-                    if temps < zone_min_t:
-                        bonus_vitesse = 2.0
-                    elif temps > zone_max_t:
-                        bonus_vitesse = -1.0
-                    else:
-                        bonus_vitesse = 0.0
-                else:
-                    bonus_vitesse = -2.0 if zone_min_t <= temps <= zone_max_t else -3.0
-
-            # bonus_marge
-            if etat == "VRAI":
-                bonus_marge = 0.0
-            elif std_m == 0 or mean_m == 0:
-                bonus_marge = -1.0
-            else:
-                zone_min_m = mean_m - std_m
-                zone_max_m = mean_m + std_m
-                if marge < zone_min_m:
-                    bonus_marge = 0.0
-                elif marge > zone_max_m:
-                    bonus_marge = -2.0
-                else:
-                    bonus_marge = -1.0
-
-            score_global = math.floor(score_base + bonus_vitesse + bonus_marge)
-
-        upsert_payloads.append({
-            "id":            obs["id"],
-            "bonus_vitesse": round(bonus_vitesse, 2),
-            "bonus_marge":   round(bonus_marge, 2),
-            "score_global":  score_global,
-        })
-
-    # --- 5) Mise à jour en une seule requête ---
+    current = [r for r in inserted_rows if r.get("id") is not None]
+    if not current:
+        return []
+    keys = session_keys(current)
+    windows = await repo.scoring_windows(user_id, keys)
+    missing = keys - windows.keys()
+    if missing:
+        # clés absentes du store (pas encore reconstruites) : amorçage depuis l'historique
+        current_ids = {r["id"] for r in current}
+        history = [o for o in await repo.scoring_history(user_id) if o.get("id") not in current_ids]
+        windows.update(history_windows(user_id, history, missing))
+    upsert_payloads = score_session(user_id, current, windows)
     if upsert_payloads:
         try:
-            res = supabase.table("Observations").upsert(upsert_payloads, on_conflict="id").execute()
-            print(f"[scoring upsert] data count: {len(res.data or [])}, error: {getattr(res, 'error', None)}")
+            res = await repo.upsert_scores(upsert_payloads)
+            print(f"[scoring upsert] data count: {len(res)}")
         except Exception as e:
             print(f"[scoring upsert] exception: {e}")
+            upsert_payloads = []
+    try:
+        await repo.write_scoring_windows(windows.values())
+    except Exception as e:
+        # fenêtres en retard sur l'historique : python -m app.cli.rebuild_scoring_stats
+        print(f"[scoring stats] exception: {e}")
+    return upsert_payloads
 
 
-def _update_classement_after_session(sb, data: List[Dict[str, Any]]) -> None:
+async def _update_classement_after_session(
+    repo: TrainingRepository,
+    entrainement_id: int,
+    user_id: int,
+    scored_rows: List[Dict[str, Any]],
+) -> None:
     """
-    Relit les scores depuis Supabase après insertion et met à jour Classement + users_map
-    en une seule requête chacun. Remplace le trigger trg_update_classement_on_observation.
-    Prérequis : la table Classement doit avoir une colonne week_start DATE.
+    Met à jour Classement + users_map après scoring (remplace le trigger
+    trg_update_classement_on_observation). `scored_rows` : observations insérées,
+    scores du scoring en mémoire compris.
+    Un appel : increment_classement (migration 016) ajoute les deltas de la session
+    de façon atomique. Sans la fonction : relecture des scores, de Classement et de
+    users_map (en parallèle) puis écriture des totaux — deux sessions concurrentes
+    peuvent alors perdre un incrément.
     """
-    if not data:
-        return
-
-    # 1) Récupérer entrainement_id et Users_Id
-    entrainement_id = data[0].get("Entrainement_Id")
-    if entrainement_id is None:
-        print("[update_classement] Entrainement_Id manquant dans data")
-        return
-
-    entr_row = (
-        sb.table("Entrainement")
-        .select("Users_Id")
-        .eq("id", entrainement_id)
-        .limit(1)
-        .execute()
-        .data or []
-    )
-    if not entr_row or entr_row[0].get("Users_Id") is None:
-        print(f"[update_classement] Entrainement {entrainement_id} introuvable")
-        return
-    user_id = int(entr_row[0]["Users_Id"])
-
-    # 2) Relire les scores depuis Observations
-    #    (le trigger Supabase a calculé score_global au moment de l'INSERT)
-    obs_rows = (
-        sb.table("Observations")
-        .select("score_global, Score")
-        .eq("Entrainement_Id", entrainement_id)
-        .execute()
-        .data or []
-    )
-    delta_classement = sum(int(r.get("score_global") or r.get("Score") or 0) for r in obs_rows)
-    delta_score_base  = sum(int(r.get("Score") or 0) for r in obs_rows)
-
-    today  = date.today()
-    monday = today - timedelta(days=today.weekday())
-
-    # 3) Upsert Classement (score_global + score_week avec reset si nouvelle semaine)
-    existing_cl = (
-        sb.table("Classement")
-        .select("score_global, score_week, week_start")
-        .eq("Users_Id", user_id)
-        .maybe_single()
-        .execute()
-    )
-    cl = getattr(existing_cl, "data", None) or {}
-
-    prev_global    = int(cl.get("score_global") or 0)
-    prev_week      = int(cl.get("score_week") or 0)
-    week_start_str = cl.get("week_start")
-    if week_start_str:
-        stored_monday = date.fromisoformat(str(week_start_str))
-        is_new_week   = stored_monday < monday
-    else:
-        is_new_week = True
-
-    new_score_week   = delta_classement if is_new_week else prev_week + delta_classement
-    new_score_global = prev_global + delta_classement
-
-    sb.table("Classement").upsert(
-        {
-            "Users_Id":     user_id,
-            "score_global": new_score_global,
-            "score_week":   new_score_week,
-            "week_start":   monday.isoformat(),
-        },
-        on_conflict="Users_Id",
-    ).execute()
-
-    # 4) Mettre à jour users_map (score_base + last_training_date)
-    user_row = (
-        sb.table("users_map")
-        .select("score_base")
-        .eq("user_id", user_id)
-        .maybe_single()
-        .execute()
-    )
-    um = getattr(user_row, "data", None) or {}
-    prev_score_base = int(um.get("score_base") or 0)
-
-    sb.table("users_map").update({
-        "score_base":         prev_score_base + delta_score_base,
-        "last_training_date": today.isoformat(),
-    }).eq("user_id", user_id).execute()
-
+    if increment_enabled():
+        delta_classement, delta_base = session_deltas(scored_rows)
+        try:
+            totals = await repo.increment_classement(user_id, delta_classement, delta_base)
+            leaderboard.apply_totals(user_id, totals)
+            return
+        except Exception as e:
+            if getattr(e, "code", None) != "PGRST202":
+                raise
+            mark_increment_missing(e)
+    obs_rows, cl, um = await repo.classement_inputs(entrainement_id, user_id)
+    classement, users_map = classement_payloads(user_id, obs_rows, cl, um, date.today())
+    await repo.write_classement(user_id, classement, users_map)
+    leaderboard.apply_totals(user_id, classement)
 
-@router.post("/observations")
-def post_observations(payload: Any = Body(...), authorization: Optional[str] = Header(default=None)):
-    """Insert des observations.
-    Reçoit soit un array d'objets, soit { items: [...] }.
-    Champs requis par élément :
-      - Entrainement_Id, Parcours_Id, Operateur_Un, Operateur_Deux, Operation, Proposition, (optionnel) Temps_Seconds, (optionnel) Correction
-    """
-    sb = user_scoped_client(authorization)
 
-    # ---------- parsing entrée (inchangé) ----------
+def _parse_observation_rows(payload: Any) -> List[Dict[str, Any]]:
     if isinstance(payload, dict) and isinstance(payload.get("items"), list):
         items = payload["items"]
     elif isinstance(payload, list):
@@ -616,126 +439,263 @@ def post_observations(payload: Any = Body(...), authorization: Optional[str] = H
             rows.append(row)
         except Exception as e:
             raise HTTPException(422, detail=f"Observation[{i}] invalide: {e}")
+    return rows
+
+
+def _norm_op(db_val: str) -> Optional[str]:
+    v = (db_val or "").strip().lower()
+    if v in ("addition", "soustraction", "multiplication"):
+        return v
+    return None
+
+
+def _evaluate_evolutions(sb, user_id: int, data: List[Dict[str, Any]]):
+    """
+    Évaluation d'évolution (EvolutionService, client sync) pour les opérations du batch,
+    dont les observations alimentent les compteurs de fenêtre.
+    Appelée dans le threadpool de FastAPI (run_in_threadpool) depuis post_observations.
+    """
+    evolutions: List[Dict[str, Any]] = []
+    positions_by_user: Dict[int, Dict[str, Any]] = {}
+    evolution_error: Optional[str] = None
+
+    try:
+        ops = {op for op in (_norm_op(r.get("Operation", "")) for r in data) if op}
+        if ops:
+            evo = EvolutionService(sb)
+            for op in ops:
+                maybe = evo.evaluate_and_record_if_needed(user_id, op, data)
+                if maybe:
+                    evolutions.append(maybe)
+            positions_by_user[user_id] = evo.positions_for_user(user_id)
+    except Exception as e:
+        evolution_error = str(e)
+
+    return evolutions, positions_by_user, evolution_error
+
+
+def _replay_flag(out: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    if out.get("replayed"):
+        response["replayed"] = True
+    return response
+
+
+async def _call_submit(submit, entrainement_id: int, rows: List[Dict[str, Any]], key: Optional[str]) -> Dict[str, Any]:
+    """Fonction SQL de soumission, avec p_idempotency_key tant que la migration 015 répond."""
+    if key is not None and idempotency.rpc_key_enabled():
+        try:
+            return await submit(entrainement_id, rows, active_rules(), key)
+        except Exception as e:
+            if getattr(e, "code", None) != "PGRST202":
+                raise
+            idempotency.mark_rpc_missing(e)
+    return await submit(entrainement_id, rows, active_rules())
+
 
-    # ---------- protection double soumission ----------
+async def _submit_via_rpc(repo: TrainingRepository, entrainement_id: int, rows: List[Dict[str, Any]],
+                          key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Chemin RPC : toute la session en un appel à submit_observations.
+    Retourne None si la fonction SQL n'est pas déployée (→ chemin legacy).
+    """
+    try:
+        out = await _call_submit(repo.submit_observations, entrainement_id, rows, key)
+    except Exception as e:
+        code = getattr(e, "code", None)
+        if code == "PGRST202":
+            mark_rpc_missing(e)
+            return None
+        if code == "42501":
+            raise HTTPException(status_code=403, detail="Entrainement non autorisé")
+        raise HTTPException(status_code=500, detail=f"submit_observations: {e}")
+
+    status = out.get("status")
+    if status == "already_processed":
+        return {"status": "already_processed", "message": "Entrainement déjà soumis"}
+    if status == "not_found":
+        raise HTTPException(status_code=404, detail="Entrainement introuvable")
+
+    ids = out.get("ids") or []
+    uid = out.get("user_id")
+    if not out.get("replayed"):
+        leaderboard.apply_totals(uid, out.get("classement"))  # migration 022
+    return _replay_flag(out, {
+        "inserted": len(ids),
+        "ids": ids,
+        "evolutions": out.get("evolutions") or [],
+        "positions": {int(uid): out.get("positions") or {}} if uid is not None else {},
+        "evolution_error": None,
+    })
+
+
+async def _submit_via_outbox(repo: TrainingRepository, entrainement_id: int, rows: List[Dict[str, Any]],
+                             key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Chemin outbox : insertion + job en un appel à submit_observations_async, réponse
+    immédiate ; évolutions et positions arrivent dans le résultat du job.
+    Retourne None si la migration 014 n'est pas déployée (→ chemin RPC).
+    """
+    try:
+        out = await _call_submit(repo.submit_observations_async, entrainement_id, rows, key)
+    except Exception as e:
+        code = getattr(e, "code", None)
+        if code == "PGRST202":
+            mark_outbox_missing(e)
+            return None
+        if code == "42501":
+            raise HTTPException(status_code=403, detail="Entrainement non autorisé")
+        raise HTTPException(status_code=500, detail=f"submit_observations_async: {e}")
+
+    status = out.get("status")
+    if status == "already_processed":
+        return {"status": "already_processed", "message": "Entrainement déjà soumis"}
+    if status == "not_found":
+        raise HTTPException(status_code=404, detail="Entrainement introuvable")
+
+    ids = out.get("ids") or []
+    job_id = out.get("job_id")
+    if job_id is not None:
+        outbox.notify()
+    return _replay_flag(out, {
+        "inserted": len(ids),
+        "ids": ids,
+        "job": {"id": job_id, "status": "pending", "poll": f"/observations/jobs/{job_id}"} if job_id is not None else None,
+        "evolutions": [],
+        "positions": {},
+        "evolution_error": None,
+    })
+
+
+@router.get("/observations/jobs/{job_id}")
+async def get_observation_job(job_id: int, authorization: Optional[str] = Header(default=None)):
+    """État du traitement différé d'une soumission (OBSERVATIONS_PIPELINE=outbox).
+    status : pending | running | done | failed ; une fois 'done', `evolutions` et
+    `positions` ont la forme de la réponse synchrone de POST /observations.
+    """
+    repo = _training_repo(authorization)
+    job = await repo.outbox_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    result = job.get("result") or {}
+    uid = result.get("user_id")
+    return {
+        "id": job["id"],
+        "entrainement_id": job.get("Entrainement_Id"),
+        "status": job.get("status"),
+        "attempts": job.get("attempts"),
+        "error": job.get("last_error") if job.get("status") != "done" else None,
+        "evolutions": result.get("evolutions") or [],
+        "positions": {int(uid): result.get("positions") or {}} if uid is not None else {},
+    }
+
+
+@router.post("/observations")
+async def post_observations(
+    payload: Any = Body(...),
+    authorization: Optional[str] = Header(default=None),
+    idempotency_key: Optional[str] = Header(default=None),
+):
+    """Insert des observations.
+    Reçoit soit un array d'objets, soit { items: [...], batch_id? }.
+    Champs requis par élément :
+      - Entrainement_Id, Parcours_Id, Operateur_Un, Operateur_Deux, Operation, Proposition, (optionnel) Temps_Seconds, (optionnel) Correction
+    Traitement : fonction SQL submit_observations(_async), ou chemin legacy (voir services/submission.py).
+    Idempotency-Key (ou batch_id) : un rejeu reçoit la réponse d'origine, `replayed: true` (services/idempotency.py).
+    """
+    repo = _training_repo(authorization)
+
+    # ---------- parsing entrée (inchangé) ----------
+    rows = _parse_observation_rows(payload)
+    try:
+        key = idempotency.idempotency_key(idempotency_key, payload)
+    except ValueError as e:
+        raise HTTPException(422, detail=str(e))
+
+    if key is None or not rows or len({r["Entrainement_Id"] for r in rows}) != 1:
+        return await _submit_observations(repo, rows, None, authorization)
+
+    # ---------- rejeu : réponse d'origine, sans aller-retour si ce process l'a déjà servie ----------
+    entrainement_id = rows[0]["Entrainement_Id"]
+    cached = idempotency.cached_response(authorization, entrainement_id, key)
+    if cached is not None:
+        return {**cached, "replayed": True}
+    out = await _submit_observations(repo, rows, key, authorization)
+    if "inserted" in out:
+        idempotency.remember(authorization, entrainement_id, key, {k: v for k, v in out.items() if k != "replayed"})
+    return out
+
+
+async def _submit_observations(repo: TrainingRepository, rows: List[Dict[str, Any]], key: Optional[str],
+                               authorization: Optional[str]) -> Dict[str, Any]:
+    # ---------- chemin outbox / RPC : un aller-retour pour tout le lot ----------
+    if rows and len({r["Entrainement_Id"] for r in rows}) == 1:
+        if outbox_enabled():
+            out = await _submit_via_outbox(repo, rows[0]["Entrainement_Id"], rows, key)
+            if out is not None:
+                return out
+        if rpc_enabled():
+            out = await _submit_via_rpc(repo, rows[0]["Entrainement_Id"], rows, key)
+            if out is not None:
+                return out
+
+    # ---------- chemin legacy (OBSERVATIONS_PIPELINE=legacy) ----------
+
+    # ---------- protection double soumission + Volume attendu (lectures parallèles) ----------
+    entr: Optional[Dict[str, Any]] = None
     if rows:
         entrainement_id = rows[0]["Entrainement_Id"]
-        existing = sb.table("Observations").select("id").eq("Entrainement_Id", entrainement_id).limit(1).execute()
-        if existing.data:
+        already, entr = await repo.submission_context(entrainement_id)
+        if already:
             return {"status": "already_processed", "message": "Entrainement déjà soumis"}
 
-    # ---------- troncature au Volume attendu ----------
-    if rows:
-        entr_vol = (
-            sb.table("Entrainement")
-            .select("id, Volume")
-            .eq("id", entrainement_id)
-            .limit(1)
-            .execute()
-            .data or []
-        )
-        if entr_vol and entr_vol[0].get("Volume") is not None:
-            volume_max = int(entr_vol[0]["Volume"])
+        # ---------- troncature au Volume attendu ----------
+        if entr and entr.get("Volume") is not None:
+            volume_max = int(entr["Volume"])
             if len(rows) > volume_max:
                 rows = rows[:volume_max]
 
-    # ---------- insertion ----------
+    # ---------- insertion (paquets envoyés en parallèle) ----------
     print("[DEBUG] rows to insert:", rows)
     CHUNK_SIZE = 20
     data = []
-    for i in range(0, len(rows), CHUNK_SIZE):
-        chunk = rows[i:i + CHUNK_SIZE]
-        res = sb.table("Observations").insert(chunk).execute()
-        err = getattr(res, "error", None)
-        if err:
-            raise HTTPException(500, detail=f"Insert error (chunk {i}): {err}")
-        chunk_data = getattr(res, "data", []) or []
+    for n, chunk_data in enumerate(await repo.insert_observations(rows, CHUNK_SIZE)):
         if not chunk_data:
-            raise HTTPException(500, detail=f"Insertion Observations échouée (chunk {i})")
+            raise HTTPException(500, detail=f"Insertion Observations échouée (chunk {n * CHUNK_SIZE})")
         data.extend(chunk_data)
 
+    _eid = data[0].get("Entrainement_Id") if data else None
+    _uid = int(entr["Users_Id"]) if entr and entr.get("Users_Id") is not None else None
+
     # ---------- CALCUL DU SCORING ----------
+    scores: List[Dict[str, Any]] = []
     try:
-        _eid = data[0].get("Entrainement_Id") if data else None
-        if _eid is not None:
-            _entr = (
-                sb.table("Entrainement")
-                .select("Users_Id")
-                .eq("id", _eid)
-                .limit(1)
-                .execute()
-                .data or []
-            )
-            _uid = int(_entr[0]["Users_Id"]) if _entr and _entr[0].get("Users_Id") is not None else None
-            if _uid is not None:
-                _calculate_scoring(sb, int(_eid), _uid, data)
+        if _eid is not None and _uid is not None:
+            scores = await _calculate_scoring(repo, _uid, data)
     except Exception as e:
         print(f"[post_observations] erreur calculate_scoring: {e}")
 
     # ---------- MISE À JOUR CLASSEMENT & users_map ----------
     try:
-        _update_classement_after_session(sb, data)
+        if _eid is None:
+            print("[update_classement] Entrainement_Id manquant dans data")
+        elif _uid is None:
+            print(f"[update_classement] Entrainement {_eid} introuvable")
+        else:
+            by_id = {p["id"]: p for p in scores}
+            scored = [{**r, **by_id.get(r.get("id"), {})} for r in data]
+            await _update_classement_after_session(repo, int(_eid), _uid, scored)
     except Exception as e:
         print(f"[post_observations] erreur update_classement: {e}")
 
     # ---------- ÉVALUATION D'ÉVOLUTION ----------
-    def _norm_op(db_val: str) -> Optional[str]:
-        v = (db_val or "").strip().lower()
-        if v in ("addition", "soustraction", "multiplication"):
-            return v
-        return None
-
-    # 1) Entrainements concernés par CE batch
-    entr_ids = list({r.get("Entrainement_Id") for r in data if r.get("Entrainement_Id") is not None})
-
+    # Un batch = un Entrainement = un utilisateur ; EvolutionService reste sync (thread dédié)
     evolutions: List[Dict[str, Any]] = []
     positions_by_user: Dict[int, Dict[str, Any]] = {}
     evolution_error: Optional[str] = None
-
-    try:
-        if entr_ids:
-            # Petit helper local qui utilise le client user-scopé
-            def _query(table: str, columns: str = "*"):
-                b = sb.from_(table)
-                sel = getattr(b, "select", None)
-                if callable(sel):
-                    return sel(columns)
-                b2 = sb.table(table)
-                sel2 = getattr(b2, "select", None)
-                if callable(sel2):
-                    return sel2(columns)
-                return b
-
-            entr_rows = (
-                _query("Entrainement", "id, Users_Id")
-                .in_("id", entr_ids)
-                .execute()
-                .data
-                or []
-            )
-            entr_to_user = {int(r["id"]): int(r["Users_Id"]) for r in entr_rows if r.get("Users_Id") is not None}
-
-            per_user_ops: Dict[int, set] = {}
-            for r in data:
-                eid = r.get("Entrainement_Id")
-                uid = entr_to_user.get(int(eid)) if eid is not None else None
-                if uid is None:
-                    continue
-                op_norm = _norm_op(r.get("Operation", ""))
-                if op_norm is None:
-                    continue
-                per_user_ops.setdefault(uid, set()).add(op_norm)
-
-            evo = EvolutionService(sb)
-            for uid, ops in per_user_ops.items():
-                for op in ops:
-                    maybe = evo.evaluate_and_record_if_needed(uid, op)
-                    if maybe:
-                        evolutions.append(maybe)
-                positions_by_user[uid] = evo.positions_for_user(uid)
-
-    except Exception as e:
-        evolution_error = str(e)
+    if data and _uid is not None:
+        evolutions, positions_by_user, evolution_error = await run_in_threadpool(
+            _evaluate_evolutions, user_scoped_client(authorization), _uid, data
+        )
 
     return {
         "inserted": len(data),
@@ -746,6 +706,175 @@ def post_observations(payload: Any = Body(...), authorization: Optional[str] = H
     }
 
 
+# -----------------------------------------------------------------------------
+# Session en direct (WebSocket) : scoring en mémoire, une écriture à la clôture
+# -----------------------------------------------------------------------------
+LIVE_SESSION_IDLE_SECONDS = float(os.getenv("LIVE_SESSION_IDLE_SECONDS", "300"))
+
+
+async def _live_session_stats(repo: TrainingRepository, user_id: int, exercises: List[Dict[str, Any]]):
+    """Statistiques de scoring des clés de la session : Stats_Scoring, clés absentes amorcées depuis l'historique."""
+    keys = session_keys({"Parcours_Id": e["Parcours_Id"], "Operation": e["Type"]} for e in exercises)
+    windows = await repo.scoring_windows(user_id, keys)
+    missing = keys - windows.keys()
+    if missing:
+        windows.update(history_windows(user_id, await repo.scoring_history(user_id), missing))
+    return {k: w.stats() for k, w in windows.items()}
+
+
+async def _start_live_session(repo: TrainingRepository, user_id: int, msg: Dict[str, Any]) -> LiveSession:
+    try:
+        n = int(msg.get("volume") or msg.get("n") or 0)
+        if n < 1 or n > 200:
+            raise ValueError()
+    except Exception:
+        raise HTTPException(status_code=422, detail="volume must be between 1 and 200")
+    if msg.get("seed") is not None:
+        random.seed(msg["seed"])
+
+    positions = await repo.positions(user_id)
+    for t in ("Addition", "Soustraction", "Multiplication"):
+        if not positions.get(t):
+            raise HTTPException(status_code=400, detail=f"Aucun niveau (Parcours) disponible pour {t}")
+    exercises = _mixte_exercises(positions, n, include_solution=True)
+
+    entrainement, stats = await asyncio.gather(
+        repo.insert_entrainement({
+            "Users_Id": user_id,
+            "Parcours_Id": int(positions["Addition"]["id"]),
+            "Volume": n * 3,
+            "Date": date.today().isoformat(),
+            "Time": datetime.now().strftime("%H:%M:%S"),
+        }),
+        _live_session_stats(repo, user_id, exercises),
+    )
+    if not entrainement:
+        raise HTTPException(status_code=500, detail="Insertion Entrainement échouée")
+    return LiveSession(user_id, int(entrainement["id"]), exercises, stats, active_rules())
+
+
+async def _flush_live_session(repo: TrainingRepository, live: LiveSession, authorization: str) -> Dict[str, Any]:
+    """Réponses reçues → une soumission (submit_observations) ; rejouable sans double écriture."""
+    if not live.answers:
+        return {"inserted": 0, "ids": [], "evolutions": [], "positions": {}, "evolution_error": None}
+    return await _submit_observations(repo, live.rows(), f"ws-{live.entrainement_id}", authorization)
+
+
+async def _flush_live_session_retry(repo: TrainingRepository, live: LiveSession, authorization: str) -> Dict[str, Any]:
+    """_flush_live_session, avec un second essai : même clé ws-{id}, donc sans double écriture."""
+    try:
+        return await _flush_live_session(repo, live, authorization)
+    except Exception as e:
+        logger.warning(f"[ws/session] flush en échec (entrainement {live.entrainement_id}), nouvel essai : "
+                       f"{getattr(e, 'detail', e)}")
+    return await _flush_live_session(repo, live, authorization)
+
+
+@router.websocket("/ws/session")
+async def live_session(websocket: WebSocket, access_token: Optional[str] = Query(None)):
+    """Session mixte en direct, un message JSON par étape.
+    Jeton : en-tête Authorization, ou ?access_token= (clients sans en-têtes WebSocket).
+      client → {"type": "start", "volume": n, "seed"?}      n exercices par type
+      serveur → {"type": "session", entrainement_id, parcours_ids, total} puis {"type": "exercise", index, ...}
+      client → {"type": "answer", "proposition": p, "temps_seconds"?}
+      serveur → {"type": "feedback", correct, solution, bonus_*, score_global, total_score, remaining}
+                puis l'exercice suivant
+      client → {"type": "end"}                               clôture anticipée (optionnel)
+      serveur → {"type": "summary", ...réponse de POST /observations}, fermeture
+                ou, si l'écriture échoue : {"type": "error", detail, idempotency_key, observations}
+                (à re-POSTer sur /observations avec Idempotency-Key), fermeture 1011
+    Les réponses sont scorées en mémoire (services/live_session.py) et écrites en une
+    soumission à la clôture — y compris sur déconnexion ou inactivité
+    (LIVE_SESSION_IDLE_SECONDS).
+    """
+    authorization = websocket.headers.get("authorization") or (f"Bearer {access_token}" if access_token else None)
+    identity = await optional_identity(authorization)
+    if identity is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    repo = _training_repo(authorization)
+    await websocket.accept()
+
+    live: Optional[LiveSession] = None
+    try:
+        while True:
+            try:
+                msg = await asyncio.wait_for(websocket.receive_json(), timeout=LIVE_SESSION_IDLE_SECONDS)
+            except asyncio.TimeoutError:
+                break
+            kind = msg.get("type") if isinstance(msg, dict) else None
+            try:
+                if kind == "start" and live is None:
+                    user_id = await _caller_user_id(repo, identity, None, None)
+                    live = await _start_live_session(repo, user_id, msg)
+                    await websocket.send_json({
+                        "type": "session",
+                        "entrainement_id": live.entrainement_id,
+                        "parcours_ids": {e["Type"]: e["Parcours_Id"] for e in live.exercises},
+                        "total": len(live.exercises),
+                    })
+                    await websocket.send_json({"type": "exercise", **live.next_exercise()})
+                elif kind == "answer" and live is not None:
+                    temps = msg.get("temps_seconds")
+                    feedback = live.answer(int(msg["proposition"]), int(temps) if temps is not None else None)
+                    await websocket.send_json({"type": "feedback", **feedback})
+                    if live.finished:
+                        break
+                    await websocket.send_json({"type": "exercise", **live.next_exercise()})
+                elif kind == "end":
+                    break
+                else:
+                    await websocket.send_json({"type": "error", "detail": f"message inattendu : {kind}"})
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "detail": e.detail})
+                if live is None:
+                    await websocket.close(code=status.WS_1011_INTERNAL_ERROR if e.status_code >= 500 else 1000)
+                    return
+            except (KeyError, TypeError, ValueError) as e:
+                await websocket.send_json({"type": "error", "detail": f"message invalide : {e}"})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                # erreur PostgREST / httpx (démarrage) : rien n'est encore scoré si live is None
+                logger.warning(f"[ws/session] {kind} en échec : {e}")
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                if live is None:
+                    await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+                    return
+
+        if live is not None:
+            try:
+                out = await _flush_live_session_retry(repo, live, authorization)
+            except Exception as e:
+                # réponses en mémoire seulement : renvoyées au client pour qu'il les re-POSTe
+                logger.warning(f"[ws/session] flush final en échec (entrainement {live.entrainement_id}) : "
+                               f"{getattr(e, 'detail', e)}")
+                await websocket.send_json({
+                    "type": "error",
+                    "detail": f"écriture de la session échouée : {getattr(e, 'detail', e)}",
+                    "entrainement_id": live.entrainement_id,
+                    "idempotency_key": f"ws-{live.entrainement_id}",
+                    "observations": live.rows(),
+                })
+                await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+                return
+            await websocket.send_json({
+                "type": "summary",
+                "entrainement_id": live.entrainement_id,
+                "answered": len(live.answers),
+                "total_score": live.total_score,
+                **out,
+            })
+        await websocket.close()
+    except WebSocketDisconnect:
+        if live is not None and live.answers:
+            try:
+                # shield : la soumission va au bout même si la tâche de la connexion est annulée
+                await asyncio.shield(_flush_live_session(repo, live, authorization))
+            except Exception as e:
+                logger.warning(f"[ws/session] flush après déconnexion (entrainement {live.entrainement_id}) : {e}")
+
+
 # -----------------------------------------------------------------------------
 # Review / Correction globale (niveau Entrainement)
 # -----------------------------------------------------------------------------
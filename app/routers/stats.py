@@ -1,26 +1,22 @@
 from __future__ import annotations
 
 import os
-from functools import lru_cache
 from datetime import datetime, timedelta, date as date_cls
 from zoneinfo import ZoneInfo
 
-from fastapi import APIRouter, Header, HTTPException, Query
-from supabase import create_client, Client
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from app.deps import optional_identity, service_client
+from app.services.activity import active_days, activity_enabled, is_missing_feature, mark_activity_missing
+from app.services.identity import Identity, cache_stats, resolver
 
 router = APIRouter(prefix="/stats", tags=["stats"])
 PARIS = ZoneInfo("Europe/Paris")
 
 # ────────────────────────────────────────────────────────────────────────────────
-# Supabase client (cached)
+# Supabase client (vue service sur le pool partagé)
 # ────────────────────────────────────────────────────────────────────────────────
-@lru_cache(maxsize=1)
-def _sb() -> Client:
-    url = os.environ.get("SUPABASE_URL")
-    key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("SUPABASE_ANON_KEY")
-    if not url or not key:
-        raise RuntimeError("Missing SUPABASE_URL or SUPABASE_*_KEY")
-    return create_client(url, key)
+def _sb():
+    return service_client()
 
 # ────────────────────────────────────────────────────────────────────────────────
 # Health
@@ -30,42 +26,22 @@ def ping():
     return {"ok": True}
 
 # ────────────────────────────────────────────────────────────────────────────────
-# Small helper: try users_map in both flavors (Users_Id | user_id)
+# Caller identity (Authorization header, or ?token= for debugging)
 # ────────────────────────────────────────────────────────────────────────────────
-def _users_map_lookup(sb: Client, auth_uid: str) -> int | None:
-    # try Users_Id (CamelCase)
-    try:
-        r = (
-            sb.table("users_map")
-              .select("Users_Id")
-              .eq("auth_uid", auth_uid)
-              .single()
-              .execute()
-        )
-        if r.data and "Users_Id" in r.data:
-            return int(r.data["Users_Id"])
-    except Exception:
-        pass
-    # try user_id (snake_case)
-    try:
-        r = (
-            sb.table("users_map")
-              .select("user_id")
-              .eq("auth_uid", auth_uid)
-              .single()
-              .execute()
-        )
-        if r.data and "user_id" in r.data:
-            return int(r.data["user_id"])
-    except Exception:
-        pass
-    return None
+async def _caller(
+    authorization: str | None = Header(None, alias="Authorization"),
+    token: str | None = Query(None, description="JWT if Authorization header isn't sent"),
+) -> Identity | None:
+    # fallback: build Bearer from ?token=
+    if (not authorization or not authorization.startswith("Bearer ")) and token:
+        authorization = f"Bearer {token}"
+    return await optional_identity(authorization)
 
 # ────────────────────────────────────────────────────────────────────────────────
 # Resolve current user → Users.id (int)
 # ────────────────────────────────────────────────────────────────────────────────
 def _resolve_user(
-    authorization: str | None,
+    identity: Identity | None,
     users_id_override: str | None = None,
     auth_uid_override: str | None = None,
     email_override: str | None = None,
@@ -73,9 +49,9 @@ def _resolve_user(
     """
     Returns Users.id (int) preferring, in order:
       1) users_id_override (stringified int)
-      2) auth_uid_override (UUID) → users_map / Users.auth_uid
+      2) auth_uid_override (UUID) → users_map (cached) / Users.auth_uid
       3) email_override → Users.email
-      4) Authorization: Bearer <jwt> → users_map / Users.auth_uid / fallback by token email
+      4) verified JWT identity → users_map (cached) / Users.auth_uid / fallback by token email
     """
     sb = _sb()
 
@@ -89,27 +65,22 @@ def _resolve_user(
     auth_uid = auth_uid_override
     auth_email = (email_override or "").lower() if email_override else None
 
-    # 2) no overrides → read identity from JWT
+    # 2) no overrides → identity from the verified JWT
     if not auth_uid and not auth_email:
-        if not authorization or not authorization.startswith("Bearer "):
-            raise HTTPException(status_code=401, detail="Missing Bearer token")
-        token = authorization.split(" ", 1)[1]
-        try:
-            u = sb.auth.get_user(token).user
-            if not u:
-                raise HTTPException(status_code=401, detail="Invalid token")
-            auth_uid = u.id
-            auth_email = (u.email or "").lower()
-        except Exception:
-            raise HTTPException(status_code=401, detail="Invalid token")
-
-    # 3) users_map(auth_uid → Users.id), supports Users_Id or user_id
+        if identity is None:
+            raise HTTPException(status_code=401, detail="Missing or invalid Bearer token")
+        if identity.user_id is not None:
+            return identity.user_id
+        auth_uid = identity.auth_uid
+        auth_email = (identity.email or "").lower() or None
+
+    # 3) users_map(auth_uid → Users.id)
     if auth_uid:
-        mapped = _users_map_lookup(sb, auth_uid)
+        mapped = resolver.resolve(auth_uid, sb=sb)
         if mapped is not None:
             return mapped
 
-        # 4) Users.auth_uid = auth_uid
+        # 4) Users.auth_uid = auth_uid (users without a users_map row)
         try:
             r2 = (
                 sb.table("Users")
@@ -143,51 +114,57 @@ def _resolve_user(
 # ────────────────────────────────────────────────────────────────────────────────
 # Day streak (global — all operations)
 # ────────────────────────────────────────────────────────────────────────────────
+def _training_days(sb, uid: int, since: date_cls) -> set[date_cls]:
+    """Training days since `since`: Activite_Jour (migration 019), else Entrainement dates."""
+    if activity_enabled():
+        try:
+            return {date_cls.fromisoformat(d) for d in active_days(sb, uid, since)}
+        except Exception as e:
+            if not is_missing_feature(e):
+                raise
+            mark_activity_missing(e)
+
+    res = (
+        sb.table("Entrainement")
+        .select("Date")
+        .eq("Users_Id", uid)
+        .gte("Date", since.isoformat())
+        .order("Date", desc=False)
+        .execute()
+    )
+    days: set[date_cls] = set()
+    for r in res.data or []:
+        d = r["Date"]
+        if isinstance(d, str):
+            d = datetime.fromisoformat(d).date()
+        days.add(d)
+    return days
+
+
 @router.get("/day_streak_current")
 def day_streak_current(
-    # capture Authorization header safely
-    authorization: str | None = Header(None, alias="Authorization"),
+    # Authorization header (or ?token=) → verified identity
+    identity: Identity | None = Depends(_caller),
     # debug params to test without header
-    token: str | None = Query(None, description="JWT if Authorization header isn't sent"),
     users_id: str | None = Query(None, description="Override Users.id (int)"),
     auth_uid: str | None = Query(None, description="Override auth_uid (UUID)"),
     email: str | None = Query(None, description="Override Users.email"),
 ):
     sb = _sb()
 
-    # fallback: build Bearer from ?token=
-    if (not authorization or not authorization.startswith("Bearer ")) and token:
-        authorization = f"Bearer {token}"
-
     uid = _resolve_user(
-        authorization,
+        identity,
         users_id_override=users_id,
         auth_uid_override=auth_uid,
         email_override=email,
     )
 
-    # pull last 2 years of training dates
-    since = (datetime.now(PARIS) - timedelta(days=730)).date().isoformat()
-    res = (
-        sb.table("Entrainement")
-        .select("Date")
-        .eq("Users_Id", uid)
-        .gte("Date", since)
-        .order("Date", desc=False)
-        .execute()
-    )
-    rows = res.data or []
-    if not rows:
+    # distinct training days over the last 2 years
+    since = (datetime.now(PARIS) - timedelta(days=730)).date()
+    days = _training_days(sb, uid, since)
+    if not days:
         return {"current_streak_days": 0, "max_streak_days": 0}
 
-    # distinct training days
-    days: set[date_cls] = set()
-    for r in rows:
-        d = r["Date"]
-        if isinstance(d, str):
-            d = datetime.fromisoformat(d).date()
-        days.add(d)
-
     # current streak (ending today in Europe/Paris)
     today = datetime.now(PARIS).date()
     cur = 0
@@ -228,45 +205,21 @@ def echo(
     }
 
 @router.get("/debug_user")
-def debug_user(
-    authorization: str | None = Header(None, alias="Authorization"),
-    token: str | None = Query(None),
-):
+def debug_user(identity: Identity | None = Depends(_caller)):
     sb = _sb()
 
-    # build Bearer from ?token= if header is missing
-    if (not authorization or not authorization.startswith("Bearer ")) and token:
-        authorization = f"Bearer {token}"
-    if not authorization or not authorization.startswith("Bearer "):
-        return {"error": "Missing Bearer"}
-
-    jwt = authorization.split(" ", 1)[1]
-    out = {"token_info": {}, "lookups": {}}
+    if identity is None:
+        return {"error": "Missing or invalid Bearer"}
 
-    # token info
-    try:
-        u = sb.auth.get_user(jwt).user
-        out["token_info"] = {"auth_uid": getattr(u, "id", None), "email": getattr(u, "email", None)}
-    except Exception as e:
-        out["token_info"] = {"error": f"auth.get_user failed: {e}"}
-        return out
-
-    auth_uid = out["token_info"].get("auth_uid")
-    email_lc = (out["token_info"].get("email") or "").lower()
-
-    # users_map (both column variants)
-    try:
-        mapped = _users_map_lookup(sb, auth_uid)
-        out["lookups"]["users_map"] = {"mapped_user_id": mapped}
-    except Exception as e:
-        out["lookups"]["users_map"] = f"error: {e}"
+    out = {
+        "token_info": {"auth_uid": identity.auth_uid, "email": identity.email},
+        "lookups": {},
+        "identity_cache": cache_stats(),
+    }
+    email_lc = (identity.email or "").lower()
 
-    # Users.auth_uid
-    try:
-        r = sb.table("Users").select("id").eq("auth_uid", auth_uid).single().execute()
-        out["lookups"]["Users.auth_uid"] = r.data
-    except Exception as e:
-        out["lookups"]["Users.auth_uid"] = f"error: {e}"
+    # users_map (cached resolver)
+    out["lookups"]["users_map"] = {"mapped_user_id": identity.user_id}
 
     # Users.email
     try:
@@ -275,4 +228,4 @@ def debug_user(
     except Exception as e:
         out["lookups"]["Users.email"] = f"error: {e}"
 
-    return out
\ No newline at end of file
+    return out
@@ -0,0 +1,126 @@
+# app/services/activity.py
+"""
+Index d'activité quotidienne (Activite_Jour, migration 019).
+
+Une ligne par (Users_Id, Jour) : sessions créées, observations et réponses
+justes, le jour étant la "Date" de l'Entrainement. Tenue à jour par triggers
+SQL (création d'Entrainement, insertion d'observations) ; `session_deltas` /
+`observation_deltas` / `merge_day` en sont l'équivalent Python (émulation hors
+ligne, générateur).
+
+Lectures par plage de jours : /stats/day_streak_current lit les jours actifs
+de l'utilisateur (`active_days`), /progression/regularite les lignes
+Stats_Entrainement datées du parcours (`parcours_daily_counts`). Table ou
+colonne absente : retour aux lectures d'origine (`activity_enabled`).
+"""
+from __future__ import annotations
+
+import logging
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .keyset import iter_rows
+from .session_stats import SESSION_STATS_TABLE, is_correct
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_TABLE = "Activite_Jour"
+ACTIVITY_KEY = ("Users_Id", "Jour")
+ACTIVITY_SUMS = ("sessions", "observations", "corrects")
+
+_activity_missing = False
+
+
+def activity_enabled() -> bool:
+    return not _activity_missing
+
+
+def mark_activity_missing(error: Exception) -> None:
+    """Migration 019 absente : les endpoints relisent Entrainement / Observations."""
+    global _activity_missing
+    if not _activity_missing:
+        logger.warning(f"[Activity] {ACTIVITY_TABLE} indisponible, lecture des tables brutes : {error}")
+    _activity_missing = True
+
+
+def is_missing_feature(error: Exception) -> bool:
+    # table absente (PGRST205 / 42P01) ou colonne "Date" absente de Stats_Entrainement
+    return getattr(error, "code", None) in ("PGRST205", "42P01", "PGRST204", "42703")
+
+
+def day_of(entrainement: Dict[str, Any], default: Optional[date] = None) -> str:
+    """Jour d'un entraînement (coalesce("Date"::date, current_date) du trigger)."""
+    d = entrainement.get("Date")
+    if d:
+        return str(d)[:10]
+    return (default or date.today()).isoformat()
+
+
+# ─────────────────────────────────────────────
+# Calcul (équivalent des triggers de la migration 019)
+# ─────────────────────────────────────────────
+def _delta(uid: Any, jour: str) -> Dict[str, Any]:
+    return {"Users_Id": uid, "Jour": jour, **{c: 0 for c in ACTIVITY_SUMS}}
+
+
+def session_deltas(entrainements: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Sessions par (utilisateur, jour) des entraînements créés."""
+    out: Dict[Tuple, Dict[str, Any]] = {}
+    for e in entrainements:
+        if e.get("Users_Id") is None:
+            continue
+        key = (e["Users_Id"], day_of(e))
+        out.setdefault(key, _delta(*key))["sessions"] += 1
+    return list(out.values())
+
+
+def observation_deltas(observations: Iterable[Dict[str, Any]],
+                       sessions: Dict[Any, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Observations et réponses justes par (utilisateur, jour) ; `sessions` : id → Entrainement."""
+    out: Dict[Tuple, Dict[str, Any]] = {}
+    for o in observations:
+        e = sessions.get(o.get("Entrainement_Id"))
+        if not e or e.get("Users_Id") is None:
+            continue
+        key = (e["Users_Id"], day_of(e))
+        row = out.setdefault(key, _delta(*key))
+        row["observations"] += 1
+        row["corrects"] += is_correct(o)
+    return list(out.values())
+
+
+def merge_day(current: Optional[Dict[str, Any]], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Ligne existante + delta (ON CONFLICT DO UPDATE des triggers)."""
+    if not current:
+        return dict(delta)
+    merged = dict(current)
+    for c in ACTIVITY_SUMS:
+        merged[c] = (current.get(c) or 0) + delta[c]
+    return merged
+
+
+# ─────────────────────────────────────────────
+# Lectures
+# ─────────────────────────────────────────────
+def active_days(sb, user_id: int, since: date) -> List[str]:
+    """Jours (ISO, croissants) depuis `since` où l'utilisateur a créé au moins une session."""
+    rows = iter_rows(
+        lambda: sb.table(ACTIVITY_TABLE).select("Jour").eq("Users_Id", user_id)
+        .gte("Jour", since.isoformat()).gt("sessions", 0),
+        key="Jour",
+    )
+    return [str(r["Jour"])[:10] for r in rows]
+
+
+def parcours_daily_counts(sb, parcours_id: int, start: date, end: date) -> Dict[str, int]:
+    """Observations du parcours par jour d'entraînement, sur [start, end] (Stats_Entrainement."Date")."""
+    counts: Dict[str, int] = {}
+    rows = iter_rows(
+        lambda: sb.table(SESSION_STATS_TABLE).select("Date,n,last_observation_id").eq("Parcours_Id", parcours_id)
+        .gte("Date", start.isoformat()).lte("Date", end.isoformat()),
+        key="last_observation_id",
+    )
+    for r in rows:
+        d = str(r["Date"])[:10]
+        counts[d] = counts.get(d, 0) + int(r.get("n") or 0)
+    return counts
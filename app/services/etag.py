@@ -0,0 +1,119 @@
+# app/services/etag.py
+"""
+GET conditionnels (ETag / If-None-Match) des écrans relus à chaque ouverture.
+
+L'ETag d'une réponse résume l'état dont elle dépend, lu en un appel par la
+fonction SQL etag_state (migration 020, recherches d'index) :
+  observation    dernière observation de l'utilisateur
+  suivi          dernier Suivi_Parcours de l'utilisateur
+  positions      par opération : parcours courant, suivi, dernière observation
+                 du parcours (« restantes » de /parcours/positions_currentes)
+  parcours       dernière observation des parcours demandés (écrans par parcours,
+                 tous utilisateurs confondus)
+  entrainement   dernière observation d'un entraînement
+plus le nom de la ressource et les paramètres de la requête. Un If-None-Match
+égal reçoit un 304 avant toute requête lourde.
+
+Sans migration 020 (PGRST202) ou avec HTTP_ETAGS=false, pas d'ETag : les
+endpoints répondent comme avant. ETAG_SALT (ou ETAG_VERSION ci-dessous) est à
+changer quand le format d'une réponse change à état égal.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+ETAGS_ENABLED = os.getenv("HTTP_ETAGS", "true").lower() in ("1", "true", "yes")
+ETAG_SALT = os.getenv("ETAG_SALT", "")
+ETAG_VERSION = "1"
+
+# état dont dépend chaque ressource (clés de etag_state)
+RESOURCES: Dict[str, tuple] = {
+    "kpi_timeseries": ("parcours",),
+    "levels_summary": ("parcours",),
+    "score_cumule_50": ("observation",),
+    "observations_metrics": ("entrainement",),
+    "positions_currentes": ("observation", "suivi", "positions"),
+}
+
+_rpc_missing = False
+
+
+def etags_enabled() -> bool:
+    return ETAGS_ENABLED and not _rpc_missing
+
+
+def mark_rpc_missing(error: Exception) -> None:
+    global _rpc_missing
+    if not _rpc_missing:
+        logger.warning(f"[ETag] etag_state indisponible (migration 020), réponses sans ETag : {error}")
+    _rpc_missing = True
+
+
+def resource_state(
+    sb,
+    *,
+    user_id: Optional[int] = None,
+    parcours_ids: Iterable[int] = (),
+    entrainement_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    res = sb.rpc("etag_state", {
+        "p_user_id": user_id,
+        "p_parcours_ids": [int(p) for p in parcours_ids] or None,
+        "p_entrainement_id": entrainement_id,
+    }).execute()
+    data = getattr(res, "data", None)
+    if isinstance(data, list):
+        data = data[0] if data else None
+    return data or {}
+
+
+def make_etag(resource: str, state: Dict[str, Any], query: str = "", scope: Optional[str] = None) -> str:
+    """ETag faible : ressource, paramètres (ordre indifférent), état et, si fourni, portée (jeton)."""
+    params = sorted(parse_qsl(query, keep_blank_values=True))
+    seed = json.dumps([ETAG_VERSION, ETAG_SALT, resource, params, state, scope], sort_keys=True, default=str)
+    return f'W/"{hashlib.sha256(seed.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def resource_etag(
+    sb,
+    resource: str,
+    query: str = "",
+    scope: Optional[str] = None,
+    **keys: Any,
+) -> Optional[str]:
+    """ETag courant de `resource`, ou None (désactivé, migration absente, erreur de lecture)."""
+    if not etags_enabled():
+        return None
+    try:
+        state = resource_state(sb, **keys)
+    except Exception as e:
+        if getattr(e, "code", None) == "PGRST202":
+            mark_rpc_missing(e)
+        else:
+            logger.warning(f"[ETag] lecture de l'état impossible pour {resource} : {e}")
+        return None
+    wanted = {k: state.get(k) for k in RESOURCES[resource]}
+    if scope is not None:
+        scope = hashlib.sha256(scope.encode("utf-8")).hexdigest()
+    return make_etag(resource, wanted, query, scope)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparaison faible (RFC 9110) : `*` ou l'un des ETags listés."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == opaque:
+            return True
+    return False
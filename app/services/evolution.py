@@ -3,6 +3,20 @@ from __future__ import annotations
 from typing import Dict, List, Optional, Tuple
 from datetime import date
 
+from .parcours_catalog import get_catalog
+from .position_store import (
+    POSITION_TABLE,
+    append_suivi,
+    is_missing_column,
+    mark_window_missing,
+    position_after_suivi,
+    read_positions,
+    window_add,
+    window_enabled,
+    window_stats,
+    window_valid,
+)
+
 OP_TYPES = ("addition", "soustraction", "multiplication")
 # Mapping interne entre la valeur normalisée et la valeur stockée en DB (majuscule initiale)
 OP_TO_DB = {
@@ -15,16 +29,32 @@ EVOL_PROGRESSION = "progression"
 EVOL_STAGNATION  = "stagnation"
 EVOL_REGRESSION  = "régression"
 
+# règle de décision (process_session en SQL la reproduit ; rejeu : app.cli.replay_progression)
+PROGRESSION_THRESHOLD = 0.90  # taux strictement supérieur → niveau suivant
+REGRESSION_THRESHOLD = 0.5    # taux strictement inférieur → niveau précédent
+
+
+def decide(pct: float, has_prev: bool, has_next: bool,
+           progression: float = PROGRESSION_THRESHOLD, regression: float = REGRESSION_THRESHOLD) -> str:
+    if pct > progression and has_next:
+        return EVOL_PROGRESSION
+    if pct < regression and has_prev:
+        return EVOL_REGRESSION
+    return EVOL_STAGNATION
+
 
 class EvolutionService:
     """
-    Fenêtre = toutes les obs > Derniere_Observation_Id (par utilisateur + opération).
-    Seuils: >0.95 progression, <0.5 régression, sinon stagnation.
+    Fenêtre = toutes les obs > Derniere_Observation_Id (par utilisateur + opération),
+    tenue par les compteurs de Position_Courante (migration 017).
+    Seuils (`decide`): >0.90 progression, <0.5 régression, sinon stagnation.
     Voisins par (Type_Operation, Niveau). Auto-init niveau 1 si aucun suivi.
     """
 
     def __init__(self, sb_client):
         self.sb = sb_client
+        # positions courantes lues une fois par utilisateur pour la durée de l'instance
+        self._positions: Dict[int, Dict[str, Dict]] = {}
 
     # --- helper compat multi-SDK pour les SELECT ---
     def _q(self, table: str, columns: str = "*"):
@@ -56,110 +86,69 @@ class EvolutionService:
 
 
     # --------------------- lectures & écritures DB ---------------------
+    def _positions_for(self, user_id: int) -> Dict[str, Dict]:
+        if user_id not in self._positions:
+            self._positions[user_id] = read_positions(self.sb, user_id)
+        return self._positions[user_id]
+
+    def current_position(self, user_id: int, op_type: str) -> Optional[Dict]:
+        """Ligne Position_Courante de l'opération (compteurs de fenêtre compris), ou None."""
+        return self._positions_for(user_id).get(self._op_db(op_type))
+
     def _last_suivi_for_op(self, user_id: int, op_type: str) -> Optional[Dict]:
         """
-        Récupère la DERNIÈRE ligne de Suivi_Parcours (append-only) pour ce user ET ce type d'opération.
-        Implémentation en 2 temps:
-          1) on prend les 50 derniers suivis de l'utilisateur
-          2) pour chacun on charge le Parcours et on compare Type_Operation
+        Récupère la DERNIÈRE position (Suivi_Parcours) pour ce user ET ce type d'opération.
+        Lue dans Position_Courante : une lecture pour les trois opérations, mémorisée sur l'instance.
         """
-        suivis = (
-            self._q("Suivi_Parcours", "id, Parcours_Id, Derniere_Observation_Id")
-            .eq("Users_Id", user_id)
-            .order("id", desc=True)
-            .limit(50)
-            .execute()
-            .data
-            or []
-        )
         wanted = self._op_db(op_type)
-        for s in suivis:
-            p = (
-                self._q("Parcours", "id, Niveau, Critere, Type_Operation")
-                .eq("id", s["Parcours_Id"])
-                .limit(1)
-                .execute()
-                .data
-            )
-            if p and p[0].get("Type_Operation") == wanted:
-                return {"suivi": s, "parcours": p[0]}
-        return None
+        pos = self._positions_for(user_id).get(wanted)
+        if not pos:
+            return None
+        p = get_catalog().get(pos.get("Parcours_Id"))
+        if not p:
+            return None
+        suivi = {
+            "id": pos.get("Suivi_Id"),
+            "Parcours_Id": pos.get("Parcours_Id"),
+            "Derniere_Observation_Id": pos.get("Derniere_Observation_Id"),
+        }
+        return {"suivi": suivi, "parcours": p}
+
+    def _append_suivi(self, payload: Dict) -> Optional[Dict]:
+        """Écrit Suivi_Parcours + Position_Courante et garde le cache d'instance cohérent."""
+        row = append_suivi(self.sb, payload)
+        pos = position_after_suivi(row or payload)
+        if pos and pos["Users_Id"] in self._positions:
+            self._positions[pos["Users_Id"]][pos["Type_Operation"]] = pos
+        return row
 
     def _initial_parcours_for_op(self, op_type: str) -> Dict:
         wanted = self._op_db(op_type)
-        rows = (
-            self._q("Parcours", "id, Niveau, Critere, Type_Operation")
-            .eq("Type_Operation", wanted)
-            .order("Niveau")
-            .limit(1)
-            .execute()
-            .data
-        )
-        if not rows:
-            rows = (
-                self._q("Parcours", "id, Niveau, Critere, Type_Operation")
-                .eq("Type_Operation", wanted)
-                .order("id")
-                .limit(1)
-                .execute()
-                .data
-            )
-        if not rows:
+        p0 = get_catalog().first(wanted)
+        if not p0:
             raise ValueError(f"Aucun Parcours pour Type_Operation={wanted}")
-        return rows[0]
+        return p0
 
     def _ensure_initialized(self, user_id: int, op_type: str) -> Dict:
         last = self._last_suivi_for_op(user_id, op_type)
         if last:
             return last
         p0 = self._initial_parcours_for_op(op_type)
-        res_ins = (
-            self.sb.table("Suivi_Parcours")
-            .insert({
-                "Users_Id": user_id,
-                "Parcours_Id": p0["id"],
-                "Date": date.today().isoformat(),
-                "Type_Evolution": "initialisation",
-                "Taux_Reussite": 0.0,
-                "Derniere_Observation_Id": None,
-            })
-            .execute()
-        )
-        ins = (res_ins.data[0] if getattr(res_ins, "data", None) else {"Parcours_Id": p0["id"], "Derniere_Observation_Id": None})
+        row = self._append_suivi({
+            "Users_Id": user_id,
+            "Parcours_Id": p0["id"],
+            "Date": date.today().isoformat(),
+            "Type_Evolution": "initialisation",
+            "Taux_Reussite": 0.0,
+            "Derniere_Observation_Id": None,
+        })
+        ins = row or {"Parcours_Id": p0["id"], "Derniere_Observation_Id": None}
         return {"suivi": ins, "parcours": p0}
 
 
     def _neighbors_by_niveau(self, op_type: str, current_niveau: int) -> Tuple[Optional[Dict], Dict, Optional[Dict]]:
-        wanted = self._op_db(op_type)
-        cur_rows = (
-            self._q("Parcours", "id, Niveau, Critere, Type_Operation")
-            .eq("Type_Operation", wanted)
-            .eq("Niveau", current_niveau)
-            .limit(1)
-            .execute()
-            .data or []
-        )
-        cur = cur_rows[0] if cur_rows else None
-
-        prev = (
-            self._q("Parcours", "id, Niveau, Critere, Type_Operation")
-            .eq("Type_Operation", wanted)
-            .lt("Niveau", current_niveau)
-            .order("Niveau", desc=True)
-            .limit(1)
-            .execute()
-            .data
-        )
-        nxt = (
-            self._q("Parcours", "id, Niveau, Critere, Type_Operation")
-            .eq("Type_Operation", wanted)
-            .gt("Niveau", current_niveau)
-            .order("Niveau")
-            .limit(1)
-            .execute()
-            .data
-        )
-        return (prev[0] if prev else None, cur, nxt[0] if nxt else None)
+        """Niveaux voisins par (Type_Operation, Niveau) : échelle du catalogue Parcours, sans requête."""
+        return get_catalog().neighbors(self._op_db(op_type), current_niveau)
 
     def _user_entrainement_ids(self, user_id: int) -> List[int]:
         rows = (
@@ -175,7 +164,8 @@ class EvolutionService:
 
     def _window_stats_since(self, user_id: int, op_type: str, last_obs_id: Optional[int]) -> Dict:
         """
-        Fenêtre: toutes les Observations de CE user pour cette opération, id > last_obs_id.
+        Recomptage de la fenêtre : toutes les Observations de CE user pour cette
+        opération, id > last_obs_id (amorçage des compteurs de window_for).
         """
         entr_ids = self._user_entrainement_ids(user_id)
         if not entr_ids:
@@ -196,30 +186,77 @@ class EvolutionService:
         last_id = (rows[-1]["id"] if rows else (last_obs_id or 0))
         return {"total": total, "corrects": corrects, "last_id_included": last_id}
 
+    def _write_window(self, user_id: int, wanted: str, values: Dict, expected_last: Optional[int] = None) -> bool:
+        """
+        Écrit les compteurs de fenêtre. `expected_last` : écriture conditionnelle
+        (Fenetre_Dernier_Id inchangé depuis la lecture). False si aucune ligne écrite.
+        """
+        if not window_enabled():
+            return False
+        q = self.sb.table(POSITION_TABLE).update(values).eq("Users_Id", user_id).eq("Type_Operation", wanted)
+        if expected_last is not None:
+            q = q.eq("Fenetre_Dernier_Id", expected_last)
+        try:
+            return bool(q.execute().data)
+        except Exception as e:
+            if is_missing_column(e):
+                mark_window_missing(e)
+            else:
+                print(f"[evolution] écriture des compteurs {wanted} : {e}")
+            return False
+
+    def window_for(self, user_id: int, op_type: str, session_rows: Optional[List[Dict]] = None) -> Dict:
+        """
+        Fenêtre de l'opération depuis le dernier suivi : {total, corrects, last_id_included}.
+        Compteurs de Position_Courante, augmentés des observations `session_rows` qui
+        viennent d'être insérées (ingestion) ; recomptés depuis Observations s'ils sont
+        absents, d'un autre suivi, ou avancés entre-temps par une session concurrente.
+        """
+        wanted = self._op_db(op_type)
+        pos = self.current_position(user_id, op_type)
+        last_obs_id = pos.get("Derniere_Observation_Id") if pos else None
+        if pos is None or not window_enabled():
+            return self._window_stats_since(user_id, op_type, last_obs_id)
+
+        if window_valid(pos):
+            values = window_add(pos, session_rows or [], wanted)
+            if values["Fenetre_Dernier_Id"] == int(pos["Fenetre_Dernier_Id"]):
+                return window_stats(pos)
+            if self._write_window(user_id, wanted, values, expected_last=int(pos["Fenetre_Dernier_Id"])):
+                pos.update(values)
+                return window_stats(pos)
+
+        stats = self._window_stats_since(user_id, op_type, last_obs_id)
+        values = {
+            "Total_Fenetre": stats["total"],
+            "Corrects_Fenetre": stats["corrects"],
+            "Fenetre_Depuis_Id": int(last_obs_id or 0),
+            "Fenetre_Dernier_Id": int(stats["last_id_included"]),
+        }
+        if self._write_window(user_id, wanted, values):
+            pos.update(values)
+        return stats
+
     @staticmethod
     def _decide(pct: float, has_prev: bool, has_next: bool) -> str:
-        if pct > 0.90 and has_next:
-            return EVOL_PROGRESSION
-        if pct < 0.5 and has_prev:
-            return EVOL_REGRESSION
-        return EVOL_STAGNATION
+        return decide(pct, has_prev, has_next)
 
     # --------------------- API publique ---------------------
-    def evaluate_and_record_if_needed(self, user_id: int, op_type: str) -> Optional[Dict]:
+    def evaluate_and_record_if_needed(self, user_id: int, op_type: str,
+                                      session_rows: Optional[List[Dict]] = None) -> Optional[Dict]:
+        """
+        `session_rows` : observations qui viennent d'être insérées (avec id et Etat),
+        ajoutées aux compteurs de fenêtre avant la décision.
+        """
         op_type = self._norm_op(op_type)
         if op_type not in OP_TYPES:
             return None
 
         ctx = self._ensure_initialized(user_id, op_type)
-        last_suivi = ctx["suivi"]
         cur_parcours = ctx["parcours"]
         critere = int(cur_parcours.get("Critere") or 0)
 
-        stats = self._window_stats_since(
-            user_id=user_id,
-            op_type=op_type,
-            last_obs_id=last_suivi.get("Derniere_Observation_Id"),
-        )
+        stats = self.window_for(user_id, op_type, session_rows)
         if stats["total"] < critere or critere <= 0:
             return None
 
@@ -233,20 +270,14 @@ class EvolutionService:
         elif decision == EVOL_REGRESSION and prev_p:
             arrival = prev_p
 
-        res_ins = (
-            self.sb.table("Suivi_Parcours")
-            .insert({
-                "Users_Id": user_id,
-                "Parcours_Id": arrival["id"],
-                "Date": date.today().isoformat(),
-                "Type_Evolution": decision,
-                "Taux_Reussite": round(pct, 4),
-                "Derniere_Observation_Id": int(stats["last_id_included"]),
-            })
-            .execute()
-        )
-        ins = res_ins.data[0] if getattr(res_ins, "data", None) else None
-
+        ins = self._append_suivi({
+            "Users_Id": user_id,
+            "Parcours_Id": arrival["id"],
+            "Date": date.today().isoformat(),
+            "Type_Evolution": decision,
+            "Taux_Reussite": round(pct, 4),
+            "Derniere_Observation_Id": int(stats["last_id_included"]),
+        })
 
         return {
             "suivi": ins,
@@ -0,0 +1,84 @@
+# app/services/idempotency.py
+"""
+Soumissions idempotentes : POST /observations avec une clé client
+(en-tête Idempotency-Key, ou `batch_id` dans { items: [...], batch_id }).
+
+Sur réseau mobile instable, l'app renvoie la même session quand la réponse se
+perd. Avec une clé, le rejeu reçoit la réponse d'origine (`replayed: true`)
+sans nouvelle insertion, ni scoring, ni Classement :
+  - cache du process (LRU + TTL, IDEMPOTENCY_CACHE_*) : zéro aller-retour pour
+    une rafale de rejeus arrivant sur le même process ;
+  - table Idempotency_Keys (migration 015), écrite par submit_observations(_async)
+    dans la transaction de la soumission : rejeu sur un autre process, ou après
+    expiration du cache (24 h). Purge : app/cron/idempotency_cleanup.py
+
+Le cache est cloisonné par jeton (sha256 de l'en-tête Authorization) : une
+clé devinée ne rend pas la réponse d'un autre utilisateur. La table l'est par
+le contrôle d'appartenance de l'entraînement, fait avant le rejeu.
+Sans migration 015 (PGRST202 avec p_idempotency_key), seul le cache s'applique.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from .identity import TTLCache
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TABLE = "Idempotency_Keys"
+KEY_MAX_LENGTH = 200  # CHECK de la table
+CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_CACHE_TTL", "600"))
+
+_responses = TTLCache(CACHE_SIZE)
+_rpc_missing = False
+
+
+def idempotency_key(header: Optional[str], payload: Any) -> Optional[str]:
+    """Clé de la requête : en-tête Idempotency-Key, sinon `batch_id` du corps. ValueError si invalide."""
+    raw = header
+    if raw is None and isinstance(payload, dict) and payload.get("batch_id") is not None:
+        raw = str(payload["batch_id"])
+    if raw is None:
+        return None
+    key = raw.strip()
+    if not key or len(key) > KEY_MAX_LENGTH:
+        raise ValueError(f"clé d'idempotence vide ou de plus de {KEY_MAX_LENGTH} caractères")
+    return key
+
+
+def _cache_key(authorization: Optional[str], entrainement_id: int, key: str):
+    scope = hashlib.sha256((authorization or "").encode("utf-8")).hexdigest()
+    return scope, entrainement_id, key
+
+
+def cached_response(authorization: Optional[str], entrainement_id: int, key: str) -> Optional[Dict[str, Any]]:
+    value = _responses.get(_cache_key(authorization, entrainement_id, key))
+    return value if isinstance(value, dict) else None
+
+
+def remember(authorization: Optional[str], entrainement_id: int, key: str, response: Dict[str, Any]) -> None:
+    _responses.set(_cache_key(authorization, entrainement_id, key), response, CACHE_TTL_SECONDS)
+
+
+def rpc_key_enabled() -> bool:
+    """p_idempotency_key accepté par les fonctions SQL (migration 015) ?"""
+    return not _rpc_missing
+
+
+def mark_rpc_missing(error: Exception) -> None:
+    global _rpc_missing
+    if not _rpc_missing:
+        logger.warning(f"[Idempotency] p_idempotency_key non supporté (migration 015 absente), cache seul : {error}")
+    _rpc_missing = True
+
+
+def purge_expired(sb) -> int:
+    """Supprime les clés expirées. Retourne le nombre de lignes supprimées."""
+    now = datetime.now(timezone.utc).isoformat()
+    res = sb.table(IDEMPOTENCY_TABLE).delete().lt("expires_at", now).execute()
+    return len(getattr(res, "data", []) or [])
@@ -0,0 +1,325 @@
+# app/services/identity.py
+"""
+Identité de l'appelant : vérification locale du JWT Supabase + résolution
+`sub` (auth_uid) → Users.id mise en cache.
+
+Vérification (dans l'ordre) :
+  - SUPABASE_JWT_SECRET défini → HS256 vérifié localement ;
+  - sinon clés publiques JWKS du projet ({SUPABASE_URL}/auth/v1/.well-known/jwks.json),
+    mises en cache SUPABASE_JWKS_TTL secondes (rechargées si `kid` inconnu) ;
+    l'algorithme est celui de la clé (RS256 / ES256), un en-tête `alg` différent est refusé ;
+  - aucune clé utilisable (projet HS256 sans secret configuré) → un appel GoTrue
+    `get_user`, puis le jeton vérifié est mémorisé jusqu'à son `exp`.
+Dans tous les cas : `exp` et l'audience (SUPABASE_JWT_AUDIENCE) sont contrôlés.
+
+Résolution Users.id :
+  - cache LRU (IDENTITY_CACHE_SIZE entrées) avec TTL IDENTITY_CACHE_TTL ;
+  - cache négatif (auth_uid sans ligne users_map) IDENTITY_NEGATIVE_TTL secondes ;
+  - une seule requête users_map(user_id) au premier passage, création
+    Users + users_map si `register=True` (ancien user_resolver).
+
+Les dépendances FastAPI (`current_identity`, `optional_identity`,
+`current_user_id`) sont dans app/deps.py.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from jose import jwt as jose_jwt
+from jose.exceptions import JOSEError
+
+from ..supabase_pool import get_factory
+
+logger = logging.getLogger(__name__)
+
+JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_TTL_SECONDS = float(os.getenv("SUPABASE_JWKS_TTL", "3600"))
+JWKS_MIN_REFRESH_SECONDS = 30.0  # anti-martèlement sur `kid` inconnu
+# algorithme d'une clé JWKS : son `alg`, sinon déduit de `kty` ; asymétriques uniquement
+JWKS_ALGORITHMS = {"RSA": "RS256", "EC": "ES256"}
+
+CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("IDENTITY_CACHE_TTL", "300"))
+NEGATIVE_TTL_SECONDS = float(os.getenv("IDENTITY_NEGATIVE_TTL", "30"))
+
+_MISSING = object()
+
+
+class InvalidToken(Exception):
+    """JWT absent, mal formé, expiré ou signature invalide."""
+
+
+@dataclass
+class Identity:
+    auth_uid: str
+    user_id: Optional[int]
+    email: Optional[str] = None
+    claims: Dict[str, Any] = field(default_factory=dict)
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Cache LRU + TTL
+# ────────────────────────────────────────────────────────────────────────────────
+class TTLCache:
+    """LRU borné, TTL par entrée (les valeurs None servent de cache négatif)."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return _MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Vérification du JWT
+# ────────────────────────────────────────────────────────────────────────────────
+class TokenVerifier:
+    def __init__(self, secret: Optional[str] = JWT_SECRET, audience: Optional[str] = JWT_AUDIENCE):
+        self.secret = secret
+        self.audience = audience
+        self._jwks: Dict[str, Dict[str, Any]] = {}
+        self._jwks_fetched_at = 0.0
+        self._lock = threading.Lock()
+        # jetons validés par GoTrue (pas de clé locale) : sha256(token) → claims
+        self._remote_ok = TTLCache(CACHE_SIZE)
+
+    # ---- JWKS ----
+    def _jwks_url(self) -> str:
+        return f"{get_factory().auth_url}/.well-known/jwks.json"
+
+    def jwks_stale(self, kid: Optional[str] = None) -> bool:
+        if self.secret:
+            return False
+        age = time.monotonic() - self._jwks_fetched_at
+        if not self._jwks_fetched_at or age >= JWKS_TTL_SECONDS:
+            return True
+        return kid is not None and kid not in self._jwks and age >= JWKS_MIN_REFRESH_SECONDS
+
+    def refresh_jwks(self) -> None:
+        with self._lock:
+            try:
+                factory = get_factory()
+                res = factory.http_client.get(self._jwks_url(), headers={"apiKey": factory.key}, timeout=5.0)
+                res.raise_for_status()
+                keys = res.json().get("keys") or []
+                self._jwks = {k.get("kid"): k for k in keys if k.get("kid")}
+            except Exception as e:
+                logger.warning(f"[Identity] JWKS indisponible: {e}")
+            self._jwks_fetched_at = time.monotonic()
+
+    # ---- décodage ----
+    def _decode_local(self, token: str) -> Optional[Dict[str, Any]]:
+        """Claims vérifiés localement, ou None si aucune clé locale ne s'applique."""
+        try:
+            header = jose_jwt.get_unverified_header(token)
+        except JOSEError as e:
+            raise InvalidToken(f"JWT mal formé: {e}")
+        alg = header.get("alg") or "HS256"
+        options = {"verify_aud": bool(self.audience)}
+        try:
+            if alg == "HS256":
+                if not self.secret:
+                    return None
+                return jose_jwt.decode(token, self.secret, algorithms=["HS256"], audience=self.audience, options=options)
+            key = self._jwks.get(header.get("kid"))
+            if key is None:
+                return None
+            key_alg = key.get("alg") or JWKS_ALGORITHMS.get(key.get("kty"))
+            if key_alg not in JWKS_ALGORITHMS.values():
+                return None
+            if alg != key_alg:
+                raise InvalidToken(f"Algorithme {alg} refusé pour la clé {header.get('kid')} ({key_alg})")
+            return jose_jwt.decode(token, key, algorithms=[key_alg], audience=self.audience, options=options)
+        except JOSEError as e:
+            raise InvalidToken(str(e))
+
+    @staticmethod
+    def _claims_from_user(token: str, user: Any) -> Dict[str, Any]:
+        claims = jose_jwt.get_unverified_claims(token)
+        if not user or getattr(user, "id", None) != claims.get("sub"):
+            raise InvalidToken("Invalid token")
+        return claims
+
+    def _cache_remote(self, token_hash: str, claims: Dict[str, Any]) -> None:
+        ttl = float(claims.get("exp") or 0) - time.time()
+        if ttl > 0:
+            self._remote_ok.set(token_hash, claims, ttl)
+
+    def _prepare(self, token: str):
+        if not token or token.count(".") != 2:
+            raise InvalidToken("Missing Bearer token")
+        try:
+            kid = jose_jwt.get_unverified_header(token).get("kid")
+        except JOSEError as e:
+            raise InvalidToken(f"JWT mal formé: {e}")
+        return kid, hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        kid, token_hash = self._prepare(token)
+        if self.jwks_stale(kid):
+            self.refresh_jwks()
+        claims = self._decode_local(token)
+        if claims is not None:
+            return claims
+        cached = self._remote_ok.get(token_hash)
+        if cached is not _MISSING:
+            return cached
+        try:
+            user = get_factory().auth.get_user(token).user
+        except Exception as e:
+            raise InvalidToken(f"Invalid token: {e}")
+        claims = self._claims_from_user(token, user)
+        self._cache_remote(token_hash, claims)
+        return claims
+
+    async def averify(self, token: str) -> Dict[str, Any]:
+        kid, token_hash = self._prepare(token)
+        if self.jwks_stale(kid):
+            await asyncio.to_thread(self.refresh_jwks)
+        claims = self._decode_local(token)
+        if claims is not None:
+            return claims
+        cached = self._remote_ok.get(token_hash)
+        if cached is not _MISSING:
+            return cached
+        try:
+            user = (await get_factory().async_auth.get_user(token)).user
+        except Exception as e:
+            raise InvalidToken(f"Invalid token: {e}")
+        claims = self._claims_from_user(token, user)
+        self._cache_remote(token_hash, claims)
+        return claims
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# auth_uid → Users.id
+# ────────────────────────────────────────────────────────────────────────────────
+class IdentityResolver:
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL_SECONDS, negative_ttl: float = NEGATIVE_TTL_SECONDS):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(maxsize)
+
+    def remember(self, auth_uid: str, user_id: Optional[int]) -> None:
+        self.cache.set(auth_uid, user_id, self.ttl if user_id is not None else self.negative_ttl)
+
+    def invalidate(self, auth_uid: str) -> None:
+        self.cache.pop(auth_uid)
+
+    @staticmethod
+    def _new_user(email: Optional[str], name: Optional[str]) -> Dict[str, Any]:
+        return {"name": name or email or "Utilisateur", "email": email or None}
+
+    def resolve(self, auth_uid: str, email: Optional[str] = None, name: Optional[str] = None,
+                register: bool = False, sb=None) -> Optional[int]:
+        cached = self.cache.get(auth_uid)
+        if cached is not _MISSING and (cached is not None or not register):
+            return cached
+
+        sb = sb or get_factory().service()
+        m = sb.table("users_map").select("user_id").eq("auth_uid", auth_uid).limit(1).execute()
+        data = getattr(m, "data", []) or []
+        user_id = int(data[0]["user_id"]) if data else None
+
+        if user_id is None and register:
+            u = sb.table("Users").insert(self._new_user(email, name)).execute()
+            udata = getattr(u, "data", []) or []
+            if not udata:
+                raise RuntimeError("Création Users échouée")
+            user_id = int(udata[0]["id"])
+            sb.table("users_map").insert({"auth_uid": auth_uid, "user_id": user_id}).execute()
+
+        self.remember(auth_uid, user_id)
+        return user_id
+
+    async def aresolve(self, auth_uid: str, email: Optional[str] = None, name: Optional[str] = None,
+                       register: bool = False, sb=None) -> Optional[int]:
+        cached = self.cache.get(auth_uid)
+        if cached is not _MISSING and (cached is not None or not register):
+            return cached
+
+        sb = sb or get_factory().async_service()
+        m = await sb.table("users_map").select("user_id").eq("auth_uid", auth_uid).limit(1).execute()
+        data = getattr(m, "data", []) or []
+        user_id = int(data[0]["user_id"]) if data else None
+
+        if user_id is None and register:
+            u = await sb.table("Users").insert(self._new_user(email, name)).execute()
+            udata = getattr(u, "data", []) or []
+            if not udata:
+                raise RuntimeError("Création Users échouée")
+            user_id = int(udata[0]["id"])
+            await sb.table("users_map").insert({"auth_uid": auth_uid, "user_id": user_id}).execute()
+
+        self.remember(auth_uid, user_id)
+        return user_id
+
+
+verifier = TokenVerifier()
+resolver = IdentityResolver()
+
+
+def _identity(claims: Dict[str, Any], user_id: Optional[int]) -> Identity:
+    return Identity(auth_uid=claims["sub"], user_id=user_id, email=claims.get("email"), claims=claims)
+
+
+def identity_from_token(token: str, register: bool = False) -> Identity:
+    """Vérifie le JWT et résout Users.id (cache). Lève InvalidToken."""
+    claims = verifier.verify(token)
+    if not claims.get("sub"):
+        raise InvalidToken("JWT sans sub")
+    return _identity(claims, resolver.resolve(claims["sub"], email=claims.get("email"), register=register))
+
+
+async def aidentity_from_token(token: str, register: bool = False) -> Identity:
+    claims = await verifier.averify(token)
+    if not claims.get("sub"):
+        raise InvalidToken("JWT sans sub")
+    return _identity(claims, await resolver.aresolve(claims["sub"], email=claims.get("email"), register=register))
+
+
+def cache_stats() -> Dict[str, Any]:
+    c = resolver.cache
+    return {"entries": len(c), "hits": c.hits, "misses": c.misses,
+            "ttl": resolver.ttl, "negative_ttl": resolver.negative_ttl,
+            "verification": "secret" if verifier.secret else "jwks"}
@@ -0,0 +1,131 @@
+# app/services/keyset.py
+"""
+Lecture en flux des grandes tables, paginée par clé (`id > dernier id`).
+
+Pourquoi pas `.limit(100000)` : PostgREST plafonne chaque réponse à `max-rows`
+(1000 par défaut chez Supabase), les lignes au-delà manquent sans erreur.
+Pourquoi pas `.range(offset, ...)` : Postgres relit puis jette `offset` lignes à
+chaque page, le coût total croît comme le carré du volume.
+
+Ici chaque page est une recherche d'index sur la clé, de taille bornée, et
+l'appelant agrège au fil de l'eau : mémoire plate, coût linéaire.
+
+    rows = iter_rows(lambda: sb.table("Observations").select("id,Etat").eq("Parcours_Id", pid))
+    ok = sum(1 for r in rows if r["Etat"] == "VRAI")
+
+`query` est une fabrique : elle renvoie à chaque appel un builder neuf (les
+builders postgrest-py se modifient en place). La clé doit être sélectionnée.
+`page_size` ne doit pas dépasser le max-rows du serveur (une page plus courte
+que demandé signifie « fin de table »).
+"""
+from __future__ import annotations
+
+import heapq
+import os
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List
+
+PAGE_SIZE = int(os.getenv("KEYSET_PAGE_SIZE", "1000"))
+IN_CHUNK = 500  # valeurs par filtre `in` (longueur d'URL bornée)
+
+Row = Dict[str, Any]
+
+
+def _next_key(page: List[Row], key: str) -> Any:
+    last = page[-1].get(key)
+    if last is None:
+        raise ValueError(f"[Keyset] la colonne '{key}' doit être sélectionnée")
+    return last
+
+
+def _page_query(query: Callable[[], Any], key: str, last: Any, page_size: int, desc: bool):
+    q = query()
+    if last is not None:
+        q = q.lt(key, last) if desc else q.gt(key, last)
+    return q.order(key, desc=desc).limit(page_size)
+
+
+def iter_pages(
+    query: Callable[[], Any],
+    *,
+    key: str = "id",
+    page_size: int = PAGE_SIZE,
+    after: Any = None,
+    desc: bool = False,
+) -> Iterator[List[Row]]:
+    """Pages successives (listes de `page_size` lignes au plus), triées par `key`."""
+    last = after
+    while True:
+        page = getattr(_page_query(query, key, last, page_size, desc).execute(), "data", []) or []
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        last = _next_key(page, key)
+
+
+def iter_rows(query: Callable[[], Any], **kw) -> Iterator[Row]:
+    """Lignes une à une (voir iter_pages pour les options)."""
+    for page in iter_pages(query, **kw):
+        yield from page
+
+
+def iter_in(
+    query: Callable[[], Any],
+    column: str,
+    values: Iterable[Any],
+    *,
+    chunk: int = IN_CHUNK,
+    **kw,
+) -> Iterator[Row]:
+    """`column IN values` par paquets de `chunk` valeurs, chaque paquet lu par clé."""
+    vals = list(dict.fromkeys(values))
+    for i in range(0, len(vals), chunk):
+        part = vals[i:i + chunk]
+        yield from iter_rows(lambda part=part: query().in_(column, part), **kw)
+
+
+def iter_in_merged(
+    query: Callable[[], Any],
+    column: str,
+    values: Iterable[Any],
+    *,
+    key: str = "id",
+    chunk: int = IN_CHUNK,
+    **kw,
+) -> Iterator[Row]:
+    """
+    Comme iter_in, mais dans l'ordre global de `key` : les paquets sont lus à
+    la demande (une page en mémoire par paquet) et fusionnés.
+    """
+    vals = list(dict.fromkeys(values))
+    streams = [
+        iter_rows(lambda part=vals[i:i + chunk]: query().in_(column, part), key=key, **kw)
+        for i in range(0, len(vals), chunk)
+    ]
+    yield from heapq.merge(*streams, key=lambda r: r[key])
+
+
+async def aiter_pages(
+    query: Callable[[], Any],
+    *,
+    key: str = "id",
+    page_size: int = PAGE_SIZE,
+    after: Any = None,
+    desc: bool = False,
+) -> AsyncIterator[List[Row]]:
+    """Pendant async de iter_pages (builders AsyncScopedClient)."""
+    last = after
+    while True:
+        res = await _page_query(query, key, last, page_size, desc).execute()
+        page = getattr(res, "data", []) or []
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        last = _next_key(page, key)
+
+
+async def aiter_rows(query: Callable[[], Any], **kw) -> AsyncIterator[Row]:
+    async for page in aiter_pages(query, **kw):
+        for row in page:
+            yield row
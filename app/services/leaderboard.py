@@ -0,0 +1,461 @@
+# app/services/leaderboard.py
+"""
+Classement en mémoire : une structure ordonnée par portée (score_global pour
+« all », score_week pour « this_week ») sur les clés (-score, Users_Id).
+
+GET /classement faisait par requête un `order(...).range(...)` pour la page et
+un `count="exact"` sur Classement pour le rang de l'appelant (parcours de tous
+les scores supérieurs). Ici :
+  rang d'un utilisateur   nb de scores strictement supérieurs + 1, O(log n)
+  page / top-k            accès par position, O(log n + k)
+  autour d'un utilisateur position puis tranche, O(log n + k)
+  après / avant un curseur  (score, Users_Id) cherché par bisect, O(log n + k) :
+                          une page profonde coûte autant que la première
+
+Structure : liste triée découpée en blocs (LOAD clés, bisect dans le bloc) et
+arbre de Fenwick sur la taille des blocs pour passer d'une position globale à
+(bloc, indice) et inversement.
+
+Alimentation :
+  warm()          relit Classement par clé (Users_Id) au démarrage (lifespan de
+                  app/main.py), puis toutes les LEADERBOARD_REFRESH_SECONDS : les
+                  écritures d'autres process (worker outbox séparé, autres
+                  workers de l'API, malus de /pixel) y sont reprises
+  apply_totals()  nouveaux totaux d'un utilisateur renvoyés par la soumission
+                  (process_session, migration 022 ; increment_classement) : le
+                  process qui écrit voit son classement à jour sans attendre
+Les mises à jour reçues pendant une relecture sont rejouées sur la nouvelle
+structure avant l'échange.
+
+Les colonnes de Classement sont reprises telles quelles (score_week d'une
+semaine passée compris), comme les requêtes qu'elles remplacent. Tant que le
+classement n'est pas chargé (ou LEADERBOARD_ENGINE=false), /classement lit la
+table comme avant.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .keyset import aiter_pages
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_ENGINE = os.getenv("LEADERBOARD_ENGINE", "true").strip().lower() in ("1", "true", "yes")
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "300"))
+
+METRICS = ("score_global", "score_week")
+LOAD = 512  # clés par bloc (découpé au-delà de 2 * LOAD)
+CURSOR_VERSION = 1
+
+Key = Tuple[int, int]  # (-score, Users_Id)
+
+
+# ─────────────────────────────────────────────
+# Liste triée par blocs
+# ─────────────────────────────────────────────
+class _Fenwick:
+    """Sommes préfixes des tailles de blocs."""
+
+    def __init__(self, sizes: List[int]):
+        self.n = len(sizes)
+        self.tree = [0] * (self.n + 1)
+        for i, s in enumerate(sizes, start=1):
+            self.tree[i] += s
+            j = i + (i & -i)
+            if j <= self.n:
+                self.tree[j] += self.tree[i]
+
+    def add(self, i: int, delta: int) -> None:
+        i += 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i: int) -> int:
+        """Nombre de clés des blocs [0, i)."""
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, k: int) -> Tuple[int, int]:
+        """(bloc, indice dans le bloc) de la position globale k."""
+        pos, step = 0, 1 << self.n.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.n and self.tree[nxt] <= k:
+                pos = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return pos, k
+
+
+class SortedKeys:
+    """Clés triées : ajout, retrait, recherche et accès par position en O(log n)."""
+
+    def __init__(self, keys: Iterable[Key] = (), load: int = LOAD):
+        self._load = load
+        ordered = sorted(keys)
+        self._blocks = [ordered[i:i + load] for i in range(0, len(ordered), load)]
+        self._len = len(ordered)
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self._maxes = [b[-1] for b in self._blocks]
+        self._index = _Fenwick([len(b) for b in self._blocks])
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, key: Key) -> None:
+        if not self._blocks:
+            self._blocks.append([key])
+            self._len = 1
+            self._reindex()
+            return
+        i = min(bisect_left(self._maxes, key), len(self._blocks) - 1)
+        block = self._blocks[i]
+        insort(block, key)
+        self._maxes[i] = block[-1]
+        self._len += 1
+        if len(block) > 2 * self._load:
+            self._blocks[i:i + 1] = [block[:self._load], block[self._load:]]
+            self._reindex()
+        else:
+            self._index.add(i, 1)
+
+    def discard(self, key: Key) -> bool:
+        i = bisect_left(self._maxes, key)
+        if i == len(self._blocks):
+            return False
+        block = self._blocks[i]
+        j = bisect_left(block, key)
+        if j == len(block) or block[j] != key:
+            return False
+        del block[j]
+        self._len -= 1
+        if block:
+            self._maxes[i] = block[-1]
+            self._index.add(i, -1)
+        else:
+            del self._blocks[i]
+            self._reindex()
+        return True
+
+    def bisect_left(self, key: Any) -> int:
+        """Nombre de clés < key."""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._blocks):
+            return self._len
+        return self._index.prefix(i) + bisect_left(self._blocks[i], key)
+
+    def bisect_right(self, key: Any) -> int:
+        """Nombre de clés <= key."""
+        i = bisect_right(self._maxes, key)
+        if i == len(self._blocks):
+            return self._len
+        return self._index.prefix(i) + bisect_right(self._blocks[i], key)
+
+    def slice(self, start: int, stop: int) -> List[Key]:
+        """Clés des positions [start, stop)."""
+        start, stop = max(0, start), min(self._len, stop)
+        out: List[Key] = []
+        if start >= stop:
+            return out
+        i, j = self._index.find(start)
+        while len(out) < stop - start:
+            block = self._blocks[i]
+            out.extend(block[j:j + (stop - start - len(out))])
+            i, j = i + 1, 0
+        return out
+
+
+# ─────────────────────────────────────────────
+# Classement d'une portée
+# ─────────────────────────────────────────────
+class Leaderboard:
+    """Scores d'une colonne de Classement, ordre (score décroissant, Users_Id croissant)."""
+
+    def __init__(self, scores: Optional[Dict[int, int]] = None):
+        self._scores: Dict[int, int] = dict(scores or {})
+        self._keys = SortedKeys((-s, u) for u, s in self._scores.items())
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def score(self, user_id: int) -> Optional[int]:
+        return self._scores.get(user_id)
+
+    def set(self, user_id: int, score: int) -> None:
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._keys.discard((-old, user_id))
+        self._scores[user_id] = score
+        self._keys.add((-score, user_id))
+
+    def remove(self, user_id: int) -> None:
+        old = self._scores.pop(user_id, None)
+        if old is not None:
+            self._keys.discard((-old, user_id))
+
+    def count_above(self, score: int) -> int:
+        """Nombre de scores strictement supérieurs à `score`."""
+        return self._keys.bisect_left((-score,))
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Rang « compétition » (ex aequo au même rang), None si absent."""
+        s = self._scores.get(user_id)
+        return None if s is None else self.count_above(s) + 1
+
+    def position(self, user_id: int) -> Optional[int]:
+        """Position (0 = premier) dans l'ordre total, None si absent."""
+        s = self._scores.get(user_id)
+        return None if s is None else self._keys.bisect_left((-s, user_id))
+
+    def page(self, offset: int, limit: int) -> List[Tuple[int, int]]:
+        """(Users_Id, score) des positions [offset, offset + limit)."""
+        return [(u, -ns) for ns, u in self._keys.slice(offset, offset + limit)]
+
+    def around(self, user_id: int, radius: int, after: Optional[int] = None) -> Tuple[int, List[Tuple[int, int]]]:
+        """(position du premier, entrées) : `radius` voisins avant l'utilisateur, `after` (défaut `radius`) après."""
+        pos = self.position(user_id)
+        if pos is None:
+            return 0, []
+        start = max(0, pos - radius)
+        end = pos + (radius if after is None else after) + 1
+        return start, self.page(start, end - start)
+
+    def after(self, score: int, user_id: int, limit: int) -> Tuple[int, List[Tuple[int, int]]]:
+        """(position du premier, entrées) : `limit` entrées qui suivent (score, user_id), exclu."""
+        start = self._keys.bisect_right((-score, user_id))
+        return start, self.page(start, limit)
+
+    def before(self, score: int, user_id: int, limit: int) -> Tuple[int, List[Tuple[int, int]]]:
+        """(position du premier, entrées) : `limit` entrées qui précèdent (score, user_id), exclu."""
+        end = self._keys.bisect_left((-score, user_id))
+        start = max(0, end - limit)
+        return start, self.page(start, end - start)
+
+
+# ─────────────────────────────────────────────
+# Les deux portées, chargées depuis Classement
+# ─────────────────────────────────────────────
+def _score(v: Any) -> int:
+    return int(v or 0)
+
+
+class LeaderboardEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._boards: Dict[str, Leaderboard] = {m: Leaderboard() for m in METRICS}
+        self._pending: Optional[Dict[int, Tuple[int, int]]] = None
+        self.ready = False
+        self.loaded_at: Optional[float] = None
+
+    def begin_reload(self) -> None:
+        """À appeler avant de relire Classement : les mises à jour suivantes seront rejouées."""
+        with self._lock:
+            self._pending = {}
+
+    def abort_reload(self) -> None:
+        with self._lock:
+            self._pending = None
+
+    def load(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Remplace le classement par les lignes Classement (Users_Id, score_global, score_week)."""
+        scores: Dict[str, Dict[int, int]] = {m: {} for m in METRICS}
+        for r in rows:
+            uid = int(r["Users_Id"])
+            for m in METRICS:
+                scores[m][uid] = _score(r.get(m))
+        boards = {m: Leaderboard(scores[m]) for m in METRICS}
+        with self._lock:
+            for uid, (glob, week) in (self._pending or {}).items():
+                boards["score_global"].set(uid, glob)
+                boards["score_week"].set(uid, week)
+            self._boards = boards
+            self._pending = None
+            self.ready = True
+            self.loaded_at = time.time()
+        return len(boards["score_global"])
+
+    def apply(self, user_id: int, score_global: Any, score_week: Any) -> None:
+        """Nouveaux totaux d'un utilisateur (valeurs écrites dans Classement)."""
+        uid, glob, week = int(user_id), _score(score_global), _score(score_week)
+        with self._lock:
+            self._boards["score_global"].set(uid, glob)
+            self._boards["score_week"].set(uid, week)
+            if self._pending is not None:
+                self._pending[uid] = (glob, week)
+
+    # ---- lectures (mêmes formes que ClassementRepository) ----
+    def scores(self, user_id: int) -> Optional[Dict[str, int]]:
+        with self._lock:
+            glob = self._boards["score_global"].score(user_id)
+            if glob is None:
+                return None
+            return {"score_global": glob, "score_week": self._boards["score_week"].score(user_id)}
+
+    def count_above(self, metric: str, score: int) -> int:
+        with self._lock:
+            return self._boards[metric].count_above(score)
+
+    def top(self, metric: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self._rows(metric, self._boards[metric].page(offset, limit))
+
+    def around(self, metric: str, user_id: int, radius: int,
+               after: Optional[int] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        with self._lock:
+            start, entries = self._boards[metric].around(user_id, radius, after)
+            return start, self._rows(metric, entries)
+
+    def after(self, metric: str, score: int, user_id: int, limit: int) -> Tuple[int, List[Dict[str, Any]]]:
+        with self._lock:
+            start, entries = self._boards[metric].after(score, user_id, limit)
+            return start, self._rows(metric, entries)
+
+    def before(self, metric: str, score: int, user_id: int, limit: int) -> Tuple[int, List[Dict[str, Any]]]:
+        with self._lock:
+            start, entries = self._boards[metric].before(score, user_id, limit)
+            return start, self._rows(metric, entries)
+
+    def _rows(self, metric: str, entries: List[Tuple[int, int]]) -> List[Dict[str, Any]]:
+        other = "score_week" if metric == "score_global" else "score_global"
+        board = self._boards[other]
+        return [{"Users_Id": u, metric: s, other: board.score(u)} for u, s in entries]
+
+
+class LeaderboardReader:
+    """ClassementRepository servi par le moteur (mêmes méthodes, sans requête)."""
+
+    def __init__(self, eng: LeaderboardEngine):
+        self.engine = eng
+
+    async def top(self, metric: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        return self.engine.top(metric, offset, limit)
+
+    async def scores(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return self.engine.scores(user_id)
+
+    async def count_above(self, metric: str, score: int) -> int:
+        return self.engine.count_above(metric, score)
+
+    async def around(self, metric: str, user_id: int, radius: int,
+                     after: Optional[int] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        return self.engine.around(metric, user_id, radius, after)
+
+    async def after(self, metric: str, score: int, user_id: int, limit: int) -> Tuple[int, List[Dict[str, Any]]]:
+        return self.engine.after(metric, score, user_id, limit)
+
+    async def before(self, metric: str, score: int, user_id: int, limit: int) -> Tuple[int, List[Dict[str, Any]]]:
+        return self.engine.before(metric, score, user_id, limit)
+
+
+# ─────────────────────────────────────────────
+# Curseurs de pagination (clé score + Users_Id)
+# ─────────────────────────────────────────────
+CURSOR_DIRECTIONS = ("next", "prev")
+
+
+def encode_cursor(scope: str, direction: str, score: int, user_id: int) -> str:
+    """Curseur opaque : page qui suit (`next`) ou précède (`prev`) l'entrée (score, user_id)."""
+    raw = json.dumps([CURSOR_VERSION, scope, direction, int(score), int(user_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, scope: str) -> Tuple[str, int, int]:
+    """(direction, score, user_id) ; ValueError si le curseur est illisible ou d'une autre portée."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        version, cur_scope, direction, score, user_id = json.loads(raw)
+    except Exception:
+        raise ValueError("curseur invalide")
+    if version != CURSOR_VERSION or direction not in CURSOR_DIRECTIONS \
+            or not isinstance(score, int) or not isinstance(user_id, int):
+        raise ValueError("curseur invalide")
+    if cur_scope != scope:
+        raise ValueError(f"curseur de la portée '{cur_scope}', pas '{scope}'")
+    return direction, score, user_id
+
+
+engine = LeaderboardEngine()
+
+
+def engine_ready() -> bool:
+    return LEADERBOARD_ENGINE and engine.ready
+
+
+def reader() -> Optional[LeaderboardReader]:
+    """Lecteur en mémoire, ou None tant que le classement n'est pas chargé."""
+    return LeaderboardReader(engine) if engine_ready() else None
+
+
+def apply_totals(user_id: Optional[int], totals: Optional[Dict[str, Any]]) -> None:
+    """Totaux Classement renvoyés par une soumission ({score_global, score_week, ...})."""
+    if not LEADERBOARD_ENGINE or user_id is None or not totals or totals.get("score_global") is None:
+        return
+    engine.apply(int(user_id), totals.get("score_global"), totals.get("score_week"))
+
+
+# ─────────────────────────────────────────────
+# Chargement et rafraîchissement (process API)
+# ─────────────────────────────────────────────
+async def warm(sb, eng: Optional[LeaderboardEngine] = None) -> int:
+    """Relit Classement par pages (clé Users_Id) et remplace le classement. Retourne le nb de lignes."""
+    eng = eng or engine
+    eng.begin_reload()
+    rows: List[Dict[str, Any]] = []
+    try:
+        async for page in aiter_pages(lambda: sb.table("Classement").select("Users_Id,score_global,score_week"),
+                                      key="Users_Id"):
+            rows.extend(page)
+    except BaseException:
+        eng.abort_reload()
+        raise
+    return eng.load(rows)
+
+
+_task: Optional[asyncio.Task] = None
+
+
+async def _refresh_forever(sb) -> None:
+    while True:
+        started = time.perf_counter()
+        try:
+            n = await warm(sb)
+            logger.info(f"[Leaderboard] {n} lignes chargées en {time.perf_counter() - started:.2f}s")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[Leaderboard] chargement de Classement impossible : {e}")
+        await asyncio.sleep(LEADERBOARD_REFRESH_SECONDS)
+
+
+def start_refresher(sb) -> None:
+    global _task
+    if LEADERBOARD_ENGINE and _task is None:
+        _task = asyncio.get_running_loop().create_task(_refresh_forever(sb))
+
+
+async def stop_refresher() -> None:
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
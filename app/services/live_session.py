@@ -0,0 +1,115 @@
+# app/services/live_session.py
+"""
+Session en direct (WebSocket /ws/session, routers/sessions.py).
+
+Toute la session vit en mémoire : exercices générés une fois depuis les
+positions courantes, statistiques Stats_Scoring des trois clés lues une fois au
+démarrage, puis chaque réponse est corrigée et scorée localement dès réception
+(même moteur et même règle que submit_observations : submission.scoring_payloads).
+Aucune écriture par réponse : à la clôture, `rows()` part en un seul appel à la
+chaîne de soumission habituelle (submit_observations), qui persiste
+observations, scores, fenêtres, Classement et évolutions.
+
+Comme submit_observations, toutes les réponses sont scorées contre l'historique
+d'avant la session (les fenêtres n'ingèrent la session qu'à la clôture) : les
+scores renvoyés en direct sont ceux que la fonction SQL recalcule, tant
+qu'aucune autre session du même utilisateur n'est soumise entre-temps.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional
+
+from .scoring_stats import EMPTY_STATS, Key, KeyStats, key_of
+from .submission import scoring_payloads
+
+
+class LiveSession:
+    """
+    `exercises` : items de generer_mixte avec `Solution` ; `stats` : statistiques
+    des clés (Parcours_Id, Operation) de la session, historique hors session.
+    """
+
+    def __init__(self, user_id: int, entrainement_id: int, exercises: List[Dict[str, Any]],
+                 stats: Dict[Key, KeyStats], rules: Optional[str] = None):
+        self.user_id = user_id
+        self.entrainement_id = entrainement_id
+        self.exercises = exercises
+        self.stats = stats
+        self.rules = rules
+        self.answers: List[Dict[str, Any]] = []
+        self.total_score = 0
+        self._sent_at: Optional[float] = None
+
+    @property
+    def index(self) -> int:
+        return len(self.answers)
+
+    @property
+    def finished(self) -> bool:
+        return self.index >= len(self.exercises)
+
+    def next_exercise(self) -> Optional[Dict[str, Any]]:
+        """Exercice courant, sans la solution. None si la session est terminée."""
+        if self.finished:
+            return None
+        self._sent_at = time.monotonic()
+        exo = self.exercises[self.index]
+        return {"index": self.index, **{k: v for k, v in exo.items() if k != "Solution"}}
+
+    def answer(self, proposition: int, temps_seconds: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Corrige et score la réponse à l'exercice courant (colonnes du trigger
+        Observations + bonus du moteur).
+        `temps_seconds` absent : temps mesuré depuis l'envoi de l'exercice.
+        """
+        if self.finished:
+            raise ValueError("session terminée")
+        exo = self.exercises[self.index]
+        if temps_seconds is None:
+            elapsed = time.monotonic() - self._sent_at if self._sent_at is not None else 0
+            temps_seconds = int(round(elapsed))
+        solution = int(exo["Solution"])
+        correct = int(proposition) == solution
+        obs = {
+            "id": None,
+            "Parcours_Id": exo["Parcours_Id"],
+            "Operation": exo["Type"],
+            "Operateur_Un": exo["Operateur_Un"],
+            "Operateur_Deux": exo["Operateur_Deux"],
+            "Proposition": int(proposition),
+            "Temps_Seconds": int(temps_seconds),
+            # colonnes calculées par le trigger Observations
+            "Solution": solution,
+            "Etat": "VRAI" if correct else "FAUX",
+            "Score": 1 if correct else -1,
+            "Marge_Erreur": abs(int(proposition) - solution),
+        }
+        k = key_of(obs)
+        scored = scoring_payloads([obs], {k: self.stats.get(k) or EMPTY_STATS}, self.rules)[0]
+        self.answers.append(obs)
+        self.total_score += scored["score_global"]
+        return {
+            "index": self.index - 1,
+            "correct": correct,
+            "solution": solution,
+            "marge_erreur": obs["Marge_Erreur"],
+            "bonus_vitesse": scored["bonus_vitesse"],
+            "bonus_marge": scored["bonus_marge"],
+            "score_global": scored["score_global"],
+            "total_score": self.total_score,
+            "remaining": len(self.exercises) - self.index,
+        }
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Lignes de POST /observations pour les réponses reçues."""
+        return [{
+            "Entrainement_Id": self.entrainement_id,
+            "Parcours_Id": o["Parcours_Id"],
+            "Operateur_Un": o["Operateur_Un"],
+            "Operateur_Deux": o["Operateur_Deux"],
+            "Operation": o["Operation"],
+            "Proposition": o["Proposition"],
+            "Correction": "NON",
+            "Temps_Seconds": o["Temps_Seconds"],
+        } for o in self.answers]
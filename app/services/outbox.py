@@ -0,0 +1,171 @@
+# app/services/outbox.py
+"""
+Worker de la table Outbox (supabase/migrations/014_session_outbox.sql).
+
+Avec OBSERVATIONS_PIPELINE=outbox, POST /observations n'insère que les
+observations et un évènement 'session_submitted' (submit_observations_async,
+même transaction) puis répond. Le reste — scoring, Stats_Scoring, Classement,
+users_map, évolutions, positions : process_session — est exécuté ici :
+
+  claim_outbox_jobs   réserve jusqu'à `concurrency` jobs (lease, SKIP LOCKED :
+                      plusieurs workers/process se partagent la file)
+  run_outbox_job      applique process_session et marque le job 'done' dans la
+                      même transaction : un job rejoué (lease expirée, worker
+                      arrêté) n'applique jamais ses effets deux fois
+  fail_outbox_job     en cas d'erreur : nouvelle tentative après 2^n s, ou
+                      'failed' après OUTBOX_MAX_ATTEMPTS
+
+Le worker tourne dans le process de l'API (OUTBOX_IN_PROCESS, démarré par le
+lifespan de app/main.py, réveillé par notify() après chaque soumission) ou à
+part : python -m app.cli.outbox_worker
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import Any, Dict, List, Optional
+
+from . import leaderboard
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_IN_PROCESS = os.getenv("OUTBOX_IN_PROCESS", "true").strip().lower() in ("1", "true", "yes")
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "4"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+
+CLAIM_RPC = "claim_outbox_jobs"
+RUN_RPC = "run_outbox_job"
+FAIL_RPC = "fail_outbox_job"
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class OutboxWorker:
+    """`sb` : client async service role (les fonctions du worker lui sont réservées)."""
+
+    def __init__(self, sb, concurrency: int = OUTBOX_CONCURRENCY, name: Optional[str] = None,
+                 poll: float = OUTBOX_POLL_SECONDS):
+        self.sb = sb
+        self.concurrency = max(1, concurrency)
+        self.name = name or worker_name()
+        self.poll = poll
+        self.done = 0
+        self.errors = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def notify(self) -> None:
+        """Réveille la boucle (job enfilé par ce process) sans attendre le prochain poll."""
+        if self._wake is not None:
+            self._wake.set()
+
+    def stop(self) -> None:
+        self._stopping = True
+        self.notify()
+
+    async def claim(self) -> List[Dict[str, Any]]:
+        res = await self.sb.rpc(CLAIM_RPC, {
+            "p_worker": self.name,
+            "p_limit": self.concurrency,
+            "p_lease_seconds": OUTBOX_LEASE_SECONDS,
+        }).execute()
+        return getattr(res, "data", []) or []
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        try:
+            res = await self.sb.rpc(RUN_RPC, {"p_job_id": job["id"], "p_worker": self.name}).execute()
+            data = getattr(res, "data", None) or {}
+            status = data.get("status")
+            if status == "done":
+                self.done += 1
+                result = data.get("result") or {}
+                leaderboard.apply_totals(result.get("user_id"), result.get("classement"))
+            else:
+                logger.info(f"[Outbox] job {job['id']} : {status}")
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"[Outbox] job {job['id']} (tentative {job.get('attempts')}) en échec : {e}")
+            try:
+                await self.sb.rpc(FAIL_RPC, {
+                    "p_job_id": job["id"],
+                    "p_worker": self.name,
+                    "p_error": str(e),
+                    "p_max_attempts": OUTBOX_MAX_ATTEMPTS,
+                }).execute()
+            except Exception as e2:
+                # la lease expirera : le job sera repris
+                logger.error(f"[Outbox] fail_outbox_job {job['id']} : {e2}")
+
+    async def run_once(self) -> int:
+        """Une passe : réserve puis traite en parallèle jusqu'à `concurrency` jobs. Retourne leur nombre."""
+        jobs = await self.claim()
+        if jobs:
+            await asyncio.gather(*(self._run(j) for j in jobs))
+        return len(jobs)
+
+    async def drain(self) -> int:
+        """Traite la file jusqu'à ce qu'aucun job ne soit disponible."""
+        total = 0
+        while not self._stopping:
+            n = await self.run_once()
+            if not n:
+                break
+            total += n
+        return total
+
+    async def run_forever(self) -> None:
+        self._wake = asyncio.Event()
+        logger.info(f"[Outbox] worker {self.name} démarré (concurrence {self.concurrency})")
+        while not self._stopping:
+            self._wake.clear()
+            try:
+                busy = await self.run_once()
+            except Exception as e:
+                logger.error(f"[Outbox] claim_outbox_jobs : {e}")
+                busy = 0
+            if not busy:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll)
+                except asyncio.TimeoutError:
+                    pass
+        logger.info(f"[Outbox] worker {self.name} arrêté ({self.done} jobs traités, {self.errors} échecs)")
+
+
+# ─────────────────────────────────────────────
+# Worker du process API (lifespan de app/main.py)
+# ─────────────────────────────────────────────
+_worker: Optional[OutboxWorker] = None
+_task: Optional[asyncio.Task] = None
+
+
+def start_worker(sb) -> OutboxWorker:
+    global _worker, _task
+    if _worker is None:
+        _worker = OutboxWorker(sb)
+        _task = asyncio.get_running_loop().create_task(_worker.run_forever())
+    return _worker
+
+
+async def stop_worker(timeout: float = 10.0) -> None:
+    """Arrêt propre : les jobs en cours se terminent ; au-delà de `timeout`, leur lease expirera."""
+    global _worker, _task
+    if _worker is None:
+        return
+    _worker.stop()
+    try:
+        await asyncio.wait_for(_task, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning("[Outbox] arrêt du worker : délai dépassé, jobs repris à l'expiration de leur lease")
+    _worker, _task = None, None
+
+
+def notify() -> None:
+    if _worker is not None:
+        _worker.notify()
@@ -0,0 +1,226 @@
+# app/services/parcours_catalog.py
+"""
+Catalogue Parcours en mémoire, partagé par tout le process.
+
+La table Parcours est petite et ne change quasiment jamais : on la charge une
+fois, on l'indexe, et les helpers de position la lisent ici au lieu de faire
+un `.eq("id", pid)` par ligne de Suivi_Parcours.
+
+Index :
+  - par id
+  - par (Type_Operation, Niveau)
+  - par ordre de niveau (liste triée par type d'opération)
+  - échelle des niveaux distincts par type, avec le rang de chaque niveau :
+    niveau précédent / suivant en O(1) (`neighbors`, décisions d'évolution)
+
+Rafraîchissement :
+  - toutes les PARCOURS_CATALOG_TTL secondes, une sonde légère (count + max id)
+    vérifie si la table a bougé ; rechargement complet seulement si oui ;
+  - rechargement forcé au-delà de PARCOURS_CATALOG_MAX_AGE secondes
+    (couvre une édition de colonne sans ajout/suppression de ligne) ;
+  - `invalidate()` pour forcer le prochain accès à recharger.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CATALOG_TTL_SECONDS = float(os.getenv("PARCOURS_CATALOG_TTL", "60"))
+CATALOG_MAX_AGE_SECONDS = float(os.getenv("PARCOURS_CATALOG_MAX_AGE", "3600"))
+
+
+def _level_sort_key(row: Dict) -> Tuple[bool, int, int]:
+    # même ordre que `.order("Niveau")` côté Postgres (NULLs en dernier), puis id
+    niveau = row.get("Niveau")
+    return (niveau is None, int(niveau or 0), int(row.get("id") or 0))
+
+
+class ParcoursCatalog:
+    """Snapshot indexé de la table Parcours, rechargé sur sonde de version ou TTL."""
+
+    def __init__(
+        self,
+        sb_client=None,
+        ttl: float = CATALOG_TTL_SECONDS,
+        max_age: float = CATALOG_MAX_AGE_SECONDS,
+    ):
+        self._sb = sb_client
+        self.ttl = ttl
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+        self._by_id: Dict[int, Dict] = {}
+        self._by_level: Dict[Tuple[str, int], Dict] = {}
+        self._ladder: Dict[str, List[Dict]] = {}
+        self._steps: Dict[str, List[Dict]] = {}
+        self._step_rank: Dict[Tuple[str, int], int] = {}
+        self._version: Optional[Tuple[int, int]] = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    # --------------------- chargement ---------------------
+    def _client(self):
+        if self._sb is None:
+            from ..deps import supabase  # import tardif : deps crée le client au chargement
+            self._sb = supabase
+        return self._sb
+
+    def _probe_version(self) -> Tuple[int, int]:
+        """Empreinte bon marché de la table : (nombre de lignes, id max)."""
+        res = (
+            self._client().table("Parcours")
+            .select("id", count="exact")
+            .order("id", desc=True)
+            .limit(1)
+            .execute()
+        )
+        rows = getattr(res, "data", []) or []
+        max_id = int(rows[0]["id"]) if rows else 0
+        return (int(getattr(res, "count", 0) or 0), max_id)
+
+    def _load(self) -> None:
+        rows = (
+            self._client().table("Parcours")
+            .select("*")
+            .order("id")
+            .execute()
+            .data
+            or []
+        )
+
+        by_id: Dict[int, Dict] = {}
+        by_level: Dict[Tuple[str, int], Dict] = {}
+        ladder: Dict[str, List[Dict]] = {}
+        for r in rows:
+            if r.get("id") is None:
+                continue
+            by_id[int(r["id"])] = r
+            typ = r.get("Type_Operation")
+            if not typ:
+                continue
+            ladder.setdefault(typ, []).append(r)
+            if r.get("Niveau") is not None:
+                # premier arrivé (id le plus petit) gagne, comme `.eq(...).limit(1)`
+                by_level.setdefault((typ, int(r["Niveau"])), r)
+        for typ in ladder:
+            ladder[typ].sort(key=_level_sort_key)
+
+        # un échelon par Niveau distinct (la ligne de by_level), dans l'ordre des niveaux
+        steps: Dict[str, List[Dict]] = {}
+        for (typ, _niveau), r in sorted(by_level.items(), key=lambda kv: (kv[0][0], kv[0][1])):
+            steps.setdefault(typ, []).append(r)
+        step_rank = {(typ, int(r["Niveau"])): i for typ, rows_ in steps.items() for i, r in enumerate(rows_)}
+
+        max_id = max(by_id) if by_id else 0
+        self._by_id, self._by_level, self._ladder = by_id, by_level, ladder
+        self._steps, self._step_rank = steps, step_rank
+        self._version = (len(rows), max_id)
+        self._loaded_at = self._checked_at = time.monotonic()
+        logger.info(f"[ParcoursCatalog] {len(by_id)} parcours chargés (version={self._version})")
+
+    def ensure_fresh(self) -> None:
+        now = time.monotonic()
+        if self._loaded_at and now - self._checked_at < self.ttl:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded_at and now - self._checked_at < self.ttl:
+                return
+            if not self._loaded_at or now - self._loaded_at >= self.max_age:
+                self._load()
+                return
+            try:
+                version = self._probe_version()
+            except Exception as e:
+                # sonde en échec : on garde le snapshot courant, nouvel essai au prochain TTL
+                logger.warning(f"[ParcoursCatalog] sonde de version en échec: {e}")
+                self._checked_at = now
+                return
+            if version != self._version:
+                self._load()
+            else:
+                self._checked_at = now
+
+    def needs_refresh(self) -> bool:
+        """Vrai si le prochain accès déclenchera une sonde ou un rechargement (I/O)."""
+        return not self._loaded_at or time.monotonic() - self._checked_at >= self.ttl
+
+    def invalidate(self) -> None:
+        """Force un rechargement complet au prochain accès."""
+        with self._lock:
+            self._loaded_at = 0.0
+            self._checked_at = 0.0
+
+    # --------------------- lectures ---------------------
+    def get(self, parcours_id) -> Optional[Dict]:
+        if parcours_id is None:
+            return None
+        self.ensure_fresh()
+        try:
+            row = self._by_id.get(int(parcours_id))
+        except (TypeError, ValueError):
+            return None
+        return dict(row) if row else None
+
+    def type_of(self, parcours_id) -> Optional[str]:
+        row = self.get(parcours_id)
+        return row.get("Type_Operation") if row else None
+
+    def by_level(self, type_op: str, niveau: int) -> Optional[Dict]:
+        self.ensure_fresh()
+        row = self._by_level.get((type_op, int(niveau)))
+        return dict(row) if row else None
+
+    def levels(self, type_op: str) -> List[Dict]:
+        """Parcours du type, triés par Niveau (puis id)."""
+        self.ensure_fresh()
+        return [dict(r) for r in self._ladder.get(type_op, [])]
+
+    def neighbors(self, type_op: str, niveau: int) -> Tuple[Optional[Dict], Optional[Dict], Optional[Dict]]:
+        """
+        (niveau précédent, niveau courant, niveau suivant) du type, par Niveau :
+        équivalent des requêtes `.lt/.gt("Niveau").order("Niveau")` sans I/O.
+        Niveau absent du catalogue : courant None, voisins par recherche dichotomique.
+        """
+        self.ensure_fresh()
+        niveau = int(niveau)
+        steps = self._steps.get(type_op) or []
+        rank = self._step_rank.get((type_op, niveau))
+        if rank is None:
+            below = bisect_left([int(r["Niveau"]) for r in steps], niveau)
+            cur, prev_i, next_i = None, below - 1, below
+        else:
+            cur, prev_i, next_i = steps[rank], rank - 1, rank + 1
+        prev = steps[prev_i] if prev_i >= 0 else None
+        nxt = steps[next_i] if next_i < len(steps) else None
+        return (dict(prev) if prev else None, dict(cur) if cur else None, dict(nxt) if nxt else None)
+
+    def first(self, type_op: str) -> Optional[Dict]:
+        """Premier niveau du type (équivalent `.order("Niveau").limit(1)`)."""
+        self.ensure_fresh()
+        rows = self._ladder.get(type_op) or []
+        return dict(rows[0]) if rows else None
+
+    @property
+    def version(self) -> Optional[Tuple[int, int]]:
+        return self._version
+
+
+_catalog: Optional[ParcoursCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> ParcoursCatalog:
+    """Catalogue process-wide (créé au premier appel)."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = ParcoursCatalog()
+    return _catalog
@@ -0,0 +1,315 @@
+# app/services/position_store.py
+"""
+Position courante par (Users_Id, Type_Operation).
+
+Suivi_Parcours est append-only : retrouver le niveau actuel imposait de scanner
+les 50 à 300 derniers suivis et de les joindre à Parcours. La table
+Position_Courante garde la dernière ligne par opération ; elle est mise à jour
+dans le même chemin d'écriture que Suivi_Parcours (`append_suivi`), seulement
+vers un Suivi_Id plus récent, et une lecture suffit pour les trois opérations
+(`read_positions`).
+
+Si le store n'a aucune ligne pour l'utilisateur (pas encore backfillé), on
+retombe sur l'historique Suivi_Parcours et on répare le store au passage.
+Reconstruction complète : `python -m app.cli.backfill_positions`.
+
+Compteurs de fenêtre (migration 017) : la ligne garde aussi le nombre
+d'observations de l'opération et de réponses VRAI depuis le dernier suivi
+(Derniere_Observation_Id). Incrémentés à l'ingestion d'une session (chemin
+legacy : EvolutionService ; SQL : process_session), remis à zéro par chaque
+nouveau suivi : la décision d'évolution ne relit plus l'historique. Des
+compteurs absents ou d'un autre point de départ (`window_valid`) sont
+recomptés une fois depuis Observations.
+
+`aread_positions` / `acurrent_parcours` : mêmes lectures pour les routes async
+(client `AsyncScopedClient`).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from .parcours_catalog import get_catalog
+
+logger = logging.getLogger(__name__)
+
+POSITION_TABLE = "Position_Courante"
+OP_TYPES_DB = ("Addition", "Soustraction", "Multiplication")
+HISTORY_SCAN_LIMIT = 300
+
+WINDOW_COLUMNS = ("Total_Fenetre", "Corrects_Fenetre", "Fenetre_Depuis_Id", "Fenetre_Dernier_Id")
+_window_missing = False
+
+
+def window_enabled() -> bool:
+    """Colonnes de compteurs présentes dans Position_Courante (migration 017) ?"""
+    return not _window_missing
+
+
+def mark_window_missing(error: Exception) -> None:
+    global _window_missing
+    if not _window_missing:
+        logger.warning(f"[PositionStore] compteurs de fenêtre absents (migration 017), recomptage à chaque évaluation : {error}")
+    _window_missing = True
+
+
+def is_missing_column(error: Exception) -> bool:
+    return getattr(error, "code", None) == "PGRST204"
+
+
+def window_reset(last_obs_id: Optional[int]) -> Dict[str, Any]:
+    """
+    Compteurs d'une position qui vient d'être écrite par un suivi. Sans
+    Derniere_Observation_Id (initialisation), ils restent à recompter.
+    """
+    return {
+        "Total_Fenetre": 0,
+        "Corrects_Fenetre": 0,
+        "Fenetre_Depuis_Id": last_obs_id,
+        "Fenetre_Dernier_Id": last_obs_id,
+    }
+
+
+def window_valid(pos: Optional[Dict[str, Any]]) -> bool:
+    """Compteurs renseignés et partant bien du dernier suivi de la position."""
+    if not pos or any(pos.get(c) is None for c in WINDOW_COLUMNS):
+        return False
+    return int(pos["Fenetre_Depuis_Id"]) == int(pos.get("Derniere_Observation_Id") or 0)
+
+
+def window_add(pos: Dict[str, Any], rows: Iterable[Dict[str, Any]], operation: str) -> Dict[str, Any]:
+    """Compteurs après ingestion de `rows` (observations insérées) ; les ids déjà comptés sont ignorés."""
+    last = int(pos["Fenetre_Dernier_Id"])
+    new = [r for r in rows if r.get("Operation") == operation and r.get("id") is not None and int(r["id"]) > last]
+    return {
+        "Total_Fenetre": int(pos["Total_Fenetre"]) + len(new),
+        "Corrects_Fenetre": int(pos["Corrects_Fenetre"]) + sum(1 for r in new if r.get("Etat") == "VRAI"),
+        "Fenetre_Depuis_Id": int(pos["Fenetre_Depuis_Id"]),
+        "Fenetre_Dernier_Id": max([last] + [int(r["id"]) for r in new]),
+    }
+
+
+def window_stats(pos: Dict[str, Any]) -> Dict[str, Any]:
+    """Compteurs au format `window` des évolutions."""
+    return {
+        "total": int(pos["Total_Fenetre"]),
+        "corrects": int(pos["Corrects_Fenetre"]),
+        "last_id_included": int(pos["Fenetre_Dernier_Id"]),
+    }
+
+
+def position_from_suivi(suivi: Dict[str, Any], parcours: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Construit la ligne Position_Courante correspondant à une ligne Suivi_Parcours."""
+    if parcours is None:
+        parcours = get_catalog().get(suivi.get("Parcours_Id"))
+    if not parcours or not parcours.get("Type_Operation") or suivi.get("Users_Id") is None:
+        return None
+    return {
+        "Users_Id": int(suivi["Users_Id"]),
+        "Type_Operation": parcours["Type_Operation"],
+        "Parcours_Id": int(parcours["id"]),
+        "Niveau": parcours.get("Niveau"),
+        "Suivi_Id": suivi.get("id"),
+        "Derniere_Observation_Id": suivi.get("Derniere_Observation_Id"),
+        "Taux_Reussite": suivi.get("Taux_Reussite"),
+        "Type_Evolution": suivi.get("Type_Evolution"),
+        "Date": suivi.get("Date"),
+    }
+
+
+def position_after_suivi(suivi: Dict[str, Any], parcours: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Ligne Position_Courante écrite avec un nouveau suivi : compteurs de fenêtre remis à zéro."""
+    pos = position_from_suivi(suivi, parcours)
+    if pos and window_enabled():
+        pos.update(window_reset(pos["Derniere_Observation_Id"]))
+    return pos
+
+
+def upsert_positions(sb, rows: Iterable[Dict[str, Any]], only_missing: bool = False) -> None:
+    """Écrase les positions (backfill, rejeu) ; `only_missing` : crée seulement les lignes absentes."""
+    payload = [r for r in rows if r]
+    if payload:
+        sb.table(POSITION_TABLE).upsert(payload, on_conflict="Users_Id,Type_Operation",
+                                        ignore_duplicates=only_missing).execute()
+
+
+def advance_position(sb, pos: Optional[Dict[str, Any]]) -> None:
+    """
+    Écrit `pos` seulement si son Suivi_Id est plus récent que celui de la ligne
+    en place (ou si la ligne n'existe pas) : deux suivis écrits en concurrence
+    (évolution, /progression/analyser) ne ramènent jamais la position à un
+    suivi plus ancien. Un aller-retour dans le cas courant.
+    """
+    if not pos:
+        return
+    if pos.get("Suivi_Id") is None:
+        upsert_positions(sb, [pos])  # insertion sans représentation : pas d'ordre connu
+        return
+
+    def _update(q) -> bool:
+        res = q(sb.table(POSITION_TABLE).update(pos).eq("Users_Id", pos["Users_Id"])
+                .eq("Type_Operation", pos["Type_Operation"])).execute()
+        return bool(getattr(res, "data", None))
+
+    if _update(lambda q: q.lt("Suivi_Id", pos["Suivi_Id"])):
+        return
+    res = sb.table(POSITION_TABLE).upsert(pos, on_conflict="Users_Id,Type_Operation", ignore_duplicates=True).execute()
+    if getattr(res, "data", None):
+        return
+    # ligne créée entre-temps par un autre écrivain, ou sans Suivi_Id
+    _update(lambda q: q.lt("Suivi_Id", pos["Suivi_Id"])) or _update(lambda q: q.is_("Suivi_Id", "null"))
+
+
+def append_suivi(sb, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Point d'écriture unique de Suivi_Parcours : insère la ligne d'historique
+    puis avance Position_Courante (`advance_position`). Retourne la ligne insérée (ou None).
+    """
+    res = sb.table("Suivi_Parcours").insert(payload).execute()
+    data = getattr(res, "data", None) or []
+    row = data[0] if data else None
+    try:
+        try:
+            advance_position(sb, position_after_suivi(row or payload))
+        except Exception as e:
+            if not (window_enabled() and is_missing_column(e)):
+                raise
+            mark_window_missing(e)
+            advance_position(sb, position_from_suivi(row or payload))
+    except Exception as e:
+        # l'historique fait foi : le store sera réparé à la prochaine lecture
+        logger.warning(f"[PositionStore] upsert Position_Courante en échec: {e}")
+    return row
+
+
+def _history_query(sb, user_id: int):
+    return (
+        sb.table("Suivi_Parcours")
+        .select("id,Users_Id,Parcours_Id,Date,Taux_Reussite,Type_Evolution,Derniere_Observation_Id")
+        .eq("Users_Id", user_id)
+        .order("id", desc=True)
+        .limit(HISTORY_SCAN_LIMIT)
+    )
+
+
+def _latest_by_type(suivis: Iterable[Dict[str, Any]], wanted: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Première ligne (la plus récente) par type parmi des suivis triés id desc."""
+    wanted = set(wanted)
+    catalog = get_catalog()
+    out: Dict[str, Dict[str, Any]] = {}
+    for s in suivis:
+        pos = position_from_suivi(s, catalog.get(s.get("Parcours_Id")))
+        if not pos or pos["Type_Operation"] not in wanted or pos["Type_Operation"] in out:
+            continue
+        out[pos["Type_Operation"]] = pos
+        if len(out) == len(wanted):
+            break
+    return out
+
+
+def _index_store_rows(rows: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    return {r["Type_Operation"]: r for r in rows if r.get("Type_Operation") in OP_TYPES_DB}
+
+
+def _positions_from_history(sb, user_id: int, wanted: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Fallback : dernière ligne Suivi_Parcours par type, via l'historique + catalogue."""
+    return _latest_by_type(_history_query(sb, user_id).execute().data or [], wanted)
+
+
+def read_positions(sb, user_id: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Positions courantes de l'utilisateur, indexées par Type_Operation (valeur DB).
+    Une seule lecture quand le store est à jour ; les opérations sans suivi sont absentes.
+    """
+    out: Dict[str, Dict[str, Any]] = {}
+    try:
+        rows = sb.table(POSITION_TABLE).select("*").eq("Users_Id", user_id).execute().data or []
+        out = _index_store_rows(rows)
+    except Exception as e:
+        logger.warning(f"[PositionStore] lecture Position_Courante en échec: {e}")
+
+    if not out:
+        # aucune ligne : utilisateur pas encore backfillé (ou store indisponible)
+        repaired = _positions_from_history(sb, user_id, OP_TYPES_DB)
+        if repaired:
+            out.update(repaired)
+            try:
+                upsert_positions(sb, repaired.values(), only_missing=True)
+            except Exception as e:
+                logger.warning(f"[PositionStore] réparation Position_Courante en échec: {e}")
+    return out
+
+
+def _parcours_for_positions(positions: Dict[str, Dict[str, Any]], types: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    catalog = get_catalog()
+    out: Dict[str, Optional[Dict[str, Any]]] = {}
+    for t in types:
+        pos = positions.get(t)
+        prow = catalog.get(pos.get("Parcours_Id")) if pos else None
+        out[t] = prow or catalog.first(t)
+    return out
+
+
+def current_parcours(sb, user_id: int, types: Iterable[str] = OP_TYPES_DB) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Parcours courant (ligne complète du catalogue) pour chaque type demandé,
+    sinon le premier niveau du type. Une seule lecture pour les trois opérations.
+    """
+    return _parcours_for_positions(read_positions(sb, user_id), types)
+
+
+# --------------------- variantes async ---------------------
+async def ensure_catalog_fresh() -> None:
+    """Rafraîchit le catalogue hors de la boucle d'événements si une sonde est due."""
+    catalog = get_catalog()
+    if catalog.needs_refresh():
+        await asyncio.to_thread(catalog.ensure_fresh)
+
+
+async def aupsert_positions(sb, rows: Iterable[Dict[str, Any]], only_missing: bool = False) -> None:
+    payload = [r for r in rows if r]
+    if payload:
+        await sb.table(POSITION_TABLE).upsert(payload, on_conflict="Users_Id,Type_Operation",
+                                              ignore_duplicates=only_missing).execute()
+
+
+async def aread_positions(sb, user_id: int) -> Dict[str, Dict[str, Any]]:
+    """Version async de `read_positions` (même fallback historique)."""
+    out: Dict[str, Dict[str, Any]] = {}
+    try:
+        res = await sb.table(POSITION_TABLE).select("*").eq("Users_Id", user_id).execute()
+        out = _index_store_rows(res.data or [])
+    except Exception as e:
+        logger.warning(f"[PositionStore] lecture Position_Courante en échec: {e}")
+
+    await ensure_catalog_fresh()
+    if not out:
+        res = await _history_query(sb, user_id).execute()
+        repaired = _latest_by_type(res.data or [], OP_TYPES_DB)
+        if repaired:
+            out.update(repaired)
+            try:
+                await aupsert_positions(sb, repaired.values(), only_missing=True)
+            except Exception as e:
+                logger.warning(f"[PositionStore] réparation Position_Courante en échec: {e}")
+    return out
+
+
+async def acurrent_parcours(sb, user_id: int, types: Iterable[str] = OP_TYPES_DB) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Version async de `current_parcours`."""
+    return _parcours_for_positions(await aread_positions(sb, user_id), types)
+
+
+def rebuild_from_history(suivis: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Rejoue des lignes Suivi_Parcours (ordre d'id croissant) et retourne la
+    dernière position par (Users_Id, Type_Operation). Utilisé par le backfill.
+    """
+    catalog = get_catalog()
+    latest: Dict[tuple, Dict[str, Any]] = {}
+    for s in suivis:
+        pos = position_from_suivi(s, catalog.get(s.get("Parcours_Id")))
+        if pos:
+            latest[(pos["Users_Id"], pos["Type_Operation"])] = pos
+    return list(latest.values())
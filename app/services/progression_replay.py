@@ -0,0 +1,158 @@
+# app/services/progression_replay.py
+"""
+Rejeu de la machine d'états des évolutions sur l'historique d'un utilisateur.
+
+Les observations arrivent par id croissant ; à la fin de chaque session
+(changement d'Entrainement_Id) et pour chaque opération jouée, même règle que
+la soumission (EvolutionService, process_session) :
+  - première session de l'opération : suivi 'initialisation' au premier niveau ;
+  - fenêtre = observations de l'opération depuis le dernier suivi ;
+  - dès `Critere` observations : décision (`evolution.decide`, seuils
+    paramétrables), nouveau suivi, fenêtre remise à zéro.
+
+Le résultat est la suite de Suivi_Parcours que la règle aurait produite, et les
+positions finales avec leurs compteurs de fenêtre (migration 017).
+Utilisé par app.cli.replay_progression.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .evolution import EVOL_PROGRESSION, EVOL_REGRESSION, PROGRESSION_THRESHOLD, REGRESSION_THRESHOLD, decide
+from .parcours_catalog import ParcoursCatalog
+from .position_store import OP_TYPES_DB, position_from_suivi
+
+
+class _Window:
+    """Position et fenêtre d'une opération pendant le rejeu."""
+    __slots__ = ("parcours", "checkpoint", "total", "corrects", "last_id", "last_suivi")
+
+    def __init__(self):
+        self.parcours: Optional[Dict] = None  # None : opération pas encore initialisée
+        self.checkpoint: Optional[int] = None  # Derniere_Observation_Id du dernier suivi
+        self.total = self.corrects = 0
+        self.last_id: Optional[int] = None
+        self.last_suivi: Optional[Dict] = None
+
+
+class UserReplay:
+    """`add` chaque observation de l'utilisateur (id croissant), puis `finish`."""
+
+    def __init__(self, user_id: int, catalog: ParcoursCatalog,
+                 progression: float = PROGRESSION_THRESHOLD, regression: float = REGRESSION_THRESHOLD):
+        self.user_id = user_id
+        self.catalog = catalog
+        self.progression = progression
+        self.regression = regression
+        self.windows: Dict[str, _Window] = {}
+        self.suivis: List[Dict[str, Any]] = []
+        self.observations = 0
+        self._session: Any = None
+        self._session_date: Optional[str] = None
+        self._session_ops: set = set()
+
+    def add(self, obs: Dict[str, Any], session_date: Optional[str] = None) -> None:
+        """`session_date` : Date de l'Entrainement, reprise dans les suivis de la session."""
+        eid = obs.get("Entrainement_Id")
+        if eid != self._session:
+            self.close_session()
+            self._session, self._session_date = eid, session_date
+        op = obs.get("Operation")
+        if op not in OP_TYPES_DB:
+            return
+        w = self.windows.setdefault(op, _Window())
+        w.total += 1
+        w.corrects += obs.get("Etat") == "VRAI"
+        w.last_id = int(obs["id"])
+        self._session_ops.add(op)
+        self.observations += 1
+
+    def close_session(self) -> None:
+        for op in OP_TYPES_DB:  # ordre de process_session
+            if op in self._session_ops:
+                self._evaluate(op)
+        self._session, self._session_ops = None, set()
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Clôt la dernière session. Retourne les suivis rejoués, dans l'ordre d'écriture."""
+        self.close_session()
+        return self.suivis
+
+    def _append(self, w: _Window, parcours: Dict, evolution: str, taux: float, last_obs: Optional[int]) -> None:
+        row = {
+            "Users_Id": self.user_id,
+            "Parcours_Id": int(parcours["id"]),
+            "Date": self._session_date,
+            "Type_Evolution": evolution,
+            "Taux_Reussite": taux,
+            "Derniere_Observation_Id": last_obs,
+        }
+        self.suivis.append(row)
+        w.parcours, w.last_suivi = parcours, row
+
+    def _evaluate(self, op: str) -> None:
+        w = self.windows[op]
+        if w.parcours is None:
+            first = self.catalog.first(op)
+            if first is None:
+                return
+            self._append(w, first, "initialisation", 0.0, None)
+        critere = int(w.parcours.get("Critere") or 0)
+        if critere <= 0 or w.total < critere:
+            return
+
+        pct = w.corrects / w.total
+        prev_p, cur_p, next_p = self.catalog.neighbors(op, int(w.parcours["Niveau"]))
+        decision = decide(pct, prev_p is not None, next_p is not None, self.progression, self.regression)
+        arrival = next_p if decision == EVOL_PROGRESSION else prev_p if decision == EVOL_REGRESSION else cur_p
+        self._append(w, arrival or w.parcours, decision, round(pct, 4), w.last_id)
+        w.checkpoint, w.total, w.corrects = w.last_id, 0, 0
+
+    def positions(self) -> List[Dict[str, Any]]:
+        """
+        Lignes Position_Courante des opérations rejouées (après écriture des suivis :
+        Suivi_Id repris de la ligne insérée), compteurs de fenêtre compris.
+        """
+        out = []
+        for w in self.windows.values():
+            if w.last_suivi is None:
+                continue
+            pos = position_from_suivi(w.last_suivi, w.parcours)
+            if pos:
+                depuis = int(w.checkpoint or 0)
+                pos.update({
+                    "Total_Fenetre": w.total,
+                    "Corrects_Fenetre": w.corrects,
+                    "Fenetre_Depuis_Id": depuis,
+                    "Fenetre_Dernier_Id": w.last_id if w.last_id is not None else depuis,
+                })
+                out.append(pos)
+        return out
+
+
+def _step(row: Dict[str, Any]) -> Tuple:
+    taux = row.get("Taux_Reussite")
+    return (
+        int(row["Parcours_Id"]),
+        row.get("Type_Evolution"),
+        row.get("Derniere_Observation_Id"),
+        round(float(taux or 0.0), 4),
+    )
+
+
+def diff_history(before: Iterable[Dict[str, Any]], after: Iterable[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Compare deux suites de suivis d'une opération (ordre d'écriture).
+    None si identiques (niveau, évolution, dernière observation, taux), sinon un résumé.
+    """
+    b, a = [_step(r) for r in before], [_step(r) for r in after]
+    if a == b:
+        return None
+    first = next((i for i, (x, y) in enumerate(zip(b, a)) if x != y), min(len(a), len(b)))
+    return {
+        "first_divergence": first,
+        "before": len(b),
+        "after": len(a),
+        "parcours_before": b[-1][0] if b else None,
+        "parcours_after": a[-1][0] if a else None,
+    }
@@ -0,0 +1,282 @@
+# app/services/repositories.py
+"""
+Couche d'accès données async des endpoints chauds (entraînement, classement).
+
+Les routes `async def` ne doivent pas appeler le client supabase-py sync : chaque
+appel bloquerait la boucle d'événements. Ces repositories passent par
+`AsyncScopedClient` (deps.async_user_scoped_client / async_service_client) et
+regroupent les lectures indépendantes avec `asyncio.gather`.
+
+Le calcul (scoring, classement) reste dans les routers ; ici, uniquement l'I/O.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .position_store import acurrent_parcours
+from .scoring import RULES_SESSION
+from .scoring_stats import STATS_COLUMNS, STATS_TABLE, Key, RollingWindow
+from .submission import INCREMENT_RPC, SUBMIT_ASYNC_RPC, SUBMIT_RPC
+from .user_resolver import aresolve_or_register_user_id
+
+SCORING_ENTRAINEMENTS_LIMIT = 200
+SCORING_OBSERVATIONS_LIMIT = 2000
+SCORING_COLUMNS = (
+    "id, Entrainement_Id, Parcours_Id, Operation, Operateur_Un, Operateur_Deux, "
+    "Proposition, Correction, Temps_Seconds, Etat, Score, Solution, Marge_Erreur"
+)
+
+
+def _rows(res) -> List[Dict[str, Any]]:
+    return getattr(res, "data", []) or []
+
+
+def _one(res) -> Optional[Dict[str, Any]]:
+    return getattr(res, "data", None) or None
+
+
+class TrainingRepository:
+    """
+    `sb` : client async scopé utilisateur (RLS) ;
+    `service` : client async service role (users_map, upsert des scores, increment_classement).
+    """
+
+    def __init__(self, sb, service):
+        self.sb = sb
+        self.service = service
+
+    # --------------------- utilisateurs & positions ---------------------
+    async def resolve_user_id(self, auth_uid: str, email: Optional[str] = None) -> int:
+        return await aresolve_or_register_user_id(self.service, auth_uid, email=email)
+
+    async def positions(self, user_id: int) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Parcours courant des trois opérations (une lecture Position_Courante)."""
+        return await acurrent_parcours(self.sb, user_id)
+
+    # --------------------- entraînements ---------------------
+    async def insert_entrainement(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        data = _rows(await self.sb.table("Entrainement").insert(payload).execute())
+        return data[0] if data else None
+
+    async def entrainement(self, entrainement_id: int, columns: str = "id, Users_Id, Volume") -> Optional[Dict[str, Any]]:
+        res = await (
+            self.sb.table("Entrainement")
+            .select(columns)
+            .eq("id", entrainement_id)
+            .limit(1)
+            .execute()
+        )
+        data = _rows(res)
+        return data[0] if data else None
+
+    # --------------------- observations ---------------------
+    async def submission_context(self, entrainement_id: int) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """(déjà soumis ?, ligne Entrainement) — les deux lectures en parallèle."""
+        existing, entr = await asyncio.gather(
+            self.sb.table("Observations").select("id").eq("Entrainement_Id", entrainement_id).limit(1).execute(),
+            self.entrainement(entrainement_id),
+        )
+        return bool(_rows(existing)), entr
+
+    async def insert_observations(self, rows: List[Dict[str, Any]], chunk_size: int) -> List[List[Dict[str, Any]]]:
+        """Insère par paquets, envoyés en parallèle. Retourne les lignes insérées par paquet (ordre conservé)."""
+        chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+        results = await asyncio.gather(*(self.sb.table("Observations").insert(c).execute() for c in chunks))
+        return [_rows(r) for r in results]
+
+    async def scoring_history(self, user_id: int) -> List[Dict[str, Any]]:
+        """Observations des derniers entraînements du user (historique + session courante), id desc."""
+        entr = await (
+            self.sb.table("Entrainement")
+            .select("id")
+            .eq("Users_Id", user_id)
+            .order("id", desc=True)
+            .limit(SCORING_ENTRAINEMENTS_LIMIT)
+            .execute()
+        )
+        entr_ids = [r["id"] for r in _rows(entr)]
+        if not entr_ids:
+            return []
+        res = await (
+            self.sb.table("Observations")
+            .select(SCORING_COLUMNS)
+            .in_("Entrainement_Id", entr_ids)
+            .order("id", desc=True)
+            .limit(SCORING_OBSERVATIONS_LIMIT)
+            .execute()
+        )
+        return _rows(res)
+
+    async def scoring_windows(self, user_id: int, keys: Iterable[Key]) -> Dict[Key, RollingWindow]:
+        """Fenêtres Stats_Scoring des clés (Parcours_Id, Operation) demandées — une lecture."""
+        keys = set(keys)
+        if not keys:
+            return {}
+        res = await (
+            self.service.table(STATS_TABLE)
+            .select(STATS_COLUMNS)
+            .eq("Users_Id", user_id)
+            .in_("Parcours_Id", sorted({k[0] for k in keys}))
+            .execute()
+        )
+        windows = (RollingWindow.from_row(r) for r in _rows(res))
+        return {w.key: w for w in windows if w.key in keys}
+
+    async def write_scoring_windows(self, windows: Iterable[RollingWindow]) -> None:
+        payload = [w.to_row() for w in windows]
+        if payload:
+            await self.service.table(STATS_TABLE).upsert(payload, on_conflict="Users_Id,Parcours_Id,Operation").execute()
+
+    async def submit_observations(self, entrainement_id: int, rows: List[Dict[str, Any]], rules: str = RULES_SESSION,
+                                  idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        """Fonction SQL submit_observations : insertion, scoring, classement, évolutions en un aller-retour."""
+        params: Dict[str, Any] = {"p_entrainement_id": entrainement_id, "p_rows": rows}
+        if rules != RULES_SESSION:
+            # p_rules (migration 013) : absent des déploiements antérieurs → PGRST202 → legacy
+            params["p_rules"] = rules
+        if idempotency_key is not None:
+            params["p_idempotency_key"] = idempotency_key  # migration 015
+        res = await self.sb.rpc(SUBMIT_RPC, params).execute()
+        return getattr(res, "data", None) or {}
+
+    async def submit_observations_async(self, entrainement_id: int, rows: List[Dict[str, Any]], rules: str = RULES_SESSION,
+                                        idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        """submit_observations_async (migration 014) : insertion + job Outbox, traitement différé."""
+        params: Dict[str, Any] = {"p_entrainement_id": entrainement_id, "p_rows": rows, "p_rules": rules}
+        if idempotency_key is not None:
+            params["p_idempotency_key"] = idempotency_key  # migration 015
+        res = await self.sb.rpc(SUBMIT_ASYNC_RPC, params).execute()
+        return getattr(res, "data", None) or {}
+
+    async def outbox_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Job Outbox de l'appelant (RLS : ses propres jobs uniquement)."""
+        res = await (
+            self.sb.table("Outbox")
+            .select("id, event, Entrainement_Id, status, attempts, last_error, result, created_at, updated_at")
+            .eq("id", job_id)
+            .limit(1)
+            .execute()
+        )
+        data = _rows(res)
+        return data[0] if data else None
+
+    async def upsert_scores(self, payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return _rows(await self.service.table("Observations").upsert(payloads, on_conflict="id").execute())
+
+    # --------------------- classement ---------------------
+    async def increment_classement(self, user_id: int, delta_classement: int, delta_base: int) -> Dict[str, Any]:
+        """Deltas de la session → Classement + users_map en une instruction SQL (migration 016, service role)."""
+        res = await self.service.rpc(INCREMENT_RPC, {
+            "p_user_id": user_id,
+            "p_delta_classement": delta_classement,
+            "p_delta_base": delta_base,
+        }).execute()
+        return getattr(res, "data", None) or {}
+
+    async def classement_inputs(self, entrainement_id: int, user_id: int):
+        """(scores de la session, ligne Classement, ligne users_map) — lectures en parallèle."""
+        obs, cl, um = await asyncio.gather(
+            self.sb.table("Observations").select("score_global, Score").eq("Entrainement_Id", entrainement_id).execute(),
+            self.sb.table("Classement").select("score_global, score_week, week_start").eq("Users_Id", user_id).maybe_single().execute(),
+            self.sb.table("users_map").select("score_base").eq("user_id", user_id).maybe_single().execute(),
+        )
+        return _rows(obs), _one(cl) or {}, _one(um) or {}
+
+    async def write_classement(self, user_id: int, classement: Dict[str, Any], users_map: Dict[str, Any]) -> None:
+        await asyncio.gather(
+            self.sb.table("Classement").upsert(classement, on_conflict="Users_Id").execute(),
+            self.sb.table("users_map").update(users_map).eq("user_id", user_id).execute(),
+        )
+
+
+class ClassementRepository:
+    """Lectures du leaderboard (client async service role), ordre (metric desc, Users_Id asc)."""
+
+    COLUMNS = "Users_Id,score_global,score_week"
+
+    def __init__(self, sb):
+        self.sb = sb
+
+    async def top(self, metric: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        res = await (
+            self.sb.table("Classement")
+            .select(self.COLUMNS)
+            .order(metric, desc=True)
+            .order("Users_Id")
+            .range(offset, offset + limit - 1)
+            .execute()
+        )
+        return _rows(res)
+
+    async def scores(self, user_id: int) -> Optional[Dict[str, Any]]:
+        res = await self.sb.table("Classement").select("score_global,score_week").eq("Users_Id", user_id).maybe_single().execute()
+        return _one(res)
+
+    async def count_above(self, metric: str, score: int) -> int:
+        # postgrest-py 0.16 n'a pas `head=` : count exact + limit(1), le total vient de Content-Range
+        cnt = await (
+            self.sb.table("Classement")
+            .select("Users_Id", count="exact")
+            .gt(metric, score)
+            .limit(1)
+            .execute()
+        )
+        return int(getattr(cnt, "count", 0) or 0)
+
+    async def _count_tied(self, metric: str, score: int, user_id: int, inclusive: bool) -> int:
+        """Ex aequo de `score` classés avant `user_id` (lui compris si `inclusive`)."""
+        q = self.sb.table("Classement").select("Users_Id", count="exact").eq(metric, score)
+        q = q.lte("Users_Id", user_id) if inclusive else q.lt("Users_Id", user_id)
+        cnt = await q.limit(1).execute()
+        return int(getattr(cnt, "count", 0) or 0)
+
+    async def position(self, metric: str, score: int, user_id: int, inclusive: bool = False) -> int:
+        """Nombre de lignes classées avant (score, user_id) — ou jusqu'à elle si `inclusive`."""
+        above, tied = await asyncio.gather(
+            self.count_above(metric, score),
+            self._count_tied(metric, score, user_id, inclusive),
+        )
+        return above + tied
+
+    async def around(self, metric: str, user_id: int, radius: int,
+                     after: Optional[int] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """`radius` lignes avant l'utilisateur, lui, puis `after` (défaut `radius`) lignes après."""
+        data = await self.scores(user_id)
+        if not data:
+            return 0, []
+        pos = await self.position(metric, int(data.get(metric) or 0), user_id)
+        start = max(0, pos - radius)
+        end = pos + (radius if after is None else after) + 1
+        return start, await self.top(metric, start, end - start)
+
+    async def after(self, metric: str, score: int, user_id: int, limit: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """`limit` lignes qui suivent (score, user_id) : ex aequo d'id supérieur, puis scores inférieurs."""
+        tied, pos = await asyncio.gather(
+            self.sb.table("Classement").select(self.COLUMNS)
+            .eq(metric, score).gt("Users_Id", user_id).order("Users_Id").limit(limit).execute(),
+            self.position(metric, score, user_id, inclusive=True),
+        )
+        rows = _rows(tied)
+        if len(rows) < limit:
+            rows += _rows(await (
+                self.sb.table("Classement").select(self.COLUMNS)
+                .lt(metric, score).order(metric, desc=True).order("Users_Id").limit(limit - len(rows)).execute()
+            ))
+        return pos, rows
+
+    async def before(self, metric: str, score: int, user_id: int, limit: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """`limit` lignes qui précèdent (score, user_id) : ex aequo d'id inférieur, puis scores supérieurs."""
+        tied, pos = await asyncio.gather(
+            self.sb.table("Classement").select(self.COLUMNS)
+            .eq(metric, score).lt("Users_Id", user_id).order("Users_Id", desc=True).limit(limit).execute(),
+            self.position(metric, score, user_id),
+        )
+        rows = _rows(tied)
+        if len(rows) < limit:
+            rows += _rows(await (
+                self.sb.table("Classement").select(self.COLUMNS)
+                .gt(metric, score).order(metric).order("Users_Id", desc=True).limit(limit - len(rows)).execute()
+            ))
+        rows.reverse()
+        return pos - len(rows), rows
@@ -0,0 +1,128 @@
+# app/services/score_series.py
+"""
+Série du score cumulé par utilisateur (Score_Cumule, migration 021).
+
+Une ligne par utilisateur : nombre d'observations `n`, score total `total`,
+dernière observation comptée, et `checkpoints`, le score cumulé depuis la
+première observation toutes les CHECKPOINT (50) observations — tableau en ajout
+seul, étendu à l'insertion des observations par un trigger SQL (`extend` en est
+l'équivalent Python : émulation hors ligne, générateur, recalcul sans la table).
+
+Toute fenêtre multiple de CHECKPOINT se lit dans les mêmes sommes préfixes :
+score de la fenêtre ]a, b] = cumul(b) − cumul(a). /progression/score_cumule_50
+n'a ainsi besoin que d'une ligne, quelle que soit la longueur de l'historique.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from .keyset import iter_in_merged, iter_rows
+from .session_stats import is_missing_table
+
+logger = logging.getLogger(__name__)
+
+SCORE_SERIES_TABLE = "Score_Cumule"
+SCORE_SERIES_COLUMNS = "Users_Id,n,total,checkpoints,last_observation_id"
+CHECKPOINT = 50
+
+_series_missing = False
+
+
+def series_enabled() -> bool:
+    return not _series_missing
+
+
+def mark_series_missing(error: Exception) -> None:
+    """Table absente (migration 021) : la série est recalculée depuis les observations."""
+    global _series_missing
+    if not _series_missing:
+        logger.warning(f"[ScoreSeries] {SCORE_SERIES_TABLE} indisponible, recalcul depuis les observations : {error}")
+    _series_missing = True
+
+
+def score_value(v: Any) -> int:
+    """Score d'une observation (NULL ou illisible : 0), tronqué comme int(float(...))."""
+    try:
+        return int(float(str(v))) if v is not None and str(v).strip() != "" else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+def empty_series(user_id: Any = None) -> Dict[str, Any]:
+    return {"Users_Id": user_id, "n": 0, "total": 0, "checkpoints": [], "last_observation_id": None}
+
+
+# ─────────────────────────────────────────────
+# Calcul (équivalent de score_cumule_ingest)
+# ─────────────────────────────────────────────
+def extend(series: Optional[Dict[str, Any]], observations: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Série prolongée des `observations` (dans l'ordre des ids) ; `series` n'est pas modifiée."""
+    out = dict(series) if series else empty_series()
+    n, total = int(out.get("n") or 0), int(out.get("total") or 0)
+    checkpoints = list(out.get("checkpoints") or [])
+    last = out.get("last_observation_id")
+    for o in sorted(observations, key=lambda r: r["id"]):
+        n += 1
+        total += score_value(o.get("Score"))
+        if n % CHECKPOINT == 0:
+            checkpoints.append(total)
+        last = o["id"] if last is None else max(last, o["id"])
+    out.update(n=n, total=total, checkpoints=checkpoints, last_observation_id=last)
+    return out
+
+
+def window_points(series: Dict[str, Any], step: int, windows: int) -> List[Dict[str, Any]]:
+    """
+    `windows` dernières fenêtres de `step` observations (multiple de CHECKPOINT),
+    alignées sur la première observation ; la dernière peut être incomplète. `y` :
+    score cumulé depuis le début de la première fenêtre affichée.
+    """
+    if step % CHECKPOINT:
+        raise ValueError(f"step doit être un multiple de {CHECKPOINT}")
+    n, total = int(series.get("n") or 0), int(series.get("total") or 0)
+    checkpoints = series.get("checkpoints") or []
+
+    def cumul(k: int) -> int:  # score cumulé après k observations (k multiple de CHECKPOINT ou n)
+        if k == 0:
+            return 0
+        if k == n:
+            return total
+        return int(checkpoints[k // CHECKPOINT - 1])
+
+    ends = list(range(step, n + 1, step))
+    if n % step:
+        ends.append(n)
+    ends = ends[-windows:]
+    if not ends:
+        return []
+    base = cumul((ends[0] - 1) // step * step)
+    return [{"x": i, "label": f"{i * step}", "y": cumul(end) - base} for i, end in enumerate(ends, start=1)]
+
+
+# ─────────────────────────────────────────────
+# Lectures
+# ─────────────────────────────────────────────
+def read_series(sb, user_id: int) -> Dict[str, Any]:
+    """Ligne Score_Cumule de l'utilisateur (série vide s'il n'a aucune observation)."""
+    res = sb.table(SCORE_SERIES_TABLE).select(SCORE_SERIES_COLUMNS).eq("Users_Id", user_id).limit(1).execute()
+    rows = getattr(res, "data", []) or []
+    return rows[0] if rows else empty_series(user_id)
+
+
+def series_from_observations(sb, user_id: int) -> Dict[str, Any]:
+    """Même série recalculée depuis toutes les observations de l'utilisateur (sans la table)."""
+    eids = [int(r["id"]) for r in iter_rows(lambda: sb.table("Entrainement").select("id").eq("Users_Id", user_id))]
+    rows = iter_in_merged(lambda: sb.table("Observations").select("id,Score"), "Entrainement_Id", eids)
+    return extend(empty_series(user_id), rows)
+
+
+def user_series(sb, user_id: int) -> Dict[str, Any]:
+    if series_enabled():
+        try:
+            return read_series(sb, user_id)
+        except Exception as e:
+            if not is_missing_table(e):
+                raise
+            mark_series_missing(e)
+    return series_from_observations(sb, user_id)
@@ -1,5 +1,6 @@
 import numpy as np
 from datetime import date
+from typing import Dict, Optional, Sequence
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,6 +11,8 @@ logger = logging.getLogger(__name__)
 import os
 USE_NEW_SCORING = os.getenv("USE_NEW_SCORING", "False") == "True"
 
+from .scoring_stats import KeyStats, read_window, stats_from_observations
+
 
 # ─────────────────────────────────────────────
 # RÉCUPÉRATION HISTORIQUE
@@ -37,92 +40,146 @@ def get_user_stats_for_operation(sb, user_id: int, operation_type: str, niveau:
         return []
 
 
-# ─────────────────────────────────────────────
-# CALCUL VITESSE
-# ─────────────────────────────────────────────
-def calculate_vitesse_score(
-    etat: str,
-    temps_seconds: float,
-    mean_temps: float,
-    std_temps: float
-) -> float:
+def get_user_rolling_stats(sb, user_id: int, operation_type: str, parcours_id: int) -> KeyStats:
     """
-    Calcule le score en tenant compte de la vitesse.
-
-    Seuil de similarité : ±1 écart-type autour de la moyenne
-
-    Scénarios :
-    - VRAI & Similaire (dans ±1σ)   → +1
-    - VRAI & Plus rapide (>1σ)      → +3
-    - VRAI & Plus lent (>1σ)        → +0.8
-    - FAUX & Similaire (dans ±1σ)   → -1
-    - FAUX & Plus rapide (>1σ)      → -2
-    - FAUX & Plus lent (>1σ)        → -2
+    Moyenne et écart-type de vitesse et marge d'erreur sur les 50 dernières
+    observations du même Parcours_Id/type : une ligne Stats_Scoring au lieu de
+    50 observations (fenêtre glissante mise à jour à l'ingestion).
     """
-    if std_temps == 0 or mean_temps == 0:
-        return 1.0 if etat == "VRAI" else -1.0
-
-    zone_min = mean_temps - std_temps
-    zone_max = mean_temps + std_temps
-
-    if etat == "VRAI":
-        if temps_seconds < zone_min:
-            score = 3.0    # Plus rapide → récompense
-        elif temps_seconds > zone_max:
-            score = 0.8    # Plus lent → légère pénalité
-        else:
-            score = 1.0    # Similaire → score de base
-    else:  # FAUX
-        if zone_min <= temps_seconds <= zone_max:
-            score = -1.0   # Similaire → score de base
-        else:
-            score = -2.0   # Plus rapide ou plus lent → pénalité
-
-    logger.info(f"[SCORING] Vitesse: etat={etat}, temps={temps_seconds:.2f}s, mean={mean_temps:.2f}s, std={std_temps:.2f}s, zone=[{zone_min:.2f}, {zone_max:.2f}], score={score}")
-    return score
+    try:
+        window = read_window(sb, user_id, parcours_id, operation_type)
+    except Exception as e:
+        logger.error(f"[SCORING] Error fetching rolling stats: {e}")
+        window = None
+    if window is None:
+        return KeyStats(0, None, 0.0, None, 0.0)
+    return window.stats()
 
 
 # ─────────────────────────────────────────────
-# CALCUL MARGE D'ERREUR
+# RÈGLES DE SCORING
 # ─────────────────────────────────────────────
-def calculate_marge_score(
-    etat: str,
-    marge_erreur: float,
-    mean_marge: float,
-    std_marge: float
-) -> float:
-    """
-    Calcule le bonus/malus de précision.
-    S'applique UNIQUEMENT sur les FAUX.
-
-    Scénarios :
-    - VRAI                                    → 0 (pas de bonus marge)
-    - FAUX & Marge similaire (±1σ)            → -1
-    - FAUX & Drastiquement plus précis (>1σ)  → 0
-    - FAUX & Drastiquement moins précis (>1σ) → -2
-    """
-    if etat == "VRAI":
-        return 0.0
+# Seuil de similarité : ±1 écart-type autour de la moyenne de l'historique
+# (50 dernières observations du même Parcours_Id + Operation, au moins HIST_MIN).
+#
+# RULES_SESSION — bonus ajoutés au Score de base (trigger calculate_new_scoring,
+# submit_observations, chemin legacy) ; score_global = floor(base + bonus) :
+#   vitesse  VRAI : plus rapide +2, similaire 0, plus lent -1 (σ ou moyenne nulle : 0)
+#            FAUX : similaire -2, plus rapide ou plus lent -3 (σ ou moyenne nulle : -2)
+#
+# RULES_NEW (USE_NEW_SCORING=True) — score vitesse absolu, base ±1 ;
+# bonus_vitesse = score - base ; score_global = arrondi(score vitesse + marge) :
+#   vitesse  VRAI : plus rapide +3, similaire +1, plus lent +0.8 (σ ou moyenne nulle : +1)
+#            FAUX : similaire -1, plus rapide ou plus lent -2 (σ ou moyenne nulle : -1)
+#
+# Marge d'erreur (les deux règles, FAUX uniquement ; stats sur les FAUX) :
+#   plus précis que d'habitude 0, similaire -1, moins précis -2 (σ ou moyenne nulle : -1)
+RULES_SESSION = "session"
+RULES_NEW = "new"
+HIST_MIN = 5
+
+#                 VRAI : nul, rapide, lent, similaire     FAUX : nul/similaire, hors zone
+_VITESSE = {
+    RULES_SESSION: ((0.0, 2.0, -1.0, 0.0), (-2.0, -3.0)),
+    RULES_NEW:     ((1.0, 3.0, 0.8, 1.0), (-1.0, -2.0)),
+}
+
+
+def active_rules() -> str:
+    """Règle en vigueur : USE_NEW_SCORING, relu à chaque appel (bascule à chaud en réassignant le flag)."""
+    return RULES_NEW if USE_NEW_SCORING else RULES_SESSION
+
+
+def stats_columns(stats: Sequence[KeyStats]) -> Dict[str, np.ndarray]:
+    """Colonnes n_hist / mean_* / std_* de score_batch (moyenne absente → NaN)."""
+    return {
+        "n_hist": np.fromiter((s.n for s in stats), dtype=np.int64, count=len(stats)),
+        "mean_t": np.array([s.mean_t for s in stats], dtype=float),
+        "std_t": np.fromiter((s.std_t for s in stats), dtype=float, count=len(stats)),
+        "mean_m": np.array([s.mean_m for s in stats], dtype=float),
+        "std_m": np.fromiter((s.std_m for s in stats), dtype=float, count=len(stats)),
+    }
+
 
-    if std_marge == 0 or mean_marge == 0:
-        return -1.0
+def score_batch(
+    etat,
+    temps,
+    marge,
+    n_hist,
+    mean_t,
+    std_t,
+    mean_m,
+    std_m,
+    score=None,
+    rules: Optional[str] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Score un lot d'observations en une passe vectorisée.
 
-    zone_min = mean_marge - std_marge
-    zone_max = mean_marge + std_marge
+    Entrées alignées (une valeur par observation) : etat ("VRAI" / "FAUX", ou
+    booléens VRAI), temps, marge, `score` (Score stocké, 0 = absent ; règle
+    session uniquement) et statistiques d'historique de la clé de chaque
+    observation (stats_columns ; moyenne NaN = série vide, remplacée par la
+    valeur courante).
 
-    if marge_erreur < zone_min:
-        score = 0.0    # Plus précis que d'habitude → récompense
-    elif marge_erreur > zone_max:
-        score = -2.0   # Moins précis → pénalité
+    Retourne les colonnes Score, bonus_vitesse, bonus_marge, score_global.
+    """
+    rules = rules or active_rules()
+    if rules not in _VITESSE:
+        raise ValueError(f"[SCORING] règle inconnue : {rules}")
+
+    etat = np.asarray(etat)
+    vrai = etat if etat.dtype == bool else etat == "VRAI"
+    temps = np.asarray(temps, dtype=float)
+    marge = np.asarray(marge, dtype=float)
+    mean_t = np.asarray(mean_t, dtype=float)
+    mean_m = np.asarray(mean_m, dtype=float)
+    mean_t = np.where(np.isnan(mean_t), temps, mean_t)
+    mean_m = np.where(np.isnan(mean_m), marge, mean_m)
+    std_t = np.nan_to_num(np.asarray(std_t, dtype=float))
+    std_m = np.nan_to_num(np.asarray(std_m, dtype=float))
+    enough = np.asarray(n_hist) >= HIST_MIN
+
+    # vitesse : position du temps par rapport à la zone [μ - σ, μ + σ]
+    flat_t = (std_t == 0) | (mean_t == 0)
+    faster = temps < mean_t - std_t
+    slower = temps > mean_t + std_t
+    (v_flat, v_fast, v_slow, v_same), (f_same, f_out) = _VITESSE[rules]
+    vitesse = np.select(
+        [vrai & flat_t, vrai & faster, vrai & slower, vrai, flat_t | ~(faster | slower)],
+        [v_flat, v_fast, v_slow, v_same, f_same],
+        f_out,
+    )
+
+    # marge : FAUX uniquement
+    flat_m = (std_m == 0) | (mean_m == 0)
+    marge_score = np.select(
+        [vrai, flat_m, marge < mean_m - std_m, marge > mean_m + std_m],
+        [0.0, -1.0, 0.0, -2.0],
+        -1.0,
+    )
+
+    unit = np.where(vrai, 1, -1)
+    if rules == RULES_SESSION:
+        base = unit if score is None else np.trunc(np.asarray(score, dtype=float)).astype(np.int64)
+        base = np.where(base != 0, base, unit)
+        bonus_vitesse = vitesse
+        total = np.floor(base + vitesse + marge_score)
     else:
-        score = -1.0   # Similaire → score de base
+        base = unit
+        bonus_vitesse = np.round(vitesse - base, 2)
+        total = np.rint(vitesse + marge_score)
 
-    logger.info(f"[SCORING] Marge: etat={etat}, marge={marge_erreur:.2f}%, mean={mean_marge:.2f}%, std={std_marge:.2f}%, zone=[{zone_min:.2f}, {zone_max:.2f}], score={score}")
-    return score
+    return {
+        "Score": base,
+        "bonus_vitesse": np.where(enough, bonus_vitesse, 0.0),
+        "bonus_marge": np.where(enough, marge_score, 0.0),
+        "score_global": np.where(enough, total, base).astype(np.int64),
+    }
 
 
 # ─────────────────────────────────────────────
-# CALCUL SCORE FINAL
+# CALCUL SCORE FINAL (une observation)
 # ─────────────────────────────────────────────
 def calculate_final_score(
     etat: str,
@@ -131,7 +188,7 @@ def calculate_final_score(
     historical_data: list
 ) -> dict:
     """
-    Calcule le score final avec tous les facteurs.
+    Calcule le score final avec tous les facteurs (règle RULES_NEW).
 
     Retourne :
     {
@@ -141,48 +198,29 @@ def calculate_final_score(
         "score_global": int
     }
     """
-    score_base = 1 if etat == "VRAI" else -1
-
-    # Pas assez d'historique → score de base uniquement
-    if len(historical_data) < 5:
-        logger.info(f"[SCORING] Not enough historical data ({len(historical_data)} entries) → base score only")
-        return {
-            "Score": score_base,
-            "bonus_vitesse": 0.0,
-            "bonus_marge": 0.0,
-            "score_global": score_base
-        }
-
-    # Calculer stats vitesse (sur toutes les observations)
-    temps_list = [d["Temps_Seconds"] for d in historical_data if d.get("Temps_Seconds") is not None]
-    mean_temps = np.mean(temps_list) if temps_list else temps_seconds
-    std_temps = np.std(temps_list) if len(temps_list) > 1 else 0
-
-    # Calculer stats marge (sur les FAUX uniquement)
-    marge_list = [d["Marge_Erreur"] for d in historical_data
-                  if d.get("Marge_Erreur") is not None and d.get("Etat") == "FAUX"]
-    mean_marge = np.mean(marge_list) if marge_list else marge_erreur
-    std_marge = np.std(marge_list) if len(marge_list) > 1 else 0
-
-    # Calculer les scores
-    score_vitesse = calculate_vitesse_score(etat, temps_seconds, mean_temps, std_temps)
-    score_marge = calculate_marge_score(etat, marge_erreur, mean_marge, std_marge)
-
-    # bonus = écart au score de base
-    bonus_vitesse = round(score_vitesse - score_base, 2)
-    bonus_marge = round(score_marge, 2) if etat == "FAUX" else 0.0
-
-    # Score global arrondi à l'entier
-    score_global = round(score_vitesse + score_marge)
-
-    logger.info(f"[SCORING] Final: base={score_base}, bonus_vitesse={bonus_vitesse}, bonus_marge={bonus_marge}, global={score_global}")
+    return calculate_final_score_from_stats(etat, temps_seconds, marge_erreur, stats_from_observations(historical_data))
 
-    return {
-        "Score": score_base,
-        "bonus_vitesse": bonus_vitesse,
-        "bonus_marge": bonus_marge,
-        "score_global": score_global
+
+def calculate_final_score_from_stats(
+    etat: str,
+    temps_seconds: float,
+    marge_erreur: float,
+    stats: KeyStats,
+    rules: str = RULES_NEW
+) -> dict:
+    """
+    Même calcul que calculate_final_score, l'historique étant résumé par ses
+    statistiques (get_user_rolling_stats). Lot de taille 1 de score_batch.
+    """
+    out = score_batch([etat], [temps_seconds], [marge_erreur], **stats_columns([stats]), rules=rules)
+    result = {
+        "Score": int(out["Score"][0]),
+        "bonus_vitesse": float(out["bonus_vitesse"][0]),
+        "bonus_marge": float(out["bonus_marge"][0]),
+        "score_global": int(out["score_global"][0]),
     }
+    logger.info(f"[SCORING] Final: etat={etat}, temps={temps_seconds}, historique={stats.n} entries → {result}")
+    return result
 
 
 # ─────────────────────────────────────────────
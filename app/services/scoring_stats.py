@@ -0,0 +1,223 @@
+# app/services/scoring_stats.py
+"""
+Statistiques glissantes de scoring par (Users_Id, Parcours_Id, Operation).
+
+Le scoring d'une réponse ne dépend de l'historique qu'à travers cinq nombres :
+la taille de l'historique, moyenne et écart-type de Temps_Seconds, moyenne et
+écart-type de Marge_Erreur sur les FAUX, le tout sur les 50 dernières
+observations de la même clé. Relire 2000 observations à chaque soumission pour
+les recalculer est inutile : Stats_Scoring garde par clé une fenêtre circulaire
+de WINDOW valeurs et les sommes courantes (n, Σx, Σx²) des deux séries. Chaque
+observation ingérée remplace la plus ancienne de la fenêtre et met à jour les
+sommes ; lire une ligne suffit pour scorer.
+
+Écrivains : submit_observations (SQL, migration 012) et son émulation hors
+ligne, le chemin legacy (sessions._calculate_scoring). Une clé absente du
+store (pas encore reconstruite) est amorcée depuis l'historique au passage.
+Reconstruction complète : python -m app.cli.rebuild_scoring_stats
+"""
+from __future__ import annotations
+
+import logging
+import math
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATS_TABLE = "Stats_Scoring"
+WINDOW = 50  # observations retenues par clé
+STATS_COLUMNS = (
+    "Users_Id,Parcours_Id,Operation,temps,marge,head,n,"
+    "n_temps,sum_temps,sumsq_temps,n_marge,sum_marge,sumsq_marge,last_observation_id"
+)
+
+Key = Tuple[Any, Any]  # (Parcours_Id, Operation)
+
+
+class KeyStats(NamedTuple):
+    """Historique d'une clé vu par le scoring. mean_* = None : série vide."""
+    n: int
+    mean_t: Optional[float]
+    std_t: float
+    mean_m: Optional[float]
+    std_m: float
+
+
+EMPTY_STATS = KeyStats(0, None, 0.0, None, 0.0)
+
+
+def _num(v: Any) -> Optional[float]:
+    return None if v is None else float(v)
+
+
+def _moments(n: int, s: float, sq: float) -> Tuple[Optional[float], float]:
+    """(moyenne, écart-type population) depuis les sommes courantes."""
+    if n <= 0:
+        return None, 0.0
+    var = (n * sq - s * s) / (n * n)
+    return s / n, math.sqrt(var) if var > 0 else 0.0
+
+
+def key_of(obs: Dict[str, Any]) -> Key:
+    return obs.get("Parcours_Id"), obs.get("Operation")
+
+
+class RollingWindow:
+    """
+    Fenêtre circulaire d'une clé : `temps[i]` / `marge[i]` (None si absent, ou
+    réponse non FAUX pour la marge). Tant que la fenêtre n'est pas pleine on
+    ajoute en fin ; ensuite `head` désigne la plus ancienne valeur, remplacée
+    par la suivante. `last_observation_id` rend l'ingestion idempotente.
+    Même représentation que la ligne Stats_Scoring (et stats_scoring_push en SQL).
+    """
+
+    __slots__ = ("user_id", "parcours_id", "operation", "temps", "marge", "head", "n",
+                 "n_temps", "sum_temps", "sumsq_temps", "n_marge", "sum_marge", "sumsq_marge",
+                 "last_observation_id")
+
+    def __init__(self, user_id: int, parcours_id: Any, operation: Any):
+        self.user_id = user_id
+        self.parcours_id = parcours_id
+        self.operation = operation
+        self.temps: List[Optional[float]] = []
+        self.marge: List[Optional[float]] = []
+        self.head = 0
+        self.n = 0
+        self.n_temps, self.sum_temps, self.sumsq_temps = 0, 0.0, 0.0
+        self.n_marge, self.sum_marge, self.sumsq_marge = 0, 0.0, 0.0
+        self.last_observation_id = 0
+
+    @property
+    def key(self) -> Key:
+        return self.parcours_id, self.operation
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "RollingWindow":
+        w = cls(int(row["Users_Id"]), row.get("Parcours_Id"), row.get("Operation"))
+        w.temps = [_num(v) for v in row.get("temps") or []]
+        w.marge = [_num(v) for v in row.get("marge") or []]
+        w.head = int(row.get("head") or 0)
+        w.n = int(row.get("n") or len(w.temps))
+        w.n_temps = int(row.get("n_temps") or 0)
+        w.sum_temps = float(row.get("sum_temps") or 0)
+        w.sumsq_temps = float(row.get("sumsq_temps") or 0)
+        w.n_marge = int(row.get("n_marge") or 0)
+        w.sum_marge = float(row.get("sum_marge") or 0)
+        w.sumsq_marge = float(row.get("sumsq_marge") or 0)
+        w.last_observation_id = int(row.get("last_observation_id") or 0)
+        return w
+
+    def to_row(self) -> Dict[str, Any]:
+        return {
+            "Users_Id": self.user_id,
+            "Parcours_Id": self.parcours_id,
+            "Operation": self.operation,
+            "temps": list(self.temps),
+            "marge": list(self.marge),
+            "head": self.head,
+            "n": self.n,
+            "n_temps": self.n_temps,
+            "sum_temps": self.sum_temps,
+            "sumsq_temps": self.sumsq_temps,
+            "n_marge": self.n_marge,
+            "sum_marge": self.sum_marge,
+            "sumsq_marge": self.sumsq_marge,
+            "last_observation_id": self.last_observation_id,
+        }
+
+    def push(self, obs: Dict[str, Any]) -> bool:
+        """Ajoute une observation (ids croissants). False si déjà comptée."""
+        oid = int(obs.get("id") or 0)
+        if oid and oid <= self.last_observation_id:
+            return False
+        t = _num(obs.get("Temps_Seconds"))
+        m = _num(obs.get("Marge_Erreur")) if obs.get("Etat") == "FAUX" else None
+
+        if self.n < WINDOW:
+            self.temps.append(t)
+            self.marge.append(m)
+            self.n += 1
+        else:
+            slot = self.head
+            old_t, old_m = self.temps[slot], self.marge[slot]
+            if old_t is not None:
+                self.n_temps -= 1
+                self.sum_temps -= old_t
+                self.sumsq_temps -= old_t * old_t
+            if old_m is not None:
+                self.n_marge -= 1
+                self.sum_marge -= old_m
+                self.sumsq_marge -= old_m * old_m
+            self.temps[slot], self.marge[slot] = t, m
+            self.head = (slot + 1) % WINDOW
+
+        if t is not None:
+            self.n_temps += 1
+            self.sum_temps += t
+            self.sumsq_temps += t * t
+        if m is not None:
+            self.n_marge += 1
+            self.sum_marge += m
+            self.sumsq_marge += m * m
+        self.last_observation_id = max(self.last_observation_id, oid)
+        return True
+
+    def stats(self) -> KeyStats:
+        mean_t, std_t = _moments(self.n_temps, self.sum_temps, self.sumsq_temps)
+        mean_m, std_m = _moments(self.n_marge, self.sum_marge, self.sumsq_marge)
+        return KeyStats(self.n, mean_t, std_t, mean_m, std_m)
+
+
+def stats_from_observations(history: Iterable[Dict[str, Any]]) -> KeyStats:
+    """Statistiques d'une liste d'observations déjà restreinte à une clé (au plus WINDOW)."""
+    w = RollingWindow(0, None, None)
+    for o in sorted(history, key=lambda o: int(o.get("id") or 0)):
+        w.push({**o, "id": None})
+    return w.stats()
+
+
+def history_windows(user_id: int, observations: Iterable[Dict[str, Any]],
+                    keys: Optional[Iterable[Key]] = None) -> Dict[Key, RollingWindow]:
+    """
+    Fenêtres reconstruites depuis l'historique (ordre quelconque) : les WINDOW
+    observations les plus récentes de chaque clé, ingérées par id croissant.
+    `keys` : clés à reconstruire (toutes par défaut) ; une clé sans historique
+    donne une fenêtre vide.
+    """
+    wanted = None if keys is None else set(keys)
+    by_key: Dict[Key, List[Dict[str, Any]]] = defaultdict(list)
+    for o in observations:
+        k = key_of(o)
+        if wanted is None or k in wanted:
+            by_key[k].append(o)
+    windows: Dict[Key, RollingWindow] = {}
+    for k in (wanted if wanted is not None else by_key):
+        w = RollingWindow(user_id, *k)
+        for o in sorted(by_key.get(k, []), key=lambda o: int(o["id"]))[-WINDOW:]:
+            w.push(o)
+        windows[k] = w
+    return windows
+
+
+# ─────────────────────────────────────────────
+# I/O (client supabase-py sync ; pendants async dans repositories.py)
+# ─────────────────────────────────────────────
+def read_window(sb, user_id: int, parcours_id: int, operation: str) -> Optional[RollingWindow]:
+    res = (
+        sb.table(STATS_TABLE)
+        .select(STATS_COLUMNS)
+        .eq("Users_Id", user_id)
+        .eq("Parcours_Id", parcours_id)
+        .eq("Operation", operation)
+        .limit(1)
+        .execute()
+    )
+    data = getattr(res, "data", []) or []
+    return RollingWindow.from_row(data[0]) if data else None
+
+
+def upsert_windows(sb, windows: Iterable[RollingWindow]) -> None:
+    payload = [w.to_row() for w in windows]
+    if payload:
+        sb.table(STATS_TABLE).upsert(payload, on_conflict="Users_Id,Parcours_Id,Operation").execute()
@@ -0,0 +1,154 @@
+# app/services/session_stats.py
+"""
+Agrégats par session (Stats_Entrainement, migration 018).
+
+Une ligne par (Entrainement_Id, Parcours_Id, Operation) : nombre
+d'observations, réponses justes, et pour Temps_Seconds, Marge_Erreur et Score
+le nombre de valeurs, la somme et la somme des carrés ; première et dernière
+observation (clé de pagination) ; "Date" de l'entraînement (migration 019,
+lue par services/activity.py).
+
+Écrite à l'insertion des observations par un trigger SQL (tous les chemins de
+soumission). `session_rows` / `merge_row` en sont l'équivalent Python
+(émulation hors ligne, générateur). Les écrans Progression
+(/progression/kpi_timeseries, /progression/levels_summary) et
+/observations/metrics lisent ces lignes au lieu des observations brutes ; table
+absente : retour aux observations (`stats_enabled`).
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .keyset import iter_rows
+
+logger = logging.getLogger(__name__)
+
+SESSION_STATS_TABLE = "Stats_Entrainement"
+KEY_COLUMNS = ("Entrainement_Id", "Parcours_Id", "Operation")
+MEASURES = (("temps", "Temps_Seconds"), ("marge", "Marge_Erreur"), ("score", "Score"))
+SUM_COLUMNS = ("n", "corrects") + tuple(f"{p}_{m}" for m, _ in MEASURES for p in ("n", "sum", "sumsq"))
+SESSION_STATS_COLUMNS = ",".join(
+    KEY_COLUMNS + ("Users_Id",) + SUM_COLUMNS + ("first_observation_id", "last_observation_id")
+)
+
+_stats_missing = False
+
+
+def stats_enabled() -> bool:
+    return not _stats_missing
+
+
+def mark_stats_missing(error: Exception) -> None:
+    """Table absente (migration 018) : les endpoints relisent les observations."""
+    global _stats_missing
+    if not _stats_missing:
+        logger.warning(f"[SessionStats] {SESSION_STATS_TABLE} indisponible, lecture des observations : {error}")
+    _stats_missing = True
+
+
+def is_missing_table(error: Exception) -> bool:
+    return getattr(error, "code", None) in ("PGRST205", "42P01")
+
+
+def is_correct(obs: Dict[str, Any]) -> bool:
+    # Etat peut être 'VRAI' / 'FAUX' ou on compare Proposition vs Solution
+    etat = (obs.get("Etat") or "").upper()
+    if etat in ("VRAI", "FAUX"):
+        return etat == "VRAI"
+    return str(obs.get("Proposition")) == str(obs.get("Solution"))
+
+
+def _num(v: Any) -> Optional[float]:
+    try:
+        return float(v) if v is not None and v != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _day(v: Any) -> Optional[str]:
+    return str(v)[:10] if v else None
+
+
+# ─────────────────────────────────────────────
+# Calcul (équivalent de stats_entrainement_ingest)
+# ─────────────────────────────────────────────
+def session_rows(observations: Iterable[Dict[str, Any]], sessions: Dict[Any, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Deltas par clé des observations insérées ; `sessions` : Entrainement_Id → Entrainement."""
+    out: Dict[Tuple, Dict[str, Any]] = {}
+    for o in observations:
+        key = tuple(o.get(c) for c in KEY_COLUMNS)
+        if any(k is None for k in key):
+            continue
+        row = out.get(key)
+        if row is None:
+            row = out[key] = {
+                **dict(zip(KEY_COLUMNS, key)),
+                "Users_Id": (sessions.get(key[0]) or {}).get("Users_Id"),
+                "Date": _day((sessions.get(key[0]) or {}).get("Date")),
+                **{c: 0 for c in SUM_COLUMNS},
+                "first_observation_id": o["id"],
+                "last_observation_id": o["id"],
+            }
+        row["n"] += 1
+        row["corrects"] += is_correct(o)
+        for m, col in MEASURES:
+            v = _num(o.get(col))
+            if v is not None:
+                row[f"n_{m}"] += 1
+                row[f"sum_{m}"] += v
+                row[f"sumsq_{m}"] += v * v
+        row["first_observation_id"] = min(row["first_observation_id"], o["id"])
+        row["last_observation_id"] = max(row["last_observation_id"], o["id"])
+    return list(out.values())
+
+
+def merge_row(current: Optional[Dict[str, Any]], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Ligne existante + delta (ON CONFLICT DO UPDATE du trigger)."""
+    if not current:
+        return dict(delta)
+    merged = dict(current)
+    for c in SUM_COLUMNS:
+        merged[c] = (current.get(c) or 0) + delta[c]
+    merged["Users_Id"] = current.get("Users_Id") if current.get("Users_Id") is not None else delta["Users_Id"]
+    merged["Date"] = current.get("Date") or delta.get("Date")
+    merged["first_observation_id"] = min(current["first_observation_id"], delta["first_observation_id"])
+    merged["last_observation_id"] = max(current["last_observation_id"], delta["last_observation_id"])
+    return merged
+
+
+# ─────────────────────────────────────────────
+# Lectures
+# ─────────────────────────────────────────────
+def _query(sb, parcours_id: int, operation: Optional[str]):
+    q = sb.table(SESSION_STATS_TABLE).select(SESSION_STATS_COLUMNS).eq("Parcours_Id", parcours_id)
+    return q.eq("Operation", operation) if operation else q
+
+
+def iter_parcours_stats(sb, parcours_id: int, operation: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Toutes les lignes d'un parcours, en flux (clé : dernière observation)."""
+    yield from iter_rows(lambda: _query(sb, parcours_id, operation), key="last_observation_id")
+
+
+def latest_sessions(sb, parcours_id: int, operation: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Lignes des `limit` derniers entraînements du parcours (Entrainement_Id croissant)
+    et nombre total de lignes (rang des points de la série).
+    """
+    res = (
+        _query(sb, parcours_id, operation)
+        .order("Entrainement_Id", desc=True)
+        .limit(limit)
+        .execute()
+    )
+    rows = getattr(res, "data", []) or []
+    total = sb.table(SESSION_STATS_TABLE).select("Entrainement_Id", count="exact").eq("Parcours_Id", parcours_id)
+    if operation:
+        total = total.eq("Operation", operation)
+    count = getattr(total.limit(0).execute(), "count", None)
+    return rows[::-1], int(count if count is not None else len(rows))
+
+
+def entrainement_stats(sb, entrainement_id: int) -> List[Dict[str, Any]]:
+    res = sb.table(SESSION_STATS_TABLE).select(SESSION_STATS_COLUMNS).eq("Entrainement_Id", entrainement_id).execute()
+    return getattr(res, "data", []) or []
@@ -9,6 +9,8 @@ from collections import Counter
 from typing import Optional, Dict, Any
 import logging
 
+from .keyset import iter_rows
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,26 +30,13 @@ def calculate_user_streak(user_id: int, supabase_client) -> Dict[str, Any]:
         - total_days: nombre total de jours avec entraînement
     """
     try:
-        # 1) Récupérer tous les entraînements de l'utilisateur
-        result = (
-            supabase_client.table("Entrainement")
+        # 1) Parcourir les entraînements de l'utilisateur en flux, en gardant les dates
+        entrainements = iter_rows(
+            lambda: supabase_client.table("Entrainement")
             .select("id, Date, date")
             .eq("Users_Id", user_id)
-            .order("id")
-            .limit(100000)
-            .execute()
         )
         
-        entrainements = getattr(result, "data", []) or []
-        
-        if not entrainements:
-            return {
-                "current_streak": 0,
-                "best_streak": 0,
-                "last_training_date": None,
-                "total_days": 0
-            }
-        
         # 2) Extraire les dates
         dates_set = set()
         last_date = None
@@ -0,0 +1,210 @@
+# app/services/submission.py
+"""
+Soumission d'une session d'observations (POST /observations).
+
+Trois chemins, choisis par OBSERVATIONS_PIPELINE :
+  rpc     (défaut) un seul appel à la fonction SQL submit_observations
+          (supabase/migrations/011_submit_observations.sql) : insertion, scoring,
+          Classement, users_map et évolutions de niveau dans une transaction.
+          Nombre d'allers-retours constant, quelle que soit la taille du lot.
+  outbox  submit_observations_async (migration 014) : insertion et évènement
+          Outbox dans une transaction, réponse immédiate (ids + job à suivre
+          sur GET /observations/jobs/{id}) ; le reste du traitement
+          (process_session) est fait par le worker de services/outbox.py.
+  legacy  l'enchaînement historique côté Python (doublon, insertion par paquets,
+          historique, upsert des scores, classement, évolutions), conservé pour
+          comparer les chemins.
+
+Tant qu'une migration n'est pas déployée (PGRST202 : fonction inconnue), le
+process descend d'un cran : outbox → rpc → legacy.
+
+Les règles de calcul vivent ici (scoring_payloads, classement_payloads) : le
+chemin legacy les applique, la fonction SQL et son émulation hors ligne
+(app/offline/backend.py) les reproduisent. L'historique de scoring vient des
+fenêtres glissantes Stats_Scoring (services/scoring_stats.py, migration 012) ;
+les bonus sont calculés par le moteur de scoring.py, règle USE_NEW_SCORING
+(transmise à la fonction SQL en p_rules, migration 013). Le chemin legacy
+applique les deltas de la session au Classement et à users_map en un appel
+atomique (increment_classement, migration 016), sans relire les scores.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .scoring import score_batch, stats_columns
+from .scoring_stats import EMPTY_STATS, Key, KeyStats, RollingWindow, key_of
+
+logger = logging.getLogger(__name__)
+
+OBSERVATIONS_PIPELINE = os.getenv("OBSERVATIONS_PIPELINE", "rpc").strip().lower()
+SUBMIT_RPC = "submit_observations"
+SUBMIT_ASYNC_RPC = "submit_observations_async"
+INCREMENT_RPC = "increment_classement"
+
+_rpc_missing = False
+_outbox_missing = False
+_increment_missing = False
+
+
+def rpc_enabled() -> bool:
+    return OBSERVATIONS_PIPELINE in ("rpc", "outbox") and not _rpc_missing
+
+
+def outbox_enabled() -> bool:
+    return OBSERVATIONS_PIPELINE == "outbox" and not (_outbox_missing or _rpc_missing)
+
+
+def increment_enabled() -> bool:
+    return not _increment_missing
+
+
+def mark_increment_missing(error: Exception) -> None:
+    """increment_classement absente (migration 016) : lecture-modification-écriture du chemin legacy."""
+    global _increment_missing
+    if not _increment_missing:
+        logger.warning(f"[Submission] {INCREMENT_RPC} indisponible, mise à jour du classement en trois temps : {error}")
+    _increment_missing = True
+
+
+def mark_outbox_missing(error: Exception) -> None:
+    """Migration 014 absente : bascule définitive sur le chemin rpc synchrone."""
+    global _outbox_missing
+    if not _outbox_missing:
+        logger.warning(f"[Submission] {SUBMIT_ASYNC_RPC} indisponible, chemin rpc : {error}")
+    _outbox_missing = True
+
+
+def mark_rpc_missing(error: Exception) -> None:
+    """Fonction SQL absente : bascule définitive sur le chemin legacy."""
+    global _rpc_missing
+    if not _rpc_missing:
+        logger.warning(f"[Submission] {SUBMIT_RPC} indisponible, chemin legacy : {error}")
+    _rpc_missing = True
+
+
+def scoring_payloads(
+    current_obs: List[Dict[str, Any]],
+    stats: Dict[Key, KeyStats],
+    rules: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Porte en Python la logique du trigger calculate_new_scoring.
+    `current_obs` : observations de la session (Etat/Marge_Erreur calculés par le trigger) ;
+    `stats` : historique par Parcours_Id+Operation, hors session (fenêtres Stats_Scoring).
+    bonus_vitesse, bonus_marge, score_global de toute la session en une passe
+    (scoring.score_batch, règle USE_NEW_SCORING par défaut).
+    Le trigger calculate_new_scoring reste actif pendant la phase de validation.
+    Reproduit à l'identique par submit_observations (SQL) et son émulation hors ligne.
+    """
+    if not current_obs:
+        return []
+    out = score_batch(
+        etat=[str(o.get("Etat") or "").strip() for o in current_obs],
+        temps=[float(o.get("Temps_Seconds") or 0) for o in current_obs],
+        marge=[float(o.get("Marge_Erreur") or 0) for o in current_obs],
+        score=[o.get("Score") or 0 for o in current_obs],
+        **stats_columns([stats.get(key_of(o)) or EMPTY_STATS for o in current_obs]),
+        rules=rules,
+    )
+    return [
+        {
+            "id":            obs["id"],
+            "bonus_vitesse": float(bv),
+            "bonus_marge":   float(bm),
+            "score_global":  int(sg),
+        }
+        for obs, bv, bm, sg in zip(current_obs, out["bonus_vitesse"], out["bonus_marge"], out["score_global"])
+    ]
+
+
+def score_session(
+    user_id: int,
+    current_obs: List[Dict[str, Any]],
+    windows: Dict[Key, RollingWindow],
+    rules: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Score la session contre les fenêtres (historique hors session), puis y
+    ingère les observations de la session. `windows` est complété en place
+    (nouvelles clés) ; l'appelant persiste les fenêtres modifiées.
+    """
+    payloads = scoring_payloads(current_obs, {k: w.stats() for k, w in windows.items()}, rules)
+    for obs in sorted(current_obs, key=lambda o: int(o["id"])):
+        k = key_of(obs)
+        if None in k:
+            continue
+        if k not in windows:
+            windows[k] = RollingWindow(user_id, *k)
+        windows[k].push(obs)
+    return payloads
+
+
+def session_keys(current_obs: Iterable[Dict[str, Any]]) -> set:
+    return {key_of(o) for o in current_obs if None not in key_of(o)}
+
+
+def session_deltas(obs_rows: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+    """(delta Classement, delta users_map.score_base) d'une session : score_global, à défaut Score."""
+    delta_classement = delta_score_base = 0
+    for r in obs_rows:
+        delta_classement += int(r.get("score_global") or r.get("Score") or 0)
+        delta_score_base += int(r.get("Score") or 0)
+    return delta_classement, delta_score_base
+
+
+def classement_increment(
+    user_id: int,
+    cl: Dict[str, Any],
+    um: Dict[str, Any],
+    delta_classement: int,
+    delta_score_base: int,
+    today: date,
+) -> tuple:
+    """
+    Nouvelles valeurs Classement (score_global + score_week avec reset si nouvelle semaine)
+    et users_map (score_base + last_training_date) après ajout des deltas.
+    Mêmes règles que la fonction SQL increment_classement (migration 016).
+    """
+    monday = today - timedelta(days=today.weekday())
+
+    prev_global    = int(cl.get("score_global") or 0)
+    prev_week      = int(cl.get("score_week") or 0)
+    week_start_str = cl.get("week_start")
+    if week_start_str:
+        stored_monday = date.fromisoformat(str(week_start_str))
+        is_new_week   = stored_monday < monday
+    else:
+        is_new_week = True
+
+    new_score_week   = delta_classement if is_new_week else prev_week + delta_classement
+    new_score_global = prev_global + delta_classement
+
+    classement = {
+        "Users_Id":     user_id,
+        "score_global": new_score_global,
+        "score_week":   new_score_week,
+        "week_start":   monday.isoformat(),
+    }
+    users_map = {
+        "score_base":         int(um.get("score_base") or 0) + delta_score_base,
+        "last_training_date": today.isoformat(),
+    }
+    return classement, users_map
+
+
+def classement_payloads(
+    user_id: int,
+    obs_rows: List[Dict[str, Any]],
+    cl: Dict[str, Any],
+    um: Dict[str, Any],
+    today: date,
+) -> tuple:
+    """
+    Nouvelles valeurs Classement et users_map à partir des scores de la session.
+    Prérequis : la table Classement doit avoir une colonne week_start DATE.
+    """
+    delta_classement, delta_score_base = session_deltas(obs_rows)
+    return classement_increment(user_id, cl, um, delta_classement, delta_score_base, today)
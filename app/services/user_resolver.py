@@ -1,31 +1,23 @@
 from typing import Optional
-try:
-    # supabase-py v2 (sync)
-    from supabase._sync.client import SyncClient as SupabaseClient
-except Exception:
-    SupabaseClient = object  # fallback neutre si l'import change à l'avenir
+
+from .identity import resolver
+
 
 def resolve_or_register_user_id(
-    supabase: SupabaseClient,
+    supabase,
     auth_uid: str,
     email: Optional[str] = None,
+    name: Optional[str] = None,
 ) -> int:
-    # même contenu que ci-dessus…
-    m = supabase.table("users_map").select("*").eq("auth_uid", auth_uid).execute()
-    data = getattr(m, "data", []) or []
-    if data:
-        return int(data[0]["user_id"])
-
-    new_user = {"name": email or "Utilisateur", "email": email or None}
-    u = supabase.table("Users").insert(new_user).execute()
-    udata = getattr(u, "data", []) or []
-    if not udata:
-        raise RuntimeError("Création Users échouée")
-    user_id = int(udata[0]["id"])
+    """auth_uid → Users.id, création Users + users_map si absent (cache identity partagé)."""
+    return resolver.resolve(auth_uid, email=email, name=name, register=True, sb=supabase)
 
-    supabase.table("users_map").insert({
-        "auth_uid": auth_uid,
-        "user_id": user_id,
-    }).execute()
 
-    return user_id
+async def aresolve_or_register_user_id(
+    supabase,
+    auth_uid: str,
+    email: Optional[str] = None,
+    name: Optional[str] = None,
+) -> int:
+    """Pendant async (client `AsyncScopedClient`) de resolve_or_register_user_id."""
+    return await resolver.aresolve(auth_uid, email=email, name=name, register=True, sb=supabase)
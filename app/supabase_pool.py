@@ -0,0 +1,346 @@
+# app/supabase_pool.py
+"""
+Fabrique unique de clients Supabase, adossée à un pool HTTP partagé.
+
+`create_client` construit ses propres sessions httpx : un client par requête
+(ou par job cron) = une connexion TLS neuve à chaque fois. Ici un seul
+`httpx.Client` borné (keep-alive, HTTP/2) sert tout le process ; chaque requête
+reçoit une vue légère (`ScopedClient`) qui ne fait que fixer l'en-tête
+Authorization : clé service, ou JWT utilisateur pour que RLS s'applique.
+
+Les routes `async def` utilisent le pendant asynchrone (`AsyncScopedClient`,
+via `async_service()` / `async_for_token()`) : même fabrique, mêmes limites,
+mais un `httpx.AsyncClient` qui ne bloque pas de thread pendant l'I/O
+(les limites ci-dessous s'appliquent à chacun des deux clients).
+
+Dimensionnement (par worker uvicorn) :
+  SUPABASE_POOL_MAX_CONNECTIONS   connexions simultanées max (défaut 20)
+  SUPABASE_POOL_MAX_KEEPALIVE     connexions gardées ouvertes au repos (défaut 10)
+  SUPABASE_POOL_KEEPALIVE_EXPIRY  secondes avant fermeture d'une connexion inactive (défaut 30)
+  SUPABASE_POOL_TIMEOUT           attente max d'une connexion libre, en secondes (défaut 10)
+
+`pool_stats()` (exposé sur /_pool) donne l'occupation pour ajuster ces valeurs.
+SUPABASE_BACKEND=offline branche la fabrique sur app/offline (sans réseau).
+Chaque appel PostgREST est aussi mesuré par app/metrics.py (exposé sur /metrics).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+from gotrue import SyncMemoryStorage
+from httpx import Headers, QueryParams
+from gotrue import AsyncMemoryStorage
+from postgrest import (
+    AsyncRequestBuilder,
+    AsyncRPCFilterRequestBuilder,
+    SyncRequestBuilder,
+    SyncRPCFilterRequestBuilder,
+)
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS, DEFAULT_POSTGREST_CLIENT_TIMEOUT
+from postgrest.utils import AsyncClient, SyncClient
+from supabase._async.auth_client import AsyncSupabaseAuthClient
+from supabase._sync.auth_client import SyncSupabaseAuthClient
+
+from . import metrics
+
+POOL_MAX_CONNECTIONS = int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", "20"))
+POOL_MAX_KEEPALIVE = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "10"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", "30"))
+POOL_TIMEOUT = float(os.getenv("SUPABASE_POOL_TIMEOUT", "10"))
+
+
+class _ScopedSession:
+    """
+    Ce que voient les request builders postgrest à la place d'un httpx.Client :
+    seul `request()` est utilisé, on y injecte l'Authorization de la vue.
+    """
+
+    __slots__ = ("_factory", "_authorization")
+
+    def __init__(self, factory: "SupabaseClientFactory", authorization: str):
+        self._factory = factory
+        self._authorization = authorization
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return self._factory.request(method, url, authorization=self._authorization, **kwargs)
+
+
+class _AsyncScopedSession(_ScopedSession):
+    __slots__ = ()
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self._factory.arequest(method, url, authorization=self._authorization, **kwargs)
+
+
+class ScopedClient:
+    """
+    Vue légère sur la fabrique : même surface que le client supabase-py utilisée
+    dans l'app (`table`, `from_`, `rpc`, `auth`), sans nouvelle connexion.
+    """
+
+    _session_cls = _ScopedSession
+    _builder_cls = SyncRequestBuilder
+    _rpc_builder_cls = SyncRPCFilterRequestBuilder
+
+    def __init__(self, factory: "SupabaseClientFactory", authorization: str):
+        self._factory = factory
+        self._session = self._session_cls(factory, authorization)
+
+    def table(self, table_name: str):
+        return self._builder_cls(self._session, f"/{table_name}")
+
+    def from_(self, table_name: str):
+        return self.table(table_name)
+
+    def rpc(
+        self,
+        fn: str,
+        params: Optional[Dict[Any, Any]] = None,
+        count: Optional[str] = None,
+        head: bool = False,
+        get: bool = False,
+    ):
+        method = "HEAD" if head else "GET" if get else "POST"
+        headers = Headers({"Prefer": f"count={count}"}) if count else Headers()
+        return self._rpc_builder_cls(
+            self._session, f"/rpc/{fn}", method, headers, QueryParams(), json=params or {}
+        )
+
+    @property
+    def auth(self) -> SyncSupabaseAuthClient:
+        """Client GoTrue partagé (même pool HTTP)."""
+        return self._factory.auth
+
+
+class AsyncScopedClient(ScopedClient):
+    """Même vue, builders postgrest async : `await sb.table(...).select(...).execute()`."""
+
+    _session_cls = _AsyncScopedSession
+    _builder_cls = AsyncRequestBuilder
+    _rpc_builder_cls = AsyncRPCFilterRequestBuilder
+
+    @property
+    def auth(self) -> AsyncSupabaseAuthClient:
+        return self._factory.async_auth
+
+
+class SupabaseClientFactory:
+    """Pool HTTP partagé + vues par requête. Thread-safe (routes sync en threadpool)."""
+
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        *,
+        max_connections: int = POOL_MAX_CONNECTIONS,
+        max_keepalive: int = POOL_MAX_KEEPALIVE,
+        keepalive_expiry: float = POOL_KEEPALIVE_EXPIRY,
+        pool_timeout: float = POOL_TIMEOUT,
+        transport: Optional[httpx.BaseTransport] = None,
+        async_transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.url = url.rstrip("/")
+        self.key = key
+        self.rest_url = f"{self.url}/rest/v1"
+        self.auth_url = f"{self.url}/auth/v1"
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._timeout = httpx.Timeout(DEFAULT_POSTGREST_CLIENT_TIMEOUT, pool=pool_timeout)
+        self._http = SyncClient(
+            limits=self.limits,
+            timeout=self._timeout,
+            follow_redirects=True,
+            http2=transport is None,
+            transport=transport,
+        )
+        # client async créé au premier usage (dans la boucle d'événements du serveur)
+        self._async_transport = async_transport
+        self._ahttp: Optional[AsyncClient] = None
+        self._rest_headers = {
+            **DEFAULT_POSTGREST_CLIENT_HEADERS,
+            "apiKey": key,
+            "Accept-Profile": "public",
+            "Content-Profile": "public",
+        }
+        self._service = ScopedClient(self, f"Bearer {key}")
+        self._async_service = AsyncScopedClient(self, f"Bearer {key}")
+        self._auth: Optional[SyncSupabaseAuthClient] = None
+        self._async_auth: Optional[AsyncSupabaseAuthClient] = None
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._requests = 0
+        self._errors = 0
+        self._views = 0
+
+    # --------------------- vues ---------------------
+    def service(self) -> ScopedClient:
+        """Vue service role (partagée : aucun JWT utilisateur n'y est jamais attaché)."""
+        return self._service
+
+    def for_token(self, token: str) -> ScopedClient:
+        """Vue jetable pour CETTE requête : Authorization = JWT utilisateur (RLS via auth.uid())."""
+        with self._lock:
+            self._views += 1
+        return ScopedClient(self, f"Bearer {token}")
+
+    def async_service(self) -> AsyncScopedClient:
+        return self._async_service
+
+    def async_for_token(self, token: str) -> AsyncScopedClient:
+        with self._lock:
+            self._views += 1
+        return AsyncScopedClient(self, f"Bearer {token}")
+
+    @property
+    def auth(self) -> SyncSupabaseAuthClient:
+        if self._auth is None:
+            with self._lock:
+                if self._auth is None:
+                    self._auth = SyncSupabaseAuthClient(
+                        url=self.auth_url,
+                        headers={"apiKey": self.key, "Authorization": f"Bearer {self.key}"},
+                        auto_refresh_token=False,
+                        persist_session=False,
+                        storage=SyncMemoryStorage(),
+                        http_client=self._http,
+                    )
+        return self._auth
+
+    @property
+    def async_auth(self) -> AsyncSupabaseAuthClient:
+        if self._async_auth is None:
+            with self._lock:
+                if self._async_auth is None:
+                    self._async_auth = AsyncSupabaseAuthClient(
+                        url=self.auth_url,
+                        headers={"apiKey": self.key, "Authorization": f"Bearer {self.key}"},
+                        auto_refresh_token=False,
+                        persist_session=False,
+                        storage=AsyncMemoryStorage(),
+                        http_client=self._async_http(),
+                    )
+        return self._async_auth
+
+    # --------------------- transport ---------------------
+    @property
+    def http_client(self) -> SyncClient:
+        """Client httpx partagé (appels hors PostgREST : JWKS, etc.)."""
+        return self._http
+
+    def _async_http(self) -> AsyncClient:
+        if self._ahttp is None:
+            self._ahttp = AsyncClient(
+                limits=self.limits,
+                timeout=self._timeout,
+                follow_redirects=True,
+                http2=self._async_transport is None,
+                transport=self._async_transport,
+            )
+        return self._ahttp
+
+    def _headers(self, authorization: str, headers=None) -> Headers:
+        merged = Headers(self._rest_headers)
+        if headers:
+            merged.update(headers)
+        merged["Authorization"] = authorization
+        return merged
+
+    def _enter(self) -> None:
+        with self._lock:
+            self._in_flight += 1
+            self._requests += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+    def _exit(self, failed: bool) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if failed:
+                self._errors += 1
+
+    def request(self, method: str, path: str, *, authorization: str, headers=None, **kwargs) -> httpx.Response:
+        merged = self._headers(authorization, headers)
+        self._enter()
+        res: Optional[httpx.Response] = None
+        t0 = time.perf_counter()
+        try:
+            res = self._http.request(method, f"{self.rest_url}{path}", headers=merged, **kwargs)
+            return res
+        finally:
+            self._exit(res is None)
+            metrics.record_call(method, path, merged, res, time.perf_counter() - t0)
+
+    async def arequest(self, method: str, path: str, *, authorization: str, headers=None, **kwargs) -> httpx.Response:
+        merged = self._headers(authorization, headers)
+        http = self._async_http()
+        self._enter()
+        res: Optional[httpx.Response] = None
+        t0 = time.perf_counter()
+        try:
+            res = await http.request(method, f"{self.rest_url}{path}", headers=merged, **kwargs)
+            return res
+        finally:
+            self._exit(res is None)
+            metrics.record_call(method, path, merged, res, time.perf_counter() - t0)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Occupation du pool (pour dimensionner SUPABASE_POOL_* par worker)."""
+        def _conns(client) -> list:
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            return list(getattr(pool, "connections", []) or []) if pool is not None else []
+
+        connections = _conns(self._http) + (_conns(self._ahttp) if self._ahttp is not None else [])
+        idle = sum(1 for c in connections if c.is_idle())
+        with self._lock:
+            return {
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "keepalive_expiry": self.limits.keepalive_expiry,
+                "open_connections": len(connections),
+                "idle_connections": idle,
+                "active_connections": len(connections) - idle,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "requests_total": self._requests,
+                "errors_total": self._errors,
+                "scoped_views_total": self._views,
+            }
+
+    def close(self) -> None:
+        self._http.close()
+
+    async def aclose(self) -> None:
+        if self._ahttp is not None:
+            await self._ahttp.aclose()
+            self._ahttp = None
+
+
+_factory: Optional[SupabaseClientFactory] = None
+_factory_lock = threading.Lock()
+
+
+def get_factory() -> SupabaseClientFactory:
+    """Fabrique process-wide, créée au premier appel depuis l'environnement."""
+    global _factory
+    if _factory is None:
+        with _factory_lock:
+            if _factory is None:
+                from .offline import offline_enabled, offline_factory
+
+                if offline_enabled():  # SUPABASE_BACKEND=offline : tables locales, aucun réseau
+                    _factory = offline_factory()
+                    return _factory
+                url = os.getenv("SUPABASE_URL")
+                key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+                if not url or not key:
+                    raise RuntimeError("Configure SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY")
+                _factory = SupabaseClientFactory(url, key)
+    return _factory
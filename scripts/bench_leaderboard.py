@@ -0,0 +1,173 @@
+# scripts/bench_leaderboard.py
+"""
+GET /classement : requêtes sur Classement contre classement en mémoire
+(app/services/leaderboard.py), sur le backend hors ligne.
+
+Tables Classement et users_map de --users utilisateurs (scores tirés au hasard,
+ex aequo compris), latence simulée par aller-retour. Cinq requêtes, d'abord
+servies par la table (moteur non chargé) puis par le moteur (warm) :
+  top    ?limit=50                       page de tête, sans jeton
+  me     ?limit=50 + jeton               page de tête + rang de l'appelant
+  deep   ?offset=<users/2>&limit=50      page profonde
+  cursor ?cursor=<milieu>&limit=50       page profonde par curseur (score, Users_Id)
+  around_me ?radius=25 + jeton           voisins de l'appelant
+et pour chacune p50/p95 et allers-retours Supabase (X-DB-Roundtrips). Les
+réponses des deux modes sont comparées (mêmes rangs, mêmes scores, même `me`).
+Puis les opérations du moteur seules : rang, top-k, autour de, mise à jour.
+
+Usage :
+  python scripts/bench_leaderboard.py --users 100000 --requests 200 --db-latency-ms 2
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+import httpx
+
+os.environ["APP_DEBUG"] = "1"
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_session import StepStats  # noqa: E402
+from load_test_hot_paths import _token, build_app  # noqa: E402
+
+from app.offline import MemoryStore, OfflinePostgrest, offline_auth_uid  # noqa: E402
+from app.offline.generate import CLASSEMENT_COLS, USERS_MAP_COLS  # noqa: E402
+
+CASES = ("top", "me", "deep", "cursor", "around_me")
+
+
+def make_backend(users: int, latency_ms: float, seed: int) -> OfflinePostgrest:
+    """Classement + users_map seuls : scores globaux étalés, scores de la semaine souvent nuls."""
+    rng = random.Random(seed)
+    monday = date.today() - timedelta(days=date.today().weekday())
+    store = MemoryStore()
+    store.bulk_insert("users_map", USERS_MAP_COLS, (
+        (uid, offline_auth_uid(uid), f"bench{uid}@example.invalid", 0, monday.isoformat(), False)
+        for uid in range(1, users + 1)
+    ))
+    store.bulk_insert("Classement", CLASSEMENT_COLS, (
+        (uid, int(rng.paretovariate(1.2) * 500), rng.choice((0, 0, rng.randint(0, 3000))), monday.isoformat())
+        for uid in range(1, users + 1)
+    ))
+    return OfflinePostgrest(store, latency=latency_ms / 1000.0)
+
+
+async def _measure(client: httpx.AsyncClient, args, uids: List[int], cursors: Dict[str, str]) -> Dict[str, Any]:
+    stats: Dict[str, StepStats] = defaultdict(StepStats)
+    bodies: Dict[str, List[Any]] = defaultdict(list)
+    for i, uid in enumerate(uids):
+        scope = "this_week" if i % 2 else "all"
+        auth = {"Authorization": f"Bearer {_token(uid)}"}
+        calls = {
+            "top": ("", {"scope": scope, "limit": 50}, {}),
+            "me": ("", {"scope": scope, "limit": 50}, auth),
+            "deep": ("", {"scope": scope, "limit": 50, "offset": args.users // 2}, {}),
+            "cursor": ("", {"scope": scope, "limit": 50, "cursor": cursors[scope]}, {}),
+            "around_me": ("/around_me", {"scope": scope, "radius": 25}, auth),
+        }
+        for name, (path, params, headers) in calls.items():
+            t0 = time.perf_counter()
+            r = await client.get("/classement" + path, params=params, headers=headers)
+            elapsed = time.perf_counter() - t0
+            if r.status_code >= 400:
+                stats[name].errors += 1
+                continue
+            stats[name].latencies.append(elapsed)
+            stats[name].roundtrips.append(int(r.headers.get("X-DB-Roundtrips", 0)))
+            body = r.json()
+            bodies[name].append(([(it["rank"], it["score_total"]) for it in body["items"]], body["me"]))
+    return {"steps": {n: stats[n].summary() for n in CASES}, "bodies": bodies}
+
+
+def _engine_ops(engine, users: int, n: int, rng: random.Random) -> Dict[str, float]:
+    """Durée moyenne (µs) des opérations du moteur seul."""
+    uids = [rng.randint(1, users) for _ in range(n)]
+    board = engine._boards["score_global"]
+
+    def per_op(fn) -> float:
+        t0 = time.perf_counter()
+        for u in uids:
+            fn(u)
+        return round((time.perf_counter() - t0) / n * 1e6, 2)
+
+    return {
+        "rank_us": per_op(board.rank),
+        "top50_us": per_op(lambda u: engine.top("score_global", 0, 50)),
+        "page50_deep_us": per_op(lambda u: engine.top("score_global", users // 2, 50)),
+        "around25_us": per_op(lambda u: engine.around("score_global", u, 25)),
+        "apply_us": per_op(lambda u: engine.apply(u, (board.score(u) or 0) + rng.randint(1, 300),
+                                                  rng.randint(0, 3000))),
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    backend = make_backend(args.users, args.db_latency_ms, args.seed)
+    app, _print = build_app(backend)
+    from app.deps import async_service_client
+    from app.services import leaderboard
+
+    report: Dict[str, Any] = {
+        "params": {k: getattr(args, k) for k in ("users", "requests", "db_latency_ms", "seed")},
+        "setup_s": round(time.perf_counter() - t0, 2),
+    }
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        rng = random.Random(args.seed)
+        uids = [rng.randint(1, args.users) for _ in range(args.requests)]
+        for uid in set(uids):  # chauffe : identités en cache, hors mesure dans les deux modes
+            await client.get("/classement", params={"limit": 1}, headers={"Authorization": f"Bearer {_token(uid)}"})
+        cursors = {}  # curseur d'une page au milieu du classement
+        for scope in ("all", "this_week"):
+            r = await client.get("/classement", params={"scope": scope, "limit": 1, "offset": args.users // 2})
+            cursors[scope] = r.json()["next_cursor"]
+        queries = await _measure(client, args, uids, cursors)
+
+        t0 = time.perf_counter()
+        rt0 = backend.roundtrips
+        loaded = await leaderboard.warm(async_service_client())
+        report["warm"] = {"rows": loaded, "seconds": round(time.perf_counter() - t0, 3),
+                          "db_roundtrips": backend.roundtrips - rt0}
+        engine = await _measure(client, args, uids, cursors)
+
+    report["queries"] = queries["steps"]
+    report["engine"] = engine["steps"]
+    report["speedup_p50"] = {
+        n: round(queries["steps"][n]["p50_ms"] / max(engine["steps"][n]["p50_ms"], 1e-3), 1) for n in CASES
+    }
+    report["mismatches"] = {
+        n: sum(a != b for a, b in zip(queries["bodies"][n], engine["bodies"][n])) for n in CASES
+    }
+    report["engine_ops"] = _engine_ops(leaderboard.engine, args.users, args.ops, random.Random(args.seed))
+    return report
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=100_000, help="lignes Classement")
+    ap.add_argument("--requests", type=int, default=100, help="requêtes par cas et par mode")
+    ap.add_argument("--ops", type=int, default=20_000, help="opérations par mesure du moteur seul")
+    ap.add_argument("--db-latency-ms", type=float, default=2.0, help="latence simulée par aller-retour Supabase")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--output", default=None, help="fichier JSON de résultats")
+    args = ap.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    sys.__stdout__.write(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
+    sys.exit(1 if any(report["mismatches"].values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
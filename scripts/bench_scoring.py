@@ -0,0 +1,110 @@
+# scripts/bench_scoring.py
+"""
+Micro-benchmark du moteur de scoring (app/services/scoring.py), hors base.
+
+Pour chaque taille de lot et chaque règle :
+  batch      score_batch : une passe vectorisée sur tout le lot
+  payloads   submission.scoring_payloads : extraction des colonnes depuis les
+             observations (dicts) + score_batch + payloads d'upsert
+  unitaire   calculate_final_score_from_stats appelé observation par
+             observation (API historique de scoring.py)
+
+Usage :
+  python scripts/bench_scoring.py --sizes 30,1000,100000 --repeat 5 --output bench_scoring.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging  # noqa: E402
+
+logging.disable(logging.INFO)  # calculate_final_score journalise chaque observation
+
+from app.services.scoring import (  # noqa: E402
+    RULES_NEW, RULES_SESSION, calculate_final_score_from_stats, score_batch, stats_columns,
+)
+from app.services.scoring_stats import KeyStats  # noqa: E402
+from app.services.submission import scoring_payloads  # noqa: E402
+
+UNIT_MAX = 20_000  # au-delà, le mode unitaire est trop lent pour être utile
+
+
+def _dataset(size: int, keys: int, seed: int):
+    rng = random.Random(seed)
+    stats = {(k, "Addition"): KeyStats(rng.randint(0, 50), rng.uniform(2, 12), rng.uniform(0, 4),
+                                       rng.uniform(0, 8), rng.uniform(0, 3)) for k in range(keys)}
+    obs = [{
+        "id": i, "Parcours_Id": rng.randrange(keys), "Operation": "Addition",
+        "Etat": "VRAI" if rng.random() < 0.7 else "FAUX",
+        "Temps_Seconds": rng.randint(1, 20), "Marge_Erreur": rng.randint(0, 10), "Score": None,
+    } for i in range(size)]
+    return obs, stats
+
+
+def _best(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run(sizes: List[int], repeat: int, keys: int, seed: int) -> List[Dict[str, Any]]:
+    results = []
+    for size in sizes:
+        obs, stats = _dataset(size, keys, seed)
+        per_obs = [stats[(o["Parcours_Id"], o["Operation"])] for o in obs]
+        cols = dict(
+            etat=[o["Etat"] for o in obs],
+            temps=[float(o["Temps_Seconds"]) for o in obs],
+            marge=[float(o["Marge_Erreur"]) for o in obs],
+            **stats_columns(per_obs),
+        )
+        for rules in (RULES_SESSION, RULES_NEW):
+            modes: Dict[str, Callable[[], Any]] = {
+                "batch": lambda: score_batch(**cols, rules=rules),
+                "payloads": lambda: scoring_payloads(obs, stats, rules=rules),
+            }
+            if size <= UNIT_MAX:
+                modes["unitaire"] = lambda: [
+                    calculate_final_score_from_stats(o["Etat"], float(o["Temps_Seconds"]), float(o["Marge_Erreur"]), s, rules)
+                    for o, s in zip(obs, per_obs)
+                ]
+            for mode, fn in modes.items():
+                t = _best(fn, repeat)
+                results.append({
+                    "size": size, "rules": rules, "mode": mode,
+                    "total_ms": round(t * 1000, 3),
+                    "us_per_obs": round(t * 1e6 / size, 3),
+                })
+    return results
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="30,1000,100000", help="tailles de lot, séparées par des virgules")
+    ap.add_argument("--repeat", type=int, default=5, help="répétitions (meilleur temps retenu)")
+    ap.add_argument("--keys", type=int, default=30, help="clés (Parcours_Id, Operation) distinctes")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--output", default=None, help="fichier JSON de résultats")
+    args = ap.parse_args()
+
+    results = run([int(s) for s in args.sizes.split(",") if s], args.repeat, args.keys, args.seed)
+    for r in results:
+        print(f"{r['size']:>8} {r['rules']:<8} {r['mode']:<9} {r['total_ms']:>11.3f} ms  {r['us_per_obs']:>9.3f} µs/obs")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
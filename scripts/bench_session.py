@@ -0,0 +1,214 @@
+# scripts/bench_session.py
+"""
+Benchmark reproductible du cycle de vie d'une session mobile, étape par étape :
+
+  1. POST /entrainement/start_mixte
+  2. GET  /exercices/generer_mixte
+  3. POST /observations                (3 × N réponses)
+  4. GET  /parcours/positions_currentes
+  5. GET  /pixel/state
+
+Contre le backend hors ligne (app/offline) : tables en mémoire générées, ou
+base SQLite (--offline-db), latence simulée par aller-retour. Chaque étape est
+mesurée (p50/p95/p99, débit) avec son nombre d'allers-retours Supabase
+(en-tête X-DB-Roundtrips, APP_DEBUG=1).
+
+Usage :
+  python scripts/bench_session.py --concurrency 20 --sessions 400 --output bench.json
+  python scripts/bench_session.py --baseline bench.json --max-regression 0.20   # CI
+
+Avec --baseline, code retour 1 si une étape régresse : p95 au-delà de
+(1 + max-regression) × référence, ou plus d'allers-retours qu'avant.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+os.environ["APP_DEBUG"] = "1"
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_test_hot_paths import _token, build_app, make_backend  # noqa: E402
+
+from app.offline import offline_auth_uid  # noqa: E402
+
+STEPS = ("start_mixte", "generer_mixte", "observations", "positions_currentes", "pixel_state")
+
+
+class StepStats:
+    def __init__(self) -> None:
+        self.latencies: List[float] = []
+        self.roundtrips: List[int] = []
+        self.errors = 0
+
+    def summary(self) -> Dict[str, Any]:
+        lat = sorted(self.latencies)
+        if not lat:
+            return {"count": 0, "errors": self.errors}
+
+        def pct(p: float) -> float:
+            return round(lat[min(len(lat) - 1, int(round(p * (len(lat) - 1))))] * 1000, 2)
+
+        return {
+            "count": len(lat),
+            "errors": self.errors,
+            "mean_ms": round(statistics.fmean(lat) * 1000, 2),
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "roundtrips_mean": round(statistics.fmean(self.roundtrips), 2) if self.roundtrips else None,
+            "roundtrips_max": max(self.roundtrips) if self.roundtrips else None,
+        }
+
+
+async def _session(client: httpx.AsyncClient, uid: int, n: int, rng: random.Random,
+                   stats: Dict[str, StepStats]) -> bool:
+    headers = {"Authorization": f"Bearer {_token(uid)}"}
+
+    async def step(name: str, method: str, url: str, **kw) -> Optional[httpx.Response]:
+        t0 = time.perf_counter()
+        r = await client.request(method, url, headers=headers, **kw)
+        s = stats[name]
+        if r.status_code >= 400:
+            s.errors += 1
+            return None
+        s.latencies.append(time.perf_counter() - t0)
+        if "x-db-roundtrips" in r.headers:
+            s.roundtrips.append(int(r.headers["x-db-roundtrips"]))
+        return r
+
+    r = await step("start_mixte", "POST", "/entrainement/start_mixte", params={"user_id": uid, "Volume": n})
+    if r is None:
+        return False
+    eid = r.json()["entrainement_id"]
+    r = await step("generer_mixte", "GET", "/exercices/generer_mixte", params={"user_id": uid, "n": n, "include_solution": True})
+    if r is None:
+        return False
+    answers = [{
+        "Entrainement_Id": eid, "Parcours_Id": e["Parcours_Id"], "Operation": e["Type"],
+        "Operateur_Un": e["Operateur_Un"], "Operateur_Deux": e["Operateur_Deux"],
+        "Proposition": e["Solution"] if rng.random() < 0.85 else e["Solution"] + rng.choice((-2, -1, 1, 2)),
+        "Temps_Seconds": rng.randint(1, 9),
+    } for e in r.json()["exercices"]]
+    if await step("observations", "POST", "/observations", json=answers) is None:
+        return False
+    if await step("positions_currentes", "GET", "/parcours/positions_currentes", params={"user_id": uid}) is None:
+        return False
+    return await step("pixel_state", "GET", "/pixel/state", params={"auth_uid": offline_auth_uid(uid)}) is not None
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+async def run(args) -> Dict[str, Any]:
+    backend = make_backend(args.users, args.db_latency_ms, args.offline_db)
+    app, _print = build_app(backend)
+    rng = random.Random(args.seed)
+    stats: Dict[str, StepStats] = defaultdict(StepStats)
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(args.sessions):
+        queue.put_nowait(rng.randint(1, args.users))
+    completed = 0
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        # chauffe : caches process (catalogue Parcours, JWKS, identités) hors mesure
+        await _session(client, 1, args.n, random.Random(0), defaultdict(StepStats))
+        rt0 = backend.roundtrips
+
+        async def worker(wid: int) -> None:
+            nonlocal completed
+            wrng = random.Random(args.seed * 1000 + wid)
+            while not queue.empty():
+                uid = queue.get_nowait()
+                if await _session(client, uid, args.n, wrng, stats):
+                    completed += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(w) for w in range(args.concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    requests = sum(len(s.latencies) + s.errors for s in stats.values())
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "params": {k: getattr(args, k) for k in ("users", "sessions", "concurrency", "n", "db_latency_ms", "offline_db", "seed")},
+        },
+        "elapsed_s": round(elapsed, 3),
+        "sessions_completed": completed,
+        "sessions_per_s": round(completed / elapsed, 2),
+        "requests_per_s": round(requests / elapsed, 2),
+        "db_roundtrips_total": backend.roundtrips - rt0,
+        "db_roundtrips_per_session": round((backend.roundtrips - rt0) / max(completed, 1), 2),
+        "steps": {name: stats[name].summary() for name in STEPS},
+    }
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Régressions par étape : p95 au-delà de la tolérance, ou allers-retours en hausse."""
+    problems = []
+    for name, ref in (baseline.get("steps") or {}).items():
+        cur = report["steps"].get(name) or {}
+        if not cur.get("count"):
+            problems.append(f"{name}: aucune mesure (erreurs={cur.get('errors')})")
+            continue
+        if ref.get("p95_ms") and cur["p95_ms"] > ref["p95_ms"] * (1 + max_regression):
+            problems.append(f"{name}: p95 {cur['p95_ms']} ms > {ref['p95_ms']} ms × {1 + max_regression:.2f}")
+        if ref.get("roundtrips_max") is not None and (cur.get("roundtrips_max") or 0) > ref["roundtrips_max"]:
+            problems.append(f"{name}: {cur['roundtrips_max']} allers-retours > {ref['roundtrips_max']}")
+        if cur.get("errors", 0) > ref.get("errors", 0):
+            problems.append(f"{name}: {cur['errors']} erreurs (référence {ref.get('errors', 0)})")
+    return problems
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=500, help="utilisateurs générés (tables en mémoire)")
+    ap.add_argument("--sessions", type=int, default=200, help="sessions complètes à jouer")
+    ap.add_argument("--concurrency", type=int, default=10, help="sessions simultanées")
+    ap.add_argument("--n", type=int, default=10, help="exercices par opération (3 × N réponses)")
+    ap.add_argument("--db-latency-ms", type=float, default=5.0, help="latence simulée par aller-retour Supabase")
+    ap.add_argument("--offline-db", default=None, help="base SQLite générée au lieu des tables en mémoire")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--output", default=None, help="fichier JSON de résultats")
+    ap.add_argument("--baseline", default=None, help="résultats de référence à comparer")
+    ap.add_argument("--max-regression", type=float, default=0.20, help="tolérance sur le p95 (0.20 = +20 %%)")
+    args = ap.parse_args()
+
+    report = asyncio.run(run(args))
+    out = sys.__stdout__
+    failures: List[str] = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures = compare(report, json.load(f), args.max_regression)
+        report["regressions"] = failures
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    out.write(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
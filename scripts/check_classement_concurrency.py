@@ -0,0 +1,114 @@
+# scripts/check_classement_concurrency.py
+"""
+Garde-fou : aucun incrément de Classement perdu entre sessions concurrentes.
+
+Contre le backend hors ligne (app/offline, latence simulée), soumet en parallèle
+`--sessions` sessions d'un même utilisateur par le chemin legacy
+(OBSERVATIONS_PIPELINE=legacy), puis compare Classement.score_global et
+users_map.score_base au total attendu : valeur de départ + somme des scores des
+observations insérées (score_global, à défaut Score).
+
+  atomique          increment_classement (migration 016) : doit être exact
+  lecture-écriture  ancien chemin (relecture puis écriture des totaux), pour
+                    mesurer les incréments perdus — informatif, sans échec
+
+Usage :
+  python scripts/check_classement_concurrency.py [--sessions 20] [--db-latency-ms 5]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+from typing import Any, Dict
+
+import httpx
+
+os.environ["OBSERVATIONS_PIPELINE"] = "legacy"
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_test_hot_paths import _token, build_app, make_backend  # noqa: E402
+
+from app.offline.store import Filter, Query  # noqa: E402
+
+
+def _totals(store, uid: int) -> Dict[str, int]:
+    cl, _ = store.select(Query("Classement", [Filter("Users_Id", "eq", uid)], [], 1))
+    um, _ = store.select(Query("users_map", [Filter("user_id", "eq", uid)], [], 1))
+    return {
+        "score_global": int((cl[0] if cl else {}).get("score_global") or 0),
+        "score_base": int((um[0] if um else {}).get("score_base") or 0),
+    }
+
+
+def _session_deltas(store, eids) -> Dict[str, int]:
+    delta = {"score_global": 0, "score_base": 0}
+    for eid in eids:
+        rows, _ = store.select(Query("Observations", [Filter("Entrainement_Id", "eq", eid)], [], None))
+        for r in rows:
+            delta["score_global"] += int(r.get("score_global") or r.get("Score") or 0)
+            delta["score_base"] += int(r.get("Score") or 0)
+    return delta
+
+
+async def _run(app, backend, uid: int, sessions: int, n: int) -> Dict[str, Any]:
+    headers = {"Authorization": f"Bearer {_token(uid)}"}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://api", headers=headers, timeout=300) as client:
+        payloads = []
+        for _ in range(sessions):
+            r = await client.post("/entrainement/start_mixte", params={"user_id": uid, "Volume": n})
+            eid = r.json()["entrainement_id"]
+            r = await client.get("/exercices/generer_mixte", params={"user_id": uid, "n": n, "include_solution": True})
+            payloads.append((eid, [{
+                "Entrainement_Id": eid, "Parcours_Id": e["Parcours_Id"], "Operation": e["Type"],
+                "Operateur_Un": e["Operateur_Un"], "Operateur_Deux": e["Operateur_Deux"],
+                "Proposition": e["Solution"] if random.random() < 0.8 else e["Solution"] + 1,
+                "Temps_Seconds": random.randint(1, 9),
+            } for e in r.json()["exercices"]]))
+
+        before = _totals(backend.store, uid)
+        results = await asyncio.gather(*(client.post("/observations", json=items) for _, items in payloads))
+        after = _totals(backend.store, uid)
+
+    delta = _session_deltas(backend.store, [eid for eid, _ in payloads])
+    lost = {k: before[k] + delta[k] - after[k] for k in before}
+    return {
+        "errors": sum(1 for r in results if r.status_code >= 400),
+        "expected": {k: before[k] + delta[k] for k in before},
+        "actual": after,
+        "lost": lost,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=20, help="sessions soumises en parallèle")
+    ap.add_argument("--n", type=int, default=3, help="exercices par type et par session")
+    ap.add_argument("--db-latency-ms", type=float, default=5.0, help="latence simulée par aller-retour")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    random.seed(args.seed)
+    backend = make_backend(5, args.db_latency_ms)
+    app, _print = build_app(backend)
+    from app.services import submission
+
+    out = sys.__stdout__
+    failed = False
+    for label, uid, missing in (("atomique", 1, False), ("lecture-écriture", 2, True)):
+        submission._increment_missing = missing
+        r = asyncio.run(_run(app, backend, uid, args.sessions, args.n))
+        bad = r["errors"] > 0 or any(r["lost"].values())
+        failed |= bad and not missing
+        flag = ("FAIL" if not missing else "info") if bad else "ok"
+        out.write(f"{flag:4} {label:17} attendu {r['expected']}  obtenu {r['actual']}  "
+                  f"perdu {r['lost']}  erreurs HTTP {r['errors']}\n")
+    submission._increment_missing = False
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# scripts/check_db_roundtrips.py
+"""
+Garde-fou CI : nombre d'allers-retours Supabase par endpoint chaud.
+
+Rejoue une session complète (start_mixte → generer_mixte → observations →
+classement et ses curseurs, puis revalidation ETag de positions_currentes) contre le backend hors ligne (app/offline), lit l'en-tête
+X-DB-Roundtrips (APP_DEBUG=1) de chaque réponse et échoue si un endpoint
+dépasse son budget. Une régression N+1 se voit ici avant la prod.
+
+Usage :
+  python scripts/check_db_roundtrips.py            # code retour 1 si budget dépassé
+  python scripts/check_db_roundtrips.py --json     # sortie JSON
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+from typing import Any, Dict, List
+
+import httpx
+
+os.environ["APP_DEBUG"] = "1"
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_test_hot_paths import _token, build_app, make_backend  # noqa: E402
+
+# budget max d'allers-retours par endpoint (valeurs mesurées : baisser quand on optimise, jamais monter)
+BUDGETS: Dict[str, int] = {
+    "POST /entrainement/start_mixte": 2,
+    "GET /exercices/generer_mixte": 1,
+    "POST /observations": 1,  # submit_observations ; OBSERVATIONS_PIPELINE=legacy : ~34 (historique, 3 évolutions)
+    "POST /observations (rejeu)": 0,  # même Idempotency-Key : réponse du cache du process
+    "GET /classement": 3,
+    "GET /classement (curseur)": 6,  # table : ex aequo après le curseur, position (2 comptes), scores inférieurs, me (2)
+    "GET /classement/around_me": 6,  # table : scores, position (2 comptes), fenêtre, me (2)
+    "GET /classement (mémoire)": 0,  # classement chargé (services/leaderboard.py)
+    "GET /classement/around_me (mémoire)": 0,
+    "GET /parcours/positions_currentes (304)": 1,  # If-None-Match : etag_state seul (migration 020)
+}
+
+
+async def _measure(n: int) -> List[Dict[str, Any]]:
+    random.seed(0)
+    app, _print = build_app(make_backend(5, 0.0))
+    from app.deps import async_service_client
+    from app.services import leaderboard
+
+    uid = 1
+    headers = {"Authorization": f"Bearer {_token(uid)}"}
+    out: List[Dict[str, Any]] = []
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://api", headers=headers, timeout=60) as client:
+        async def call(method: str, path: str, label: str = "", **kw) -> httpx.Response:
+            r = await client.request(method, path, **kw)
+            out.append({
+                "endpoint": f"{method} {path}{label}",
+                "status": r.status_code,
+                "roundtrips": int(r.headers.get("X-DB-Roundtrips", "-1")),
+                "db_ms": float(r.headers.get("X-DB-Time-Ms", "0")),
+            })
+            return r
+
+        # premier passage : caches à froid (catalogue Parcours, identité) — non compté
+        await client.post("/entrainement/start_mixte", params={"user_id": uid, "Volume": n})
+
+        r = await call("POST", "/entrainement/start_mixte", params={"user_id": uid, "Volume": n})
+        eid = r.json()["entrainement_id"]
+        r = await call("GET", "/exercices/generer_mixte", params={"user_id": uid, "n": n, "include_solution": True})
+        items = [{
+            "Entrainement_Id": eid, "Parcours_Id": e["Parcours_Id"], "Operation": e["Type"],
+            "Operateur_Un": e["Operateur_Un"], "Operateur_Deux": e["Operateur_Deux"],
+            "Proposition": e["Solution"] if random.random() < 0.8 else e["Solution"] + 1,
+            "Temps_Seconds": random.randint(1, 9),
+        } for e in r.json()["exercices"]]
+        first = await call("POST", "/observations", json=items, headers={"Idempotency-Key": f"batch-{eid}"})
+        r = await call("POST", "/observations", " (rejeu)", json=items, headers={"Idempotency-Key": f"batch-{eid}"})
+        if r.json().get("ids") != first.json().get("ids") or not r.json().get("replayed"):
+            out.append({"endpoint": "POST /observations (rejeu ≠ réponse d'origine)", "status": 500, "roundtrips": 0, "db_ms": 0.0})
+        await call("GET", "/classement", params={"limit": 50})
+        r = await client.get("/classement", params={"limit": 2})
+        await call("GET", "/classement", " (curseur)", params={"limit": 2, "cursor": r.json()["next_cursor"]})
+        await call("GET", "/classement/around_me", params={"radius": 2})
+        await leaderboard.warm(async_service_client())
+        await call("GET", "/classement", " (mémoire)", params={"limit": 2, "cursor": r.json()["next_cursor"]})
+        await call("GET", "/classement/around_me", " (mémoire)", params={"radius": 2})
+
+        r = await client.get("/parcours/positions_currentes", params={"user_id": uid})
+        r = await call("GET", "/parcours/positions_currentes", " (304)", params={"user_id": uid},
+                       headers={"If-None-Match": r.headers.get("ETag", "")})
+        if r.status_code != 304:
+            out.append({"endpoint": "GET /parcours/positions_currentes (pas de 304)", "status": 500, "roundtrips": 0, "db_ms": 0.0})
+
+        r = await client.get("/metrics")
+        if r.status_code != 200 or "db_queries_total" not in r.text:
+            out.append({"endpoint": "GET /metrics", "status": r.status_code, "roundtrips": 0, "db_ms": 0.0})
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=10, help="exercices par type")
+    ap.add_argument("--json", action="store_true", help="sortie JSON")
+    args = ap.parse_args()
+
+    results = asyncio.run(_measure(args.n))
+    failures = []
+    for r in results:
+        budget = BUDGETS.get(r["endpoint"])
+        r["budget"] = budget
+        if r["status"] >= 400 or r["roundtrips"] < 0 or (budget is not None and r["roundtrips"] > budget):
+            failures.append(r)
+
+    out = sys.__stdout__
+    if args.json:
+        out.write(json.dumps({"results": results, "failures": failures}, indent=2, ensure_ascii=False) + "\n")
+    else:
+        for r in results:
+            flag = "FAIL" if r in failures else "ok"
+            out.write(f"{flag:4} {r['endpoint']:36} {r['roundtrips']:>3} / {r['budget']}  ({r['db_ms']} ms, HTTP {r['status']})\n")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# scripts/check_scoring_golden.py
+"""
+Test de référence du moteur de scoring (app/services/scoring.py).
+
+Rejoue un jeu de cas déterministe (graine fixe : historiques aléatoires, écarts
+nuls, moyennes nulles, valeurs pile sur les bornes ±1σ, historique < 5, sans
+FAUX…) et compare chaque résultat aux valeurs attendues de
+scripts/golden/scoring.json. Ces valeurs ont été produites par les deux
+implémentations d'origine, avant unification :
+  session  submission.scoring_payloads (boucle Python, +2/-1/-3),
+           reproduite par submit_observations (SQL)
+  new      scoring.calculate_final_score (NumPy par observation, +3/+0.8)
+Le moteur doit les reproduire à l'identique, par lot (score_batch et
+scoring_payloads) comme à l'unité (calculate_final_score).
+
+Usage :
+  python scripts/check_scoring_golden.py            # code retour 1 au premier écart
+  python scripts/check_scoring_golden.py --update   # réécrit la référence (changement de règle voulu)
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.services.scoring import RULES_NEW, RULES_SESSION, calculate_final_score, score_batch, stats_columns  # noqa: E402
+from app.services.scoring_stats import WINDOW, RollingWindow  # noqa: E402
+from app.services.submission import scoring_payloads  # noqa: E402
+
+GOLDEN = os.path.join(ROOT, "scripts", "golden", "scoring.json")
+SEED = 20261016
+COUNT = 600
+
+
+def _history(rng: random.Random, kind: int) -> List[Dict[str, Any]]:
+    size = rng.choice((0, 1, 3, 4, 5, 6, 9, 20, 50, 57))
+    hist = []
+    for i in range(size):
+        etat = "VRAI" if rng.random() < 0.6 else "FAUX"
+        if kind == 0:    # aléatoire
+            t, m = rng.randint(1, 30), rng.randint(0, 20)
+        elif kind == 1:  # temps constant (σ = 0)
+            t, m = 7, rng.randint(0, 5)
+        elif kind == 2:  # moyennes nulles
+            t, m = 0, 0
+        elif kind == 3:  # deux valeurs : bornes ±1σ entières
+            t, m = (2, 6)[i % 2], (1, 3)[i % 2]
+        elif kind == 4:  # valeurs absentes
+            t = None if rng.random() < 0.4 else rng.randint(1, 9)
+            m = None if rng.random() < 0.4 else rng.randint(0, 9)
+        elif kind == 5:  # aucun FAUX
+            etat, t, m = "VRAI", rng.randint(1, 12), rng.randint(0, 4)
+        else:            # petites variations
+            t, m = rng.choice((3, 4, 5)), rng.choice((0, 1, 2))
+        hist.append({"id": i + 1, "Temps_Seconds": t, "Marge_Erreur": m, "Etat": etat})
+    return hist
+
+
+def make_cases(seed: int = SEED, count: int = COUNT) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    cases = []
+    for n in range(count):
+        kind = n % 7
+        hist = _history(rng, kind)
+        pool = [h[c] for h in hist for c in ("Temps_Seconds", "Marge_Erreur") if h[c] is not None]
+        etat = "VRAI" if rng.random() < 0.5 else "FAUX"
+        temps = rng.choice(pool + [0, 1, 4, 6, 15, 40]) if rng.random() < 0.7 else rng.randint(0, 40)
+        marge = rng.choice(pool + [0, 1, 2, 3, 10]) if etat == "FAUX" else 0
+        cases.append({
+            "history": hist,
+            "etat": etat,
+            "temps": temps,
+            "marge": marge,
+            "score": rng.choice((None, None, 1, -1, 0, 2)),
+        })
+    return cases
+
+
+def _stats(case: Dict[str, Any]):
+    w = RollingWindow(0, None, None)
+    for h in case["history"]:
+        w.push(h)
+    return w.stats()
+
+
+def compute(cases: List[Dict[str, Any]]) -> Dict[str, List[List[Any]]]:
+    """Résultats du moteur : [bonus_vitesse, bonus_marge, score_global] (+ Score pour new)."""
+    stats = [_stats(c) for c in cases]
+    cols = dict(
+        etat=[c["etat"] for c in cases],
+        temps=[float(c["temps"]) for c in cases],
+        marge=[float(c["marge"]) for c in cases],
+        score=[c["score"] or 0 for c in cases],
+        **stats_columns(stats),
+    )
+    session = score_batch(**cols, rules=RULES_SESSION)
+    new = score_batch(**cols, rules=RULES_NEW)
+    return {
+        "session": [[float(session["bonus_vitesse"][i]), float(session["bonus_marge"][i]), int(session["score_global"][i])]
+                    for i in range(len(cases))],
+        "new": [[int(new["Score"][i]), float(new["bonus_vitesse"][i]), float(new["bonus_marge"][i]), int(new["score_global"][i])]
+                for i in range(len(cases))],
+    }
+
+
+def _entry_points(cases: List[Dict[str, Any]]) -> Dict[str, List[List[Any]]]:
+    """Mêmes cas via les points d'entrée : scoring_payloads (lot) et calculate_final_score (unité)."""
+    current = [{"id": i, "Parcours_Id": i, "Operation": "Addition", "Etat": c["etat"], "Temps_Seconds": c["temps"],
+                "Marge_Erreur": c["marge"], "Score": c["score"]} for i, c in enumerate(cases)]
+    payloads = scoring_payloads(current, {(i, "Addition"): _stats(c) for i, c in enumerate(cases)}, rules=RULES_SESSION)
+    finals = [calculate_final_score(c["etat"], float(c["temps"]), float(c["marge"]), c["history"][-WINDOW:]) for c in cases]
+    return {
+        "session": [[p["bonus_vitesse"], p["bonus_marge"], p["score_global"]] for p in payloads],
+        "new": [[f["Score"], f["bonus_vitesse"], f["bonus_marge"], f["score_global"]] for f in finals],
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--update", action="store_true", help="réécrit la référence avec le moteur actuel")
+    args = ap.parse_args()
+
+    cases = make_cases()
+    got = compute(cases)
+    if args.update:
+        os.makedirs(os.path.dirname(GOLDEN), exist_ok=True)
+        with open(GOLDEN, "w", encoding="utf-8") as f:
+            json.dump({"seed": SEED, "count": COUNT, **got}, f, separators=(",", ":"))
+            f.write("\n")
+        print(f"référence réécrite : {GOLDEN} ({COUNT} cas)")
+        return
+
+    with open(GOLDEN, encoding="utf-8") as f:
+        golden = json.load(f)
+    failures = 0
+    for source, results in (("score_batch", got), ("points d'entrée", _entry_points(cases))):
+        for rules in ("session", "new"):
+            for i, (exp, res) in enumerate(zip(golden[rules], results[rules])):
+                if exp != res:
+                    failures += 1
+                    if failures <= 10:
+                        c = cases[i]
+                        print(f"ÉCART {source} {rules} cas {i} : attendu {exp}, obtenu {res} "
+                              f"(etat={c['etat']} temps={c['temps']} marge={c['marge']} historique={len(c['history'])})")
+    total = 2 * 2 * len(cases)
+    print(f"{'ok' if not failures else 'ÉCHEC'}  {total - failures}/{total} résultats conformes à la référence")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
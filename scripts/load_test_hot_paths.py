@@ -0,0 +1,144 @@
+# scripts/load_test_hot_paths.py
+"""
+Test de charge des endpoints chauds sur UN worker (une boucle d'événements +
+le threadpool par défaut d'anyio, comme un worker uvicorn).
+
+Chaque utilisateur virtuel enchaîne une session complète :
+  POST /entrainement/start_mixte → GET /exercices/generer_mixte
+  → POST /observations → GET /classement
+L'app tourne en mémoire (httpx.ASGITransport) et Supabase est remplacé par le
+backend hors ligne (app/offline) branché sur les transports de la fabrique,
+avec une latence simulée par aller-retour (--db-latency-ms). Aucune donnée réelle.
+
+Usage :
+  python scripts/load_test_hot_paths.py --users 200 --duration 20 --db-latency-ms 20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.offline import MemoryStore, OfflinePostgrest, offline_factory, offline_token, open_store  # noqa: E402
+from app.offline.generate import generate  # noqa: E402
+
+JWT_SECRET = "load-test-jwt-secret"
+OBS_PER_USER = 60
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Charge
+# ────────────────────────────────────────────────────────────────────────────────
+def _token(uid: int) -> str:
+    return offline_token(uid)
+
+
+def make_backend(users: int, latency_ms: float, db: Optional[str] = None) -> OfflinePostgrest:
+    """Backend hors ligne : fichier SQLite existant (--offline-db) ou tables en mémoire générées."""
+    store = open_store(db or ":memory:")
+    if isinstance(store, MemoryStore):
+        generate(store, users=users, observations=users * OBS_PER_USER)
+    return OfflinePostgrest(store, latency=latency_ms / 1000.0)
+
+
+def build_app(backend: OfflinePostgrest):
+    os.environ["SUPABASE_BACKEND"] = "offline"
+    os.environ["SUPABASE_JWT_SECRET"] = JWT_SECRET  # vérification locale des tokens de test
+    from app import supabase_pool
+
+    supabase_pool._factory = offline_factory(backend)
+
+    import builtins
+    _print = builtins.print
+    builtins.print = lambda *a, **k: None  # les routers loggent via print
+    from app.main import app
+    import logging
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return app, _print
+
+
+async def _session(client: httpx.AsyncClient, uid: int, n: int, lat: Dict[str, List[float]]) -> None:
+    headers = {"Authorization": f"Bearer {_token(uid)}"}
+
+    async def call(name: str, method: str, url: str, **kw) -> Optional[httpx.Response]:
+        t0 = time.perf_counter()
+        r = await client.request(method, url, headers=headers, **kw)
+        lat[name].append(time.perf_counter() - t0)
+        if r.status_code >= 400:
+            lat[f"{name} (erreurs)"].append(0.0)
+            return None
+        return r
+
+    r = await call("start_mixte", "POST", "/entrainement/start_mixte", params={"user_id": uid, "Volume": n})
+    if r is None:
+        return
+    eid = r.json()["entrainement_id"]
+    r = await call("generer_mixte", "GET", "/exercices/generer_mixte", params={"user_id": uid, "n": n, "include_solution": True})
+    if r is None:
+        return
+    items = [{
+        "Entrainement_Id": eid, "Parcours_Id": e["Parcours_Id"], "Operation": e["Type"],
+        "Operateur_Un": e["Operateur_Un"], "Operateur_Deux": e["Operateur_Deux"],
+        "Proposition": e["Solution"] if random.random() < 0.8 else e["Solution"] + 1,
+        "Temps_Seconds": random.randint(1, 9),
+    } for e in r.json()["exercices"]]
+    await call("observations", "POST", "/observations", json=items)
+    await call("classement", "GET", "/classement", params={"limit": 50})
+
+
+async def run(args) -> Dict[str, Any]:
+    backend = make_backend(args.users, args.db_latency_ms, args.offline_db)
+    app, _print = build_app(backend)
+
+    lat: Dict[str, List[float]] = defaultdict(list)
+    deadline = time.perf_counter() + args.duration
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://api", timeout=300) as client:
+        async def vu(uid: int):
+            while time.perf_counter() < deadline:
+                await _session(client, uid, args.n, lat)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(vu(uid) for uid in range(1, args.users + 1)))
+        elapsed = time.perf_counter() - t0
+
+    total = sum(len(v) for k, v in lat.items() if not k.endswith("(erreurs)"))
+    report = {
+        "users": args.users, "duration_s": round(elapsed, 2), "db_latency_ms": args.db_latency_ms,
+        "requests": total, "rps": round(total / elapsed, 1), "db_roundtrips": backend.roundtrips,
+        "endpoints": {
+            k: ({"count": len(v)} if k.endswith("(erreurs)") else {
+                "count": len(v),
+                "p50_ms": round(statistics.median(v) * 1000, 1),
+                "p95_ms": round(sorted(v)[int(0.95 * (len(v) - 1))] * 1000, 1),
+            }) for k, v in sorted(lat.items()) if v
+        },
+    }
+    _print(json.dumps(report, indent=2, ensure_ascii=False))
+    return report
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=200, help="utilisateurs virtuels simultanés")
+    ap.add_argument("--duration", type=float, default=20.0, help="durée en secondes")
+    ap.add_argument("--db-latency-ms", type=float, default=20.0, help="latence simulée par aller-retour Supabase")
+    ap.add_argument("--n", type=int, default=10, help="exercices par type et par session")
+    ap.add_argument("--offline-db", default=None, help="base SQLite générée (app.cli.generate_offline_data) au lieu des tables en mémoire")
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
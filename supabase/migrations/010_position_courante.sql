@@ -0,0 +1,78 @@
+-- ============================================
+-- MIGRATION: Position courante par utilisateur et operation
+-- Date: 2026-10-16
+-- Description: Vue materialisee de la derniere ligne Suivi_Parcours par
+--              (Users_Id, Type_Operation). Mise a jour par le backend dans le
+--              meme chemin d'ecriture que Suivi_Parcours (position_store.append_suivi).
+--              Reconstruction : python -m app.cli.backfill_positions
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS "Position_Courante" (
+    "Users_Id" bigint NOT NULL,
+    "Type_Operation" text NOT NULL CHECK ("Type_Operation" IN ('Addition', 'Soustraction', 'Multiplication')),
+    "Parcours_Id" bigint NOT NULL,
+    "Niveau" int,
+    "Suivi_Id" bigint,
+    "Derniere_Observation_Id" bigint,
+    "Taux_Reussite" float,
+    "Type_Evolution" text,
+    "Date" date,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY ("Users_Id", "Type_Operation")
+);
+
+COMMENT ON TABLE "Position_Courante" IS 'Derniere position (Suivi_Parcours) par utilisateur et type d operation';
+COMMENT ON COLUMN "Position_Courante"."Suivi_Id" IS 'id de la ligne Suivi_Parcours source';
+
+-- Index utilise par le backfill et le fallback historique
+CREATE INDEX IF NOT EXISTS idx_suivi_parcours_users_id_desc
+ON "Suivi_Parcours" ("Users_Id", id DESC);
+
+-- ============================================
+-- POLICIES RLS
+-- ============================================
+
+ALTER TABLE "Position_Courante" ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "position_courante_select_own" ON "Position_Courante";
+CREATE POLICY "position_courante_select_own" ON "Position_Courante"
+    FOR SELECT
+    TO authenticated
+    USING (
+        EXISTS (
+            SELECT 1 FROM users_map
+            WHERE auth_uid = auth.uid()
+            AND user_id = "Position_Courante"."Users_Id"
+        )
+    );
+
+DROP POLICY IF EXISTS "position_courante_insert_own" ON "Position_Courante";
+CREATE POLICY "position_courante_insert_own" ON "Position_Courante"
+    FOR INSERT
+    TO authenticated
+    WITH CHECK (
+        EXISTS (
+            SELECT 1 FROM users_map
+            WHERE auth_uid = auth.uid()
+            AND user_id = "Position_Courante"."Users_Id"
+        )
+    );
+
+DROP POLICY IF EXISTS "position_courante_update_own" ON "Position_Courante";
+CREATE POLICY "position_courante_update_own" ON "Position_Courante"
+    FOR UPDATE
+    TO authenticated
+    USING (
+        EXISTS (
+            SELECT 1 FROM users_map
+            WHERE auth_uid = auth.uid()
+            AND user_id = "Position_Courante"."Users_Id"
+        )
+    )
+    WITH CHECK (
+        EXISTS (
+            SELECT 1 FROM users_map
+            WHERE auth_uid = auth.uid()
+            AND user_id = "Position_Courante"."Users_Id"
+        )
+    );
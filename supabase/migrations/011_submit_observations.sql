@@ -0,0 +1,377 @@
+-- ============================================
+-- MIGRATION: Soumission d'observations en un seul appel
+-- Date: 2026-10-16
+-- Description: submit_observations(p_entrainement_id, p_rows) traite une session
+--              complete dans une transaction : insertion des observations,
+--              scoring (bonus_vitesse / bonus_marge / score_global), Classement,
+--              users_map, evolutions de niveau (Suivi_Parcours + Position_Courante).
+--              Un aller-retour par POST /observations, quelle que soit la taille
+--              du lot. Regles identiques au chemin Python historique
+--              (app/services/submission.py, EvolutionService), conserve derriere
+--              OBSERVATIONS_PIPELINE=legacy.
+-- ============================================
+
+-- Index utilises par la fonction (historique de scoring, fenetres d'evolution)
+CREATE INDEX IF NOT EXISTS idx_entrainement_users_id_desc
+ON "Entrainement" ("Users_Id", id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_observations_entrainement_id
+ON "Observations" ("Entrainement_Id", id);
+
+-- ============================================
+-- 1. Ecriture Suivi_Parcours + Position_Courante (equivalent position_store.append_suivi)
+-- ============================================
+
+CREATE OR REPLACE FUNCTION append_suivi_position(
+    p_user_id bigint,
+    p_parcours_id bigint,
+    p_type_evolution text,
+    p_taux float8,
+    p_derniere_observation_id bigint
+)
+RETURNS "Suivi_Parcours"
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_suivi "Suivi_Parcours";
+BEGIN
+    INSERT INTO "Suivi_Parcours" ("Users_Id", "Parcours_Id", "Date", "Type_Evolution", "Taux_Reussite", "Derniere_Observation_Id")
+    VALUES (p_user_id, p_parcours_id, current_date, p_type_evolution, p_taux, p_derniere_observation_id)
+    RETURNING * INTO v_suivi;
+
+    INSERT INTO "Position_Courante" ("Users_Id", "Type_Operation", "Parcours_Id", "Niveau", "Suivi_Id",
+                                     "Derniere_Observation_Id", "Taux_Reussite", "Type_Evolution", "Date", updated_at)
+    SELECT p_user_id, p."Type_Operation", p.id, p."Niveau", v_suivi.id,
+           p_derniere_observation_id, p_taux, p_type_evolution, current_date, now()
+    FROM "Parcours" p
+    WHERE p.id = p_parcours_id
+    ON CONFLICT ("Users_Id", "Type_Operation") DO UPDATE SET
+        "Parcours_Id" = EXCLUDED."Parcours_Id",
+        "Niveau" = EXCLUDED."Niveau",
+        "Suivi_Id" = EXCLUDED."Suivi_Id",
+        "Derniere_Observation_Id" = EXCLUDED."Derniere_Observation_Id",
+        "Taux_Reussite" = EXCLUDED."Taux_Reussite",
+        "Type_Evolution" = EXCLUDED."Type_Evolution",
+        "Date" = EXCLUDED."Date",
+        updated_at = now();
+
+    RETURN v_suivi;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION append_suivi_position(bigint, bigint, text, float8, bigint) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION append_suivi_position(bigint, bigint, text, float8, bigint) TO service_role;
+
+-- ============================================
+-- 2. submit_observations
+-- ============================================
+
+CREATE OR REPLACE FUNCTION submit_observations(p_entrainement_id bigint, p_rows jsonb)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_user_id bigint;
+    v_volume int;
+    v_ids bigint[];
+    v_monday date := date_trunc('week', current_date)::date;
+    v_delta_classement int;
+    v_delta_base int;
+    v_op text;
+    v_parcours_id bigint;
+    v_niveau int;
+    v_critere int;
+    v_last_obs bigint;
+    v_total int;
+    v_corrects int;
+    v_last_id bigint;
+    v_pct float8;
+    v_prev_id bigint;
+    v_prev_niveau int;
+    v_next_id bigint;
+    v_next_niveau int;
+    v_to_id bigint;
+    v_to_niveau int;
+    v_decision text;
+    v_suivi "Suivi_Parcours";
+    v_evolutions jsonb := '[]'::jsonb;
+    v_positions jsonb;
+BEGIN
+    -- Verrou sur l'entrainement : deux soumissions concurrentes se serialisent
+    SELECT "Users_Id", "Volume" INTO v_user_id, v_volume
+    FROM "Entrainement"
+    WHERE id = p_entrainement_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    IF coalesce(auth.role(), '') <> 'service_role' AND NOT EXISTS (
+        SELECT 1 FROM users_map
+        WHERE user_id = v_user_id
+        AND auth_uid::text = auth.uid()::text
+    ) THEN
+        RAISE EXCEPTION 'Entrainement % non autorise', p_entrainement_id USING ERRCODE = '42501';
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM "Observations" WHERE "Entrainement_Id" = p_entrainement_id) THEN
+        RETURN jsonb_build_object('status', 'already_processed');
+    END IF;
+
+    -- ---------- Insertion (troncature au Volume attendu) ----------
+    -- Les triggers existants calculent Solution / Etat / Score / Marge_Erreur
+    WITH ins AS (
+        INSERT INTO "Observations" ("Entrainement_Id", "Parcours_Id", "Operateur_Un", "Operateur_Deux",
+                                    "Operation", "Proposition", "Correction", "Temps_Seconds")
+        SELECT p_entrainement_id,
+               (r->>'Parcours_Id')::bigint,
+               (r->>'Operateur_Un')::int,
+               (r->>'Operateur_Deux')::int,
+               r->>'Operation',
+               (r->>'Proposition')::int,
+               coalesce(r->>'Correction', 'NON'),
+               coalesce((r->>'Temps_Seconds')::int, 0)
+        FROM jsonb_array_elements(p_rows) WITH ORDINALITY AS t(r, n)
+        WHERE v_volume IS NULL OR t.n <= v_volume
+        ORDER BY t.n
+        RETURNING id
+    )
+    SELECT coalesce(array_agg(id ORDER BY id), '{}') INTO v_ids FROM ins;
+
+    IF v_user_id IS NULL THEN
+        RETURN jsonb_build_object('status', 'ok', 'user_id', NULL, 'ids', to_jsonb(v_ids),
+                                  'evolutions', '[]'::jsonb, 'positions', '{}'::jsonb);
+    END IF;
+
+    -- ---------- Scoring (regles de submission.scoring_payloads) ----------
+    -- Historique : 2000 dernieres observations des 200 derniers entrainements,
+    -- 50 plus recentes par (Parcours_Id, Operation), hors session courante.
+    WITH recent AS (
+        SELECT id FROM "Entrainement"
+        WHERE "Users_Id" = v_user_id
+        ORDER BY id DESC
+        LIMIT 200
+    ), pool AS (
+        SELECT o.id, o."Parcours_Id", o."Operation", o."Temps_Seconds", o."Marge_Erreur", o."Etat"
+        FROM "Observations" o
+        WHERE o."Entrainement_Id" IN (SELECT id FROM recent)
+        ORDER BY o.id DESC
+        LIMIT 2000
+    ), hist AS (
+        SELECT p.*, row_number() OVER (PARTITION BY p."Parcours_Id", p."Operation" ORDER BY p.id DESC) AS rn
+        FROM pool p
+        WHERE p.id <> ALL (v_ids)
+    ), stats AS (
+        SELECT "Parcours_Id", "Operation",
+               count(*) AS n,
+               avg("Temps_Seconds")::float8 AS mean_t,
+               coalesce(stddev_pop("Temps_Seconds"), 0)::float8 AS std_t,
+               (avg("Marge_Erreur") FILTER (WHERE "Etat" = 'FAUX'))::float8 AS mean_m,
+               coalesce(stddev_pop("Marge_Erreur") FILTER (WHERE "Etat" = 'FAUX'), 0)::float8 AS std_m
+        FROM hist
+        WHERE rn <= 50
+        GROUP BY "Parcours_Id", "Operation"
+    ), cur AS (
+        SELECT o.id,
+               trim(coalesce(o."Etat", '')) AS etat,
+               coalesce(nullif(o."Score", 0), CASE WHEN trim(coalesce(o."Etat", '')) = 'VRAI' THEN 1 ELSE -1 END) AS score_base,
+               coalesce(o."Temps_Seconds", 0)::float8 AS temps,
+               coalesce(o."Marge_Erreur", 0)::float8 AS marge,
+               coalesce(s.n, 0) AS n, s.mean_t, s.std_t, s.mean_m, s.std_m
+        FROM "Observations" o
+        LEFT JOIN stats s
+          ON s."Parcours_Id" IS NOT DISTINCT FROM o."Parcours_Id"
+         AND s."Operation" IS NOT DISTINCT FROM o."Operation"
+        WHERE o.id = ANY (v_ids)
+    ), bonus AS (
+        SELECT id, score_base, n,
+               (CASE
+                    WHEN n < 5 THEN 0
+                    WHEN std_t = 0 OR coalesce(mean_t, 0) = 0 THEN CASE WHEN etat = 'VRAI' THEN 0 ELSE -2 END
+                    WHEN etat = 'VRAI' THEN
+                        CASE WHEN temps < mean_t - std_t THEN 2 WHEN temps > mean_t + std_t THEN -1 ELSE 0 END
+                    ELSE
+                        CASE WHEN temps BETWEEN mean_t - std_t AND mean_t + std_t THEN -2 ELSE -3 END
+                END)::float8 AS bv,
+               (CASE
+                    WHEN n < 5 OR etat = 'VRAI' THEN 0
+                    WHEN std_m = 0 OR coalesce(mean_m, 0) = 0 THEN -1
+                    WHEN marge < mean_m - std_m THEN 0
+                    WHEN marge > mean_m + std_m THEN -2
+                    ELSE -1
+                END)::float8 AS bm
+        FROM cur
+    )
+    UPDATE "Observations" o
+    SET bonus_vitesse = b.bv,
+        bonus_marge = b.bm,
+        score_global = CASE WHEN b.n < 5 THEN b.score_base ELSE floor(b.score_base + b.bv + b.bm)::int END
+    FROM bonus b
+    WHERE o.id = b.id;
+
+    -- ---------- Classement + users_map (regles de submission.classement_payloads) ----------
+    SELECT coalesce(sum(coalesce(nullif(score_global, 0), nullif("Score", 0), 0)), 0),
+           coalesce(sum(coalesce("Score", 0)), 0)
+    INTO v_delta_classement, v_delta_base
+    FROM "Observations"
+    WHERE "Entrainement_Id" = p_entrainement_id;
+
+    INSERT INTO "Classement" ("Users_Id", score_global, score_week, week_start)
+    VALUES (v_user_id, v_delta_classement, v_delta_classement, v_monday)
+    ON CONFLICT ("Users_Id") DO UPDATE SET
+        score_global = coalesce("Classement".score_global, 0) + EXCLUDED.score_global,
+        score_week = CASE
+            WHEN "Classement".week_start IS NULL OR "Classement".week_start < v_monday THEN EXCLUDED.score_week
+            ELSE coalesce("Classement".score_week, 0) + EXCLUDED.score_week
+        END,
+        week_start = v_monday;
+
+    UPDATE users_map
+    SET score_base = coalesce(score_base, 0) + v_delta_base,
+        last_training_date = current_date
+    WHERE user_id = v_user_id;
+
+    -- ---------- Evolutions (regles de EvolutionService.evaluate_and_record_if_needed) ----------
+    FOR v_op IN
+        SELECT t.op
+        FROM unnest(ARRAY['Addition', 'Soustraction', 'Multiplication']) WITH ORDINALITY AS t(op, n)
+        WHERE EXISTS (
+            SELECT 1 FROM "Observations"
+            WHERE id = ANY (v_ids) AND lower(trim("Operation")) = lower(t.op)
+        )
+        ORDER BY t.n
+    LOOP
+        -- Position courante, sinon dernier suivi (utilisateur pas encore backfille)
+        SELECT pc."Parcours_Id", pc."Derniere_Observation_Id"
+        INTO v_parcours_id, v_last_obs
+        FROM "Position_Courante" pc
+        WHERE pc."Users_Id" = v_user_id AND pc."Type_Operation" = v_op;
+
+        IF NOT FOUND THEN
+            SELECT s."Parcours_Id", s."Derniere_Observation_Id"
+            INTO v_parcours_id, v_last_obs
+            FROM "Suivi_Parcours" s
+            JOIN "Parcours" p ON p.id = s."Parcours_Id"
+            WHERE s."Users_Id" = v_user_id AND p."Type_Operation" = v_op
+            ORDER BY s.id DESC
+            LIMIT 1;
+        END IF;
+
+        IF NOT FOUND THEN
+            -- Auto-initialisation au premier niveau du type
+            SELECT id INTO v_parcours_id
+            FROM "Parcours"
+            WHERE "Type_Operation" = v_op
+            ORDER BY "Niveau"
+            LIMIT 1;
+            IF NOT FOUND THEN
+                CONTINUE;
+            END IF;
+            v_last_obs := NULL;
+            PERFORM append_suivi_position(v_user_id, v_parcours_id, 'initialisation', 0.0, NULL);
+        END IF;
+
+        SELECT "Niveau", coalesce("Critere", 0) INTO v_niveau, v_critere
+        FROM "Parcours" WHERE id = v_parcours_id;
+
+        -- Fenetre : observations de l'operation depuis le dernier suivi
+        SELECT count(*), count(*) FILTER (WHERE o."Etat" = 'VRAI'), max(o.id)
+        INTO v_total, v_corrects, v_last_id
+        FROM "Observations" o
+        WHERE o."Entrainement_Id" IN (
+                SELECT id FROM "Entrainement"
+                WHERE "Users_Id" = v_user_id
+                ORDER BY id DESC
+                LIMIT 200
+            )
+          AND o."Operation" = v_op
+          AND (coalesce(v_last_obs, 0) = 0 OR o.id > v_last_obs);
+
+        IF v_critere <= 0 OR v_total < v_critere THEN
+            CONTINUE;
+        END IF;
+
+        v_pct := v_corrects::float8 / v_total;
+
+        SELECT id, "Niveau" INTO v_prev_id, v_prev_niveau
+        FROM "Parcours"
+        WHERE "Type_Operation" = v_op AND "Niveau" < v_niveau
+        ORDER BY "Niveau" DESC
+        LIMIT 1;
+
+        SELECT id, "Niveau" INTO v_next_id, v_next_niveau
+        FROM "Parcours"
+        WHERE "Type_Operation" = v_op AND "Niveau" > v_niveau
+        ORDER BY "Niveau"
+        LIMIT 1;
+
+        IF v_pct > 0.90 AND v_next_id IS NOT NULL THEN
+            v_decision := 'progression';
+            v_to_id := v_next_id;
+            v_to_niveau := v_next_niveau;
+        ELSIF v_pct < 0.5 AND v_prev_id IS NOT NULL THEN
+            v_decision := 'régression';
+            v_to_id := v_prev_id;
+            v_to_niveau := v_prev_niveau;
+        ELSE
+            v_decision := 'stagnation';
+            v_to_id := v_parcours_id;
+            v_to_niveau := v_niveau;
+        END IF;
+
+        v_suivi := append_suivi_position(
+            v_user_id, v_to_id, v_decision, round(v_pct::numeric, 4)::float8, coalesce(v_last_id, v_last_obs, 0)
+        );
+
+        v_evolutions := v_evolutions || jsonb_build_array(jsonb_build_object(
+            'suivi', to_jsonb(v_suivi),
+            'operation', lower(v_op),
+            'from', jsonb_build_object('parcours_id', v_parcours_id, 'niveau', v_niveau),
+            'to', jsonb_build_object('parcours_id', v_to_id, 'niveau', v_to_niveau),
+            'type', v_decision,
+            'taux_reussite', round(v_pct::numeric, 4),
+            'window', jsonb_build_object(
+                'total', v_total,
+                'corrects', v_corrects,
+                'last_id_included', coalesce(v_last_id, v_last_obs, 0)
+            )
+        ));
+    END LOOP;
+
+    -- ---------- Positions des trois operations (equivalent positions_for_user) ----------
+    SELECT jsonb_object_agg(lower(t.op), jsonb_build_object(
+               'parcours_id', p.id, 'niveau', p."Niveau", 'critere', p."Critere"))
+    INTO v_positions
+    FROM unnest(ARRAY['Addition', 'Soustraction', 'Multiplication']) AS t(op)
+    JOIN "Parcours" p ON p.id = coalesce(
+        (SELECT pc."Parcours_Id" FROM "Position_Courante" pc
+         WHERE pc."Users_Id" = v_user_id AND pc."Type_Operation" = t.op),
+        (SELECT s."Parcours_Id" FROM "Suivi_Parcours" s
+         JOIN "Parcours" sp ON sp.id = s."Parcours_Id"
+         WHERE s."Users_Id" = v_user_id AND sp."Type_Operation" = t.op
+         ORDER BY s.id DESC LIMIT 1),
+        (SELECT fp.id FROM "Parcours" fp
+         WHERE fp."Type_Operation" = t.op
+         ORDER BY fp."Niveau" LIMIT 1)
+    );
+
+    RETURN jsonb_build_object(
+        'status', 'ok',
+        'user_id', v_user_id,
+        'ids', to_jsonb(v_ids),
+        'evolutions', v_evolutions,
+        'positions', coalesce(v_positions, '{}'::jsonb)
+    );
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION submit_observations(bigint, jsonb) TO authenticated;
+
+-- ============================================
+-- FIN DE LA MIGRATION
+-- ============================================
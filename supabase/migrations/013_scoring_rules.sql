@@ -0,0 +1,443 @@
+-- ============================================
+-- MIGRATION: Regles de scoring selectionnables
+-- Date: 2026-10-16
+-- Description: Le scoring de submit_observations suit la regle choisie par le
+--              backend (USE_NEW_SCORING, app/services/scoring.py) :
+--                'session' (defaut) : bonus +2/0/-1 (VRAI), -2/-3 (FAUX),
+--                                     score_global = floor(Score + bonus)
+--                'new'              : score vitesse +3/+1/+0.8 (VRAI), -1/-2 (FAUX),
+--                                     score_global = arrondi(vitesse + marge)
+--              Le scoring et la maintenance des fenetres Stats_Scoring sortent
+--              de submit_observations en fonctions dediees ; submit_observations
+--              prend un troisieme parametre p_rules (defaut 'session').
+--              Valeurs de reference : python scripts/check_scoring_golden.py
+-- ============================================
+
+-- ============================================
+-- 1. Fenetres des cles du lot : amorcage des cles absentes (migration 012)
+-- ============================================
+
+CREATE OR REPLACE FUNCTION stats_scoring_prepare(p_user_id bigint, p_ids bigint[])
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_key record;
+    v_stat "Stats_Scoring";
+BEGIN
+    FOR v_key IN
+        SELECT DISTINCT o."Parcours_Id" AS parcours_id, o."Operation" AS operation
+        FROM "Observations" o
+        WHERE o.id = ANY (p_ids) AND o."Parcours_Id" IS NOT NULL AND o."Operation" IS NOT NULL
+    LOOP
+        PERFORM 1 FROM "Stats_Scoring"
+        WHERE "Users_Id" = p_user_id AND "Parcours_Id" = v_key.parcours_id AND "Operation" = v_key.operation
+        FOR UPDATE;
+        IF NOT FOUND THEN
+            v_stat := stats_scoring_seed(p_user_id, v_key.parcours_id, v_key.operation, p_ids);
+            INSERT INTO "Stats_Scoring" SELECT (v_stat).*
+            ON CONFLICT ("Users_Id", "Parcours_Id", "Operation") DO NOTHING;
+        END IF;
+    END LOOP;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION stats_scoring_prepare(bigint, bigint[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION stats_scoring_prepare(bigint, bigint[]) TO service_role;
+
+-- ============================================
+-- 2. Ingestion des observations du lot dans les fenetres
+-- ============================================
+
+CREATE OR REPLACE FUNCTION stats_scoring_ingest(p_user_id bigint, p_ids bigint[])
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_key record;
+    v_obs record;
+    v_stat "Stats_Scoring";
+BEGIN
+    FOR v_key IN
+        SELECT DISTINCT o."Parcours_Id" AS parcours_id, o."Operation" AS operation
+        FROM "Observations" o
+        WHERE o.id = ANY (p_ids) AND o."Parcours_Id" IS NOT NULL AND o."Operation" IS NOT NULL
+    LOOP
+        SELECT * INTO v_stat FROM "Stats_Scoring"
+        WHERE "Users_Id" = p_user_id AND "Parcours_Id" = v_key.parcours_id AND "Operation" = v_key.operation
+        FOR UPDATE;
+        IF NOT FOUND THEN
+            CONTINUE;
+        END IF;
+
+        FOR v_obs IN
+            SELECT o.id, o."Temps_Seconds", o."Etat", o."Marge_Erreur"
+            FROM "Observations" o
+            WHERE o.id = ANY (p_ids) AND o."Parcours_Id" = v_key.parcours_id AND o."Operation" = v_key.operation
+            ORDER BY o.id
+        LOOP
+            v_stat := stats_scoring_push(v_stat, v_obs.id, v_obs."Temps_Seconds", v_obs."Etat", v_obs."Marge_Erreur");
+        END LOOP;
+
+        UPDATE "Stats_Scoring" SET
+            temps = v_stat.temps, marge = v_stat.marge, head = v_stat.head, n = v_stat.n,
+            n_temps = v_stat.n_temps, sum_temps = v_stat.sum_temps, sumsq_temps = v_stat.sumsq_temps,
+            n_marge = v_stat.n_marge, sum_marge = v_stat.sum_marge, sumsq_marge = v_stat.sumsq_marge,
+            last_observation_id = v_stat.last_observation_id, updated_at = now()
+        WHERE "Users_Id" = p_user_id AND "Parcours_Id" = v_key.parcours_id AND "Operation" = v_key.operation;
+    END LOOP;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION stats_scoring_ingest(bigint, bigint[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION stats_scoring_ingest(bigint, bigint[]) TO service_role;
+
+-- ============================================
+-- 3. Scoring d'un lot (equivalent scoring.score_batch)
+-- ============================================
+-- Historique : fenetres Stats_Scoring (a appeler apres stats_scoring_prepare,
+-- avant stats_scoring_ingest : la session n'y figure pas encore).
+
+CREATE OR REPLACE FUNCTION score_observations(p_user_id bigint, p_ids bigint[], p_rules text DEFAULT 'session')
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF p_rules NOT IN ('session', 'new') THEN
+        RAISE EXCEPTION 'Regle de scoring inconnue : %', p_rules USING ERRCODE = '22023';
+    END IF;
+
+    WITH stats AS (
+        SELECT "Parcours_Id", "Operation", n,
+               CASE WHEN n_temps > 0 THEN sum_temps / n_temps END AS mean_t,
+               CASE WHEN n_temps > 0
+                    THEN sqrt(greatest(n_temps * sumsq_temps - sum_temps * sum_temps, 0) / (n_temps::float8 * n_temps))
+                    ELSE 0 END AS std_t,
+               CASE WHEN n_marge > 0 THEN sum_marge / n_marge END AS mean_m,
+               CASE WHEN n_marge > 0
+                    THEN sqrt(greatest(n_marge * sumsq_marge - sum_marge * sum_marge, 0) / (n_marge::float8 * n_marge))
+                    ELSE 0 END AS std_m
+        FROM "Stats_Scoring"
+        WHERE "Users_Id" = p_user_id
+    ), cur AS (
+        SELECT o.id,
+               trim(coalesce(o."Etat", '')) = 'VRAI' AS vrai,
+               CASE WHEN p_rules = 'session'
+                    THEN coalesce(nullif(o."Score", 0), CASE WHEN trim(coalesce(o."Etat", '')) = 'VRAI' THEN 1 ELSE -1 END)
+                    ELSE CASE WHEN trim(coalesce(o."Etat", '')) = 'VRAI' THEN 1 ELSE -1 END
+               END AS score_base,
+               coalesce(o."Temps_Seconds", 0)::float8 AS temps,
+               coalesce(o."Marge_Erreur", 0)::float8 AS marge,
+               coalesce(s.n, 0) AS n, s.mean_t, s.std_t, s.mean_m, s.std_m
+        FROM "Observations" o
+        LEFT JOIN stats s
+          ON s."Parcours_Id" IS NOT DISTINCT FROM o."Parcours_Id"
+         AND s."Operation" IS NOT DISTINCT FROM o."Operation"
+        WHERE o.id = ANY (p_ids)
+    ), zones AS (
+        SELECT id, vrai, score_base, n, temps, marge,
+               coalesce(std_t, 0) = 0 OR coalesce(mean_t, 0) = 0 AS flat_t,
+               temps < mean_t - std_t AS faster,
+               temps > mean_t + std_t AS slower,
+               coalesce(std_m, 0) = 0 OR coalesce(mean_m, 0) = 0 AS flat_m,
+               mean_m, std_m
+        FROM cur
+    ), bonus AS (
+        SELECT id, score_base, n,
+               (CASE
+                    WHEN vrai AND flat_t THEN CASE WHEN p_rules = 'session' THEN 0 ELSE 1 END
+                    WHEN vrai AND faster THEN CASE WHEN p_rules = 'session' THEN 2 ELSE 3 END
+                    WHEN vrai AND slower THEN CASE WHEN p_rules = 'session' THEN -1 ELSE 0.8 END
+                    WHEN vrai THEN CASE WHEN p_rules = 'session' THEN 0 ELSE 1 END
+                    WHEN flat_t OR NOT (faster OR slower) THEN CASE WHEN p_rules = 'session' THEN -2 ELSE -1 END
+                    ELSE CASE WHEN p_rules = 'session' THEN -3 ELSE -2 END
+                END)::float8 AS vitesse,
+               (CASE
+                    WHEN vrai THEN 0
+                    WHEN flat_m THEN -1
+                    WHEN marge < mean_m - std_m THEN 0
+                    WHEN marge > mean_m + std_m THEN -2
+                    ELSE -1
+                END)::float8 AS bm
+        FROM zones
+    )
+    UPDATE "Observations" o
+    SET bonus_vitesse = CASE
+            WHEN b.n < 5 THEN 0
+            WHEN p_rules = 'session' THEN b.vitesse
+            ELSE round((b.vitesse - b.score_base)::numeric, 2)::float8
+        END,
+        bonus_marge = CASE WHEN b.n < 5 THEN 0 ELSE b.bm END,
+        score_global = CASE
+            WHEN b.n < 5 THEN b.score_base
+            WHEN p_rules = 'session' THEN floor(b.score_base + b.vitesse + b.bm)::int
+            ELSE round(b.vitesse + b.bm)::int
+        END
+    FROM bonus b
+    WHERE o.id = b.id;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION score_observations(bigint, bigint[], text) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION score_observations(bigint, bigint[], text) TO service_role;
+
+-- ============================================
+-- 4. submit_observations(p_entrainement_id, p_rows, p_rules)
+-- ============================================
+-- Nouvelle signature : l'ancienne (bigint, jsonb) est remplacee. Les appels a
+-- deux arguments restent valides (p_rules = 'session').
+
+DROP FUNCTION IF EXISTS submit_observations(bigint, jsonb);
+
+CREATE OR REPLACE FUNCTION submit_observations(p_entrainement_id bigint, p_rows jsonb, p_rules text DEFAULT 'session')
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_user_id bigint;
+    v_volume int;
+    v_ids bigint[];
+    v_monday date := date_trunc('week', current_date)::date;
+    v_delta_classement int;
+    v_delta_base int;
+    v_op text;
+    v_parcours_id bigint;
+    v_niveau int;
+    v_critere int;
+    v_last_obs bigint;
+    v_total int;
+    v_corrects int;
+    v_last_id bigint;
+    v_pct float8;
+    v_prev_id bigint;
+    v_prev_niveau int;
+    v_next_id bigint;
+    v_next_niveau int;
+    v_to_id bigint;
+    v_to_niveau int;
+    v_decision text;
+    v_suivi "Suivi_Parcours";
+    v_evolutions jsonb := '[]'::jsonb;
+    v_positions jsonb;
+BEGIN
+    -- Verrou sur l'entrainement : deux soumissions concurrentes se serialisent
+    SELECT "Users_Id", "Volume" INTO v_user_id, v_volume
+    FROM "Entrainement"
+    WHERE id = p_entrainement_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    IF coalesce(auth.role(), '') <> 'service_role' AND NOT EXISTS (
+        SELECT 1 FROM users_map
+        WHERE user_id = v_user_id
+        AND auth_uid::text = auth.uid()::text
+    ) THEN
+        RAISE EXCEPTION 'Entrainement % non autorise', p_entrainement_id USING ERRCODE = '42501';
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM "Observations" WHERE "Entrainement_Id" = p_entrainement_id) THEN
+        RETURN jsonb_build_object('status', 'already_processed');
+    END IF;
+
+    -- ---------- Insertion (troncature au Volume attendu) ----------
+    -- Les triggers existants calculent Solution / Etat / Score / Marge_Erreur
+    WITH ins AS (
+        INSERT INTO "Observations" ("Entrainement_Id", "Parcours_Id", "Operateur_Un", "Operateur_Deux",
+                                    "Operation", "Proposition", "Correction", "Temps_Seconds")
+        SELECT p_entrainement_id,
+               (r->>'Parcours_Id')::bigint,
+               (r->>'Operateur_Un')::int,
+               (r->>'Operateur_Deux')::int,
+               r->>'Operation',
+               (r->>'Proposition')::int,
+               coalesce(r->>'Correction', 'NON'),
+               coalesce((r->>'Temps_Seconds')::int, 0)
+        FROM jsonb_array_elements(p_rows) WITH ORDINALITY AS t(r, n)
+        WHERE v_volume IS NULL OR t.n <= v_volume
+        ORDER BY t.n
+        RETURNING id
+    )
+    SELECT coalesce(array_agg(id ORDER BY id), '{}') INTO v_ids FROM ins;
+
+    IF v_user_id IS NULL THEN
+        RETURN jsonb_build_object('status', 'ok', 'user_id', NULL, 'ids', to_jsonb(v_ids),
+                                  'evolutions', '[]'::jsonb, 'positions', '{}'::jsonb);
+    END IF;
+
+    -- ---------- Scoring (fenetres Stats_Scoring, regle p_rules) ----------
+    PERFORM stats_scoring_prepare(v_user_id, v_ids);
+    PERFORM score_observations(v_user_id, v_ids, p_rules);
+    PERFORM stats_scoring_ingest(v_user_id, v_ids);
+
+    -- ---------- Classement + users_map (regles de submission.classement_payloads) ----------
+    SELECT coalesce(sum(coalesce(nullif(score_global, 0), nullif("Score", 0), 0)), 0),
+           coalesce(sum(coalesce("Score", 0)), 0)
+    INTO v_delta_classement, v_delta_base
+    FROM "Observations"
+    WHERE "Entrainement_Id" = p_entrainement_id;
+
+    INSERT INTO "Classement" ("Users_Id", score_global, score_week, week_start)
+    VALUES (v_user_id, v_delta_classement, v_delta_classement, v_monday)
+    ON CONFLICT ("Users_Id") DO UPDATE SET
+        score_global = coalesce("Classement".score_global, 0) + EXCLUDED.score_global,
+        score_week = CASE
+            WHEN "Classement".week_start IS NULL OR "Classement".week_start < v_monday THEN EXCLUDED.score_week
+            ELSE coalesce("Classement".score_week, 0) + EXCLUDED.score_week
+        END,
+        week_start = v_monday;
+
+    UPDATE users_map
+    SET score_base = coalesce(score_base, 0) + v_delta_base,
+        last_training_date = current_date
+    WHERE user_id = v_user_id;
+
+    -- ---------- Evolutions (regles de EvolutionService.evaluate_and_record_if_needed) ----------
+    FOR v_op IN
+        SELECT t.op
+        FROM unnest(ARRAY['Addition', 'Soustraction', 'Multiplication']) WITH ORDINALITY AS t(op, n)
+        WHERE EXISTS (
+            SELECT 1 FROM "Observations"
+            WHERE id = ANY (v_ids) AND lower(trim("Operation")) = lower(t.op)
+        )
+        ORDER BY t.n
+    LOOP
+        -- Position courante, sinon dernier suivi (utilisateur pas encore backfille)
+        SELECT pc."Parcours_Id", pc."Derniere_Observation_Id"
+        INTO v_parcours_id, v_last_obs
+        FROM "Position_Courante" pc
+        WHERE pc."Users_Id" = v_user_id AND pc."Type_Operation" = v_op;
+
+        IF NOT FOUND THEN
+            SELECT s."Parcours_Id", s."Derniere_Observation_Id"
+            INTO v_parcours_id, v_last_obs
+            FROM "Suivi_Parcours" s
+            JOIN "Parcours" p ON p.id = s."Parcours_Id"
+            WHERE s."Users_Id" = v_user_id AND p."Type_Operation" = v_op
+            ORDER BY s.id DESC
+            LIMIT 1;
+        END IF;
+
+        IF NOT FOUND THEN
+            -- Auto-initialisation au premier niveau du type
+            SELECT id INTO v_parcours_id
+            FROM "Parcours"
+            WHERE "Type_Operation" = v_op
+            ORDER BY "Niveau"
+            LIMIT 1;
+            IF NOT FOUND THEN
+                CONTINUE;
+            END IF;
+            v_last_obs := NULL;
+            PERFORM append_suivi_position(v_user_id, v_parcours_id, 'initialisation', 0.0, NULL);
+        END IF;
+
+        SELECT "Niveau", coalesce("Critere", 0) INTO v_niveau, v_critere
+        FROM "Parcours" WHERE id = v_parcours_id;
+
+        -- Fenetre : observations de l'operation depuis le dernier suivi
+        SELECT count(*), count(*) FILTER (WHERE o."Etat" = 'VRAI'), max(o.id)
+        INTO v_total, v_corrects, v_last_id
+        FROM "Observations" o
+        WHERE o."Entrainement_Id" IN (
+                SELECT id FROM "Entrainement"
+                WHERE "Users_Id" = v_user_id
+                ORDER BY id DESC
+                LIMIT 200
+            )
+          AND o."Operation" = v_op
+          AND (coalesce(v_last_obs, 0) = 0 OR o.id > v_last_obs);
+
+        IF v_critere <= 0 OR v_total < v_critere THEN
+            CONTINUE;
+        END IF;
+
+        v_pct := v_corrects::float8 / v_total;
+
+        SELECT id, "Niveau" INTO v_prev_id, v_prev_niveau
+        FROM "Parcours"
+        WHERE "Type_Operation" = v_op AND "Niveau" < v_niveau
+        ORDER BY "Niveau" DESC
+        LIMIT 1;
+
+        SELECT id, "Niveau" INTO v_next_id, v_next_niveau
+        FROM "Parcours"
+        WHERE "Type_Operation" = v_op AND "Niveau" > v_niveau
+        ORDER BY "Niveau"
+        LIMIT 1;
+
+        IF v_pct > 0.90 AND v_next_id IS NOT NULL THEN
+            v_decision := 'progression';
+            v_to_id := v_next_id;
+            v_to_niveau := v_next_niveau;
+        ELSIF v_pct < 0.5 AND v_prev_id IS NOT NULL THEN
+            v_decision := 'régression';
+            v_to_id := v_prev_id;
+            v_to_niveau := v_prev_niveau;
+        ELSE
+            v_decision := 'stagnation';
+            v_to_id := v_parcours_id;
+            v_to_niveau := v_niveau;
+        END IF;
+
+        v_suivi := append_suivi_position(
+            v_user_id, v_to_id, v_decision, round(v_pct::numeric, 4)::float8, coalesce(v_last_id, v_last_obs, 0)
+        );
+
+        v_evolutions := v_evolutions || jsonb_build_array(jsonb_build_object(
+            'suivi', to_jsonb(v_suivi),
+            'operation', lower(v_op),
+            'from', jsonb_build_object('parcours_id', v_parcours_id, 'niveau', v_niveau),
+            'to', jsonb_build_object('parcours_id', v_to_id, 'niveau', v_to_niveau),
+            'type', v_decision,
+            'taux_reussite', round(v_pct::numeric, 4),
+            'window', jsonb_build_object(
+                'total', v_total,
+                'corrects', v_corrects,
+                'last_id_included', coalesce(v_last_id, v_last_obs, 0)
+            )
+        ));
+    END LOOP;
+
+    -- ---------- Positions des trois operations (equivalent positions_for_user) ----------
+    SELECT jsonb_object_agg(lower(t.op), jsonb_build_object(
+               'parcours_id', p.id, 'niveau', p."Niveau", 'critere', p."Critere"))
+    INTO v_positions
+    FROM unnest(ARRAY['Addition', 'Soustraction', 'Multiplication']) AS t(op)
+    JOIN "Parcours" p ON p.id = coalesce(
+        (SELECT pc."Parcours_Id" FROM "Position_Courante" pc
+         WHERE pc."Users_Id" = v_user_id AND pc."Type_Operation" = t.op),
+        (SELECT s."Parcours_Id" FROM "Suivi_Parcours" s
+         JOIN "Parcours" sp ON sp.id = s."Parcours_Id"
+         WHERE s."Users_Id" = v_user_id AND sp."Type_Operation" = t.op
+         ORDER BY s.id DESC LIMIT 1),
+        (SELECT fp.id FROM "Parcours" fp
+         WHERE fp."Type_Operation" = t.op
+         ORDER BY fp."Niveau" LIMIT 1)
+    );
+
+    RETURN jsonb_build_object(
+        'status', 'ok',
+        'user_id', v_user_id,
+        'ids', to_jsonb(v_ids),
+        'evolutions', v_evolutions,
+        'positions', coalesce(v_positions, '{}'::jsonb)
+    );
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION submit_observations(bigint, jsonb, text) TO authenticated;
+
+-- ============================================
+-- FIN DE LA MIGRATION
+-- ============================================
@@ -0,0 +1,549 @@
+-- ============================================
+-- MIGRATION: Traitement differe des soumissions (outbox)
+-- Date: 2026-10-16
+-- Description: Le traitement post-insertion d'une session (scoring, fenetres
+--              Stats_Scoring, Classement/users_map, evolutions, positions)
+--              sort de submit_observations dans process_session. Deux modes :
+--                submit_observations       : insertion + process_session,
+--                                            meme transaction (inchange)
+--                submit_observations_async : insertion + evenement Outbox
+--                                            'session_submitted', meme transaction ;
+--                                            process_session est execute plus
+--                                            tard par un worker
+--              Worker (app/services/outbox.py, python -m app.cli.outbox_worker) :
+--                claim_outbox_jobs -> run_outbox_job -> (echec) fail_outbox_job
+--              run_outbox_job applique process_session et marque le job 'done'
+--              dans la meme transaction : un job rejoue (lease expiree, worker
+--              tue) n'applique jamais ses effets deux fois.
+-- ============================================
+
+-- ============================================
+-- 1. Table Outbox
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS "Outbox" (
+    id bigserial PRIMARY KEY,
+    event text NOT NULL,
+    "Entrainement_Id" bigint NOT NULL,
+    "Users_Id" bigint,
+    payload jsonb NOT NULL DEFAULT '{}'::jsonb,
+    status text NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done', 'failed')),
+    attempts int NOT NULL DEFAULT 0,
+    available_at timestamptz NOT NULL DEFAULT now(),
+    locked_by text,
+    locked_at timestamptz,
+    last_error text,
+    result jsonb,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    UNIQUE (event, "Entrainement_Id")
+);
+
+COMMENT ON TABLE "Outbox" IS 'Evenements a traiter hors requete (session_submitted : process_session)';
+COMMENT ON COLUMN "Outbox".locked_at IS 'debut de la lease du worker ; expiree apres p_lease_seconds, le job est repris';
+
+-- Index de la file : jobs disponibles par anciennete
+CREATE INDEX IF NOT EXISTS idx_outbox_pending
+ON "Outbox" (available_at, id)
+WHERE status IN ('pending', 'running');
+
+-- Ordre FIFO par utilisateur (claim_outbox_jobs) et jobs d'un utilisateur
+CREATE INDEX IF NOT EXISTS idx_outbox_users_id
+ON "Outbox" ("Users_Id", id);
+
+ALTER TABLE "Outbox" ENABLE ROW LEVEL SECURITY;
+
+-- Lecture de ses propres jobs (GET /observations/jobs/{id}) ; ecritures : fonctions SECURITY DEFINER
+DROP POLICY IF EXISTS "outbox_select_own" ON "Outbox";
+CREATE POLICY "outbox_select_own" ON "Outbox"
+    FOR SELECT
+    TO authenticated
+    USING (
+        EXISTS (
+            SELECT 1 FROM users_map
+            WHERE auth_uid = auth.uid()
+            AND user_id = "Outbox"."Users_Id"
+        )
+    );
+
+-- ============================================
+-- 2. process_session(p_user_id, p_entrainement_id, p_rules)
+-- ============================================
+-- Corps repris de submit_observations (migration 013) a partir du scoring.
+-- Suppose les observations de l'entrainement deja inserees.
+
+CREATE OR REPLACE FUNCTION process_session(p_user_id bigint, p_entrainement_id bigint, p_rules text DEFAULT 'session')
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_user_id bigint := p_user_id;
+    v_ids bigint[];
+    v_monday date := date_trunc('week', current_date)::date;
+    v_delta_classement int;
+    v_delta_base int;
+    v_op text;
+    v_parcours_id bigint;
+    v_niveau int;
+    v_critere int;
+    v_last_obs bigint;
+    v_total int;
+    v_corrects int;
+    v_last_id bigint;
+    v_pct float8;
+    v_prev_id bigint;
+    v_prev_niveau int;
+    v_next_id bigint;
+    v_next_niveau int;
+    v_to_id bigint;
+    v_to_niveau int;
+    v_decision text;
+    v_suivi "Suivi_Parcours";
+    v_evolutions jsonb := '[]'::jsonb;
+    v_positions jsonb;
+BEGIN
+    SELECT coalesce(array_agg(id ORDER BY id), '{}') INTO v_ids
+    FROM "Observations"
+    WHERE "Entrainement_Id" = p_entrainement_id;
+
+    -- ---------- Scoring (fenetres Stats_Scoring, regle p_rules) ----------
+    PERFORM stats_scoring_prepare(v_user_id, v_ids);
+    PERFORM score_observations(v_user_id, v_ids, p_rules);
+    PERFORM stats_scoring_ingest(v_user_id, v_ids);
+
+    -- ---------- Classement + users_map (regles de submission.classement_payloads) ----------
+    SELECT coalesce(sum(coalesce(nullif(score_global, 0), nullif("Score", 0), 0)), 0),
+           coalesce(sum(coalesce("Score", 0)), 0)
+    INTO v_delta_classement, v_delta_base
+    FROM "Observations"
+    WHERE "Entrainement_Id" = p_entrainement_id;
+
+    INSERT INTO "Classement" ("Users_Id", score_global, score_week, week_start)
+    VALUES (v_user_id, v_delta_classement, v_delta_classement, v_monday)
+    ON CONFLICT ("Users_Id") DO UPDATE SET
+        score_global = coalesce("Classement".score_global, 0) + EXCLUDED.score_global,
+        score_week = CASE
+            WHEN "Classement".week_start IS NULL OR "Classement".week_start < v_monday THEN EXCLUDED.score_week
+            ELSE coalesce("Classement".score_week, 0) + EXCLUDED.score_week
+        END,
+        week_start = v_monday;
+
+    UPDATE users_map
+    SET score_base = coalesce(score_base, 0) + v_delta_base,
+        last_training_date = current_date
+    WHERE user_id = v_user_id;
+
+    -- ---------- Evolutions (regles de EvolutionService.evaluate_and_record_if_needed) ----------
+    FOR v_op IN
+        SELECT t.op
+        FROM unnest(ARRAY['Addition', 'Soustraction', 'Multiplication']) WITH ORDINALITY AS t(op, n)
+        WHERE EXISTS (
+            SELECT 1 FROM "Observations"
+            WHERE id = ANY (v_ids) AND lower(trim("Operation")) = lower(t.op)
+        )
+        ORDER BY t.n
+    LOOP
+        -- Position courante, sinon dernier suivi (utilisateur pas encore backfille)
+        SELECT pc."Parcours_Id", pc."Derniere_Observation_Id"
+        INTO v_parcours_id, v_last_obs
+        FROM "Position_Courante" pc
+        WHERE pc."Users_Id" = v_user_id AND pc."Type_Operation" = v_op;
+
+        IF NOT FOUND THEN
+            SELECT s."Parcours_Id", s."Derniere_Observation_Id"
+            INTO v_parcours_id, v_last_obs
+            FROM "Suivi_Parcours" s
+            JOIN "Parcours" p ON p.id = s."Parcours_Id"
+            WHERE s."Users_Id" = v_user_id AND p."Type_Operation" = v_op
+            ORDER BY s.id DESC
+            LIMIT 1;
+        END IF;
+
+        IF NOT FOUND THEN
+            -- Auto-initialisation au premier niveau du type
+            SELECT id INTO v_parcours_id
+            FROM "Parcours"
+            WHERE "Type_Operation" = v_op
+            ORDER BY "Niveau"
+            LIMIT 1;
+            IF NOT FOUND THEN
+                CONTINUE;
+            END IF;
+            v_last_obs := NULL;
+            PERFORM append_suivi_position(v_user_id, v_parcours_id, 'initialisation', 0.0, NULL);
+        END IF;
+
+        SELECT "Niveau", coalesce("Critere", 0) INTO v_niveau, v_critere
+        FROM "Parcours" WHERE id = v_parcours_id;
+
+        -- Fenetre : observations de l'operation depuis le dernier suivi
+        SELECT count(*), count(*) FILTER (WHERE o."Etat" = 'VRAI'), max(o.id)
+        INTO v_total, v_corrects, v_last_id
+        FROM "Observations" o
+        WHERE o."Entrainement_Id" IN (
+                SELECT id FROM "Entrainement"
+                WHERE "Users_Id" = v_user_id
+                ORDER BY id DESC
+                LIMIT 200
+            )
+          AND o."Operation" = v_op
+          AND (coalesce(v_last_obs, 0) = 0 OR o.id > v_last_obs);
+
+        IF v_critere <= 0 OR v_total < v_critere THEN
+            CONTINUE;
+        END IF;
+
+        v_pct := v_corrects::float8 / v_total;
+
+        SELECT id, "Niveau" INTO v_prev_id, v_prev_niveau
+        FROM "Parcours"
+        WHERE "Type_Operation" = v_op AND "Niveau" < v_niveau
+        ORDER BY "Niveau" DESC
+        LIMIT 1;
+
+        SELECT id, "Niveau" INTO v_next_id, v_next_niveau
+        FROM "Parcours"
+        WHERE "Type_Operation" = v_op AND "Niveau" > v_niveau
+        ORDER BY "Niveau"
+        LIMIT 1;
+
+        IF v_pct > 0.90 AND v_next_id IS NOT NULL THEN
+            v_decision := 'progression';
+            v_to_id := v_next_id;
+            v_to_niveau := v_next_niveau;
+        ELSIF v_pct < 0.5 AND v_prev_id IS NOT NULL THEN
+            v_decision := 'régression';
+            v_to_id := v_prev_id;
+            v_to_niveau := v_prev_niveau;
+        ELSE
+            v_decision := 'stagnation';
+            v_to_id := v_parcours_id;
+            v_to_niveau := v_niveau;
+        END IF;
+
+        v_suivi := append_suivi_position(
+            v_user_id, v_to_id, v_decision, round(v_pct::numeric, 4)::float8, coalesce(v_last_id, v_last_obs, 0)
+        );
+
+        v_evolutions := v_evolutions || jsonb_build_array(jsonb_build_object(
+            'suivi', to_jsonb(v_suivi),
+            'operation', lower(v_op),
+            'from', jsonb_build_object('parcours_id', v_parcours_id, 'niveau', v_niveau),
+            'to', jsonb_build_object('parcours_id', v_to_id, 'niveau', v_to_niveau),
+            'type', v_decision,
+            'taux_reussite', round(v_pct::numeric, 4),
+            'window', jsonb_build_object(
+                'total', v_total,
+                'corrects', v_corrects,
+                'last_id_included', coalesce(v_last_id, v_last_obs, 0)
+            )
+        ));
+    END LOOP;
+
+    -- ---------- Positions des trois operations (equivalent positions_for_user) ----------
+    SELECT jsonb_object_agg(lower(t.op), jsonb_build_object(
+               'parcours_id', p.id, 'niveau', p."Niveau", 'critere', p."Critere"))
+    INTO v_positions
+    FROM unnest(ARRAY['Addition', 'Soustraction', 'Multiplication']) AS t(op)
+    JOIN "Parcours" p ON p.id = coalesce(
+        (SELECT pc."Parcours_Id" FROM "Position_Courante" pc
+         WHERE pc."Users_Id" = v_user_id AND pc."Type_Operation" = t.op),
+        (SELECT s."Parcours_Id" FROM "Suivi_Parcours" s
+         JOIN "Parcours" sp ON sp.id = s."Parcours_Id"
+         WHERE s."Users_Id" = v_user_id AND sp."Type_Operation" = t.op
+         ORDER BY s.id DESC LIMIT 1),
+        (SELECT fp.id FROM "Parcours" fp
+         WHERE fp."Type_Operation" = t.op
+         ORDER BY fp."Niveau" LIMIT 1)
+    );
+
+    RETURN jsonb_build_object(
+        'user_id', v_user_id,
+        'ids', to_jsonb(v_ids),
+        'evolutions', v_evolutions,
+        'positions', coalesce(v_positions, '{}'::jsonb)
+    );
+END;
+$$;
+
+-- Interne (submit_observations, run_outbox_job) : Supabase accorde EXECUTE a anon et
+-- authenticated par defaut, un appel direct rajouterait les deltas de la session.
+REVOKE ALL ON FUNCTION process_session(bigint, bigint, text) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION process_session(bigint, bigint, text) TO service_role;
+
+-- ============================================
+-- 3. submit_observations : insertion + process_session (synchrone)
+-- ============================================
+
+CREATE OR REPLACE FUNCTION submit_observations(p_entrainement_id bigint, p_rows jsonb, p_rules text DEFAULT 'session')
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_user_id bigint;
+    v_volume int;
+    v_ids bigint[];
+BEGIN
+    -- Verrou sur l'entrainement : deux soumissions concurrentes se serialisent
+    SELECT "Users_Id", "Volume" INTO v_user_id, v_volume
+    FROM "Entrainement"
+    WHERE id = p_entrainement_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    IF coalesce(auth.role(), '') <> 'service_role' AND NOT EXISTS (
+        SELECT 1 FROM users_map
+        WHERE user_id = v_user_id
+        AND auth_uid::text = auth.uid()::text
+    ) THEN
+        RAISE EXCEPTION 'Entrainement % non autorise', p_entrainement_id USING ERRCODE = '42501';
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM "Observations" WHERE "Entrainement_Id" = p_entrainement_id) THEN
+        RETURN jsonb_build_object('status', 'already_processed');
+    END IF;
+
+    -- ---------- Insertion (troncature au Volume attendu) ----------
+    -- Les triggers existants calculent Solution / Etat / Score / Marge_Erreur
+    WITH ins AS (
+        INSERT INTO "Observations" ("Entrainement_Id", "Parcours_Id", "Operateur_Un", "Operateur_Deux",
+                                    "Operation", "Proposition", "Correction", "Temps_Seconds")
+        SELECT p_entrainement_id,
+               (r->>'Parcours_Id')::bigint,
+               (r->>'Operateur_Un')::int,
+               (r->>'Operateur_Deux')::int,
+               r->>'Operation',
+               (r->>'Proposition')::int,
+               coalesce(r->>'Correction', 'NON'),
+               coalesce((r->>'Temps_Seconds')::int, 0)
+        FROM jsonb_array_elements(p_rows) WITH ORDINALITY AS t(r, n)
+        WHERE v_volume IS NULL OR t.n <= v_volume
+        ORDER BY t.n
+        RETURNING id
+    )
+    SELECT coalesce(array_agg(id ORDER BY id), '{}') INTO v_ids FROM ins;
+
+    IF v_user_id IS NULL THEN
+        RETURN jsonb_build_object('status', 'ok', 'user_id', NULL, 'ids', to_jsonb(v_ids),
+                                  'evolutions', '[]'::jsonb, 'positions', '{}'::jsonb);
+    END IF;
+
+    RETURN jsonb_build_object('status', 'ok')
+        || process_session(v_user_id, p_entrainement_id, p_rules);
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION submit_observations(bigint, jsonb, text) TO authenticated;
+
+-- ============================================
+-- 4. submit_observations_async : insertion + evenement Outbox
+-- ============================================
+
+CREATE OR REPLACE FUNCTION submit_observations_async(p_entrainement_id bigint, p_rows jsonb, p_rules text DEFAULT 'session')
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_user_id bigint;
+    v_volume int;
+    v_ids bigint[];
+    v_job_id bigint;
+BEGIN
+    IF p_rules NOT IN ('session', 'new') THEN
+        RAISE EXCEPTION 'Regle de scoring inconnue : %', p_rules USING ERRCODE = '22023';
+    END IF;
+
+    -- Verrou sur l'entrainement : deux soumissions concurrentes se serialisent
+    SELECT "Users_Id", "Volume" INTO v_user_id, v_volume
+    FROM "Entrainement"
+    WHERE id = p_entrainement_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    IF coalesce(auth.role(), '') <> 'service_role' AND NOT EXISTS (
+        SELECT 1 FROM users_map
+        WHERE user_id = v_user_id
+        AND auth_uid::text = auth.uid()::text
+    ) THEN
+        RAISE EXCEPTION 'Entrainement % non autorise', p_entrainement_id USING ERRCODE = '42501';
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM "Observations" WHERE "Entrainement_Id" = p_entrainement_id) THEN
+        RETURN jsonb_build_object('status', 'already_processed');
+    END IF;
+
+    -- ---------- Insertion (troncature au Volume attendu) ----------
+    -- Les triggers existants calculent Solution / Etat / Score / Marge_Erreur
+    WITH ins AS (
+        INSERT INTO "Observations" ("Entrainement_Id", "Parcours_Id", "Operateur_Un", "Operateur_Deux",
+                                    "Operation", "Proposition", "Correction", "Temps_Seconds")
+        SELECT p_entrainement_id,
+               (r->>'Parcours_Id')::bigint,
+               (r->>'Operateur_Un')::int,
+               (r->>'Operateur_Deux')::int,
+               r->>'Operation',
+               (r->>'Proposition')::int,
+               coalesce(r->>'Correction', 'NON'),
+               coalesce((r->>'Temps_Seconds')::int, 0)
+        FROM jsonb_array_elements(p_rows) WITH ORDINALITY AS t(r, n)
+        WHERE v_volume IS NULL OR t.n <= v_volume
+        ORDER BY t.n
+        RETURNING id
+    )
+    SELECT coalesce(array_agg(id ORDER BY id), '{}') INTO v_ids FROM ins;
+
+    IF v_user_id IS NULL THEN
+        RETURN jsonb_build_object('status', 'ok', 'user_id', NULL, 'ids', to_jsonb(v_ids),
+                                  'evolutions', '[]'::jsonb, 'positions', '{}'::jsonb);
+    END IF;
+
+    INSERT INTO "Outbox" (event, "Entrainement_Id", "Users_Id", payload)
+    VALUES ('session_submitted', p_entrainement_id, v_user_id, jsonb_build_object('rules', p_rules))
+    ON CONFLICT (event, "Entrainement_Id") DO NOTHING
+    RETURNING id INTO v_job_id;
+
+    PERFORM pg_notify('outbox', v_job_id::text);
+
+    RETURN jsonb_build_object(
+        'status', 'ok',
+        'user_id', v_user_id,
+        'ids', to_jsonb(v_ids),
+        'job_id', v_job_id
+    );
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION submit_observations_async(bigint, jsonb, text) TO authenticated;
+
+-- ============================================
+-- 5. Worker : reservation, execution, echec
+-- ============================================
+
+-- Reserve jusqu'a p_limit jobs : disponibles, ou en cours dont la lease a expire
+-- (worker arrete en plein traitement). SKIP LOCKED : plusieurs workers se
+-- partagent la file sans se bloquer. Ordre FIFO par utilisateur : un job n'est
+-- pris que si aucun job anterieur du meme utilisateur n'est en attente ou en
+-- cours (les fenetres Stats_Scoring ingerent par id croissant, le Classement
+-- et les evolutions suivent l'ordre des sessions).
+CREATE OR REPLACE FUNCTION claim_outbox_jobs(p_worker text, p_limit int DEFAULT 4, p_lease_seconds int DEFAULT 60)
+RETURNS SETOF "Outbox"
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE "Outbox" o
+    SET status = 'running',
+        attempts = o.attempts + 1,
+        locked_by = p_worker,
+        locked_at = now(),
+        updated_at = now()
+    WHERE o.id IN (
+        SELECT id FROM "Outbox"
+        WHERE ((status = 'pending' AND available_at <= now())
+           OR (status = 'running' AND locked_at < now() - make_interval(secs => p_lease_seconds)))
+        AND NOT EXISTS (
+            SELECT 1 FROM "Outbox" prev
+            WHERE prev."Users_Id" = "Outbox"."Users_Id"
+            AND prev.id < "Outbox".id
+            AND prev.status IN ('pending', 'running')
+        )
+        ORDER BY available_at, id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING o.*;
+END;
+$$;
+
+-- Execute un job reserve. Les effets de process_session et le passage a 'done'
+-- sont dans la meme transaction : une erreur annule les deux.
+CREATE OR REPLACE FUNCTION run_outbox_job(p_job_id bigint, p_worker text)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_job "Outbox";
+    v_result jsonb;
+BEGIN
+    SELECT * INTO v_job FROM "Outbox" WHERE id = p_job_id FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+    IF v_job.status = 'done' THEN
+        RETURN jsonb_build_object('status', 'done', 'result', v_job.result);
+    END IF;
+    IF v_job.status <> 'running' OR v_job.locked_by IS DISTINCT FROM p_worker THEN
+        -- lease reprise par un autre worker
+        RETURN jsonb_build_object('status', 'lost');
+    END IF;
+
+    IF v_job.event = 'session_submitted' THEN
+        IF v_job."Users_Id" IS NULL THEN
+            v_result := jsonb_build_object('evolutions', '[]'::jsonb, 'positions', '{}'::jsonb);
+        ELSE
+            v_result := process_session(v_job."Users_Id", v_job."Entrainement_Id",
+                                        coalesce(v_job.payload->>'rules', 'session'));
+        END IF;
+    ELSE
+        RAISE EXCEPTION 'Evenement Outbox inconnu : %', v_job.event USING ERRCODE = '22023';
+    END IF;
+
+    UPDATE "Outbox"
+    SET status = 'done', result = v_result, last_error = NULL,
+        locked_by = NULL, locked_at = NULL, updated_at = now()
+    WHERE id = p_job_id;
+
+    RETURN jsonb_build_object('status', 'done', 'result', v_result);
+END;
+$$;
+
+-- Echec : nouvelle tentative avec attente exponentielle (2^attempts s, 5 min
+-- max), ou 'failed' apres p_max_attempts tentatives.
+CREATE OR REPLACE FUNCTION fail_outbox_job(p_job_id bigint, p_worker text, p_error text, p_max_attempts int DEFAULT 5)
+RETURNS text
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_status text;
+BEGIN
+    UPDATE "Outbox"
+    SET status = CASE WHEN attempts >= p_max_attempts THEN 'failed' ELSE 'pending' END,
+        available_at = now() + make_interval(secs => least(300, power(2, attempts))),
+        last_error = left(p_error, 2000),
+        locked_by = NULL,
+        locked_at = NULL,
+        updated_at = now()
+    WHERE id = p_job_id
+    AND status = 'running'
+    AND locked_by = p_worker
+    RETURNING status INTO v_status;
+
+    RETURN coalesce(v_status, 'lost');
+END;
+$$;
+
+REVOKE ALL ON FUNCTION claim_outbox_jobs(text, int, int) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION run_outbox_job(bigint, text) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION fail_outbox_job(bigint, text, text, int) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION claim_outbox_jobs(text, int, int) TO service_role;
+GRANT EXECUTE ON FUNCTION run_outbox_job(bigint, text) TO service_role;
+GRANT EXECUTE ON FUNCTION fail_outbox_job(bigint, text, text, int) TO service_role;
@@ -0,0 +1,258 @@
+-- ============================================
+-- MIGRATION: Soumissions idempotentes (Idempotency-Key / batch_id)
+-- Date: 2026-10-16
+-- Description: submit_observations et submit_observations_async prennent une
+--              cle d'idempotence optionnelle (p_idempotency_key, fournie par le
+--              client : en-tete Idempotency-Key ou batch_id). La reponse d'une
+--              soumission traitee est conservee 24 h par (Entrainement_Id, cle) ;
+--              un rejeu (reseau mobile instable) la recoit telle quelle,
+--              marquee 'replayed', sans toucher Observations, le scoring ni
+--              Classement. Enregistrement dans la transaction de la soumission.
+--              Purge des cles expirees : app/cron/idempotency_cleanup.py
+-- ============================================
+
+-- ============================================
+-- 1. Table Idempotency_Keys
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS "Idempotency_Keys" (
+    "Entrainement_Id" bigint NOT NULL,
+    key text NOT NULL CHECK (length(key) BETWEEN 1 AND 200),
+    "Users_Id" bigint,
+    response jsonb NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    expires_at timestamptz NOT NULL DEFAULT now() + interval '24 hours',
+    PRIMARY KEY ("Entrainement_Id", key)
+);
+
+COMMENT ON TABLE "Idempotency_Keys" IS 'Reponses des soumissions par cle client, rejouees tant que expires_at n est pas passe';
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at
+ON "Idempotency_Keys" (expires_at);
+
+-- Acces uniquement via les fonctions SECURITY DEFINER et le service role (purge)
+ALTER TABLE "Idempotency_Keys" ENABLE ROW LEVEL SECURITY;
+
+-- ============================================
+-- 2. submit_observations(..., p_idempotency_key)
+-- ============================================
+-- Le controle d'appartenance de l'entrainement precede le rejeu : une cle
+-- d'un autre utilisateur ne donne acces a rien.
+
+DROP FUNCTION IF EXISTS submit_observations(bigint, jsonb, text);
+
+CREATE OR REPLACE FUNCTION submit_observations(
+    p_entrainement_id bigint,
+    p_rows jsonb,
+    p_rules text DEFAULT 'session',
+    p_idempotency_key text DEFAULT NULL
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_user_id bigint;
+    v_volume int;
+    v_ids bigint[];
+    v_replay jsonb;
+    v_result jsonb;
+BEGIN
+    -- Verrou sur l'entrainement : deux soumissions concurrentes se serialisent
+    SELECT "Users_Id", "Volume" INTO v_user_id, v_volume
+    FROM "Entrainement"
+    WHERE id = p_entrainement_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    IF coalesce(auth.role(), '') <> 'service_role' AND NOT EXISTS (
+        SELECT 1 FROM users_map
+        WHERE user_id = v_user_id
+        AND auth_uid::text = auth.uid()::text
+    ) THEN
+        RAISE EXCEPTION 'Entrainement % non autorise', p_entrainement_id USING ERRCODE = '42501';
+    END IF;
+
+    -- Rejeu d'une soumission deja traitee : reponse d'origine, sans rien recalculer
+    IF p_idempotency_key IS NOT NULL THEN
+        SELECT response INTO v_replay
+        FROM "Idempotency_Keys"
+        WHERE "Entrainement_Id" = p_entrainement_id
+        AND key = p_idempotency_key
+        AND expires_at > now();
+
+        IF FOUND THEN
+            RETURN v_replay || jsonb_build_object('replayed', true);
+        END IF;
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM "Observations" WHERE "Entrainement_Id" = p_entrainement_id) THEN
+        RETURN jsonb_build_object('status', 'already_processed');
+    END IF;
+
+    -- ---------- Insertion (troncature au Volume attendu) ----------
+    -- Les triggers existants calculent Solution / Etat / Score / Marge_Erreur
+    WITH ins AS (
+        INSERT INTO "Observations" ("Entrainement_Id", "Parcours_Id", "Operateur_Un", "Operateur_Deux",
+                                    "Operation", "Proposition", "Correction", "Temps_Seconds")
+        SELECT p_entrainement_id,
+               (r->>'Parcours_Id')::bigint,
+               (r->>'Operateur_Un')::int,
+               (r->>'Operateur_Deux')::int,
+               r->>'Operation',
+               (r->>'Proposition')::int,
+               coalesce(r->>'Correction', 'NON'),
+               coalesce((r->>'Temps_Seconds')::int, 0)
+        FROM jsonb_array_elements(p_rows) WITH ORDINALITY AS t(r, n)
+        WHERE v_volume IS NULL OR t.n <= v_volume
+        ORDER BY t.n
+        RETURNING id
+    )
+    SELECT coalesce(array_agg(id ORDER BY id), '{}') INTO v_ids FROM ins;
+
+    IF v_user_id IS NULL THEN
+        RETURN jsonb_build_object('status', 'ok', 'user_id', NULL, 'ids', to_jsonb(v_ids),
+                                  'evolutions', '[]'::jsonb, 'positions', '{}'::jsonb);
+    END IF;
+
+    v_result := jsonb_build_object('status', 'ok')
+        || process_session(v_user_id, p_entrainement_id, p_rules);
+
+    IF p_idempotency_key IS NOT NULL THEN
+        INSERT INTO "Idempotency_Keys" ("Entrainement_Id", key, "Users_Id", response)
+        VALUES (p_entrainement_id, p_idempotency_key, v_user_id, v_result)
+        ON CONFLICT ("Entrainement_Id", key) DO UPDATE SET
+            "Users_Id" = EXCLUDED."Users_Id",
+            response = EXCLUDED.response,
+            created_at = now(),
+            expires_at = now() + interval '24 hours';
+    END IF;
+
+    RETURN v_result;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION submit_observations(bigint, jsonb, text, text) TO authenticated;
+
+-- ============================================
+-- 3. submit_observations_async(..., p_idempotency_key)
+-- ============================================
+
+DROP FUNCTION IF EXISTS submit_observations_async(bigint, jsonb, text);
+
+CREATE OR REPLACE FUNCTION submit_observations_async(
+    p_entrainement_id bigint,
+    p_rows jsonb,
+    p_rules text DEFAULT 'session',
+    p_idempotency_key text DEFAULT NULL
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_user_id bigint;
+    v_volume int;
+    v_ids bigint[];
+    v_replay jsonb;
+    v_result jsonb;
+    v_job_id bigint;
+BEGIN
+    IF p_rules NOT IN ('session', 'new') THEN
+        RAISE EXCEPTION 'Regle de scoring inconnue : %', p_rules USING ERRCODE = '22023';
+    END IF;
+
+    -- Verrou sur l'entrainement : deux soumissions concurrentes se serialisent
+    SELECT "Users_Id", "Volume" INTO v_user_id, v_volume
+    FROM "Entrainement"
+    WHERE id = p_entrainement_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    IF coalesce(auth.role(), '') <> 'service_role' AND NOT EXISTS (
+        SELECT 1 FROM users_map
+        WHERE user_id = v_user_id
+        AND auth_uid::text = auth.uid()::text
+    ) THEN
+        RAISE EXCEPTION 'Entrainement % non autorise', p_entrainement_id USING ERRCODE = '42501';
+    END IF;
+
+    -- Rejeu d'une soumission deja traitee : reponse d'origine, sans rien recalculer
+    IF p_idempotency_key IS NOT NULL THEN
+        SELECT response INTO v_replay
+        FROM "Idempotency_Keys"
+        WHERE "Entrainement_Id" = p_entrainement_id
+        AND key = p_idempotency_key
+        AND expires_at > now();
+
+        IF FOUND THEN
+            RETURN v_replay || jsonb_build_object('replayed', true);
+        END IF;
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM "Observations" WHERE "Entrainement_Id" = p_entrainement_id) THEN
+        RETURN jsonb_build_object('status', 'already_processed');
+    END IF;
+
+    -- ---------- Insertion (troncature au Volume attendu) ----------
+    -- Les triggers existants calculent Solution / Etat / Score / Marge_Erreur
+    WITH ins AS (
+        INSERT INTO "Observations" ("Entrainement_Id", "Parcours_Id", "Operateur_Un", "Operateur_Deux",
+                                    "Operation", "Proposition", "Correction", "Temps_Seconds")
+        SELECT p_entrainement_id,
+               (r->>'Parcours_Id')::bigint,
+               (r->>'Operateur_Un')::int,
+               (r->>'Operateur_Deux')::int,
+               r->>'Operation',
+               (r->>'Proposition')::int,
+               coalesce(r->>'Correction', 'NON'),
+               coalesce((r->>'Temps_Seconds')::int, 0)
+        FROM jsonb_array_elements(p_rows) WITH ORDINALITY AS t(r, n)
+        WHERE v_volume IS NULL OR t.n <= v_volume
+        ORDER BY t.n
+        RETURNING id
+    )
+    SELECT coalesce(array_agg(id ORDER BY id), '{}') INTO v_ids FROM ins;
+
+    IF v_user_id IS NULL THEN
+        RETURN jsonb_build_object('status', 'ok', 'user_id', NULL, 'ids', to_jsonb(v_ids),
+                                  'evolutions', '[]'::jsonb, 'positions', '{}'::jsonb);
+    END IF;
+
+    INSERT INTO "Outbox" (event, "Entrainement_Id", "Users_Id", payload)
+    VALUES ('session_submitted', p_entrainement_id, v_user_id, jsonb_build_object('rules', p_rules))
+    ON CONFLICT (event, "Entrainement_Id") DO NOTHING
+    RETURNING id INTO v_job_id;
+
+    PERFORM pg_notify('outbox', v_job_id::text);
+
+    v_result := jsonb_build_object(
+        'status', 'ok',
+        'user_id', v_user_id,
+        'ids', to_jsonb(v_ids),
+        'job_id', v_job_id
+    );
+
+    IF p_idempotency_key IS NOT NULL THEN
+        INSERT INTO "Idempotency_Keys" ("Entrainement_Id", key, "Users_Id", response)
+        VALUES (p_entrainement_id, p_idempotency_key, v_user_id, v_result)
+        ON CONFLICT ("Entrainement_Id", key) DO UPDATE SET
+            "Users_Id" = EXCLUDED."Users_Id",
+            response = EXCLUDED.response,
+            created_at = now(),
+            expires_at = now() + interval '24 hours';
+    END IF;
+
+    RETURN v_result;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION submit_observations_async(bigint, jsonb, text, text) TO authenticated;
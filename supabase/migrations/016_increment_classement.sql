@@ -0,0 +1,72 @@
+-- ============================================
+-- MIGRATION: Increment atomique du Classement
+-- Date: 2026-10-16
+-- Description: increment_classement applique les deltas d'une session (calcules
+--              en memoire par le scoring du chemin legacy) a Classement et
+--              users_map en une seule instruction : score_global += delta,
+--              score_week += delta avec remise a zero en debut de semaine,
+--              score_base += delta_base. Plus de lecture-modification-ecriture
+--              cote Python, donc plus d'increment perdu entre deux sessions
+--              concurrentes du meme utilisateur (verrou de ligne de l'UPDATE).
+--              Memes regles que submission.classement_increment et que le bloc
+--              Classement de process_session (migration 014).
+--              Verification : python scripts/check_classement_concurrency.py
+-- ============================================
+
+CREATE OR REPLACE FUNCTION increment_classement(
+    p_user_id bigint,
+    p_delta_classement int,
+    p_delta_base int
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_monday date := date_trunc('week', current_date)::date;
+    v_result jsonb;
+BEGIN
+    IF coalesce(auth.role(), '') <> 'service_role' AND NOT EXISTS (
+        SELECT 1 FROM users_map
+        WHERE user_id = p_user_id
+        AND auth_uid::text = auth.uid()::text
+    ) THEN
+        RAISE EXCEPTION 'Utilisateur % non autorise', p_user_id USING ERRCODE = '42501';
+    END IF;
+
+    WITH cl AS (
+        INSERT INTO "Classement" ("Users_Id", score_global, score_week, week_start)
+        VALUES (p_user_id, p_delta_classement, p_delta_classement, v_monday)
+        ON CONFLICT ("Users_Id") DO UPDATE SET
+            score_global = coalesce("Classement".score_global, 0) + EXCLUDED.score_global,
+            score_week = CASE
+                WHEN "Classement".week_start IS NULL OR "Classement".week_start < v_monday THEN EXCLUDED.score_week
+                ELSE coalesce("Classement".score_week, 0) + EXCLUDED.score_week
+            END,
+            week_start = v_monday
+        RETURNING score_global, score_week, week_start
+    ), um AS (
+        UPDATE users_map
+        SET score_base = coalesce(score_base, 0) + p_delta_base,
+            last_training_date = current_date
+        WHERE user_id = p_user_id
+        RETURNING score_base
+    )
+    SELECT jsonb_build_object(
+        'score_global', cl.score_global,
+        'score_week', cl.score_week,
+        'week_start', cl.week_start,
+        'score_base', (SELECT score_base FROM um)
+    )
+    INTO v_result
+    FROM cl;
+
+    RETURN v_result;
+END;
+$$;
+
+-- deltas arbitraires : appelable uniquement par le backend (service role),
+-- jamais directement via rpc/increment_classement par un utilisateur
+REVOKE ALL ON FUNCTION increment_classement(bigint, int, int) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION increment_classement(bigint, int, int) TO service_role;
@@ -0,0 +1,323 @@
+-- ============================================
+-- MIGRATION: Compteurs de fenetre d'evolution
+-- Date: 2026-10-16
+-- Description: La decision d'evolution (progression / stagnation / regression)
+--              comptait a chaque session les observations de l'operation depuis
+--              le dernier suivi (200 derniers entrainements, puis Observations).
+--              Position_Courante garde desormais ces compteurs par
+--              (Users_Id, Type_Operation) :
+--                Total_Fenetre, Corrects_Fenetre   observations et VRAI depuis le suivi
+--                Fenetre_Depuis_Id                 Derniere_Observation_Id du suivi
+--                                                  de depart (validite des compteurs)
+--                Fenetre_Dernier_Id                derniere observation comptee
+--              process_session les augmente des observations de la session,
+--              append_suivi_position les remet a zero. Des compteurs absents (lignes
+--              existantes) ou d'un autre suivi sont recomptes une fois au passage.
+--              Memes regles que position_store.window_* (chemin legacy, emulation
+--              hors ligne).
+-- ============================================
+
+ALTER TABLE "Position_Courante"
+    ADD COLUMN IF NOT EXISTS "Total_Fenetre" int,
+    ADD COLUMN IF NOT EXISTS "Corrects_Fenetre" int,
+    ADD COLUMN IF NOT EXISTS "Fenetre_Depuis_Id" bigint,
+    ADD COLUMN IF NOT EXISTS "Fenetre_Dernier_Id" bigint;
+
+COMMENT ON COLUMN "Position_Courante"."Total_Fenetre" IS 'observations de l operation depuis le dernier suivi';
+COMMENT ON COLUMN "Position_Courante"."Fenetre_Depuis_Id" IS 'compteurs valides si egal a coalesce(Derniere_Observation_Id, 0)';
+
+-- ============================================
+-- 1. append_suivi_position : compteurs remis a zero
+-- ============================================
+-- Sans p_derniere_observation_id (initialisation), les compteurs restent a
+-- recompter (Fenetre_Depuis_Id NULL).
+
+CREATE OR REPLACE FUNCTION append_suivi_position(
+    p_user_id bigint,
+    p_parcours_id bigint,
+    p_type_evolution text,
+    p_taux float8,
+    p_derniere_observation_id bigint
+)
+RETURNS "Suivi_Parcours"
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_suivi "Suivi_Parcours";
+BEGIN
+    INSERT INTO "Suivi_Parcours" ("Users_Id", "Parcours_Id", "Date", "Type_Evolution", "Taux_Reussite", "Derniere_Observation_Id")
+    VALUES (p_user_id, p_parcours_id, current_date, p_type_evolution, p_taux, p_derniere_observation_id)
+    RETURNING * INTO v_suivi;
+
+    INSERT INTO "Position_Courante" ("Users_Id", "Type_Operation", "Parcours_Id", "Niveau", "Suivi_Id",
+                                     "Derniere_Observation_Id", "Taux_Reussite", "Type_Evolution", "Date",
+                                     "Total_Fenetre", "Corrects_Fenetre", "Fenetre_Depuis_Id", "Fenetre_Dernier_Id",
+                                     updated_at)
+    SELECT p_user_id, p."Type_Operation", p.id, p."Niveau", v_suivi.id,
+           p_derniere_observation_id, p_taux, p_type_evolution, current_date,
+           0, 0, p_derniere_observation_id, p_derniere_observation_id,
+           now()
+    FROM "Parcours" p
+    WHERE p.id = p_parcours_id
+    ON CONFLICT ("Users_Id", "Type_Operation") DO UPDATE SET
+        "Parcours_Id" = EXCLUDED."Parcours_Id",
+        "Niveau" = EXCLUDED."Niveau",
+        "Suivi_Id" = EXCLUDED."Suivi_Id",
+        "Derniere_Observation_Id" = EXCLUDED."Derniere_Observation_Id",
+        "Taux_Reussite" = EXCLUDED."Taux_Reussite",
+        "Type_Evolution" = EXCLUDED."Type_Evolution",
+        "Date" = EXCLUDED."Date",
+        "Total_Fenetre" = EXCLUDED."Total_Fenetre",
+        "Corrects_Fenetre" = EXCLUDED."Corrects_Fenetre",
+        "Fenetre_Depuis_Id" = EXCLUDED."Fenetre_Depuis_Id",
+        "Fenetre_Dernier_Id" = EXCLUDED."Fenetre_Dernier_Id",
+        updated_at = now()
+    -- n'avance que vers un suivi plus récent (écrivains concurrents)
+    WHERE "Position_Courante"."Suivi_Id" IS NULL OR "Position_Courante"."Suivi_Id" < EXCLUDED."Suivi_Id";
+
+    RETURN v_suivi;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION append_suivi_position(bigint, bigint, text, float8, bigint) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION append_suivi_position(bigint, bigint, text, float8, bigint) TO service_role;
+
+-- ============================================
+-- 2. process_session : fenetre lue dans les compteurs
+-- ============================================
+-- Corps de la migration 014, seul le calcul de la fenetre change.
+
+CREATE OR REPLACE FUNCTION process_session(p_user_id bigint, p_entrainement_id bigint, p_rules text DEFAULT 'session')
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_user_id bigint := p_user_id;
+    v_ids bigint[];
+    v_monday date := date_trunc('week', current_date)::date;
+    v_delta_classement int;
+    v_delta_base int;
+    v_op text;
+    v_parcours_id bigint;
+    v_niveau int;
+    v_critere int;
+    v_last_obs bigint;
+    v_total int;
+    v_corrects int;
+    v_last_id bigint;
+    v_pct float8;
+    v_prev_id bigint;
+    v_prev_niveau int;
+    v_next_id bigint;
+    v_next_niveau int;
+    v_to_id bigint;
+    v_to_niveau int;
+    v_decision text;
+    v_suivi "Suivi_Parcours";
+    v_evolutions jsonb := '[]'::jsonb;
+    v_pc "Position_Courante";
+    v_new int;
+    v_new_corrects int;
+    v_positions jsonb;
+BEGIN
+    SELECT coalesce(array_agg(id ORDER BY id), '{}') INTO v_ids
+    FROM "Observations"
+    WHERE "Entrainement_Id" = p_entrainement_id;
+
+    -- ---------- Scoring (fenetres Stats_Scoring, regle p_rules) ----------
+    PERFORM stats_scoring_prepare(v_user_id, v_ids);
+    PERFORM score_observations(v_user_id, v_ids, p_rules);
+    PERFORM stats_scoring_ingest(v_user_id, v_ids);
+
+    -- ---------- Classement + users_map (regles de submission.classement_payloads) ----------
+    SELECT coalesce(sum(coalesce(nullif(score_global, 0), nullif("Score", 0), 0)), 0),
+           coalesce(sum(coalesce("Score", 0)), 0)
+    INTO v_delta_classement, v_delta_base
+    FROM "Observations"
+    WHERE "Entrainement_Id" = p_entrainement_id;
+
+    INSERT INTO "Classement" ("Users_Id", score_global, score_week, week_start)
+    VALUES (v_user_id, v_delta_classement, v_delta_classement, v_monday)
+    ON CONFLICT ("Users_Id") DO UPDATE SET
+        score_global = coalesce("Classement".score_global, 0) + EXCLUDED.score_global,
+        score_week = CASE
+            WHEN "Classement".week_start IS NULL OR "Classement".week_start < v_monday THEN EXCLUDED.score_week
+            ELSE coalesce("Classement".score_week, 0) + EXCLUDED.score_week
+        END,
+        week_start = v_monday;
+
+    UPDATE users_map
+    SET score_base = coalesce(score_base, 0) + v_delta_base,
+        last_training_date = current_date
+    WHERE user_id = v_user_id;
+
+    -- ---------- Evolutions (regles de EvolutionService.evaluate_and_record_if_needed,
+    --            fenetre tenue par les compteurs de Position_Courante) ----------
+    FOR v_op IN
+        SELECT t.op
+        FROM unnest(ARRAY['Addition', 'Soustraction', 'Multiplication']) WITH ORDINALITY AS t(op, n)
+        WHERE EXISTS (
+            SELECT 1 FROM "Observations"
+            WHERE id = ANY (v_ids) AND lower(trim("Operation")) = lower(t.op)
+        )
+        ORDER BY t.n
+    LOOP
+        -- Position courante, sinon dernier suivi (utilisateur pas encore backfille)
+        SELECT pc."Parcours_Id", pc."Derniere_Observation_Id"
+        INTO v_parcours_id, v_last_obs
+        FROM "Position_Courante" pc
+        WHERE pc."Users_Id" = v_user_id AND pc."Type_Operation" = v_op
+        FOR UPDATE;
+
+        IF NOT FOUND THEN
+            SELECT s."Parcours_Id", s."Derniere_Observation_Id"
+            INTO v_parcours_id, v_last_obs
+            FROM "Suivi_Parcours" s
+            JOIN "Parcours" p ON p.id = s."Parcours_Id"
+            WHERE s."Users_Id" = v_user_id AND p."Type_Operation" = v_op
+            ORDER BY s.id DESC
+            LIMIT 1;
+        END IF;
+
+        IF NOT FOUND THEN
+            -- Auto-initialisation au premier niveau du type
+            SELECT id INTO v_parcours_id
+            FROM "Parcours"
+            WHERE "Type_Operation" = v_op
+            ORDER BY "Niveau"
+            LIMIT 1;
+            IF NOT FOUND THEN
+                CONTINUE;
+            END IF;
+            v_last_obs := NULL;
+            PERFORM append_suivi_position(v_user_id, v_parcours_id, 'initialisation', 0.0, NULL);
+        END IF;
+
+        SELECT "Niveau", coalesce("Critere", 0) INTO v_niveau, v_critere
+        FROM "Parcours" WHERE id = v_parcours_id;
+
+        -- Fenetre : compteurs de la position (ligne verrouillee ci-dessus : sessions
+        -- concurrentes du meme utilisateur serialisees), augmentes de la session
+        SELECT * INTO v_pc
+        FROM "Position_Courante" pc
+        WHERE pc."Users_Id" = v_user_id AND pc."Type_Operation" = v_op;
+
+        IF FOUND
+           AND v_pc."Fenetre_Depuis_Id" IS NOT NULL AND v_pc."Fenetre_Dernier_Id" IS NOT NULL
+           AND v_pc."Total_Fenetre" IS NOT NULL AND v_pc."Corrects_Fenetre" IS NOT NULL
+           AND v_pc."Fenetre_Depuis_Id" = coalesce(v_pc."Derniere_Observation_Id", 0) THEN
+            SELECT count(*), count(*) FILTER (WHERE o."Etat" = 'VRAI'), max(o.id)
+            INTO v_new, v_new_corrects, v_last_id
+            FROM "Observations" o
+            WHERE o.id = ANY (v_ids)
+              AND o."Operation" = v_op
+              AND o.id > v_pc."Fenetre_Dernier_Id";
+            v_total := v_pc."Total_Fenetre" + v_new;
+            v_corrects := v_pc."Corrects_Fenetre" + v_new_corrects;
+            v_last_id := greatest(v_pc."Fenetre_Dernier_Id", coalesce(v_last_id, 0));
+        ELSE
+            -- compteurs absents ou d'un autre suivi : recomptage (une fois)
+            SELECT count(*), count(*) FILTER (WHERE o."Etat" = 'VRAI'), max(o.id)
+            INTO v_total, v_corrects, v_last_id
+            FROM "Observations" o
+            WHERE o."Entrainement_Id" IN (
+                    SELECT id FROM "Entrainement"
+                    WHERE "Users_Id" = v_user_id
+                    ORDER BY id DESC
+                    LIMIT 200
+                )
+              AND o."Operation" = v_op
+              AND (coalesce(v_last_obs, 0) = 0 OR o.id > v_last_obs);
+            v_last_id := coalesce(v_last_id, v_last_obs, 0);
+        END IF;
+
+        UPDATE "Position_Courante"
+        SET "Total_Fenetre" = v_total,
+            "Corrects_Fenetre" = v_corrects,
+            "Fenetre_Depuis_Id" = coalesce(v_last_obs, 0),
+            "Fenetre_Dernier_Id" = v_last_id
+        WHERE "Users_Id" = v_user_id AND "Type_Operation" = v_op;
+
+        IF v_critere <= 0 OR v_total < v_critere THEN
+            CONTINUE;
+        END IF;
+
+        v_pct := v_corrects::float8 / v_total;
+
+        SELECT id, "Niveau" INTO v_prev_id, v_prev_niveau
+        FROM "Parcours"
+        WHERE "Type_Operation" = v_op AND "Niveau" < v_niveau
+        ORDER BY "Niveau" DESC
+        LIMIT 1;
+
+        SELECT id, "Niveau" INTO v_next_id, v_next_niveau
+        FROM "Parcours"
+        WHERE "Type_Operation" = v_op AND "Niveau" > v_niveau
+        ORDER BY "Niveau"
+        LIMIT 1;
+
+        IF v_pct > 0.90 AND v_next_id IS NOT NULL THEN
+            v_decision := 'progression';
+            v_to_id := v_next_id;
+            v_to_niveau := v_next_niveau;
+        ELSIF v_pct < 0.5 AND v_prev_id IS NOT NULL THEN
+            v_decision := 'régression';
+            v_to_id := v_prev_id;
+            v_to_niveau := v_prev_niveau;
+        ELSE
+            v_decision := 'stagnation';
+            v_to_id := v_parcours_id;
+            v_to_niveau := v_niveau;
+        END IF;
+
+        v_suivi := append_suivi_position(
+            v_user_id, v_to_id, v_decision, round(v_pct::numeric, 4)::float8, v_last_id
+        );
+
+        v_evolutions := v_evolutions || jsonb_build_array(jsonb_build_object(
+            'suivi', to_jsonb(v_suivi),
+            'operation', lower(v_op),
+            'from', jsonb_build_object('parcours_id', v_parcours_id, 'niveau', v_niveau),
+            'to', jsonb_build_object('parcours_id', v_to_id, 'niveau', v_to_niveau),
+            'type', v_decision,
+            'taux_reussite', round(v_pct::numeric, 4),
+            'window', jsonb_build_object(
+                'total', v_total,
+                'corrects', v_corrects,
+                'last_id_included', v_last_id
+            )
+        ));
+    END LOOP;
+
+    -- ---------- Positions des trois operations (equivalent positions_for_user) ----------
+    SELECT jsonb_object_agg(lower(t.op), jsonb_build_object(
+               'parcours_id', p.id, 'niveau', p."Niveau", 'critere', p."Critere"))
+    INTO v_positions
+    FROM unnest(ARRAY['Addition', 'Soustraction', 'Multiplication']) AS t(op)
+    JOIN "Parcours" p ON p.id = coalesce(
+        (SELECT pc."Parcours_Id" FROM "Position_Courante" pc
+         WHERE pc."Users_Id" = v_user_id AND pc."Type_Operation" = t.op),
+        (SELECT s."Parcours_Id" FROM "Suivi_Parcours" s
+         JOIN "Parcours" sp ON sp.id = s."Parcours_Id"
+         WHERE s."Users_Id" = v_user_id AND sp."Type_Operation" = t.op
+         ORDER BY s.id DESC LIMIT 1),
+        (SELECT fp.id FROM "Parcours" fp
+         WHERE fp."Type_Operation" = t.op
+         ORDER BY fp."Niveau" LIMIT 1)
+    );
+
+    RETURN jsonb_build_object(
+        'user_id', v_user_id,
+        'ids', to_jsonb(v_ids),
+        'evolutions', v_evolutions,
+        'positions', coalesce(v_positions, '{}'::jsonb)
+    );
+END;
+$$;
+
+REVOKE ALL ON FUNCTION process_session(bigint, bigint, text) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION process_session(bigint, bigint, text) TO service_role;
@@ -0,0 +1,144 @@
+-- ============================================
+-- MIGRATION: Agregats par session (ecrans Progression)
+-- Date: 2026-10-17
+-- Description: /progression/kpi_timeseries, /progression/levels_summary et
+--              /observations/metrics relisaient les observations brutes (jusqu'a
+--              100k lignes) pour les regrouper en Python par Entrainement_Id.
+--              Stats_Entrainement garde une ligne par
+--              (Entrainement_Id, Parcours_Id, Operation) : nombre d'observations,
+--              reponses justes, n / somme / somme des carres de Temps_Seconds,
+--              Marge_Erreur et Score, premiere et derniere observation.
+--              Alimentee a l'insertion des observations (trigger par instruction,
+--              tous les chemins de soumission : submit_observations,
+--              submit_observations_async, legacy). Meme calcul que
+--              app/services/session_stats.py (emulation hors ligne).
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS "Stats_Entrainement" (
+    "Entrainement_Id" bigint NOT NULL,
+    "Parcours_Id" bigint NOT NULL,
+    "Operation" text NOT NULL,
+    "Users_Id" bigint,
+    n int NOT NULL DEFAULT 0,
+    corrects int NOT NULL DEFAULT 0,
+    n_temps int NOT NULL DEFAULT 0,
+    sum_temps float8 NOT NULL DEFAULT 0,
+    sumsq_temps float8 NOT NULL DEFAULT 0,
+    n_marge int NOT NULL DEFAULT 0,
+    sum_marge float8 NOT NULL DEFAULT 0,
+    sumsq_marge float8 NOT NULL DEFAULT 0,
+    n_score int NOT NULL DEFAULT 0,
+    sum_score float8 NOT NULL DEFAULT 0,
+    sumsq_score float8 NOT NULL DEFAULT 0,
+    first_observation_id bigint NOT NULL,
+    last_observation_id bigint NOT NULL,
+    PRIMARY KEY ("Entrainement_Id", "Parcours_Id", "Operation")
+);
+
+COMMENT ON TABLE "Stats_Entrainement" IS 'Agregats des observations par session, parcours et operation';
+COMMENT ON COLUMN "Stats_Entrainement".corrects IS 'Etat VRAI (a defaut Proposition = Solution)';
+COMMENT ON COLUMN "Stats_Entrainement".last_observation_id IS 'Plus grand id d observation agrege (cle de pagination)';
+
+CREATE INDEX IF NOT EXISTS idx_stats_entrainement_parcours
+    ON "Stats_Entrainement" ("Parcours_Id", "Operation", "Entrainement_Id");
+CREATE INDEX IF NOT EXISTS idx_stats_entrainement_parcours_last
+    ON "Stats_Entrainement" ("Parcours_Id", last_observation_id);
+
+-- Series obs10 / obs50 : compte et queue des observations d'un parcours
+CREATE INDEX IF NOT EXISTS idx_observations_parcours_id
+    ON "Observations" ("Parcours_Id", id);
+
+-- Table interne : lue par le service role, ecrite par le trigger (SECURITY DEFINER)
+ALTER TABLE "Stats_Entrainement" ENABLE ROW LEVEL SECURITY;
+
+-- ============================================
+-- 1. Ingestion : deltas des observations inserees, additionnes a la ligne
+--    existante (insertions concurrentes d'une meme session par paquets)
+-- ============================================
+
+CREATE OR REPLACE FUNCTION stats_entrainement_ingest()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    INSERT INTO "Stats_Entrainement" AS s (
+        "Entrainement_Id", "Parcours_Id", "Operation", "Users_Id",
+        n, corrects,
+        n_temps, sum_temps, sumsq_temps,
+        n_marge, sum_marge, sumsq_marge,
+        n_score, sum_score, sumsq_score,
+        first_observation_id, last_observation_id
+    )
+    SELECT o."Entrainement_Id", o."Parcours_Id", o."Operation", e."Users_Id",
+           count(*),
+           count(*) FILTER (WHERE CASE WHEN o."Etat" IN ('VRAI', 'FAUX') THEN o."Etat" = 'VRAI'
+                                       ELSE o."Proposition"::text = o."Solution"::text END),
+           count(o."Temps_Seconds"), coalesce(sum(o."Temps_Seconds"), 0),
+           coalesce(sum(o."Temps_Seconds"::float8 * o."Temps_Seconds"), 0),
+           count(o."Marge_Erreur"), coalesce(sum(o."Marge_Erreur"), 0),
+           coalesce(sum(o."Marge_Erreur"::float8 * o."Marge_Erreur"), 0),
+           count(o."Score"), coalesce(sum(o."Score"), 0),
+           coalesce(sum(o."Score"::float8 * o."Score"), 0),
+           min(o.id), max(o.id)
+    FROM new_rows o
+    LEFT JOIN "Entrainement" e ON e.id = o."Entrainement_Id"
+    WHERE o."Entrainement_Id" IS NOT NULL AND o."Parcours_Id" IS NOT NULL AND o."Operation" IS NOT NULL
+    GROUP BY o."Entrainement_Id", o."Parcours_Id", o."Operation", e."Users_Id"
+    ON CONFLICT ("Entrainement_Id", "Parcours_Id", "Operation") DO UPDATE SET
+        "Users_Id" = coalesce(s."Users_Id", EXCLUDED."Users_Id"),
+        n = s.n + EXCLUDED.n,
+        corrects = s.corrects + EXCLUDED.corrects,
+        n_temps = s.n_temps + EXCLUDED.n_temps,
+        sum_temps = s.sum_temps + EXCLUDED.sum_temps,
+        sumsq_temps = s.sumsq_temps + EXCLUDED.sumsq_temps,
+        n_marge = s.n_marge + EXCLUDED.n_marge,
+        sum_marge = s.sum_marge + EXCLUDED.sum_marge,
+        sumsq_marge = s.sumsq_marge + EXCLUDED.sumsq_marge,
+        n_score = s.n_score + EXCLUDED.n_score,
+        sum_score = s.sum_score + EXCLUDED.sum_score,
+        sumsq_score = s.sumsq_score + EXCLUDED.sumsq_score,
+        first_observation_id = least(s.first_observation_id, EXCLUDED.first_observation_id),
+        last_observation_id = greatest(s.last_observation_id, EXCLUDED.last_observation_id);
+    RETURN NULL;
+END;
+$$;
+
+-- ============================================
+-- 2. Amorcage sur l'historique puis trigger, insertions bloquees entre les deux
+-- ============================================
+
+LOCK TABLE "Observations" IN SHARE MODE;
+
+INSERT INTO "Stats_Entrainement" (
+    "Entrainement_Id", "Parcours_Id", "Operation", "Users_Id",
+    n, corrects,
+    n_temps, sum_temps, sumsq_temps,
+    n_marge, sum_marge, sumsq_marge,
+    n_score, sum_score, sumsq_score,
+    first_observation_id, last_observation_id
+)
+SELECT o."Entrainement_Id", o."Parcours_Id", o."Operation", e."Users_Id",
+       count(*),
+       count(*) FILTER (WHERE CASE WHEN o."Etat" IN ('VRAI', 'FAUX') THEN o."Etat" = 'VRAI'
+                                   ELSE o."Proposition"::text = o."Solution"::text END),
+       count(o."Temps_Seconds"), coalesce(sum(o."Temps_Seconds"), 0),
+       coalesce(sum(o."Temps_Seconds"::float8 * o."Temps_Seconds"), 0),
+       count(o."Marge_Erreur"), coalesce(sum(o."Marge_Erreur"), 0),
+       coalesce(sum(o."Marge_Erreur"::float8 * o."Marge_Erreur"), 0),
+       count(o."Score"), coalesce(sum(o."Score"), 0),
+       coalesce(sum(o."Score"::float8 * o."Score"), 0),
+       min(o.id), max(o.id)
+FROM "Observations" o
+LEFT JOIN "Entrainement" e ON e.id = o."Entrainement_Id"
+WHERE o."Entrainement_Id" IS NOT NULL AND o."Parcours_Id" IS NOT NULL AND o."Operation" IS NOT NULL
+GROUP BY o."Entrainement_Id", o."Parcours_Id", o."Operation", e."Users_Id"
+ON CONFLICT ("Entrainement_Id", "Parcours_Id", "Operation") DO NOTHING;
+
+DROP TRIGGER IF EXISTS trg_stats_entrainement ON "Observations";
+CREATE TRIGGER trg_stats_entrainement
+    AFTER INSERT ON "Observations"
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION stats_entrainement_ingest();
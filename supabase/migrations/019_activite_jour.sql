@@ -0,0 +1,157 @@
+-- ============================================
+-- MIGRATION: Index d'activite quotidienne
+-- Date: 2026-10-17
+-- Description: /stats/day_streak_current relisait deux ans d'Entrainement et
+--              /progression/regularite toutes les observations du parcours, puis
+--              les dates de leurs entrainements (jusqu'a quatre graphies de table
+--              et de colonne essayees).
+--                Activite_Jour        (Users_Id, Jour) -> sessions, observations,
+--                                     reponses justes ; sessions comptees a la
+--                                     creation de l'Entrainement, observations a
+--                                     leur insertion (jour = Entrainement.Date)
+--                Stats_Entrainement   + "Date" de l'entrainement (migration 018),
+--                                     lue par plage de jours par parcours
+--              Memes calculs que app/services/activity.py et session_stats.py
+--              (emulation hors ligne).
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS "Activite_Jour" (
+    "Users_Id" bigint NOT NULL,
+    "Jour" date NOT NULL,
+    sessions int NOT NULL DEFAULT 0,
+    observations int NOT NULL DEFAULT 0,
+    corrects int NOT NULL DEFAULT 0,
+    PRIMARY KEY ("Users_Id", "Jour")
+);
+
+COMMENT ON TABLE "Activite_Jour" IS 'Activite par utilisateur et par jour (Entrainement.Date)';
+
+ALTER TABLE "Activite_Jour" ENABLE ROW LEVEL SECURITY;
+
+ALTER TABLE "Stats_Entrainement" ADD COLUMN IF NOT EXISTS "Date" date;
+
+CREATE INDEX IF NOT EXISTS idx_stats_entrainement_parcours_date
+    ON "Stats_Entrainement" ("Parcours_Id", "Date");
+
+-- ============================================
+-- 1. Sessions : une par Entrainement cree
+-- ============================================
+
+CREATE OR REPLACE FUNCTION activite_jour_sessions()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    INSERT INTO "Activite_Jour" AS a ("Users_Id", "Jour", sessions)
+    SELECT e."Users_Id", coalesce(e."Date"::date, current_date), count(*)
+    FROM new_rows e
+    WHERE e."Users_Id" IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT ("Users_Id", "Jour") DO UPDATE SET sessions = a.sessions + EXCLUDED.sessions;
+    RETURN NULL;
+END;
+$$;
+
+-- ============================================
+-- 2. Observations : Stats_Entrainement (migration 018, + "Date") et Activite_Jour
+-- ============================================
+
+CREATE OR REPLACE FUNCTION stats_entrainement_ingest()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    INSERT INTO "Stats_Entrainement" AS s (
+        "Entrainement_Id", "Parcours_Id", "Operation", "Users_Id", "Date",
+        n, corrects,
+        n_temps, sum_temps, sumsq_temps,
+        n_marge, sum_marge, sumsq_marge,
+        n_score, sum_score, sumsq_score,
+        first_observation_id, last_observation_id
+    )
+    SELECT o."Entrainement_Id", o."Parcours_Id", o."Operation", e."Users_Id", e."Date"::date,
+           count(*),
+           count(*) FILTER (WHERE CASE WHEN o."Etat" IN ('VRAI', 'FAUX') THEN o."Etat" = 'VRAI'
+                                       ELSE o."Proposition"::text = o."Solution"::text END),
+           count(o."Temps_Seconds"), coalesce(sum(o."Temps_Seconds"), 0),
+           coalesce(sum(o."Temps_Seconds"::float8 * o."Temps_Seconds"), 0),
+           count(o."Marge_Erreur"), coalesce(sum(o."Marge_Erreur"), 0),
+           coalesce(sum(o."Marge_Erreur"::float8 * o."Marge_Erreur"), 0),
+           count(o."Score"), coalesce(sum(o."Score"), 0),
+           coalesce(sum(o."Score"::float8 * o."Score"), 0),
+           min(o.id), max(o.id)
+    FROM new_rows o
+    LEFT JOIN "Entrainement" e ON e.id = o."Entrainement_Id"
+    WHERE o."Entrainement_Id" IS NOT NULL AND o."Parcours_Id" IS NOT NULL AND o."Operation" IS NOT NULL
+    GROUP BY o."Entrainement_Id", o."Parcours_Id", o."Operation", e."Users_Id", e."Date"
+    ON CONFLICT ("Entrainement_Id", "Parcours_Id", "Operation") DO UPDATE SET
+        "Users_Id" = coalesce(s."Users_Id", EXCLUDED."Users_Id"),
+        "Date" = coalesce(s."Date", EXCLUDED."Date"),
+        n = s.n + EXCLUDED.n,
+        corrects = s.corrects + EXCLUDED.corrects,
+        n_temps = s.n_temps + EXCLUDED.n_temps,
+        sum_temps = s.sum_temps + EXCLUDED.sum_temps,
+        sumsq_temps = s.sumsq_temps + EXCLUDED.sumsq_temps,
+        n_marge = s.n_marge + EXCLUDED.n_marge,
+        sum_marge = s.sum_marge + EXCLUDED.sum_marge,
+        sumsq_marge = s.sumsq_marge + EXCLUDED.sumsq_marge,
+        n_score = s.n_score + EXCLUDED.n_score,
+        sum_score = s.sum_score + EXCLUDED.sum_score,
+        sumsq_score = s.sumsq_score + EXCLUDED.sumsq_score,
+        first_observation_id = least(s.first_observation_id, EXCLUDED.first_observation_id),
+        last_observation_id = greatest(s.last_observation_id, EXCLUDED.last_observation_id);
+
+    INSERT INTO "Activite_Jour" AS a ("Users_Id", "Jour", observations, corrects)
+    SELECT e."Users_Id", coalesce(e."Date"::date, current_date),
+           count(*),
+           count(*) FILTER (WHERE CASE WHEN o."Etat" IN ('VRAI', 'FAUX') THEN o."Etat" = 'VRAI'
+                                       ELSE o."Proposition"::text = o."Solution"::text END)
+    FROM new_rows o
+    JOIN "Entrainement" e ON e.id = o."Entrainement_Id"
+    WHERE e."Users_Id" IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT ("Users_Id", "Jour") DO UPDATE SET
+        observations = a.observations + EXCLUDED.observations,
+        corrects = a.corrects + EXCLUDED.corrects;
+    RETURN NULL;
+END;
+$$;
+
+-- ============================================
+-- 3. Amorcage sur l'historique puis trigger, insertions bloquees entre les deux
+-- ============================================
+
+LOCK TABLE "Entrainement", "Observations" IN SHARE MODE;
+
+UPDATE "Stats_Entrainement" s
+SET "Date" = e."Date"::date
+FROM "Entrainement" e
+WHERE e.id = s."Entrainement_Id" AND s."Date" IS NULL;
+
+INSERT INTO "Activite_Jour" ("Users_Id", "Jour", sessions, observations, corrects)
+SELECT "Users_Id", "Jour", sum(sessions), sum(observations), sum(corrects)
+FROM (
+    SELECT e."Users_Id", coalesce(e."Date"::date, current_date) AS "Jour",
+           1 AS sessions, 0 AS observations, 0 AS corrects
+    FROM "Entrainement" e
+    WHERE e."Users_Id" IS NOT NULL
+    UNION ALL
+    SELECT e."Users_Id", coalesce(e."Date"::date, current_date),
+           0, s.n, s.corrects
+    FROM "Stats_Entrainement" s
+    JOIN "Entrainement" e ON e.id = s."Entrainement_Id"
+    WHERE e."Users_Id" IS NOT NULL
+) t
+GROUP BY "Users_Id", "Jour"
+ON CONFLICT ("Users_Id", "Jour") DO NOTHING;
+
+DROP TRIGGER IF EXISTS trg_activite_jour_sessions ON "Entrainement";
+CREATE TRIGGER trg_activite_jour_sessions
+    AFTER INSERT ON "Entrainement"
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION activite_jour_sessions();
@@ -0,0 +1,49 @@
+-- ============================================
+-- MIGRATION: Validateurs des GET conditionnels (ETag)
+-- Date: 2026-10-17
+-- Description: etag_state renvoie en un appel, par index, l'etat dont dependent
+--              les ecrans relus a chaque ouverture (app/services/etag.py) :
+--                observation    derniere observation de l'utilisateur
+--                               (Stats_Entrainement, migration 018)
+--                suivi          dernier Suivi_Parcours de l'utilisateur
+--                positions      par operation (Position_Courante) : parcours, suivi,
+--                               derniere observation du parcours
+--                parcours       derniere observation de chaque parcours demande
+--                entrainement   derniere observation de l'entrainement
+--              Un ETag egal a If-None-Match donne un 304 sans autre requete.
+--              Index Suivi_Parcours et Observations : migrations 010, 011, 018.
+--              Reserve au service role (ids de tous les utilisateurs).
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_stats_entrainement_user_last
+    ON "Stats_Entrainement" ("Users_Id", last_observation_id);
+
+CREATE OR REPLACE FUNCTION etag_state(
+    p_user_id bigint DEFAULT NULL,
+    p_parcours_ids bigint[] DEFAULT NULL,
+    p_entrainement_id bigint DEFAULT NULL
+)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+SET search_path = public
+AS $$
+    SELECT jsonb_build_object(
+        'observation', (SELECT max(last_observation_id) FROM "Stats_Entrainement"
+                        WHERE p_user_id IS NOT NULL AND "Users_Id" = p_user_id),
+        'suivi', (SELECT max(id) FROM "Suivi_Parcours"
+                  WHERE p_user_id IS NOT NULL AND "Users_Id" = p_user_id),
+        'positions', (SELECT jsonb_object_agg(pc."Type_Operation", jsonb_build_array(
+                          pc."Parcours_Id", pc."Suivi_Id",
+                          (SELECT max(id) FROM "Observations" o WHERE o."Parcours_Id" = pc."Parcours_Id")))
+                      FROM "Position_Courante" pc
+                      WHERE p_user_id IS NOT NULL AND pc."Users_Id" = p_user_id),
+        'parcours', (SELECT jsonb_object_agg(pid::text, (SELECT max(id) FROM "Observations" WHERE "Parcours_Id" = pid))
+                     FROM unnest(coalesce(p_parcours_ids, '{}')) AS pid),
+        'entrainement', (SELECT max(id) FROM "Observations"
+                         WHERE p_entrainement_id IS NOT NULL AND "Entrainement_Id" = p_entrainement_id)
+    );
+$$;
+
+REVOKE ALL ON FUNCTION etag_state(bigint, bigint[], bigint) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION etag_state(bigint, bigint[], bigint) TO service_role;
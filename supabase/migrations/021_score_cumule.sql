@@ -0,0 +1,105 @@
+-- ============================================
+-- MIGRATION: Serie du score cumule par utilisateur
+-- Date: 2026-10-17
+-- Description: /progression/score_cumule_50 chargeait jusqu'a 50 000 ids
+--              d'Entrainement dans un seul filtre `in` (URL geante) puis triait et
+--              regroupait les observations en Python.
+--                Score_Cumule   une ligne par utilisateur : n observations, score
+--                               total, derniere observation, et checkpoints = score
+--                               cumule toutes les 50 observations (ajout seul)
+--              Etendue a l'insertion des observations (trigger, tous les chemins de
+--              soumission), dans l'ordre des ids de chaque insertion. Toute fenetre
+--              multiple de 50 se deduit des memes sommes prefixes.
+--              Memes calculs que app/services/score_series.py (emulation hors ligne).
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS "Score_Cumule" (
+    "Users_Id" bigint PRIMARY KEY,
+    n bigint NOT NULL DEFAULT 0,
+    total bigint NOT NULL DEFAULT 0,
+    checkpoints bigint[] NOT NULL DEFAULT '{}',
+    last_observation_id bigint,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+COMMENT ON COLUMN "Score_Cumule".checkpoints IS 'score cumule apres 50, 100, 150... observations';
+
+ALTER TABLE "Score_Cumule" ENABLE ROW LEVEL SECURITY;
+
+-- ============================================
+-- 1. Extension a l'insertion des observations
+-- ============================================
+
+CREATE OR REPLACE FUNCTION score_cumule_ingest()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    r record;
+    v_cur "Score_Cumule";
+BEGIN
+    FOR r IN
+        SELECT e."Users_Id" AS uid,
+               array_agg(coalesce(trunc(o."Score"::numeric), 0)::bigint ORDER BY o.id) AS scores,
+               max(o.id) AS last_id
+        FROM new_rows o
+        JOIN "Entrainement" e ON e.id = o."Entrainement_Id"
+        WHERE e."Users_Id" IS NOT NULL
+        GROUP BY e."Users_Id"
+        ORDER BY e."Users_Id"
+    LOOP
+        INSERT INTO "Score_Cumule" ("Users_Id") VALUES (r.uid) ON CONFLICT ("Users_Id") DO NOTHING;
+        SELECT * INTO v_cur FROM "Score_Cumule" WHERE "Users_Id" = r.uid FOR UPDATE;
+
+        UPDATE "Score_Cumule" s SET
+            n = v_cur.n + cardinality(r.scores),
+            total = v_cur.total + x.total,
+            checkpoints = v_cur.checkpoints || x.marks,
+            last_observation_id = greatest(v_cur.last_observation_id, r.last_id),
+            updated_at = now()
+        FROM (
+            SELECT coalesce(sum(sc), 0)::bigint AS total,
+                   coalesce(array_agg(cum ORDER BY i) FILTER (WHERE (v_cur.n + i) % 50 = 0), '{}') AS marks
+            FROM (
+                SELECT i, sc, (v_cur.total + sum(sc) OVER (ORDER BY i))::bigint AS cum
+                FROM unnest(r.scores) WITH ORDINALITY AS u(sc, i)
+            ) t
+        ) x
+        WHERE s."Users_Id" = r.uid;
+    END LOOP;
+    RETURN NULL;
+END;
+$$;
+
+-- ============================================
+-- 2. Amorcage sur l'historique puis trigger, insertions bloquees entre les deux
+-- ============================================
+
+LOCK TABLE "Observations" IN SHARE MODE;
+
+INSERT INTO "Score_Cumule" ("Users_Id", n, total, checkpoints, last_observation_id)
+SELECT uid, count(*), coalesce(sum(sc), 0)::bigint,
+       coalesce(array_agg(cum::bigint ORDER BY rn) FILTER (WHERE rn % 50 = 0), '{}'),
+       max(id)
+FROM (
+    SELECT e."Users_Id" AS uid, o.id,
+           coalesce(trunc(o."Score"::numeric), 0)::bigint AS sc,
+           row_number() OVER w AS rn,
+           sum(coalesce(trunc(o."Score"::numeric), 0)) OVER w AS cum
+    FROM "Observations" o
+    JOIN "Entrainement" e ON e.id = o."Entrainement_Id"
+    WHERE e."Users_Id" IS NOT NULL
+    WINDOW w AS (PARTITION BY e."Users_Id" ORDER BY o.id)
+) t
+GROUP BY uid
+ON CONFLICT ("Users_Id") DO NOTHING;
+
+DROP TRIGGER IF EXISTS trg_score_cumule ON "Observations";
+CREATE TRIGGER trg_score_cumule
+    AFTER INSERT ON "Observations"
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION score_cumule_ingest();
+
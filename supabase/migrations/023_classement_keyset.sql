@@ -0,0 +1,16 @@
+-- ============================================
+-- MIGRATION: Index de pagination du Classement
+-- Date: 2026-10-17
+-- Description: /classement pagine par curseur (score, Users_Id) et
+--              /classement/around_me lit les voisins d'un utilisateur. Servis par
+--              le classement en memoire de l'API (app/services/leaderboard.py) ;
+--              tant qu'il n'est pas charge, ClassementRepository lit la table dans
+--              l'ordre (score desc, Users_Id asc) : ces index couvrent le tri, les
+--              pages apres / avant un curseur et les comptes d'ex aequo.
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_classement_global_keyset
+    ON "Classement" (score_global DESC, "Users_Id");
+
+CREATE INDEX IF NOT EXISTS idx_classement_week_keyset
+    ON "Classement" (score_week DESC, "Users_Id");